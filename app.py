@@ -26,6 +26,8 @@ def create_app(config_name=None):
     
     # Initialize extensions with app
     db.init_app(app)
+    from services.database import init_database_engine, release_connections
+    init_database_engine(app)
     bcrypt.init_app(app)
     sess.init_app(app)
     
@@ -76,7 +78,23 @@ def create_app(config_name=None):
     # Register template routes
     from routes.templates import templates_bp
     app.register_blueprint(templates_bp)
-    
+
+    # Session listeners that keep the batch student counters and the student search index current
+    import services.batch_counters  # noqa: F401
+    import services.student_search  # noqa: F401
+
+    # Background SMS outbox dispatcher
+    from services.sms_dispatcher import init_sms_dispatcher
+    init_sms_dispatcher(app)
+
+    # Interval flusher for buffered online exam answers
+    from services.answer_buffer import init_answer_buffer
+    init_answer_buffer(app)
+
+    # Auto-submits online exam attempts whose time ran out
+    from services.attempt_sweeper import init_attempt_sweeper
+    init_attempt_sweeper(app)
+
     # Add favicon route
     @app.route('/favicon.ico')
     def favicon():
@@ -153,6 +171,24 @@ def create_app(config_name=None):
             except Exception as e:
                 return jsonify({'status': 'unhealthy', 'error': str(e)}), 500
     
+    # Expired exam attempt sweeper metrics
+    @app.route('/health/attempt-sweeper')
+    def attempt_sweeper_health():
+        """Last sweeper runs and the backlog of overdue open attempts"""
+        from services.attempt_sweeper import get_sweeper_status
+        try:
+            return jsonify(get_sweeper_status())
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'status': 'unhealthy', 'error': str(e)}), 500
+    
+    # Dashboard statistics cache counters (per worker)
+    @app.route('/health/dashboard-cache')
+    def dashboard_cache_health():
+        """Hit/miss counters of this worker's dashboard cache"""
+        from services.dashboard_stats import get_dashboard_cache_stats
+        return jsonify(get_dashboard_cache_stats())
+    
     # Root endpoint handled by templates blueprint
     
     # Create database tables
@@ -163,6 +199,9 @@ def create_app(config_name=None):
         except Exception as e:
             print(f"Error creating database tables: {str(e)}")
     
+    # Workers forked from a preloaded app must not inherit these connections
+    release_connections(app)
+    
     return app
 
 if __name__ == '__main__':
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Login benchmark
+Simulates the term-start rush: several worker processes (like gunicorn sync
+workers) sign in concurrently against one SQLite file. The mix is teachers
+with current bcrypt hashes, teachers still on legacy werkzeug pbkdf2 hashes
+(upgraded to bcrypt on their first login), wrong passwords, and guardians
+whose phone is shared by several students. Reports throughput and p50/p99
+latency per kind of sign-in.
+
+    python benchmark_login.py --workers 9 --duration 10
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import date
+
+from werkzeug.security import generate_password_hash as werkzeug_hash
+
+import config
+
+PASSWORD = 'Teach3r!pass'
+SCENARIOS = ('teacher', 'legacy_teacher', 'wrong_password', 'family')
+
+
+def _config(path, rounds):
+    class BenchmarkConfig(config.Config):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{path}'
+        SQLALCHEMY_TRACK_MODIFICATIONS = False
+        SESSION_FILE_DIR = os.path.join(os.path.dirname(path), 'sessions')
+        BCRYPT_LOG_ROUNDS = rounds
+        SMS_DISPATCHER = 'external'
+        ANSWER_BUFFER_FLUSHER = 'external'
+        ATTEMPT_SWEEPER = 'external'
+    config.config_by_name['benchmark'] = BenchmarkConfig
+
+
+def _setup(teachers, families):
+    from app import create_app
+    from models import db, User, UserRole, Batch
+    from utils.auth import generate_password_hash
+
+    app = create_app('benchmark')
+    with app.app_context():
+        batches = [Batch(name=f'Batch {i}', start_date=date(2025, 1, 1)) for i in range(5)]
+        db.session.add_all(batches)
+        bcrypt_hash = generate_password_hash(PASSWORD)
+        for i in range(teachers):
+            db.session.add(User(phoneNumber=f'0181{i:07d}', first_name=f'Teacher{i}', last_name='Bench',
+                                role=UserRole.TEACHER, password_hash=bcrypt_hash))
+            # Legacy hashes are upgraded on first login; each is signed in once
+            db.session.add(User(phoneNumber=f'0191{i:07d}', first_name=f'Legacy{i}', last_name='Bench',
+                                role=UserRole.TEACHER, password_hash=werkzeug_hash(PASSWORD)))
+        for i in range(families):
+            for sibling in range(3):
+                student = User(phoneNumber=f'0171{i:07d}', first_name=f'Student{i}_{sibling}', last_name='Bench',
+                               role=UserRole.STUDENT)
+                student.batches.extend(random.sample(batches, 2))
+                db.session.add(student)
+        db.session.commit()
+
+
+def _worker(number, workers, teachers, families, duration, queue):
+    from app import create_app
+
+    app = create_app('benchmark')
+    client = app.test_client()
+    rng = random.Random(os.getpid())
+    legacy = iter(range(number, teachers, workers))  # Each worker upgrades its own share
+    stats = {name: [] for name in SCENARIOS}
+    stats['errors'] = 0
+    deadline = time.time() + duration
+
+    while time.time() < deadline:
+        scenario = rng.choice(SCENARIOS)
+        if scenario == 'legacy_teacher':
+            index = next(legacy, None)
+            if index is None:
+                continue
+            body = {'phoneNumber': f'0191{index:07d}', 'password': PASSWORD}
+        elif scenario == 'teacher':
+            body = {'phoneNumber': f'0181{rng.randrange(teachers):07d}', 'password': PASSWORD}
+        elif scenario == 'wrong_password':
+            body = {'phoneNumber': f'0181{rng.randrange(teachers):07d}', 'password': 'not-the-password'}
+        else:
+            body = {'phoneNumber': f'0171{rng.randrange(families):07d}', 'password': 'student123'}
+
+        started = time.perf_counter()
+        response = client.post('/api/auth/login', json=body)
+        elapsed = time.perf_counter() - started
+        expected = 401 if scenario == 'wrong_password' else 200
+        if response.status_code == expected:
+            stats[scenario].append(elapsed)
+        else:
+            stats['errors'] += 1
+
+    queue.put(stats)
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct))] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure login latency under concurrent sign-ins')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count() * 2 + 1,
+                        help='Concurrent processes (default: the gunicorn worker count)')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds to run')
+    parser.add_argument('--teachers', type=int, default=200, help='Teachers of each hash kind')
+    parser.add_argument('--families', type=int, default=300, help='Guardian phones shared by three students')
+    parser.add_argument('--rounds', type=int, default=config.Config.BCRYPT_LOG_ROUNDS, help='bcrypt cost')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='login_bench_')
+    _config(os.path.join(directory, 'bench.db'), args.rounds)
+    _setup(args.teachers, args.families)
+
+    print(f"🔬 {args.workers} workers, {args.duration:.0f}s, bcrypt cost {args.rounds}")
+    ctx = multiprocessing.get_context('fork')
+    queue = ctx.Queue()
+    processes = [ctx.Process(target=_worker, args=(number, args.workers, args.teachers, args.families,
+                                                       args.duration, queue))
+                 for number in range(args.workers)]
+    for process in processes:
+        process.start()
+    results = [queue.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    print(f"{'sign-in':<16}{'count':>8}{'per s':>8}{'p50':>10}{'p99':>10}")
+    for name in SCENARIOS:
+        latencies = [v for r in results for v in r[name]]
+        p50 = statistics.median(latencies) * 1000 if latencies else 0.0
+        print(f"{name:<16}{len(latencies):>8}{len(latencies) / args.duration:>8.1f}"
+              f"{p50:>8.1f}ms{_percentile(latencies, 0.99):>8.1f}ms")
+    errors = sum(r['errors'] for r in results)
+    if errors:
+        print(f"⚠️  {errors} sign-ins returned an unexpected status")
+
+
+if __name__ == '__main__':
+    main()
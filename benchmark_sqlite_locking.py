@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+SQLite lock-contention benchmark
+Forks several worker processes (like gunicorn sync workers) that mix reads with
+mark-entry style write transactions against one database file. It runs once with
+the old engine setup (rollback journal, no tuning) and once with the tuned engine
+from services/database.py, then reports throughput, latency and
+"database is locked" errors.
+
+    python benchmark_sqlite_locking.py --workers 9 --duration 10
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from config import Config
+from services.database import configure_sqlite_engine, sqlite_settings
+
+STUDENTS = 200
+EXAMS = 20
+
+
+def _engine(path, tuned):
+    engine = create_engine(f'sqlite:///{path}')
+    if tuned:
+        configure_sqlite_engine(engine, sqlite_settings(vars(Config)))
+    return engine
+
+
+def _setup(path):
+    engine = create_engine(f'sqlite:///{path}')
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE marks (exam_id INTEGER, user_id INTEGER, marks INTEGER, '
+                          'updated_at REAL, PRIMARY KEY (exam_id, user_id))'))
+        conn.execute(text('INSERT INTO marks VALUES (:e, :u, 0, 0)'),
+                     [{'e': e, 'u': u} for e in range(EXAMS) for u in range(STUDENTS)])
+    engine.dispose()
+
+
+def _worker(path, tuned, duration, write_ratio, queue):
+    engine = _engine(path, tuned)
+    rng = random.Random(os.getpid())
+    stats = {'reads': [], 'writes': [], 'locked': 0, 'other_errors': 0}
+    deadline = time.time() + duration
+
+    while time.time() < deadline:
+        exam_id = rng.randrange(EXAMS)
+        started = time.perf_counter()
+        try:
+            if rng.random() < write_ratio:
+                # One teacher saving a page of marks: read, write, read back, commit
+                with engine.begin() as conn:
+                    conn.execute(text('SELECT count(*) FROM marks WHERE exam_id = :e'), {'e': exam_id})
+                    conn.execute(text('UPDATE marks SET marks = :m, updated_at = :t '
+                                      'WHERE exam_id = :e AND user_id = :u'),
+                                 [{'m': rng.randrange(100), 't': time.time(), 'e': exam_id, 'u': u}
+                                  for u in rng.sample(range(STUDENTS), 30)])
+                    conn.execute(text('SELECT avg(marks) FROM marks WHERE exam_id = :e'), {'e': exam_id})
+                stats['writes'].append(time.perf_counter() - started)
+            else:
+                # A ranking / results page
+                with engine.connect() as conn:
+                    conn.execute(text('SELECT user_id, marks FROM marks WHERE exam_id = :e '
+                                      'ORDER BY marks DESC'), {'e': exam_id}).fetchall()
+                stats['reads'].append(time.perf_counter() - started)
+        except OperationalError as e:
+            if 'locked' in str(e) or 'busy' in str(e):
+                stats['locked'] += 1
+            else:
+                stats['other_errors'] += 1
+
+    engine.dispose()
+    queue.put(stats)
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct))] * 1000
+
+
+def run(tuned, workers, duration, write_ratio):
+    directory = tempfile.mkdtemp(prefix='sqlite_bench_')
+    path = os.path.join(directory, 'bench.db')
+    _setup(path)
+
+    ctx = multiprocessing.get_context('fork')
+    queue = ctx.Queue()
+    processes = [ctx.Process(target=_worker, args=(path, tuned, duration, write_ratio, queue))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    results = [queue.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    reads = [v for r in results for v in r['reads']]
+    writes = [v for r in results for v in r['writes']]
+    return {
+        'label': 'tuned (WAL)' if tuned else 'baseline',
+        'writes_per_s': len(writes) / duration,
+        'reads_per_s': len(reads) / duration,
+        'write_p50': statistics.median(writes) * 1000 if writes else 0.0,
+        'write_p95': _percentile(writes, 0.95),
+        'read_p95': _percentile(reads, 0.95),
+        'locked': sum(r['locked'] for r in results),
+        'other_errors': sum(r['other_errors'] for r in results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure SQLite lock contention across worker processes')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count() * 2 + 1,
+                        help='Concurrent processes (default: the gunicorn worker count)')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds per run')
+    parser.add_argument('--write-ratio', type=float, default=0.3, help='Share of requests that write')
+    args = parser.parse_args()
+
+    print(f"🔬 {args.workers} workers, {args.duration:.0f}s per run, {args.write_ratio:.0%} writes")
+    rows = [run(False, args.workers, args.duration, args.write_ratio),
+            run(True, args.workers, args.duration, args.write_ratio)]
+
+    print(f"{'engine':<14}{'writes/s':>10}{'reads/s':>10}{'write p50':>11}{'write p95':>11}"
+          f"{'read p95':>10}{'locked':>8}")
+    for row in rows:
+        print(f"{row['label']:<14}{row['writes_per_s']:>10.1f}{row['reads_per_s']:>10.1f}"
+              f"{row['write_p50']:>9.1f}ms{row['write_p95']:>9.1f}ms{row['read_p95']:>8.1f}ms"
+              f"{row['locked']:>8}")
+        if row['other_errors']:
+            print(f"⚠️  {row['label']}: {row['other_errors']} other database errors")
+
+
+if __name__ == '__main__':
+    main()
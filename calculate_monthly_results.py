@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Calculate monthly results
+Calculates, ranks and stores the monthly results of every active batch (or one
+batch with --batch-id). Each batch is committed on its own. Run it from cron
+at month-end, e.g. "55 23 28-31 * * [ $(date -d tomorrow +\%d) = 01 ] && ...".
+"""
+import argparse
+from datetime import datetime
+
+from app import create_app
+from models import db
+from services.monthly_results import calculate_all_batches, calculate_batch_results
+
+
+def main():
+    now = datetime.utcnow()
+    parser = argparse.ArgumentParser(description='Calculate monthly results for every active batch')
+    parser.add_argument('--year', type=int, default=now.year, help='Year (default: current year)')
+    parser.add_argument('--month', type=int, default=now.month, help='Month 1-12 (default: current month)')
+    parser.add_argument('--batch-id', type=int, default=None, help='Only calculate this batch')
+    args = parser.parse_args()
+
+    if not 1 <= args.month <= 12:
+        parser.error('--month must be between 1 and 12')
+
+    app = create_app()
+    with app.app_context():
+        try:
+            if args.batch_id:
+                calculated = {args.batch_id: len(calculate_batch_results(args.batch_id, args.year, args.month))}
+                db.session.commit()
+            else:
+                calculated = calculate_all_batches(args.year, args.month)
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Monthly result calculation failed: {e}")
+            raise SystemExit(1)
+
+        for batch_id, students in calculated.items():
+            print(f"📊 Batch {batch_id}: {students} result(s)")
+        print(f"✅ Calculated {sum(calculated.values())} result(s) for {args.month:02d}/{args.year} "
+              f"across {len(calculated)} batch(es)")
+
+
+if __name__ == '__main__':
+    main()
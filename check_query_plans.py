@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Check that hot queries are served by an index
+Runs EXPLAIN QUERY PLAN for each hot predicate and fails if SQLite would
+scan every row of the table (or of an index on it). Run after
+migrate_add_hot_indexes.py, migrate_add_fee_periods.py and
+migrate_add_attempt_deadlines.py.
+
+After ANALYZE, SQLite may rightly prefer a scan on a tiny table where one
+value covers every row (e.g. a single batch), so run it on production-sized data.
+"""
+import sys
+from datetime import date, datetime
+
+from sqlalchemy import func, select, text
+
+from app import create_app
+from models import (db, Attendance, AttendanceStatus, Fee, MonthlyMark, MonthlyRanking,
+                    OnlineExamAttempt, SmsLog, SmsStatus, user_batches)
+
+
+def hot_queries():
+    """(label, table, statement) for every query the indexes are meant to serve"""
+    month_start, month_end = date(2025, 3, 1), date(2025, 4, 1)
+    return [
+        ('Marks of one paper', 'monthly_marks',
+         select(func.count(MonthlyMark.id)).where(MonthlyMark.individual_exam_id == 1)),
+        ('One student mark', 'monthly_marks',
+         select(MonthlyMark).where(MonthlyMark.monthly_exam_id == 1, MonthlyMark.individual_exam_id == 2,
+                                   MonthlyMark.user_id == 3)),
+        ('Batch attendance for a day', 'attendance',
+         select(Attendance).where(Attendance.batch_id == 1, Attendance.date == month_start)),
+        ('Student present days in a month', 'attendance',
+         select(func.count()).select_from(Attendance).where(
+             Attendance.user_id == 1, Attendance.batch_id == 2,
+             Attendance.date >= month_start, Attendance.date < month_end,
+             Attendance.status == AttendanceStatus.PRESENT)),
+        ('Student fee for a month', 'fees',
+         select(Fee).where(Fee.user_id == 1, Fee.batch_id == 2, Fee.year == 2025, Fee.month == 3)),
+        ('Batch fee sheet for a year', 'fees',
+         select(Fee).where(Fee.batch_id == 1, Fee.year == 2025)),
+        ('Delivered SMS since a date', 'sms_logs',
+         select(func.count(SmsLog.id)).where(SmsLog.status == SmsStatus.SENT,
+                                             SmsLog.sent_at >= datetime(2025, 3, 1))),
+        ('SMS history of a sender', 'sms_logs',
+         select(SmsLog).where(SmsLog.sent_by == 1).order_by(SmsLog.created_at.desc()).limit(50)),
+        ('Final ranking of an exam', 'monthly_rankings',
+         select(MonthlyRanking).where(MonthlyRanking.monthly_exam_id == 1, MonthlyRanking.is_final == True)
+         .order_by(MonthlyRanking.position)),
+        ('Ongoing attempt of a student', 'online_exam_attempts',
+         select(OnlineExamAttempt).where(OnlineExamAttempt.exam_id == 1, OnlineExamAttempt.student_id == 2,
+                                         OnlineExamAttempt.is_submitted == False)),
+        ('Overdue open attempts', 'online_exam_attempts',
+         select(OnlineExamAttempt.id).where(OnlineExamAttempt.is_submitted == False,
+                                            OnlineExamAttempt.deadline_at <= datetime(2025, 3, 1))
+         .order_by(OnlineExamAttempt.deadline_at).limit(200)),
+        ('Batch roster', 'user_batches',
+         select(user_batches.c.user_id).where(user_batches.c.batch_id == 1)),
+    ]
+
+
+def explain(statement):
+    sql = str(statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+    return [row[-1] for row in db.session.execute(text(f'EXPLAIN QUERY PLAN {sql}')).all()]
+
+
+def main():
+    app = create_app()
+    failures = 0
+    with app.app_context():
+        for label, table, statement in hot_queries():
+            plan = explain(statement)
+            # "SEARCH" seeks into an index; any "SCAN" visits every row of the table or an index
+            full_scan = any(step.startswith(f'SCAN {table}') for step in plan)
+            if full_scan:
+                failures += 1
+                print(f"❌ {label}: {' | '.join(plan)}")
+            else:
+                print(f"✅ {label}: {' | '.join(plan)}")
+
+    if failures:
+        print(f"❌ {failures} hot quer{'y' if failures == 1 else 'ies'} scan a whole table; "
+              f"run the index migrations")
+        sys.exit(1)
+    print("✅ All hot queries use an index")
+
+
+if __name__ == '__main__':
+    main()
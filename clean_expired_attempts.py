@@ -1,63 +1,51 @@
 #!/usr/bin/env python3
 """
 Clean up expired exam attempts
-Run this on VPS to fix "Time has expired" errors
+Auto-submits and grades every open attempt past its deadline, then exits.
+With --watch it keeps sweeping (run it this way, with ATTEMPT_SWEEPER=external
+for the web workers, to sweep from its own process). Run
+migrate_add_attempt_deadlines.py first on databases created before deadlines.
 """
-import sqlite3
-from datetime import datetime
+import argparse
+import json
+import time
 
-# VPS database path
-DB_PATH = '/var/www/saroyarsir/smartgardenhub.db'
+from app import create_app
+from models import db
+from services.attempt_sweeper import drain_expired_attempts, get_sweeper_status
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Auto-submit online exam attempts whose time ran out')
+    parser.add_argument('--watch', action='store_true',
+                        help='Keep sweeping instead of exiting after one pass')
+    parser.add_argument('--interval', type=int, default=None,
+                        help='Seconds between sweeps (default: ATTEMPT_SWEEP_INTERVAL)')
+    parser.add_argument('--batch-size', type=int, default=None,
+                        help='Attempts graded per batch (default: ATTEMPT_SWEEP_BATCH_SIZE)')
+    parser.add_argument('--status', action='store_true',
+                        help='Print the sweeper metrics and overdue backlog, then exit')
+    args = parser.parse_args()
+
+    app = create_app()
+    interval = args.interval or app.config['ATTEMPT_SWEEP_INTERVAL']
+    with app.app_context():
+        if args.status:
+            print(json.dumps(get_sweeper_status(), indent=2, default=str))
+            return
+
+        while True:
+            try:
+                swept = drain_expired_attempts(limit=args.batch_size)
+                if swept or not args.watch:
+                    print(f"✅ Auto-submitted {swept} expired attempt(s)")
+            except Exception as e:
+                db.session.rollback()
+                print(f"❌ Attempt sweep error: {e}")
+            if not args.watch:
+                break
+            time.sleep(interval)
 
-def clean_expired_attempts():
-    """Auto-submit all expired attempts"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # Check what columns exist
-    cursor.execute("PRAGMA table_info(online_exam_attempts)")
-    columns = [row[1] for row in cursor.fetchall()]
-    print(f"Available columns: {columns}")
-    
-    # Find expired attempts
-    cursor.execute("""
-        SELECT a.id, a.exam_id, a.student_id, a.started_at, e.duration
-        FROM online_exam_attempts a
-        JOIN online_exams e ON a.exam_id = e.id
-        WHERE a.is_submitted = 0
-    """)
-    
-    expired = []
-    now = datetime.utcnow()
-    
-    for row in cursor.fetchall():
-        attempt_id, exam_id, student_id, started_at, duration = row
-        started = datetime.fromisoformat(started_at.replace('Z', '+00:00').replace('+00:00', ''))
-        elapsed = (now - started).total_seconds()
-        time_limit = duration * 60
-        
-        if elapsed >= time_limit:
-            expired.append(attempt_id)
-    
-    if expired:
-        print(f"Found {len(expired)} expired attempts to auto-submit")
-        
-        # Auto-submit them - just mark as submitted
-        for attempt_id in expired:
-            cursor.execute("""
-                UPDATE online_exam_attempts 
-                SET is_submitted = 1,
-                    submitted_at = ?
-                WHERE id = ?
-            """, (now, attempt_id))
-            print(f"  ✅ Auto-submitted attempt {attempt_id}")
-        
-        conn.commit()
-        print(f"\n✅ Cleaned {len(expired)} expired attempts")
-    else:
-        print("✅ No expired attempts found")
-    
-    conn.close()
 
 if __name__ == '__main__':
-    clean_expired_attempts()
+    main()
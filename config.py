@@ -2,6 +2,7 @@
 Updated Configuration for SQLite Development
 """
 import os
+import tempfile
 from pathlib import Path
 
 class Config:
@@ -14,11 +15,62 @@ class Config:
     SESSION_PERMANENT = False
     SESSION_USE_SIGNER = True
     SESSION_FILE_THRESHOLD = 500
+    AUTH_PRELOAD_BATCH_IDS = False  # Load a student's active batch ids up front instead of on first use
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))  # Cost of new hashes; logins upgrade other hashes to it
+    
+    # SQLite connection tuning, applied by services/database.py to every new connection
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 15000))  # ms a writer waits for the lock
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))  # bytes
+    SQLITE_CACHE_SIZE = int(os.environ.get('SQLITE_CACHE_SIZE', -64000))  # negative = KiB per connection
     
     # File upload configuration
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
     UPLOAD_FOLDER = 'static/uploads'
 
+    # BulkSMSBD gateway
+    SMS_API_URL = os.environ.get('SMS_API_URL', 'http://bulksmsbd.net/api/smsapi')
+    SMS_API_KEY = os.environ.get('SMS_API_KEY', 'gsOKLO6XtKsANCvgPHNt')
+    SMS_SENDER_ID = os.environ.get('SMS_SENDER_ID', '8809617628909')
+    SMS_API_TIMEOUT = int(os.environ.get('SMS_API_TIMEOUT', 30))
+    SMS_GATEWAY_CONCURRENCY = int(os.environ.get('SMS_GATEWAY_CONCURRENCY', 8))  # Parallel gateway requests per process
+    SMS_GATEWAY_MAX_NUMBERS = 100  # Recipients per comma-separated multi-number request
+
+    # SMS outbox dispatcher: 'thread' drains the outbox inside each web worker,
+    # 'external' leaves it to dispatch_sms_outbox.py running as its own process
+    SMS_DISPATCHER = os.environ.get('SMS_DISPATCHER', 'thread')
+    SMS_DISPATCH_BATCH_SIZE = 100
+    SMS_DISPATCH_MAX_ATTEMPTS = 3
+    SMS_DISPATCH_RETRY_DELAY = 30  # seconds, doubled on every further attempt
+    SMS_DISPATCH_POLL_INTERVAL = 5
+
+    # Online exam answer buffer: answers are journaled to disk per attempt and written
+    # to the database in batches. 'thread' flushes from inside each web worker,
+    # 'external' leaves it to flush_answer_buffer.py running as its own process
+    ANSWER_BUFFER_DIR = os.environ.get('ANSWER_BUFFER_DIR')  # default: <instance>/answer_buffer
+    ANSWER_BUFFER_FLUSHER = os.environ.get('ANSWER_BUFFER_FLUSHER', 'thread')
+    ANSWER_BUFFER_FLUSH_INTERVAL = 10  # seconds
+    ANSWER_BUFFER_MAX_PENDING = 20  # answers one worker buffers for an attempt before flushing it inline
+    ANSWER_BUFFER_FSYNC = True
+
+    # Expired online exam attempts: 'thread' sweeps from one elected web worker,
+    # 'external' leaves it to clean_expired_attempts.py --watch running as its own process
+    ATTEMPT_SWEEPER = os.environ.get('ATTEMPT_SWEEPER', 'thread')
+    ATTEMPT_SWEEP_INTERVAL = 30  # seconds
+    ATTEMPT_SWEEP_GRACE = 60  # seconds past the deadline left for the browser's own auto-submit
+    ATTEMPT_SWEEP_BATCH_SIZE = 200
+    ATTEMPT_SWEEPER_STATUS_FILE = os.environ.get('ATTEMPT_SWEEPER_STATUS_FILE')  # default: <instance>/attempt_sweeper.json
+
+    # Dashboard counts are cached per worker; commits touching users or batches clear it
+    DASHBOARD_CACHE_TTL = int(os.environ.get('DASHBOARD_CACHE_TTL', 30))  # seconds, 0 disables
+
+    # Bulk student imports: 'thread' runs each job on a background thread of the worker
+    # that took the upload, 'inline' runs it inside the request
+    STUDENT_IMPORT_RUNNER = os.environ.get('STUDENT_IMPORT_RUNNER', 'thread')
+    STUDENT_IMPORT_CHUNK_SIZE = 500  # Students inserted and committed together
+    STUDENT_IMPORT_HASH_WORKERS = int(os.environ.get('STUDENT_IMPORT_HASH_WORKERS', 0))  # 0 = one per CPU
+
 class DevelopmentConfig(Config):
     """Development configuration with SQLite"""
     DEBUG = True
@@ -39,8 +91,29 @@ class ProductionConfig(Config):
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_ECHO = False
 
+class TestingConfig(Config):
+    """Testing configuration with in-memory SQLite"""
+    TESTING = True
+    
+    SQLALCHEMY_DATABASE_URI = "sqlite://"
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ECHO = False
+    SESSION_FILE_DIR = os.path.join(tempfile.gettempdir(), 'smartgardenhub_test_sessions')
+
+    # Tests drive the dispatcher explicitly
+    SMS_DISPATCHER = 'external'
+    SMS_DISPATCH_RETRY_DELAY = 0
+    ANSWER_BUFFER_DIR = os.path.join(tempfile.gettempdir(), 'smartgardenhub_test_answers')
+    ANSWER_BUFFER_FLUSHER = 'external'
+    ATTEMPT_SWEEPER = 'external'
+    ATTEMPT_SWEEPER_STATUS_FILE = os.path.join(tempfile.gettempdir(), 'smartgardenhub_test_sweeper.json')
+    STUDENT_IMPORT_RUNNER = 'inline'
+    BCRYPT_LOG_ROUNDS = 4
+    STUDENT_IMPORT_HASH_WORKERS = 1
+
 config_by_name = {
     'development': DevelopmentConfig,
     'production': ProductionConfig,
+    'testing': TestingConfig,
     'default': DevelopmentConfig
 }
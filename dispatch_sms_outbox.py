@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Drain the SMS outbox
+Run as a long-lived process (with SMS_DISPATCHER=external for the web workers)
+or once with --once to flush whatever is due
+"""
+import argparse
+import time
+
+from app import create_app
+from models import db
+from services.sms_dispatcher import drain_outbox
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Send queued SMS messages from the outbox')
+    parser.add_argument('--once', action='store_true',
+                        help='Drain due messages once and exit')
+    parser.add_argument('--interval', type=int, default=None,
+                        help='Seconds between polls (default: SMS_DISPATCH_POLL_INTERVAL)')
+    parser.add_argument('--batch-size', type=int, default=None,
+                        help='Messages claimed per batch (default: SMS_DISPATCH_BATCH_SIZE)')
+    args = parser.parse_args()
+
+    app = create_app()
+    interval = args.interval or app.config['SMS_DISPATCH_POLL_INTERVAL']
+    with app.app_context():
+        while True:
+            try:
+                processed = drain_outbox(limit=args.batch_size)
+                if processed:
+                    print(f"✅ Processed {processed} queued SMS message(s)")
+            except Exception as e:
+                db.session.rollback()
+                print(f"❌ SMS dispatch error: {e}")
+            if args.once:
+                break
+            time.sleep(interval)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Flush buffered online exam answers
+Run as a long-lived process (with ANSWER_BUFFER_FLUSHER=external for the web workers)
+or once with --once, e.g. after a crash, to write every journaled answer to the database
+"""
+import argparse
+import time
+
+from app import create_app
+from models import db
+from services.answer_buffer import flush_buffered_answers
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write buffered online exam answers to the database')
+    parser.add_argument('--once', action='store_true',
+                        help='Flush every journal once and exit')
+    parser.add_argument('--interval', type=int, default=None,
+                        help='Seconds between flushes (default: ANSWER_BUFFER_FLUSH_INTERVAL)')
+    args = parser.parse_args()
+
+    app = create_app()
+    interval = args.interval or app.config['ANSWER_BUFFER_FLUSH_INTERVAL']
+    with app.app_context():
+        while True:
+            try:
+                written = flush_buffered_answers()
+                if written:
+                    print(f"✅ Flushed {written} buffered answer(s)")
+            except Exception as e:
+                db.session.rollback()
+                print(f"❌ Answer buffer flush error: {e}")
+            if args.once:
+                break
+            time.sleep(interval)
+
+
+if __name__ == '__main__':
+    main()
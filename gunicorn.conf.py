@@ -66,6 +66,10 @@ def pre_fork(server, worker):
 
 def post_fork(server, worker):
     """Called just after a worker has been forked."""
+    # Each worker opens its own SQLite connections; pools inherited from the
+    # preloaded master are discarded (services/database.py does this at fork)
+    from services.database import dispose_engines_after_fork
+    dispose_engines_after_fork()
     server.log.info(f"Worker spawned (pid: {worker.pid})")
 
 def worker_abort(worker):
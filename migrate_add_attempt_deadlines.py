@@ -0,0 +1,62 @@
+"""
+Migration script for online exam attempt deadlines
+Adds online_exam_attempts.deadline_at (started_at + the exam's duration),
+backfills it for existing attempts and indexes it with is_submitted, so the
+expired-attempt sweeper finds overdue attempts with an index range search.
+New attempts get their deadline in start_exam. Safe to run repeatedly.
+"""
+from app import create_app
+from models import db
+from sqlalchemy import text, inspect
+
+INDEXES = [
+    ('ix_online_exam_attempts_open_deadline', 'is_submitted, deadline_at'),
+]
+
+
+def migrate():
+    """Add, backfill and index the attempt deadline column"""
+    app = create_app()
+    with app.app_context():
+        try:
+            inspector = inspect(db.engine)
+            columns = [col['name'] for col in inspector.get_columns('online_exam_attempts')]
+
+            if 'deadline_at' in columns:
+                print("✅ Column 'deadline_at' already exists in online_exam_attempts table")
+            else:
+                print("📝 Adding 'deadline_at' column to online_exam_attempts table...")
+                db.session.execute(text('ALTER TABLE online_exam_attempts ADD COLUMN deadline_at DATETIME'))
+
+            print("📝 Backfilling attempt deadlines from started_at and exam duration...")
+            result = db.session.execute(text("""
+                UPDATE online_exam_attempts
+                SET deadline_at = (
+                    SELECT strftime('%Y-%m-%d %H:%M:%f', online_exam_attempts.started_at,
+                                    '+' || online_exams.duration || ' minutes')
+                    FROM online_exams
+                    WHERE online_exams.id = online_exam_attempts.exam_id
+                )
+                WHERE deadline_at IS NULL AND started_at IS NOT NULL
+            """))
+            print(f"✅ Backfilled {result.rowcount} attempt(s)")
+
+            indexes = [index['name'] for index in inspector.get_indexes('online_exam_attempts')]
+            for name, cols in INDEXES:
+                if name in indexes:
+                    print(f"✅ Index '{name}' already exists")
+                    continue
+                print(f"📝 Creating index '{name}'...")
+                db.session.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON online_exam_attempts ({cols})'))
+
+            db.session.commit()
+            db.session.execute(text('ANALYZE online_exam_attempts'))
+            db.session.commit()
+            print("✅ Attempt deadline migration complete!")
+
+        except Exception as e:
+            print(f"❌ Error during migration: {e}")
+            db.session.rollback()
+
+if __name__ == '__main__':
+    migrate()
@@ -0,0 +1,44 @@
+"""
+Migration script for denormalized batch student counters
+Adds active_students_count, archived_students_count and total_students_count
+to batches and counts them from user_batches, so batch lists no longer load
+every enrollment. Session listeners keep them current from then on.
+Safe to run repeatedly; every run recounts all batches.
+"""
+from app import create_app
+from models import db
+from sqlalchemy import text, inspect
+
+COUNTER_COLUMNS = ('active_students_count', 'archived_students_count', 'total_students_count')
+
+
+def migrate():
+    """Add and recount the batch student counters"""
+    app = create_app()
+    with app.app_context():
+        try:
+            inspector = inspect(db.engine)
+            columns = [col['name'] for col in inspector.get_columns('batches')]
+
+            for column in COUNTER_COLUMNS:
+                if column in columns:
+                    print(f"✅ Column '{column}' already exists in batches table")
+                else:
+                    print(f"📝 Adding '{column}' column to batches table...")
+                    db.session.execute(text(
+                        f'ALTER TABLE batches ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0'
+                    ))
+
+            print("📝 Counting students per batch...")
+            from services.batch_counters import recount_batches
+            recount_batches(db.session.connection())
+
+            db.session.commit()
+            print("✅ Batch student counter migration complete!")
+
+        except Exception as e:
+            print(f"❌ Error during migration: {e}")
+            db.session.rollback()
+
+if __name__ == '__main__':
+    migrate()
@@ -0,0 +1,47 @@
+"""
+Migration script for denormalized online exam question counts
+Adds online_exams.questions_count and sets it from online_questions, so the
+exam listing no longer counts every exam's questions on each load. Question
+adds and deletes keep it current from then on. Safe to run repeatedly; every
+run recounts, which also repairs any drift.
+"""
+from app import create_app
+from models import db
+from sqlalchemy import text, inspect
+
+
+def migrate():
+    """Add and recount online_exams.questions_count"""
+    app = create_app()
+    with app.app_context():
+        try:
+            inspector = inspect(db.engine)
+            columns = [col['name'] for col in inspector.get_columns('online_exams')]
+
+            if 'questions_count' in columns:
+                print("✅ Column 'questions_count' already exists in online_exams table")
+            else:
+                print("📝 Adding 'questions_count' column to online_exams table...")
+                db.session.execute(text(
+                    'ALTER TABLE online_exams ADD COLUMN questions_count INTEGER NOT NULL DEFAULT 0'
+                ))
+
+            print("📝 Counting questions per exam...")
+            result = db.session.execute(text("""
+                UPDATE online_exams
+                SET questions_count = (
+                    SELECT COUNT(*) FROM online_questions
+                    WHERE online_questions.exam_id = online_exams.id
+                )
+            """))
+            print(f"✅ Recounted {result.rowcount} exam(s)")
+
+            db.session.commit()
+            print("✅ Exam question count migration complete!")
+
+        except Exception as e:
+            print(f"❌ Error during migration: {e}")
+            db.session.rollback()
+
+if __name__ == '__main__':
+    migrate()
@@ -0,0 +1,73 @@
+"""
+Migration script for fee billing periods
+Adds fees.year and fees.month, backfills them from due_date and indexes them,
+so month/year fee lookups are equality checks on an index instead of
+strftime() over every row. New and edited fees keep the columns in step
+through Fee's due_date validator. Safe to run repeatedly.
+"""
+from app import create_app
+from models import db
+from sqlalchemy import text, inspect
+
+COLUMNS = [
+    ('year', 'INTEGER'),
+    ('month', 'INTEGER'),
+]
+
+INDEXES = [
+    ('ix_fees_user_batch_period', 'user_id, batch_id, year, month'),
+    ('ix_fees_batch_period', 'batch_id, year, month'),
+]
+
+# Replaced by the period indexes
+OBSOLETE_INDEXES = ['ix_fees_user_batch_due']
+
+
+def migrate():
+    """Add, backfill and index the fee period columns"""
+    app = create_app()
+    with app.app_context():
+        try:
+            inspector = inspect(db.engine)
+            columns = [col['name'] for col in inspector.get_columns('fees')]
+
+            for name, ddl in COLUMNS:
+                if name in columns:
+                    print(f"✅ Column '{name}' already exists in fees table")
+                    continue
+                print(f"📝 Adding '{name}' column to fees table...")
+                db.session.execute(text(f'ALTER TABLE fees ADD COLUMN {name} {ddl}'))
+
+            print("📝 Backfilling fee periods from due_date...")
+            result = db.session.execute(text("""
+                UPDATE fees
+                SET year = CAST(strftime('%Y', due_date) AS INTEGER),
+                    month = CAST(strftime('%m', due_date) AS INTEGER)
+                WHERE due_date IS NOT NULL AND (year IS NULL OR month IS NULL)
+            """))
+            print(f"✅ Backfilled {result.rowcount} fee(s)")
+
+            indexes = [index['name'] for index in inspector.get_indexes('fees')]
+            for name, cols in INDEXES:
+                if name in indexes:
+                    print(f"✅ Index '{name}' already exists")
+                    continue
+                print(f"📝 Creating index '{name}'...")
+                db.session.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON fees ({cols})'))
+
+            for name in OBSOLETE_INDEXES:
+                if name in indexes:
+                    print(f"🗑️  Dropping superseded index '{name}'...")
+                    db.session.execute(text(f'DROP INDEX IF EXISTS {name}'))
+
+            db.session.commit()
+            db.session.execute(text('ANALYZE fees'))
+            db.session.commit()
+            print("✅ Fee period migration complete!")
+
+        except Exception as e:
+            print(f"❌ Error during migration: {e}")
+            db.session.rollback()
+
+if __name__ == '__main__':
+    migrate()
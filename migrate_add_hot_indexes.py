@@ -0,0 +1,71 @@
+"""
+Migration script for composite indexes on hot query predicates
+Creates the indexes declared in models.py __table_args__ on existing databases
+(db.create_all() only adds them to new tables). Safe to run repeatedly.
+Fee period indexes come with migrate_add_fee_periods.py.
+Run check_query_plans.py afterwards to confirm the hot queries use them.
+"""
+from app import create_app
+from models import db
+from sqlalchemy import text, inspect
+
+INDEXES = [
+    ('monthly_marks', 'ix_monthly_marks_individual_user', 'individual_exam_id, user_id'),
+    ('monthly_marks', 'ix_monthly_marks_exam_user', 'monthly_exam_id, user_id'),
+    ('attendance', 'ix_attendance_batch_date', 'batch_id, date'),
+    ('attendance', 'ix_attendance_user_batch_date_status', 'user_id, batch_id, date, status'),
+    ('sms_logs', 'ix_sms_logs_status_sent_at', 'status, sent_at'),
+    ('sms_logs', 'ix_sms_logs_sender_created', 'sent_by, created_at'),
+    ('monthly_rankings', 'ix_monthly_rankings_exam_final_position', 'monthly_exam_id, is_final, position'),
+    ('online_exam_attempts', 'idx_exam_student_submitted', 'exam_id, student_id, is_submitted'),
+    ('user_batches', 'ix_user_batches_batch', 'batch_id, user_id'),
+]
+
+# Superseded by a wider index above
+OBSOLETE_INDEXES = [
+    ('online_exam_attempts', 'idx_exam_student'),
+]
+
+
+def migrate():
+    """Create missing composite indexes and refresh planner statistics"""
+    app = create_app()
+    with app.app_context():
+        try:
+            inspector = inspect(db.engine)
+            tables = set(inspector.get_table_names())
+            created = 0
+
+            for table, name, cols in INDEXES:
+                if table not in tables:
+                    print(f"⚠️  Table '{table}' does not exist, skipping '{name}'")
+                    continue
+                existing = [index['name'] for index in inspector.get_indexes(table)]
+                if name in existing:
+                    print(f"✅ Index '{name}' already exists")
+                    continue
+                print(f"📝 Creating index '{name}' on {table} ({cols})...")
+                db.session.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({cols})'))
+                created += 1
+
+            for table, name in OBSOLETE_INDEXES:
+                if table in tables and name in [index['name'] for index in inspector.get_indexes(table)]:
+                    print(f"🗑️  Dropping superseded index '{name}'...")
+                    db.session.execute(text(f'DROP INDEX IF EXISTS {name}'))
+
+            db.session.commit()
+
+            if created:
+                # Let the SQLite planner see the new indexes' selectivity
+                print("📊 Running ANALYZE...")
+                db.session.execute(text('ANALYZE'))
+                db.session.commit()
+
+            print(f"✅ Index migration complete! ({created} created)")
+
+        except Exception as e:
+            print(f"❌ Error during migration: {e}")
+            db.session.rollback()
+
+if __name__ == '__main__':
+    migrate()
@@ -0,0 +1,36 @@
+"""
+Migration script for the SMS balance ledger
+Adds sms_jobs.reserved_cost and seeds the sms_balance row from the legacy
+'sms_balance' Settings value. The sms_balance and sms_balance_entries tables
+are created by db.create_all() in create_app().
+"""
+from app import create_app
+from models import db
+from sqlalchemy import text, inspect
+
+def migrate():
+    """Add reserved_cost to sms_jobs and open the balance ledger"""
+    app = create_app()
+    with app.app_context():
+        try:
+            inspector = inspect(db.engine)
+            columns = [col['name'] for col in inspector.get_columns('sms_jobs')]
+
+            if 'reserved_cost' in columns:
+                print("✅ Column 'reserved_cost' already exists in sms_jobs table")
+            else:
+                print("📝 Adding 'reserved_cost' column to sms_jobs table...")
+                db.session.execute(text('ALTER TABLE sms_jobs ADD COLUMN reserved_cost INTEGER DEFAULT 0'))
+                db.session.commit()
+
+            from services.sms_balance import get_balance
+            balance = get_balance()
+            db.session.commit()
+            print(f"✅ SMS balance ledger ready: {balance.balance} SMS ({balance.reserved} reserved)")
+
+        except Exception as e:
+            print(f"❌ Error during migration: {e}")
+            db.session.rollback()
+
+if __name__ == '__main__':
+    migrate()
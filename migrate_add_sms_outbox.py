@@ -0,0 +1,55 @@
+"""
+Migration script to turn sms_logs into an SMS outbox
+Adds job_id, attempts, next_attempt_at and claim_token columns plus their indexes.
+The sms_jobs table itself is created by db.create_all() in create_app().
+"""
+from app import create_app
+from models import db
+from sqlalchemy import text, inspect
+
+COLUMNS = [
+    ('job_id', 'INTEGER REFERENCES sms_jobs(id)'),
+    ('attempts', 'INTEGER NOT NULL DEFAULT 0'),
+    ('next_attempt_at', 'DATETIME'),
+    ('claim_token', 'VARCHAR(32)'),
+]
+
+INDEXES = [
+    ('ix_sms_logs_job_id', 'job_id'),
+    ('ix_sms_logs_claim_token', 'claim_token'),
+    ('ix_sms_logs_outbox', 'status, next_attempt_at'),
+]
+
+
+def migrate():
+    """Add outbox columns and indexes to the sms_logs table"""
+    app = create_app()
+    with app.app_context():
+        try:
+            inspector = inspect(db.engine)
+            columns = [col['name'] for col in inspector.get_columns('sms_logs')]
+
+            for name, ddl in COLUMNS:
+                if name in columns:
+                    print(f"✅ Column '{name}' already exists in sms_logs table")
+                    continue
+                print(f"📝 Adding '{name}' column to sms_logs table...")
+                db.session.execute(text(f'ALTER TABLE sms_logs ADD COLUMN {name} {ddl}'))
+
+            indexes = [index['name'] for index in inspector.get_indexes('sms_logs')]
+            for name, cols in INDEXES:
+                if name in indexes:
+                    print(f"✅ Index '{name}' already exists")
+                    continue
+                print(f"📝 Creating index '{name}'...")
+                db.session.execute(text(f'CREATE INDEX {name} ON sms_logs ({cols})'))
+
+            db.session.commit()
+            print("✅ SMS outbox migration complete!")
+
+        except Exception as e:
+            print(f"❌ Error during migration: {e}")
+            db.session.rollback()
+
+if __name__ == '__main__':
+    migrate()
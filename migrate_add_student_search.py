@@ -0,0 +1,36 @@
+"""
+Migration script for the student search index
+Creates the student_search FTS5 table (trigram tokenizer) and fills it with
+every active student, so the student list can search on the server instead
+of downloading every student. Session listeners keep it current from then on.
+Safe to run repeatedly; every run rebuilds the index.
+"""
+from app import create_app
+from models import db
+
+
+def migrate():
+    """Create and rebuild the student search index"""
+    app = create_app()
+    with app.app_context():
+        try:
+            from services.student_search import create_search_table, reindex_students
+            connection = db.session.connection()
+
+            print("📝 Creating student_search table...")
+            if not create_search_table(connection):
+                print("⚠️ FTS5 with the trigram tokenizer is not available; search will use ILIKE")
+                return
+
+            print("📝 Indexing students...")
+            indexed = reindex_students(connection)
+
+            db.session.commit()
+            print(f"✅ Student search migration complete! ({indexed} students indexed)")
+
+        except Exception as e:
+            print(f"❌ Error during migration: {e}")
+            db.session.rollback()
+
+if __name__ == '__main__':
+    migrate()
@@ -6,6 +6,7 @@ from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime, date
 from enum import Enum
 from sqlalchemy import Numeric
+from sqlalchemy.orm import validates
 import json
 
 db = SQLAlchemy()
@@ -38,6 +39,12 @@ class FeeStatus(Enum):
     PAID = "paid"
     OVERDUE = "overdue"
 
+class ImportJobStatus(Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
 class SmsStatus(Enum):
     PENDING = "pending"
     SENT = "sent"
@@ -53,7 +60,9 @@ user_batches = db.Table('user_batches',
     db.Column('user_id', db.Integer, db.ForeignKey('users.id'), primary_key=True),
     db.Column('batch_id', db.Integer, db.ForeignKey('batches.id'), primary_key=True),
     db.Column('enrollment_date', db.DateTime, default=datetime.utcnow),
-    db.Column('is_active', db.Boolean, default=True)
+    db.Column('is_active', db.Boolean, default=True),
+    # The primary key leads with user_id; batch rosters look up by batch_id
+    db.Index('ix_user_batches_batch', 'batch_id', 'user_id')
 )
 
 exam_batches = db.Table('exam_batches',
@@ -123,14 +132,19 @@ class User(db.Model):
             return self._student_id
         # Generate based on ID and year
         if self.id and self.role == UserRole.STUDENT:
-            year = self.created_at.year if self.created_at else datetime.now().year
-            return f"STU{year}{self.id:04d}"
+            return self.format_student_id(self.id, self.created_at)
         return None
     
     @student_id.setter
     def student_id(self, value):
         self._student_id = value
     
+    @classmethod
+    def format_student_id(cls, user_id, created_at=None):
+        """Student ID for a user id and creation time, for rows loaded without the model"""
+        year = created_at.year if created_at else datetime.now().year
+        return f"STU{year}{user_id:04d}"
+    
     def __repr__(self):
         return f'<User {self.phone}: {self.full_name}>'
 
@@ -155,6 +169,10 @@ class Batch(db.Model):
     archived_at = db.Column(db.DateTime, nullable=True)
     archived_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
     archive_reason = db.Column(db.Text, nullable=True)
+    # Student member counters, recounted by services.batch_counters
+    active_students_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    archived_students_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    total_students_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -168,7 +186,7 @@ class Batch(db.Model):
     @property
     def current_students(self):
         """Count of currently enrolled students"""
-        return len([s for s in self.students if s.is_active])
+        return self.active_students_count or 0
     
     @property
     def monthly_fee(self):
@@ -293,6 +311,9 @@ class Fee(db.Model):
     exam_fee = db.Column(Numeric(10, 2), default=0.00)  # New: Exam fee
     others_fee = db.Column(Numeric(10, 2), default=0.00)  # New: Others fee
     due_date = db.Column(db.Date, nullable=False)
+    # Billing period, derived from due_date so month lookups are indexed equality checks
+    year = db.Column(db.Integer, nullable=True)
+    month = db.Column(db.Integer, nullable=True)
     paid_date = db.Column(db.Date, nullable=True)
     status = db.Column(db.Enum(FeeStatus), default=FeeStatus.PENDING)
     payment_method = db.Column(db.String(50), nullable=True)
@@ -307,6 +328,20 @@ class Fee(db.Model):
     user = db.relationship('User', back_populates='fees')
     batch = db.relationship('Batch', back_populates='fees')
     
+    __table_args__ = (
+        db.Index('ix_fees_user_batch_period', 'user_id', 'batch_id', 'year', 'month'),
+        db.Index('ix_fees_batch_period', 'batch_id', 'year', 'month'),
+    )
+    
+    @validates('due_date')
+    def _set_period(self, key, due_date):
+        """Keep year/month in step with due_date on every write"""
+        if isinstance(due_date, str):
+            due_date = date.fromisoformat(due_date)
+        self.year = due_date.year if due_date else None
+        self.month = due_date.month if due_date else None
+        return due_date
+    
     def __repr__(self):
         return f'<Fee {self.user_id} - {self.amount}>'
 
@@ -325,13 +360,103 @@ class SmsLog(db.Model):
     sent_at = db.Column(db.DateTime, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Outbox fields (rows queued by an SmsJob are delivered by the SMS dispatcher)
+    job_id = db.Column(db.Integer, db.ForeignKey('sms_jobs.id'), nullable=True, index=True)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    next_attempt_at = db.Column(db.DateTime, nullable=True)
+    claim_token = db.Column(db.String(32), nullable=True, index=True)
+    
     # Relationships
     user = db.relationship('User', back_populates='sms_logs', foreign_keys=[user_id])
     sent_by_user = db.relationship('User', foreign_keys=[sent_by])
+    job = db.relationship('SmsJob', back_populates='messages')
+    
+    __table_args__ = (
+        db.Index('ix_sms_logs_outbox', 'status', 'next_attempt_at'),
+        db.Index('ix_sms_logs_status_sent_at', 'status', 'sent_at'),
+        db.Index('ix_sms_logs_sender_created', 'sent_by', 'created_at'),
+    )
     
     def __repr__(self):
         return f'<SmsLog {self.phone_number}: {self.status}>'
 
+class SmsJob(db.Model):
+    """A queued bulk SMS send; its messages are SmsLog rows drained by the dispatcher"""
+    __tablename__ = 'sms_jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    source = db.Column(db.String(50), nullable=False)  # bulk, attendance, absent_attendance, exam_result
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    charge_sender = db.Column(db.Boolean, default=False)  # Deduct delivered messages from creator's sms_count
+    total = db.Column(db.Integer, default=0)
+    reserved_cost = db.Column(db.Integer, default=0)  # SMS credits held on the balance until the job settles
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime, nullable=True)
+    
+    # Relationships
+    creator = db.relationship('User', foreign_keys=[created_by])
+    messages = db.relationship('SmsLog', back_populates='job', lazy='dynamic')
+    
+    def __repr__(self):
+        return f'<SmsJob {self.id} {self.source}: {self.total}>'
+
+class StudentImportJob(db.Model):
+    """A bulk student import running in the background; progress is polled from any worker"""
+    __tablename__ = 'student_import_jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(255), nullable=True)
+    status = db.Column(db.Enum(ImportJobStatus), nullable=False, default=ImportJobStatus.PENDING)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    processed = db.Column(db.Integer, nullable=False, default=0)  # Rows validated and written or rejected
+    succeeded = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    errors = db.Column(db.Text, nullable=True)  # JSON list of rejected rows
+    results = db.Column(db.Text, nullable=True)  # JSON list of created students
+    message = db.Column(db.Text, nullable=True)  # Why the job failed as a whole
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    completed_at = db.Column(db.DateTime, nullable=True)
+    
+    creator = db.relationship('User', foreign_keys=[created_by])
+    
+    def __repr__(self):
+        return f'<StudentImportJob {self.id} {self.status.value}: {self.processed}/{self.total}>'
+
+class SmsBalance(db.Model):
+    """Running SMS credit total (single row, only changed with atomic UPDATEs)"""
+    __tablename__ = 'sms_balance'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    balance = db.Column(db.Integer, nullable=False, default=0)
+    reserved = db.Column(db.Integer, nullable=False, default=0)  # Held by queued SMS jobs
+    total_used = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    @property
+    def available(self):
+        return self.balance - self.reserved
+    
+    def __repr__(self):
+        return f'<SmsBalance {self.balance} ({self.reserved} reserved)>'
+
+class SmsBalanceEntry(db.Model):
+    """Ledger of SMS balance movements"""
+    __tablename__ = 'sms_balance_entries'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    entry_type = db.Column(db.String(20), nullable=False)  # reserve, settle, charge, adjust
+    balance_change = db.Column(db.Integer, nullable=False, default=0)
+    reserved_change = db.Column(db.Integer, nullable=False, default=0)
+    job_id = db.Column(db.Integer, db.ForeignKey('sms_jobs.id'), nullable=True, index=True)
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    memo = db.Column(db.String(255), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    def __repr__(self):
+        return f'<SmsBalanceEntry {self.entry_type}: {self.balance_change}>'
+
 class Attendance(db.Model):
     """Attendance tracking model"""
     __tablename__ = 'attendance'
@@ -353,11 +478,35 @@ class Attendance(db.Model):
     batch = db.relationship('Batch', back_populates='attendance_records')
     marked_by_user = db.relationship('User', foreign_keys=[marked_by])
     
-    __table_args__ = (db.UniqueConstraint('user_id', 'batch_id', 'date', name='unique_user_batch_date'),)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'batch_id', 'date', name='unique_user_batch_date'),
+        db.Index('ix_attendance_batch_date', 'batch_id', 'date'),
+        # Covers per-student present/absent counts without touching the table
+        db.Index('ix_attendance_user_batch_date_status', 'user_id', 'batch_id', 'date', 'status'),
+    )
     
     def __repr__(self):
         return f'<Attendance {self.user_id} - {self.date}: {self.status}>'
 
+class AttendanceMonth(db.Model):
+    """Cached attendance matrix of one batch and month: a status string per student"""
+    __tablename__ = 'attendance_months'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    batch_id = db.Column(db.Integer, db.ForeignKey('batches.id'), nullable=False)
+    year = db.Column(db.Integer, nullable=False)
+    month = db.Column(db.Integer, nullable=False)
+    days = db.Column(db.Integer, nullable=False)
+    # {"<user_id>": "PPA.L..."}: one character per day of the month, '.' when unmarked
+    statuses = db.Column(db.JSON, nullable=False, default=dict)
+    version = db.Column(db.Integer, default=0, nullable=False)  # Bumped on every incremental update
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (db.UniqueConstraint('batch_id', 'year', 'month', name='unique_attendance_month'),)
+    
+    def __repr__(self):
+        return f'<AttendanceMonth batch={self.batch_id} {self.year}-{self.month:02d}>'
+
 class MonthlyResult(db.Model):
     """Monthly result calculation model"""
     __tablename__ = 'monthly_results'
@@ -540,7 +689,12 @@ class MonthlyMark(db.Model):
     individual_exam = db.relationship('IndividualExam', back_populates='monthly_marks')
     user = db.relationship('User')
     
-    __table_args__ = (db.UniqueConstraint('monthly_exam_id', 'individual_exam_id', 'user_id', name='unique_monthly_mark'),)
+    __table_args__ = (
+        db.UniqueConstraint('monthly_exam_id', 'individual_exam_id', 'user_id', name='unique_monthly_mark'),
+        # The unique index leads with monthly_exam_id; per-paper lookups need their own
+        db.Index('ix_monthly_marks_individual_user', 'individual_exam_id', 'user_id'),
+        db.Index('ix_monthly_marks_exam_user', 'monthly_exam_id', 'user_id'),
+    )
     
     def __repr__(self):
         return f'<MonthlyMark {self.user_id} - {self.marks_obtained}/{self.total_marks}>'
@@ -593,12 +747,35 @@ class MonthlyRanking(db.Model):
     monthly_exam = db.relationship('MonthlyExam')
     user = db.relationship('User')
     
-    __table_args__ = (db.UniqueConstraint('monthly_exam_id', 'user_id', name='unique_monthly_ranking'),)
+    __table_args__ = (
+        db.UniqueConstraint('monthly_exam_id', 'user_id', name='unique_monthly_ranking'),
+        db.Index('ix_monthly_rankings_exam_final_position', 'monthly_exam_id', 'is_final', 'position'),
+    )
     
     def __repr__(self):
         return f'<MonthlyRanking {self.position} - User {self.user_id}>'
 
 
+class MonthlyRankingSnapshot(db.Model):
+    """Materialized comprehensive ranking for a monthly exam, rebuilt when dirty"""
+    __tablename__ = 'monthly_ranking_snapshots'
+
+    id = db.Column(db.Integer, primary_key=True)
+    monthly_exam_id = db.Column(db.Integer, db.ForeignKey('monthly_exams.id'), nullable=False, unique=True)
+    batch_id = db.Column(db.Integer, db.ForeignKey('batches.id'), nullable=False, index=True)
+    payload = db.Column(db.JSON, nullable=True)  # {'individual_exams': [...], 'rankings': [...]}
+    is_dirty = db.Column(db.Boolean, default=True, nullable=False, index=True)
+    version = db.Column(db.Integer, default=0, nullable=False)  # Bumped on every invalidation
+    built_at = db.Column(db.DateTime, nullable=True)
+    dirtied_at = db.Column(db.DateTime, nullable=True)
+
+    # Relationships
+    monthly_exam = db.relationship('MonthlyExam')
+
+    def __repr__(self):
+        return f'<MonthlyRankingSnapshot exam={self.monthly_exam_id} dirty={self.is_dirty}>'
+
+
 class Document(db.Model):
     """PDF/Document storage for online exams and study materials"""
     __tablename__ = 'documents'
@@ -659,6 +836,7 @@ class OnlineExam(db.Model):
     chapter_name = db.Column(db.String(255), nullable=False)  # e.g., "Chapter 1: Motion"
     duration = db.Column(db.Integer, nullable=False)  # Duration in minutes
     total_questions = db.Column(db.Integer, nullable=False)  # Max 40
+    questions_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Questions added so far
     pass_percentage = db.Column(db.Float, default=40.0)  # Minimum percentage to pass
     allow_retake = db.Column(db.Boolean, default=True)  # Allow students to retake
     is_active = db.Column(db.Boolean, default=True)
@@ -717,13 +895,17 @@ class OnlineExamAttempt(db.Model):
     total_marks = db.Column(db.Integer, default=0)  # Total possible marks
     percentage = db.Column(db.Float, default=0.0)
     is_passed = db.Column(db.Boolean, default=False)
+    deadline_at = db.Column(db.DateTime, nullable=True)  # started_at + exam duration; swept once passed
     
     # Relationships
     exam = db.relationship('OnlineExam', back_populates='attempts')
     student = db.relationship('User', foreign_keys=[student_id])
     answers = db.relationship('OnlineStudentAnswer', back_populates='attempt', cascade='all, delete-orphan')
     
-    __table_args__ = (db.Index('idx_exam_student', 'exam_id', 'student_id'),)
+    __table_args__ = (
+        db.Index('idx_exam_student_submitted', 'exam_id', 'student_id', 'is_submitted'),
+        db.Index('ix_online_exam_attempts_open_deadline', 'is_submitted', 'deadline_at'),
+    )
     
     def __repr__(self):
         return f'<OnlineExamAttempt {self.id} - Student {self.student_id} - Exam {self.exam_id}>'
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Rebuild dirty monthly ranking snapshots
+Run once (e.g. from cron) or with --interval to keep snapshots warm in the background
+"""
+import argparse
+import time
+
+from app import create_app
+from services.ranking_snapshots import rebuild_dirty_snapshots
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rebuild dirty monthly ranking snapshots')
+    parser.add_argument('--interval', type=int, default=0,
+                        help='Seconds between ticks; 0 runs a single pass')
+    parser.add_argument('--limit', type=int, default=50,
+                        help='Maximum snapshots rebuilt per tick')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        while True:
+            rebuilt = rebuild_dirty_snapshots(limit=args.limit)
+            if rebuilt:
+                print(f"✅ Rebuilt {rebuilt} ranking snapshot(s)")
+            if not args.interval:
+                break
+            time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Reconcile batch student counters
+Compares every batch's active/archived/total student counters with its
+enrollment in user_batches and repairs the ones that drifted (e.g. after
+raw SQL edits or imports that bypass the ORM). Use --dry-run to only report.
+"""
+import argparse
+
+from app import create_app
+from models import db
+from services.batch_counters import find_count_drift, reconcile_batch_counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Repair drifted batch student counters')
+    parser.add_argument('--dry-run', action='store_true', help='Report drift without repairing it')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        try:
+            drift = find_count_drift() if args.dry_run else reconcile_batch_counts()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Reconciliation failed: {e}")
+            raise SystemExit(1)
+
+        for row in drift:
+            print(f"⚠️  Batch {row['batch_id']}: active {row['active_students_count']}→{row['actual_active_students_count']}, "
+                  f"archived {row['archived_students_count']}→{row['actual_archived_students_count']}, "
+                  f"total {row['total_students_count']}→{row['actual_total_students_count']}")
+        if not drift:
+            print("✅ All batch counters match their enrollment")
+        elif args.dry_run:
+            print(f"📝 {len(drift)} batch(es) drifted; run without --dry-run to repair")
+        else:
+            print(f"✅ Repaired {len(drift)} batch(es)")
+
+
+if __name__ == '__main__':
+    main()
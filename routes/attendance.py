@@ -2,27 +2,57 @@
 Attendance Management Routes - Enhanced for Mobile & PC Responsiveness
 """
 from flask import Blueprint, request
-from models import db, Attendance, User, Batch, UserRole, AttendanceStatus
-from utils.auth import login_required, require_role, get_current_user
-from utils.response import success_response, error_response
+from models import db, Attendance, User, Batch, UserRole, AttendanceStatus, user_batches
+from utils.auth import login_required, require_role, get_current_user, get_current_user_batch_ids
+from utils.upsert import bulk_upsert
+from utils.response import (success_response, error_response, cursor_response, ndjson_response,
+                            encode_cursor, decode_cursor)
+from services.ranking_snapshots import mark_batch_rankings_dirty
+from services.attendance_matrix import get_month_matrix, record_marks, decode_statuses
+from services.sms_dispatcher import enqueue_sms
+from services.sms_balance import InsufficientSmsBalance
 from datetime import datetime, timedelta
-from sqlalchemy import func, and_, extract
+from sqlalchemy import func, extract, tuple_
 import calendar
 
 attendance_bp = Blueprint('attendance', __name__)
 
+ATTENDANCE_PAGE_SIZE = 500
+ATTENDANCE_MAX_PAGE_SIZE = 2000
+
+def _notification_phones(student):
+    """Distinct guardian and student phone numbers for an attendance SMS"""
+    phone_numbers = []
+    if student.guardian_phone:
+        phone_numbers.append(student.guardian_phone)
+    if student.phone and student.phone not in phone_numbers:
+        phone_numbers.append(student.phone)
+    return phone_numbers
+
 @attendance_bp.route('', methods=['GET'])
 @login_required
 def get_attendance():
-    """Get attendance records with enhanced filtering"""
+    """
+    Get attendance records with enhanced filtering
+    Pages are keyset-paginated on (date, id), newest first: pass pagination.next_cursor
+    back as ?cursor= for the next page. ?format=ndjson streams every matching record
+    (from the cursor on) as one JSON object per line, for large exports.
+    """
     try:
         current_user = get_current_user()
         batch_id = request.args.get('batch_id', type=int)
         date_str = request.args.get('date')
         start_date_str = request.args.get('start_date')
         end_date_str = request.args.get('end_date')
+        cursor = request.args.get('cursor')
+        stream = request.args.get('format') == 'ndjson'
+        limit = min(max(request.args.get('limit', ATTENDANCE_PAGE_SIZE, type=int), 1), ATTENDANCE_MAX_PAGE_SIZE)
         
-        query = Attendance.query
+        # Project only the columns the response needs; names come from the join, not lazy loads
+        query = db.session.query(
+            Attendance.id, Attendance.user_id, Attendance.batch_id, Attendance.date, Attendance.status,
+            User.first_name, User.last_name, Batch.name.label('batch_name')
+        ).join(User, Attendance.user_id == User.id).join(Batch, Attendance.batch_id == Batch.id)
         
         if current_user.role == UserRole.STUDENT:
             query = query.filter(Attendance.user_id == current_user.id)
@@ -53,34 +83,112 @@ def get_attendance():
             except ValueError:
                 return error_response('Invalid end_date format. Use YYYY-MM-DD', 400)
         
-        # Join with User and Batch tables for filtering
-        query = query.join(User, Attendance.user_id == User.id).join(Batch, Attendance.batch_id == Batch.id)
-        records = query.order_by(Attendance.date.desc()).all()
-        
-        attendance_records = []
-        for record in records:
-            record_data = {
-                'id': record.id,
-                'userId': record.user_id,
-                'batchId': record.batch_id,
-                'date': record.date.isoformat(),
-                'status': record.status.value,
-                'user': {
-                    'firstName': record.user.first_name,
-                    'lastName': record.user.last_name,
-                    'fullName': record.user.full_name
-                },
-                'batch': {
-                    'name': record.batch.name
-                }
-            }
-            attendance_records.append(record_data)
+        # Resume after the last row of the previous page
+        if cursor:
+            try:
+                cursor_date, cursor_id = decode_cursor(cursor)
+                cursor_date = datetime.strptime(cursor_date, '%Y-%m-%d').date()
+                cursor_id = int(cursor_id)
+            except (ValueError, TypeError):
+                return error_response('Invalid cursor', 400)
+            query = query.filter(tuple_(Attendance.date, Attendance.id) < (cursor_date, cursor_id))
         
-        return success_response('Attendance retrieved', attendance_records)
+        query = query.order_by(Attendance.date.desc(), Attendance.id.desc())
+        
+        if stream:
+            rows = (_attendance_row(row) for row in query.yield_per(1000))
+            return ndjson_response(rows, filename='attendance.ndjson')
+        
+        rows = query.limit(limit + 1).all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1].date, rows[-1].id)
+        
+        return cursor_response([_attendance_row(row) for row in rows], next_cursor, limit,
+                               'Attendance retrieved')
         
     except Exception as e:
         return error_response(f'Failed to retrieve attendance: {str(e)}', 500)
 
+def _attendance_row(row):
+    """JSON shape of one projected attendance row"""
+    return {
+        'id': row.id,
+        'userId': row.user_id,
+        'batchId': row.batch_id,
+        'date': row.date.isoformat(),
+        'status': row.status.value,
+        'user': {
+            'firstName': row.first_name,
+            'lastName': row.last_name,
+            'fullName': f"{row.first_name} {row.last_name}"
+        },
+        'batch': {
+            'name': row.batch_name
+        }
+    }
+
+def _save_attendance(batch_id, attendance_date, attendance_data, marked_by):
+    """
+    Upsert one day's attendance for the students of a batch with a constant number of
+    queries: one roster query, one existing-records query and one executemany upsert.
+    Entries for students outside the batch or with an unknown status are skipped.
+    Returns [{'student', 'status', 'action'}] in payload order; the caller commits.
+    """
+    valid_statuses = {status.value for status in AttendanceStatus}
+    entries = {}
+    for student_attendance in attendance_data:
+        user_id = student_attendance.get('userId')
+        status = str(student_attendance.get('status') or 'present').lower()
+        if not user_id or status not in valid_statuses:
+            continue
+        try:
+            entries[int(user_id)] = status
+        except (TypeError, ValueError):
+            continue
+    
+    if not entries:
+        return []
+    
+    roster = {student.id: student for student in User.query.join(
+        user_batches, user_batches.c.user_id == User.id
+    ).filter(
+        user_batches.c.batch_id == batch_id,
+        User.id.in_(entries.keys())
+    ).all()}
+    
+    existing = {user_id for (user_id,) in db.session.query(Attendance.user_id).filter(
+        Attendance.batch_id == batch_id,
+        Attendance.date == attendance_date,
+        Attendance.user_id.in_(roster.keys())
+    ).all()}
+    
+    now = datetime.utcnow()
+    rows = []
+    attendance_updates = []
+    for user_id, status in entries.items():
+        student = roster.get(user_id)
+        if student is None:
+            continue
+        rows.append({
+            'user_id': user_id,
+            'batch_id': batch_id,
+            'date': attendance_date,
+            'status': AttendanceStatus(status),
+            'marked_by': marked_by,
+            'created_at': now,
+            'updated_at': now
+        })
+        attendance_updates.append({
+            'student': student,
+            'status': status,
+            'action': 'updated' if user_id in existing else 'created'
+        })
+    
+    bulk_upsert(Attendance, rows, ('user_id', 'batch_id', 'date'), ('status', 'marked_by', 'updated_at'))
+    return attendance_updates
+
 @attendance_bp.route('/bulk', methods=['POST'])
 @login_required
 @require_role(UserRole.TEACHER, UserRole.SUPER_USER)
@@ -104,143 +212,53 @@ def bulk_mark_attendance():
         if not batch:
             return error_response('Batch not found', 404)
         
-        attendance_updates = []
+        attendance_updates = _save_attendance(batch_id, attendance_date, attendance_data, current_user.id)
         
-        for student_attendance in attendance_data:
-            user_id = student_attendance.get('userId')
-            status = student_attendance.get('status', 'present')
-            
-            if not user_id:
-                continue
-                
-            # Validate user is in the batch
-            user = User.query.get(user_id)
-            if not user or batch not in user.batches:
-                continue
-            
-            existing = Attendance.query.filter_by(
-                user_id=user_id,
-                batch_id=batch_id,
-                date=attendance_date
-            ).first()
-            
-            if existing:
-                existing.status = AttendanceStatus(status)
-                existing.marked_by = current_user.id
-                existing.updated_at = datetime.utcnow()
-                attendance_updates.append({
-                    'student': user,
-                    'status': status,
-                    'action': 'updated'
-                })
-            else:
-                new_attendance = Attendance(
-                    user_id=user_id,
-                    batch_id=batch_id,
-                    date=attendance_date,
-                    status=AttendanceStatus(status),
-                    marked_by=current_user.id,
-                    created_at=datetime.utcnow()
-                )
-                db.session.add(new_attendance)
-                attendance_updates.append({
-                    'student': user,
-                    'status': status,
-                    'action': 'created'
-                })
+        # Present-day counts feed that month's exam rankings
+        record_marks(batch_id, attendance_date,
+                     {update['student'].id: AttendanceStatus(update['status']) for update in attendance_updates})
+        mark_batch_rankings_dirty(batch_id, attendance_date.year, attendance_date.month)
         
-        db.session.commit()
-        
-        # Send SMS notifications if requested
-        sms_sent = 0
-        sms_sent_numbers = []
+        # Compose SMS notifications if requested, while the roster is still loaded
+        outbox = []
         if send_sms and attendance_updates:
-            # Import SMS sending function (no balance check - API handles it)
-            from routes.sms import send_sms_via_api
-            from models import SmsLog, SmsStatus
+            from flask import session
+            custom_templates = session.get('custom_templates', {})
+            present_template = custom_templates.get('attendance_present', 'Dear Parent, {student_name} was PRESENT today in {batch_name} on {date}. Keep up the good work!')
+            absent_template = custom_templates.get('attendance_absent', 'Dear Parent, {student_name} was ABSENT today in {batch_name} on {date}. Please ensure regular attendance.')
             
+            # Never queue more messages than the teacher's remaining SMS balance
+            available = max(0, current_user.sms_count or 0)
             for update in attendance_updates:
                 student = update['student']
-                status = update['status']
-                
-                # Prepare SMS message using templates
-                from flask import session
-                custom_templates = session.get('custom_templates', {})
-                
-                # Get the appropriate template based on attendance status
-                if status.lower() == 'present':
-                    template = custom_templates.get('attendance_present', 'Dear Parent, {student_name} was PRESENT today in {batch_name} on {date}. Keep up the good work!')
-                else:  # absent
-                    template = custom_templates.get('attendance_absent', 'Dear Parent, {student_name} was ABSENT today in {batch_name} on {date}. Please ensure regular attendance.')
-                
-                # Replace template variables with actual data
+                template = present_template if update['status'].lower() == 'present' else absent_template
                 message = template.format(
                     student_name=student.full_name,
                     batch_name=batch.name,
                     date=attendance_date.strftime('%d/%m/%Y')
                 )
-                
-                # Collect phone numbers to send SMS
-                phone_numbers = []
-                
-                # Add guardian/parent phone number if exists
-                if hasattr(student, 'guardian_phone') and student.guardian_phone:
-                    phone_numbers.append(student.guardian_phone)
-                
-                # Add student's own phone number
-                if student.phone:
-                    phone_numbers.append(student.phone)
-                
-                # Remove duplicates
-                phone_numbers = list(set(phone_numbers))
-                
-                # Send SMS to each phone number
-                for phone in phone_numbers:
-                    if not phone:
-                        continue
-                    
-                    # Check if teacher still has SMS balance
-                    if current_user.sms_count <= 0:
-                        break
-                    
-                    try:
-                        # Send SMS
-                        result = send_sms_via_api(phone, message)
-                        
-                        # Calculate SMS cost based on message content
-                        from routes.sms import calculate_sms_cost, deduct_sms_balance
-                        sms_cost = calculate_sms_cost(message) if result.get('success') else 0
-                        
-                        # Create SMS log
-                        sms_log = SmsLog(
-                            user_id=student.id,
-                            phone_number=phone,
-                            message=message,
-                            status=SmsStatus.SENT if result.get('success') else SmsStatus.FAILED,
-                            sent_by=current_user.id,
-                            api_response=result,
-                            cost=sms_cost,
-                            sent_at=datetime.utcnow() if result.get('success') else None
-                        )
-                        db.session.add(sms_log)
-                        
-                        if result.get('success'):
-                            # Deduct from local balance
-                            deduct_sms_balance(sms_cost)
-                            sms_sent += 1
-                            sms_sent_numbers.append(phone)
-                            # Deduct 1 SMS from teacher's balance
-                            current_user.sms_count -= 1
-                            
-                    except Exception as sms_error:
-                        print(f"Failed to send SMS to {phone}: {sms_error}")
-            
-            # Commit SMS logs and balance update
-            db.session.commit()
+                for phone in _notification_phones(student):
+                    if len(outbox) < available:
+                        outbox.append({'phone': phone, 'message': message, 'user_id': student.id})
+        
+        db.session.commit()
+        
+        # Queue them; the SMS dispatcher delivers them
+        sms_job = None
+        sms_error = None
+        if send_sms and attendance_updates:
+            try:
+                sms_job = enqueue_sms(outbox, current_user.id, 'attendance', charge_sender=True)
+                db.session.commit()
+            except InsufficientSmsBalance as e:
+                db.session.rollback()
+                sms_error = str(e)
         
         response_data = {
             'attendance_marked': len(attendance_updates),
-            'sms_sent': sms_sent,
+            'sms_queued': sms_job.total if sms_job else 0,
+            'sms_job_id': sms_job.id if sms_job else None,
+            'sms_error': sms_error,
             'sms_balance': current_user.sms_count,
             'date': attendance_date.isoformat(),
             'batch_name': batch.name
@@ -274,150 +292,58 @@ def bulk_mark_attendance_send_absent_sms():
         if not batch:
             return error_response('Batch not found', 404)
         
-        attendance_updates = []
-        absent_students = []
+        attendance_updates = _save_attendance(batch_id, attendance_date, attendance_data, current_user.id)
+        absent_students = [update['student'] for update in attendance_updates
+                           if update['status'] == AttendanceStatus.ABSENT.value]
         
-        # Process all attendance data
-        for student_attendance in attendance_data:
-            user_id = student_attendance.get('userId')
-            status = student_attendance.get('status', 'present')
-            
-            if not user_id:
-                continue
-                
-            # Validate user is in the batch
-            user = User.query.get(user_id)
-            if not user or batch not in user.batches:
-                continue
-            
-            existing = Attendance.query.filter_by(
-                user_id=user_id,
-                batch_id=batch_id,
-                date=attendance_date
-            ).first()
-            
-            if existing:
-                existing.status = AttendanceStatus(status)
-                existing.marked_by = current_user.id
-                existing.updated_at = datetime.utcnow()
-                attendance_updates.append({
-                    'student': user,
-                    'status': status,
-                    'action': 'updated'
-                })
-            else:
-                new_attendance = Attendance(
-                    user_id=user_id,
-                    batch_id=batch_id,
-                    date=attendance_date,
-                    status=AttendanceStatus(status),
-                    marked_by=current_user.id,
-                    created_at=datetime.utcnow()
-                )
-                db.session.add(new_attendance)
-                attendance_updates.append({
-                    'student': user,
-                    'status': status,
-                    'action': 'created'
-                })
-            
-            # Collect absent students
-            if status.lower() == 'absent':
-                absent_students.append(user)
-        
-        db.session.commit()
-        
-        # Send SMS only to absent students
-        sms_sent = 0
-        sms_failed = 0
+        record_marks(batch_id, attendance_date,
+                     {update['student'].id: AttendanceStatus(update['status']) for update in attendance_updates})
+        mark_batch_rankings_dirty(batch_id, attendance_date.year, attendance_date.month)
         
+        # Compose messages while the roster is still loaded; the commit expires it
+        outbox = []
         if absent_students:
-            # Check teacher's SMS balance
-            # Import SMS sending function (no balance check - API handles it)
-            from routes.sms import send_sms_via_api
-            from models import SmsLog, SmsStatus
+            from flask import session
+            custom_templates = session.get('custom_templates', {})
+            template = custom_templates.get(
+                'attendance_absent', 
+                'Dear Parent, {student_name} was ABSENT today in {batch_name} on {date}. Please ensure regular attendance.'
+            )
             
             for student in absent_students:
-                # Get absent message template
-                from flask import session
-                custom_templates = session.get('custom_templates', {})
-                template = custom_templates.get(
-                    'attendance_absent', 
-                    'Dear Parent, {student_name} was ABSENT today in {batch_name} on {date}. Please ensure regular attendance.'
-                )
-                
-                # Replace template variables with actual data
                 message = template.format(
                     student_name=student.full_name,
                     batch_name=batch.name,
                     date=attendance_date.strftime('%d/%m/%Y')
                 )
-                
-                # Collect phone numbers to send SMS
-                phone_numbers = []
-                
-                # Add guardian/parent phone number if exists
-                if hasattr(student, 'guardian_phone') and student.guardian_phone:
-                    phone_numbers.append(student.guardian_phone)
-                
-                # Add student's own phone number
-                if student.phone:
-                    phone_numbers.append(student.phone)
-                
-                # Remove duplicates
-                phone_numbers = list(set(phone_numbers))
-                
-                # Send SMS to each phone number
-                for phone in phone_numbers:
-                    if not phone:
-                        continue
-                    
-                    try:
-                        # Send SMS
-                        result = send_sms_via_api(phone, message)
-                        
-                        # Calculate SMS cost based on message content
-                        from routes.sms import calculate_sms_cost, deduct_sms_balance
-                        sms_cost = calculate_sms_cost(message) if result.get('success') else 0
-                        
-                        # Create SMS log
-                        sms_log = SmsLog(
-                            user_id=student.id,
-                            phone_number=phone,
-                            message=message,
-                            status=SmsStatus.SENT if result.get('success') else SmsStatus.FAILED,
-                            sent_by=current_user.id,
-                            api_response=result,
-                            cost=sms_cost,
-                            sent_at=datetime.utcnow() if result.get('success') else None
-                        )
-                        db.session.add(sms_log)
-                        
-                        if result.get('success'):
-                            # Deduct from local balance
-                            deduct_sms_balance(sms_cost)
-                            sms_sent += 1
-                        else:
-                            sms_failed += 1
-                            
-                    except Exception as sms_error:
-                        print(f"Failed to send SMS to {phone}: {sms_error}")
-                        sms_failed += 1
-            
-            # Commit SMS logs and balance update
-            db.session.commit()
+                for phone in _notification_phones(student):
+                    outbox.append({'phone': phone, 'message': message, 'user_id': student.id})
+        
+        db.session.commit()
+        
+        # Queue SMS only to absent students; the SMS dispatcher delivers them
+        sms_job = None
+        sms_error = None
+        if absent_students:
+            try:
+                sms_job = enqueue_sms(outbox, current_user.id, 'absent_attendance')
+                db.session.commit()
+            except InsufficientSmsBalance as e:
+                db.session.rollback()
+                sms_error = str(e)
         
         response_data = {
             'attendance_marked': len(attendance_updates),
             'absent_count': len(absent_students),
-            'sms_sent': sms_sent,
-            'sms_failed': sms_failed,
+            'sms_queued': sms_job.total if sms_job else 0,
+            'sms_job_id': sms_job.id if sms_job else None,
+            'sms_error': sms_error,
             'sms_balance': current_user.sms_count,
             'date': attendance_date.isoformat(),
             'batch_name': batch.name
         }
         
-        return success_response('Attendance marked and SMS sent to absent students', response_data)
+        return success_response('Attendance marked and SMS queued for absent students', response_data)
         
     except Exception as e:
         db.session.rollback()
@@ -426,91 +352,77 @@ def bulk_mark_attendance_send_absent_sms():
 @attendance_bp.route('/monthly', methods=['GET'])
 @login_required
 def get_monthly_attendance():
-    """Get monthly attendance sheet data"""
+    """
+    Get monthly attendance sheet data, served from the cached month matrix.
+    ?format=compact returns one status string per student ('P', 'A', 'L', '.' per day)
+    instead of a per-day dict.
+    """
     try:
         current_user = get_current_user()
         batch_id = request.args.get('batch_id', type=int)
         month = request.args.get('month', type=int)
         year = request.args.get('year', type=int)
-        
-        print(f"🔍 Monthly attendance request - batch_id: {batch_id}, month: {month}, year: {year}")
+        compact = request.args.get('format') == 'compact'
         
         if not batch_id or not month or not year:
-            print(f"❌ Missing parameters - batch_id: {batch_id}, month: {month}, year: {year}")
             return error_response('Batch ID, month, and year are required', 400)
         
+        if not (1 <= month <= 12):
+            return error_response('Month must be between 1 and 12', 400)
+        
         if current_user.role == UserRole.STUDENT:
             # Students can only view their own batch attendance
-            user_batch_ids = [b.id for b in current_user.batches if b.is_active]
+            user_batch_ids = get_current_user_batch_ids()
             if batch_id not in user_batch_ids:
                 return error_response('Access denied', 403)
         
         # Get batch
         batch = Batch.query.get(batch_id)
         if not batch:
-            print(f"❌ Batch not found for ID: {batch_id}")
-            print(f"📋 Available batches: {[(b.id, b.name) for b in Batch.query.all()]}")
             return error_response('Batch not found', 404)
         
-        print(f"✅ Found batch: {batch.name} (ID: {batch.id})")
-        
         # Get students in batch
-        students = User.query.join(User.batches).filter(
+        students = db.session.query(User.id, User.first_name, User.last_name, User.created_at).join(User.batches).filter(
             User.role == UserRole.STUDENT,
             User.is_active == True,
             User.is_archived == False,
             Batch.id == batch_id
         ).order_by(User.first_name, User.last_name).all()
         
-        # Get days in month
-        days_in_month = calendar.monthrange(year, month)[1]
-        days = list(range(1, days_in_month + 1))
-        
-        # Get attendance records for the month
-        start_date = datetime(year, month, 1).date()
-        end_date = datetime(year, month, days_in_month).date()
+        matrix = get_month_matrix(batch_id, year, month)
+        statuses = matrix.statuses or {}
+        days = matrix.days
+        db.session.commit()  # Keep a freshly built matrix
         
-        attendance_records = Attendance.query.filter(
-            and_(
-                Attendance.batch_id == batch_id,
-                Attendance.date >= start_date,
-                Attendance.date <= end_date
-            )
-        ).all()
-        
-        # Organize attendance by student and date
-        attendance_map = {}
-        for record in attendance_records:
-            key = f"{record.user_id}_{record.date.day}"
-            attendance_map[key] = record.status.value
-        
-        # Build response data
         students_data = []
         for student in students:
-            attendance_dict = {}
-            for day in days:
-                key = f"{student.id}_{day}"
-                attendance_dict[day] = attendance_map.get(key, None)
-            
-            students_data.append({
+            student_data = {
                 'id': student.id,
-                'name': student.full_name,
-                'student_id': getattr(student, 'student_id', ''),
-                'attendance': attendance_dict
-            })
+                'name': f"{student.first_name} {student.last_name}",
+                # Same value as User.student_id for a student without an explicit ID
+                'student_id': User.format_student_id(student.id, student.created_at)
+            }
+            if compact:
+                student_data['statuses'] = statuses.get(str(student.id)) or '.' * days
+            else:
+                student_data['attendance'] = decode_statuses(statuses.get(str(student.id)), days)
+            students_data.append(student_data)
         
         month_data = {
             'students': students_data,
-            'days': days,
+            'days': list(range(1, days + 1)),
             'month': month,
             'year': year,
             'month_name': calendar.month_name[month],
             'batch_name': batch.name
         }
+        if compact:
+            month_data['legend'] = {'P': 'present', 'A': 'absent', 'L': 'late', '.': None}
         
         return success_response('Monthly attendance retrieved', month_data)
         
     except Exception as e:
+        db.session.rollback()
         return error_response(f'Failed to retrieve monthly attendance: {str(e)}', 500)
 
 @attendance_bp.route('/summary', methods=['GET'])
@@ -3,15 +3,27 @@ Authentication Routes
 Login, logout, and session management
 """
 from flask import Blueprint, request, jsonify, session, redirect, url_for, flash
-from werkzeug.security import generate_password_hash
-from models import db, User, UserRole
-from utils.auth import login_required, require_role
+from models import db, User, UserRole, Batch, user_batches
+from utils.auth import (login_required, require_role, get_current_user as get_session_user,
+                        generate_password_hash, verify_password)
 from utils.response import success_response, error_response
 import re
 from datetime import datetime
 
 auth_bp = Blueprint('auth', __name__)
 
+def _batches_by_student(users):
+    """{user_id: [batch rows]} for the students sharing a login phone, from one query"""
+    rows = db.session.query(
+        user_batches.c.user_id, Batch.id, Batch.name, Batch.description, Batch.fee_amount, Batch.is_active
+    ).join(Batch, Batch.id == user_batches.c.batch_id).filter(
+        user_batches.c.user_id.in_([u.id for u in users])
+    ).order_by(user_batches.c.user_id, Batch.id).all()
+    batches = {}
+    for row in rows:
+        batches.setdefault(row.user_id, []).append(row)
+    return batches
+
 def validate_phone(phone):
     """Validate Bangladeshi phone number format"""
     # Remove any spaces or special characters
@@ -63,7 +75,7 @@ def login():
                 return redirect(url_for('templates.login'))
         
         # Find all users with this phone number (for shared parent numbers)
-        users = User.query.filter_by(phoneNumber=formatted_phone, is_active=True).all()
+        users = User.query.filter_by(phoneNumber=formatted_phone, is_active=True).order_by(User.id).all()
         
         if not users:
             if request.is_json:
@@ -92,41 +104,15 @@ def login():
         
         # Check password based on user role
         password_valid = False
-
-        # Helper to verify hashed passwords handling str and bytes, and multiple hashing backends
-        def verify_hash(stored_hash, plain_password):
-            # Normalize bytes to str where possible
-            try:
-                if isinstance(stored_hash, (bytes, bytearray)):
-                    stored_hash = stored_hash.decode('utf-8')
-            except Exception:
-                pass
-
-            # Try werkzeug first (usually for werkzeug-generated hashes)
-            try:
-                from werkzeug.security import check_password_hash as werk_check
-                try:
-                    if isinstance(stored_hash, str):
-                        return werk_check(stored_hash, plain_password)
-                except Exception:
-                    pass
-            except Exception:
-                pass
-
-            # Fallback to bcrypt-based checker from utils.auth
-            try:
-                from utils.auth import check_password_hash as bcrypt_check
-                return bool(bcrypt_check(stored_hash, plain_password))
-            except Exception:
-                return False
+        needs_rehash = False
 
         if user.role == UserRole.STUDENT:
             # For students: only accept "student123" as password
             password_valid = (password == "student123")
         else:
-            # For teachers and super users, check hashed password
+            # For teachers and super users: one check with the scheme the stored hash names
             if user.password_hash:
-                password_valid = verify_hash(user.password_hash, password)
+                password_valid, needs_rehash = verify_password(user.password_hash, password)
         
         if not password_valid:
             # Handle error response based on request type
@@ -137,10 +123,15 @@ def login():
                 flash('Invalid phone number or password. Please try again.', 'error')
                 return redirect(url_for('templates.login'))
         
-        # Update last login
+        # Update last login, moving legacy or differently-costed hashes to the configured bcrypt cost
         user.last_login = datetime.utcnow()
+        if needs_rehash:
+            user.password_hash = generate_password_hash(password)
         db.session.commit()
         
+        # Batches of every student on this phone, in one query
+        student_batches = _batches_by_student(users) if user.role == UserRole.STUDENT else {}
+        
         # Create session (match TypeScript session structure)
         # For multi-student accounts, combine all students' names
         if len(users) > 1:
@@ -165,22 +156,17 @@ def login():
             'isArchived': user.is_archived or False
         }
         
-        # Safely get batch IDs for students - collect from ALL students with this phone
+        # Batch IDs for students - collect from ALL students with this phone
         if user.role == UserRole.STUDENT:
-            try:
-                all_batch_ids = []
-                for student_user in users:
-                    user_batches = student_user.batches if hasattr(student_user, 'batches') else []
-                    for batch in user_batches:
-                        if batch.id not in all_batch_ids:
-                            all_batch_ids.append(batch.id)
-                
-                if all_batch_ids:
-                    session_user['batchId'] = all_batch_ids[0]  # First batch for backward compatibility
-                    session_user['allBatchIds'] = all_batch_ids  # All batches for multi-batch support
-            except Exception as e:
-                print(f"Error getting batches: {str(e)}")
-                pass  # Leave batchId as None if there's any issue
+            all_batch_ids = []
+            for student_user in users:
+                for batch in student_batches.get(student_user.id, []):
+                    if batch.id not in all_batch_ids:
+                        all_batch_ids.append(batch.id)
+            
+            if all_batch_ids:
+                session_user['batchId'] = all_batch_ids[0]  # First batch for backward compatibility
+                session_user['allBatchIds'] = all_batch_ids  # All batches for multi-batch support
         
         # Set session data for both template and API compatibility
         session['user'] = session_user
@@ -217,10 +203,9 @@ def login():
             
             for student in users:
                 try:
-                    student_batches = student.batches if hasattr(student, 'batches') else []
                     batches_list = []
                     
-                    for batch in student_batches:
+                    for batch in student_batches.get(student.id, []):
                         if batch.is_active and batch.id not in all_batch_ids:
                             all_batch_ids.add(batch.id)
                             all_batches.append({
@@ -322,8 +307,7 @@ def logout():
 def get_current_user():
     """Get current user information"""
     try:
-        user_id = session.get('user_id')
-        user = User.query.get(user_id)
+        user = get_session_user()
         
         if not user:
             return error_response('User not found', 404)
@@ -365,8 +349,7 @@ def get_current_user():
 def change_password():
     """Change user password (for teachers and super users only)"""
     try:
-        user_id = session.get('user_id')
-        user = User.query.get(user_id)
+        user = get_session_user()
         
         if not user:
             return error_response('User not found', 404)
@@ -382,7 +365,7 @@ def change_password():
             return error_response('Current password and new password are required', 400)
         
         # Verify current password
-        if not user.password_hash or not verify_hash(user.password_hash, current_password):
+        if not user.password_hash or not verify_password(user.password_hash, current_password)[0]:
             return error_response('Current password is incorrect', 401)
         
         # Validate new password
@@ -409,7 +392,7 @@ def check_session():
         if not user_id:
             return error_response('No active session', 401)
         
-        user = User.query.get(user_id)
+        user = get_session_user()
         
         if not user or not user.is_active:
             session.clear()
@@ -4,11 +4,13 @@ CRUD operations for batches and student enrollment
 """
 from flask import Blueprint, request
 from models import db, Batch, User, UserRole, user_batches
-from utils.auth import login_required, require_role, get_current_user
+from utils.auth import login_required, require_role, get_current_user, get_current_user_batch_ids
 from utils.response import success_response, error_response, paginated_response, serialize_batch
-from sqlalchemy import or_
+from sqlalchemy import or_, and_
 from datetime import datetime, date
 from decimal import Decimal
+import hashlib
+import json
 
 batches_bp = Blueprint('batches', __name__)
 
@@ -54,7 +56,7 @@ def get_batches():
                 batch_info['class'] = class_name
             
             # Add current student count
-            batch_info['currentStudents'] = len([s for s in batch.students if s.is_active])
+            batch_info['currentStudents'] = batch.active_students_count
             batch_info['maxStudents'] = batch.max_students or 50
             
             batches_data.append(batch_info)
@@ -285,10 +287,9 @@ def delete_batch(batch_id):
         if not batch:
             return error_response('Batch not found', 404)
         
-        # Check if batch has students enrolled
-        active_students = [s for s in batch.students if s.is_active]
-        if active_students:
-            return error_response(f'Cannot delete batch with {len(active_students)} active students. Please remove students first.', 400)
+        # Check if batch has students enrolled; archived ones keep their enrollment too
+        if batch.total_students_count:
+            return error_response(f'Cannot delete batch with {batch.total_students_count} enrolled students (including archived). Please remove students first.', 400)
         
         # Hard delete - permanently remove from database
         batch_name = batch.name
@@ -314,55 +315,65 @@ def get_batch_students(batch_id):
     try:
         from models import MonthlyExam, MonthlyRanking
         
-        batch = Batch.query.get(batch_id)
-        
-        if not batch:
-            return error_response('Batch not found', 404)
-        
-        # Find most recent monthly exam for this batch with finalized rankings
-        most_recent_exam = MonthlyExam.query.filter_by(
-            batch_id=batch_id
+        # Most recent monthly exam of this batch; its final positions are the roll numbers
+        most_recent_exam_id = db.session.query(MonthlyExam.id).filter(
+            MonthlyExam.batch_id == batch_id
         ).order_by(
             MonthlyExam.year.desc(),
-            MonthlyExam.month.desc()
-        ).first()
-        
-        # Build a map of user_id to current rank from most recent exam
-        rank_map = {}
-        if most_recent_exam:
-            rankings = MonthlyRanking.query.filter_by(
-                monthly_exam_id=most_recent_exam.id,
-                is_final=True
-            ).all()
-            
-            for ranking in rankings:
-                if ranking.position:
-                    rank_map[ranking.user_id] = ranking.position  # Use position as current rank
+            MonthlyExam.month.desc(),
+            MonthlyExam.id.desc()
+        ).limit(1).scalar_subquery()
+        
+        # One query: members, their current rank, ordered by rank (unranked last)
+        rows = db.session.query(
+            User.id, User.phoneNumber, User.first_name, User.last_name, User.email, User.role,
+            User.guardian_phone, User.emergency_contact, User.created_at,
+            MonthlyRanking.position
+        ).join(
+            user_batches, user_batches.c.user_id == User.id
+        ).outerjoin(MonthlyRanking, and_(
+            MonthlyRanking.user_id == User.id,
+            MonthlyRanking.monthly_exam_id == most_recent_exam_id,
+            MonthlyRanking.is_final == True
+        )).filter(
+            user_batches.c.batch_id == batch_id,
+            User.is_active == True,
+            User.is_archived == False
+        ).order_by(
+            MonthlyRanking.position.is_(None),
+            MonthlyRanking.position,
+            User.id
+        ).all()
+        
+        if not rows and not db.session.query(Batch.id).filter_by(id=batch_id).first():
+            return error_response('Batch not found', 404)
         
         students = []
-        for student in batch.students:
-            if student.is_active and not student.is_archived:
-                student_data = {
-                    'id': student.id,
-                    'phoneNumber': student.phoneNumber,  # Correct field name
-                    'phone': student.phoneNumber,  # Add alias for compatibility
-                    'first_name': student.first_name,
-                    'last_name': student.last_name,
-                    'full_name': student.full_name,
-                    'email': student.email,
-                    'student_id': student.student_id,  # Generated student ID property
-                    'guardian_phone': student.guardian_phone,
-                    'emergency_contact': student.emergency_contact,
-                    'created_at': student.created_at.isoformat(),
-                    'roll_number': rank_map.get(student.id),  # Current rank as roll number
-                    'current_rank': rank_map.get(student.id)  # Current rank
-                }
-                students.append(student_data)
-        
-        # Sort students by current rank (students without rank go to the end)
-        students.sort(key=lambda s: (s['current_rank'] is None, s['current_rank'] if s['current_rank'] else 999999))
-        
-        return success_response('Batch students retrieved', {'students': students})
+        for row in rows:
+            rank = row.position or None
+            students.append({
+                'id': row.id,
+                'phoneNumber': row.phoneNumber,  # Correct field name
+                'phone': row.phoneNumber,  # Add alias for compatibility
+                'first_name': row.first_name,
+                'last_name': row.last_name,
+                'full_name': f"{row.first_name} {row.last_name}",
+                'email': row.email,
+                # Same as the User.student_id property
+                'student_id': User.format_student_id(row.id, row.created_at) if row.role == UserRole.STUDENT else None,
+                'guardian_phone': row.guardian_phone,
+                'emergency_contact': row.emergency_contact,
+                'created_at': row.created_at.isoformat() if row.created_at else None,
+                'roll_number': rank,  # Current rank as roll number
+                'current_rank': rank  # Current rank
+            })
+        
+        # The attendance, fee and marks screens refetch this often; let them revalidate
+        etag = hashlib.sha1(json.dumps(students, sort_keys=True).encode('utf-8')).hexdigest()[:20]
+        response, _ = success_response('Batch students retrieved', {'students': students})
+        response.set_etag(f'roster-{batch_id}-{etag}')
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response.make_conditional(request)
         
     except Exception as e:
         return error_response(f'Failed to get batch students: {str(e)}', 500)
@@ -439,17 +450,14 @@ def remove_student_from_batch(batch_id, student_id):
 def get_my_batches():
     """Get current student's batches"""
     try:
-        current_user = get_current_user()
-        
         batches = []
-        for batch in current_user.batches:
-            if batch.is_active:
-                batch_data = serialize_batch(batch)
-                
-                # Add student-specific information
-                batch_data['enrollment_date'] = None  # This would need to be added to the association table
-                
-                batches.append(batch_data)
+        for batch in Batch.query.filter(Batch.id.in_(get_current_user_batch_ids())).order_by(Batch.id).all():
+            batch_data = serialize_batch(batch)
+            
+            # Add student-specific information
+            batch_data['enrollment_date'] = None  # This would need to be added to the association table
+            
+            batches.append(batch_data)
         
         return success_response('Student batches retrieved', {'batches': batches})
         
@@ -472,7 +480,7 @@ def get_active_batches():
                 'fee_amount': float(batch.fee_amount),
                 'start_date': batch.start_date.isoformat(),
                 'end_date': batch.end_date.isoformat() if batch.end_date else None,
-                'student_count': len([s for s in batch.students if s.is_active and not s.is_archived])
+                'student_count': batch.active_students_count
             }
             batches_data.append(batch_data)
         
@@ -606,9 +614,8 @@ def get_archived_batches():
                 batch_data['archived_by_name'] = 'Unknown'
             
             # Count archived students in this batch
-            archived_student_count = len([s for s in batch.students if s.is_archived and s.role == UserRole.STUDENT])
-            batch_data['archived_students_count'] = archived_student_count
-            batch_data['total_students_count'] = len([s for s in batch.students if s.role == UserRole.STUDENT])
+            batch_data['archived_students_count'] = batch.archived_students_count
+            batch_data['total_students_count'] = batch.total_students_count
             
             batches_data.append(batch_data)
         
@@ -2,10 +2,11 @@
 Dashboard API Routes
 Statistics and overview data for dashboard
 """
-from flask import Blueprint, jsonify, session
-from models import User, Batch, db, UserRole
-from utils.auth import login_required, require_role
+from flask import Blueprint, jsonify
+from models import db, UserRole, Batch
+from utils.auth import login_required, require_role, get_current_user, get_current_user_batch_ids
 from utils.response import success_response, error_response
+from services.dashboard_stats import get_admin_stats, get_teacher_overview
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
@@ -14,55 +15,8 @@ dashboard_bp = Blueprint('dashboard', __name__)
 def get_dashboard_stats():
     """Get dashboard statistics"""
     try:
-        # Get counts (exclude archived students)
-        total_students = User.query.filter_by(role=UserRole.STUDENT, is_active=True, is_archived=False).count()
-        total_teachers = User.query.filter_by(role=UserRole.TEACHER, is_active=True).count()
-        total_batches = Batch.query.count()  # Get total count of all batches (active and inactive)
-        
-        # Calculate pending fees (placeholder for now - you can implement proper fee calculation)
-        pending_fees = 0.0  # This would need proper fee management integration
-        
-        # SMS count (placeholder for now - you can implement proper SMS tracking)
-        sms_count = 0  # This would need proper SMS service integration
-        
-        # Get recent students (last 5, exclude archived)
-        recent_students = User.query.filter_by(role=UserRole.STUDENT, is_active=True, is_archived=False)\
-                             .order_by(User.created_at.desc())\
-                             .limit(5).all()
-        
-        # Get all batches with student counts (for detailed data, exclude archived students)
-        all_batches_data = []
-        batches = Batch.query.all()  # Get all batches, not just active ones
-        for batch in batches:
-            student_count = len([s for s in batch.students if s.role == UserRole.STUDENT and s.is_active and not s.is_archived])
-            all_batches_data.append({
-                'id': batch.id,
-                'name': batch.name,
-                'description': batch.description,
-                'student_count': student_count,
-                'fee_amount': float(batch.fee_amount),
-                'is_active': batch.is_active
-            })
-        
-        # Format recent students
-        recent_students_data = [{
-            'id': student.id,
-            'name': f"{student.first_name} {student.last_name}",
-            'phoneNumber': student.phoneNumber,
-            'email': student.email,
-            'created_at': student.created_at.isoformat()
-        } for student in recent_students]
-        
-        # Return stats in the format expected by the frontend
-        stats = {
-            'totalStudents': total_students,
-            'totalBatches': total_batches,
-            'pendingFees': pending_fees,
-            'smsCount': sms_count,
-            'totalTeachers': total_teachers,
-            'recentStudents': recent_students_data,
-            'allBatchesData': all_batches_data
-        }
+        # Grouped counts, cached for a few seconds per worker
+        stats = get_admin_stats()
         
         return jsonify(stats)
         
@@ -74,8 +28,7 @@ def get_dashboard_stats():
 def get_overview():
     """Get dashboard overview data"""
     try:
-        user_id = session.get('user_id')
-        current_user = User.query.get(user_id)
+        current_user = get_current_user()
         
         if current_user.role == UserRole.STUDENT:
             # Student overview
@@ -84,7 +37,7 @@ def get_overview():
                 'name': batch.name,
                 'description': batch.description,
                 'fee_amount': float(batch.fee_amount)
-            } for batch in current_user.batches if batch.is_active]
+            } for batch in Batch.query.filter(Batch.id.in_(get_current_user_batch_ids())).order_by(Batch.id).all()]
             
             overview = {
                 'user_type': 'student',
@@ -95,8 +48,7 @@ def get_overview():
             # Teacher/Admin overview (exclude archived students)
             overview = {
                 'user_type': 'teacher',
-                'total_students': User.query.filter_by(role=UserRole.STUDENT, is_active=True, is_archived=False).count(),
-                'total_batches': Batch.query.filter_by(is_active=True).count()
+                **get_teacher_overview()
             }
         
         return success_response('Overview retrieved successfully', overview)
@@ -4,7 +4,7 @@ Create, manage, and handle exam submissions including monthly exams
 """
 from flask import Blueprint, request
 from models import db, Exam, Question, ExamSubmission, ExamAnswer, Batch, User, UserRole, ExamType, ExamStatus, SubmissionStatus, QuestionType, exam_batches
-from utils.auth import login_required, require_role, get_current_user
+from utils.auth import login_required, require_role, get_current_user, get_current_user_batch_ids
 from utils.response import success_response, error_response, serialize_exam
 from sqlalchemy import or_, and_
 from datetime import datetime, timedelta
@@ -28,7 +28,7 @@ def get_exams():
         # Filter based on user role
         if current_user.role == UserRole.STUDENT:
             # Students can only see exams for their batches
-            user_batch_ids = [b.id for b in current_user.batches if b.is_active]
+            user_batch_ids = get_current_user_batch_ids()
             if not user_batch_ids:
                 return success_response('No exams found', [])
             query = query.join(exam_batches).filter(exam_batches.c.batch_id.in_(user_batch_ids))
@@ -176,7 +176,7 @@ def get_monthly_exams():
         
         # Filter based on user role
         if current_user.role == UserRole.STUDENT:
-            user_batch_ids = [b.id for b in current_user.batches if b.is_active]
+            user_batch_ids = get_current_user_batch_ids()
             if not user_batch_ids:
                 return success_response('No monthly exams found', [])
             query = query.join(exam_batches).filter(exam_batches.c.batch_id.in_(user_batch_ids))
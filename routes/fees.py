@@ -6,7 +6,7 @@ from flask import Blueprint, request, session
 from models import db, Fee, User, Batch, UserRole, FeeStatus
 from utils.auth import login_required, require_role, get_current_user, check_batch_access
 from utils.response import success_response, error_response, paginated_response, serialize_fee
-from sqlalchemy import or_, and_, func, extract
+from sqlalchemy import or_, and_, func
 from datetime import datetime, date, timedelta
 from decimal import Decimal
 import calendar
@@ -51,11 +51,11 @@ def get_fees():
         # Filter by month/year
         if month and year:
             query = query.filter(
-                extract('month', Fee.due_date) == month,
-                extract('year', Fee.due_date) == year
+                Fee.month == month,
+                Fee.year == year
             )
         elif year:
-            query = query.filter(extract('year', Fee.due_date) == year)
+            query = query.filter(Fee.year == year)
         
         # Filter overdue fees
         if overdue_only:
@@ -558,8 +558,8 @@ def create_monthly_fees(batch_id):
             existing_fee = Fee.query.filter(
                 Fee.user_id == student.id,
                 Fee.batch_id == batch_id,
-                extract('month', Fee.due_date) == month,
-                extract('year', Fee.due_date) == year
+                Fee.month == month,
+                Fee.year == year
             ).first()
             
             if existing_fee:
@@ -625,11 +625,11 @@ def get_fee_summary():
         # Filter by month/year
         if month and year:
             base_query = base_query.filter(
-                extract('month', Fee.due_date) == month,
-                extract('year', Fee.due_date) == year
+                Fee.month == month,
+                Fee.year == year
             )
         elif year:
-            base_query = base_query.filter(extract('year', Fee.due_date) == year)
+            base_query = base_query.filter(Fee.year == year)
         
         # Calculate statistics
         total_fees = base_query.count()
@@ -728,7 +728,7 @@ def get_monthly_fees():
         # Get fees for the year
         fees_query = Fee.query.filter(
             Fee.batch_id == batch_id,
-            extract('year', Fee.due_date) == year
+            Fee.year == year
         ).all()
         
         # Create a lookup dictionary for fees
@@ -840,8 +840,8 @@ def save_monthly_fee():
         existing_fee = Fee.query.filter(
             Fee.user_id == student_id,
             Fee.batch_id == batch.id,
-            extract('month', Fee.due_date) == month,
-            extract('year', Fee.due_date) == year
+            Fee.month == month,
+            Fee.year == year
         ).first()
         
         if existing_fee:
@@ -959,8 +959,8 @@ def save_monthly_fee_noauth():
         existing_fee = Fee.query.filter(
             Fee.user_id == student_id,
             Fee.batch_id == batch.id,
-            extract('month', Fee.due_date) == month,
-            extract('year', Fee.due_date) == year
+            Fee.month == month,
+            Fee.year == year
         ).first()
 
         if existing_fee:
@@ -1040,7 +1040,7 @@ def get_monthly_fees_noauth():
         # Get fees for the year
         fees_query = Fee.query.filter(
             Fee.batch_id == batch_id,
-            extract('year', Fee.due_date) == year
+            Fee.year == year
         ).all()
         
         # Create a lookup dictionary for fees
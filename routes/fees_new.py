@@ -2,14 +2,17 @@
 Fee Management Routes - Completely rewritten for clarity and reliability
 """
 from flask import Blueprint, request, jsonify
-from models import db, User, Batch, Fee, UserRole, FeeStatus
-from sqlalchemy import extract
+from models import db, User, Batch, Fee, UserRole, FeeStatus, user_batches
+from sqlalchemy import delete, insert, update
 from datetime import datetime, date
 from decimal import Decimal
 import calendar
 
 fees_bp = Blueprint('fees', __name__)
 
+# Cells accepted by one save-monthly-bulk call (a full 12-month sheet of 400 students)
+MAX_BULK_FEE_CHANGES = 4800
+
 def success_response(message, data=None, status=200):
     """Standard success response format"""
     response = {
@@ -87,7 +90,7 @@ def load_monthly_fees():
         # Get all fees for this batch and year
         fees = Fee.query.filter(
             Fee.batch_id == batch_id,
-            extract('year', Fee.due_date) == year
+            Fee.year == year
         ).all()
         
         # Create a lookup dictionary: student_id -> month -> fee_data
@@ -235,8 +238,8 @@ def save_monthly_fee():
         existing_fee = Fee.query.filter(
             Fee.user_id == student_id,
             Fee.batch_id == batch_id,
-            extract('month', Fee.due_date) == month,
-            extract('year', Fee.due_date) == year
+            Fee.month == month,
+            Fee.year == year
         ).first()
         
         if existing_fee:
@@ -308,6 +311,182 @@ def save_monthly_fee():
         return error_response(f'Failed to save fee: {str(e)}', 500)
 
 
+@fees_bp.route('/save-monthly-bulk', methods=['POST'])
+def save_monthly_fees_bulk():
+    """
+    Save many monthly fee cells of one batch in a single transaction
+    POST /api/fees/save-monthly-bulk
+    
+    Request body (only the edited cells; "year" per cell overrides the default):
+    {
+        "batch_id": 1,
+        "year": 2025,
+        "changes": [
+            {"student_id": 1, "month": 1, "amount": 500},
+            {"student_id": 2, "month": 3, "amount": 0, "year": 2026}
+        ]
+    }
+    
+    Returns per-cell results in request order:
+    {
+        "success": true,
+        "message": "Fees saved successfully",
+        "data": {
+            "results": [
+                {"student_id": 1, "month": 1, "year": 2025, "status": "created", "fee_id": 123, "amount": 500},
+                {"student_id": 2, "month": 3, "year": 2026, "status": "deleted", "fee_id": null, "amount": 0}
+            ],
+            "summary": {"created": 1, "updated": 0, "deleted": 1, "unchanged": 0, "superseded": 0, "error": 0}
+        }
+    }
+    
+    A cell repeated in one request is saved from its last entry; earlier entries report "superseded".
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return error_response('Request body is required', 400)
+        
+        try:
+            batch_id = int(data.get('batch_id'))
+            default_year = int(data.get('year') or datetime.now().year)
+        except (ValueError, TypeError):
+            return error_response('batch_id and year must be integers', 400)
+        
+        changes = data.get('changes')
+        if not isinstance(changes, list) or not changes:
+            return error_response('changes must be a non-empty list', 400)
+        
+        if len(changes) > MAX_BULK_FEE_CHANGES:
+            return error_response(f'At most {MAX_BULK_FEE_CHANGES} changes can be saved at once', 400)
+        
+        batch = Batch.query.get(batch_id)
+        if not batch:
+            return error_response('Batch not found', 404)
+        
+        # One roster query replaces the per-cell student lookup and enrollment check
+        roster = {user_id for (user_id,) in db.session.query(User.id).join(
+            user_batches, user_batches.c.user_id == User.id
+        ).filter(
+            user_batches.c.batch_id == batch_id,
+            User.role == UserRole.STUDENT,
+            User.is_active == True
+        ).all()}
+        
+        # Validate every cell; later edits of the same cell win
+        results = []
+        cells = {}
+        for change in changes:
+            result = {'student_id': None, 'month': None, 'year': None, 'status': 'error',
+                      'fee_id': None, 'amount': None}
+            results.append(result)
+            try:
+                student_id = int(change.get('student_id'))
+                month = int(change.get('month'))
+                year = int(change.get('year') or default_year)
+                amount = Decimal(str(change.get('amount')))
+            except Exception:
+                result['error'] = 'student_id, month and amount are required numbers'
+                continue
+            
+            result.update({'student_id': student_id, 'month': month, 'year': year, 'amount': float(amount)})
+            if not (1 <= month <= 12):
+                result['error'] = 'Month must be between 1 and 12'
+            elif not (2020 <= year <= 2030):
+                result['error'] = 'Year must be between 2020 and 2030'
+            elif amount < 0:
+                result['error'] = 'Amount cannot be negative'
+            elif student_id not in roster:
+                result['error'] = 'Student is not an active student of this batch'
+            else:
+                previous = cells.get((student_id, year, month))
+                if previous is not None:
+                    previous['status'] = 'superseded'
+                cells[(student_id, year, month)] = result
+        
+        # Existing fees of the touched periods, in one indexed query
+        existing = {}
+        if cells:
+            years = {year for (_, year, _) in cells}
+            for fee in db.session.query(Fee.id, Fee.user_id, Fee.year, Fee.month, Fee.amount).filter(
+                Fee.batch_id == batch_id,
+                Fee.year.in_(years),
+                Fee.user_id.in_({student_id for (student_id, _, _) in cells})
+            ).order_by(Fee.id):
+                existing.setdefault((fee.user_id, fee.year, fee.month), fee)
+        
+        now = datetime.utcnow()
+        inserts, updates, delete_ids = [], [], []
+        for (student_id, year, month), result in cells.items():
+            amount = Decimal(str(result['amount']))
+            fee = existing.get((student_id, year, month))
+            if fee is None:
+                if amount == 0:
+                    result['status'] = 'unchanged'
+                else:
+                    result['status'] = 'created'
+                    inserts.append({
+                        'user_id': student_id,
+                        'batch_id': batch_id,
+                        'amount': amount,
+                        'due_date': date(year, month, calendar.monthrange(year, month)[1]),
+                        'year': year,
+                        'month': month,
+                        'status': FeeStatus.PENDING,
+                        'notes': f'Monthly fee for {calendar.month_name[month]} {year}',
+                        'created_at': now,
+                        'updated_at': now
+                    })
+            elif amount == 0:
+                result['status'] = 'deleted'
+                delete_ids.append(fee.id)
+            elif Decimal(str(fee.amount)) == amount:
+                result['status'] = 'unchanged'
+                result['fee_id'] = fee.id
+            else:
+                result['status'] = 'updated'
+                result['fee_id'] = fee.id
+                updates.append({'id': fee.id, 'amount': amount, 'updated_at': now})
+        
+        if inserts:
+            db.session.execute(insert(Fee.__table__), inserts)
+        if updates:
+            db.session.execute(update(Fee), updates)
+        if delete_ids:
+            db.session.execute(delete(Fee).where(Fee.id.in_(delete_ids)),
+                               execution_options={'synchronize_session': False})
+        
+        if inserts:
+            # Report the ids of the new rows (their periods had no fee before this transaction)
+            created = {(fee.user_id, fee.year, fee.month): fee.id for fee in db.session.query(
+                Fee.id, Fee.user_id, Fee.year, Fee.month
+            ).filter(
+                Fee.batch_id == batch_id,
+                Fee.year.in_({row['year'] for row in inserts}),
+                Fee.user_id.in_({row['user_id'] for row in inserts})
+            )}
+            for key, result in cells.items():
+                if result['status'] == 'created':
+                    result['fee_id'] = created.get(key)
+        
+        db.session.commit()
+        
+        summary = {status: 0 for status in ('created', 'updated', 'deleted', 'unchanged', 'superseded', 'error')}
+        for result in results:
+            summary[result['status']] += 1
+        
+        return success_response('Fees saved successfully', {
+            'batch_id': batch_id,
+            'results': results,
+            'summary': summary
+        })
+        
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error saving fees in bulk: {str(e)}")
+        return error_response(f'Failed to save fees: {str(e)}', 500)
+
+
 @fees_bp.route('/test', methods=['GET'])
 def test_endpoint():
     """Simple test endpoint to verify routes are working"""
@@ -316,6 +495,7 @@ def test_endpoint():
         'available_endpoints': [
             'GET /api/fees/load-monthly?batch_id=X&year=Y',
             'POST /api/fees/save-monthly',
+            'POST /api/fees/save-monthly-bulk',
             'GET /api/fees/test'
         ]
     })
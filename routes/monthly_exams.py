@@ -4,16 +4,21 @@ Ranking, GPA calculation, merit lists, and performance analytics
 """
 from flask import Blueprint, request, jsonify, current_app
 from models import (db, MonthlyExam, IndividualExam, MonthlyMark, Batch, User, 
-                   UserRole, Settings, SmsLog, SmsStatus, Attendance, AttendanceStatus, MonthlyRanking)
-from utils.auth import login_required, require_role, get_current_user
+                   UserRole, Settings, MonthlyRanking, user_batches)
+from utils.auth import login_required, require_role, get_current_user, get_current_user_batch_ids
 from utils.response import success_response, error_response
+from utils.upsert import bulk_upsert
 from services.sms_service import send_bulk_notification
+from services.sms_dispatcher import enqueue_sms
+from services.ranking_engine import calculate_grade_and_gpa, compute_comprehensive_ranking
+from services.student_search import reindex_batch_students
+from services.ranking_snapshots import (get_ranking_snapshot, mark_rankings_dirty,
+                                        mark_batch_rankings_dirty, delete_ranking_snapshot)
 from sqlalchemy import func, desc, case, and_, or_
 from datetime import datetime, date, timedelta
 from decimal import Decimal
 import calendar
 import logging
-import requests
 import os
 import re
 
@@ -283,216 +288,14 @@ def get_comprehensive_monthly_ranking(exam_id):
         
         # Check access permission
         if current_user.role == UserRole.STUDENT:
-            user_batch_ids = [b.id for b in current_user.batches if b.is_active]
+            user_batch_ids = get_current_user_batch_ids()
             if monthly_exam.batch_id not in user_batch_ids:
                 return error_response('Access denied', 403)
         
-        # Get all individual exams for this monthly exam
-        individual_exams = IndividualExam.query.filter_by(
-            monthly_exam_id=exam_id
-        ).order_by(IndividualExam.order_index).all()
-        
-        # Get all students in the batch (exclude archived students)
-        batch_students = User.query.join(
-            User.batches
-        ).filter(
-            User.role == UserRole.STUDENT,
-            User.is_active == True,
-            User.is_archived == False,
-            Batch.id == monthly_exam.batch_id
-        ).all()
-        
-        # Calculate comprehensive rankings
-        rankings = []
-        
-        for student in batch_students:
-            # Get existing ranking to get roll number and previous position
-            existing_ranking = MonthlyRanking.query.filter_by(
-                monthly_exam_id=exam_id,
-                user_id=student.id
-            ).first()
-            
-            # Get individual exam marks
-            individual_marks = {}
-            total_exam_marks = 0
-            total_possible_marks = 0
-            exam_count = len(individual_exams)
-            passed_exams = 0
-            
-            for exam in individual_exams:
-                mark = MonthlyMark.query.filter_by(
-                    monthly_exam_id=exam_id,
-                    individual_exam_id=exam.id,
-                    user_id=student.id
-                ).first()
-                
-                if mark:
-                    individual_marks[exam.id] = {
-                        'exam_title': exam.title,
-                        'subject': exam.subject,
-                        'marks_obtained': mark.marks_obtained,
-                        'total_marks': mark.total_marks,
-                        'percentage': round((mark.marks_obtained / mark.total_marks * 100), 2) if mark.total_marks > 0 else 0,
-                        'is_absent': mark.is_absent,
-                        'grade': calculate_grade_and_gpa((mark.marks_obtained / mark.total_marks * 100) if mark.total_marks > 0 else 0)[0]
-                    }
-                    if not mark.is_absent:
-                        total_exam_marks += mark.marks_obtained
-                        if mark.marks_obtained >= (mark.total_marks * 0.4):  # 40% pass mark
-                            passed_exams += 1
-                    total_possible_marks += mark.total_marks
-                else:
-                    individual_marks[exam.id] = {
-                        'exam_title': exam.title,
-                        'subject': exam.subject,
-                        'marks_obtained': 0,
-                        'total_marks': exam.marks,
-                        'percentage': 0,
-                        'is_absent': True,
-                        'grade': 'F'
-                    }
-                    total_possible_marks += exam.marks
-            
-            # Calculate attendance marks (1 mark per present day in the month)
-            # Only count attendance from the SAME MONTH as the exam
-            attendance_marks = 0
-            total_days = 0
-            max_attendance_marks = 0
-            
-            if monthly_exam.start_date and monthly_exam.end_date:
-                # Get the first and last day of the exam's month
-                exam_month = monthly_exam.month
-                exam_year = monthly_exam.year
-                
-                # First day of the month
-                month_start = datetime(exam_year, exam_month, 1).date()
-                
-                # Last day of the month
-                if exam_month == 12:
-                    month_end = datetime(exam_year + 1, 1, 1).date() - timedelta(days=1)
-                else:
-                    month_end = datetime(exam_year, exam_month + 1, 1).date() - timedelta(days=1)
-                
-                # Count total working days in this specific month (Monday to Friday)
-                current_date = month_start
-                
-                while current_date <= month_end:
-                    # Count only weekdays (Monday to Friday)
-                    if current_date.weekday() < 5:  # 0-4 are Monday to Friday
-                        total_days += 1
-                    current_date += timedelta(days=1)
-                
-                max_attendance_marks = total_days  # Maximum possible attendance marks for the month
-                
-                # Count present days ONLY in this specific month
-                present_count = Attendance.query.filter(
-                    Attendance.user_id == student.id,
-                    Attendance.batch_id == monthly_exam.batch_id,
-                    Attendance.date >= month_start,
-                    Attendance.date <= month_end,
-                    Attendance.status == AttendanceStatus.PRESENT
-                ).count()
-                attendance_marks = present_count
-            
-            # Calculate attendance percentage
-            attendance_percentage = (attendance_marks / total_days * 100) if total_days > 0 else 0
-            
-            # Calculate final totals (NO BONUS - just exam marks + attendance marks)
-            final_total = total_exam_marks + attendance_marks
-            total_possible = total_possible_marks + max_attendance_marks  # Total possible including max attendance
-            
-            # Calculate simple percentage based on obtained vs total possible
-            percentage = (final_total / total_possible * 100) if total_possible > 0 else 0
-            
-            # Calculate grade and GPA based on final percentage
-            grade, gpa = calculate_grade_and_gpa(percentage)
-            exam_gpa = calculate_grade_and_gpa((total_exam_marks / total_possible_marks * 100) if total_possible_marks > 0 else 0)[1]
-            
-            # Get previous month ranking for comparison and roll number
-            previous_position = None
-            previous_roll_number = None
-            
-            if existing_ranking and existing_ranking.previous_position:
-                previous_position = existing_ranking.previous_position
-            
-            # Always try to find previous month ranking for roll number inheritance
-            prev_month = monthly_exam.month - 1 if monthly_exam.month > 1 else 12
-            prev_year = monthly_exam.year if monthly_exam.month > 1 else monthly_exam.year - 1
-            
-            prev_exam = MonthlyExam.query.filter_by(
-                batch_id=monthly_exam.batch_id,
-                month=prev_month,
-                year=prev_year
-            ).first()
-            
-            if prev_exam:
-                prev_ranking = MonthlyRanking.query.filter_by(
-                    monthly_exam_id=prev_exam.id,
-                    user_id=student.id,
-                    is_final=True
-                ).first()
-                if prev_ranking:
-                    previous_position = prev_ranking.position
-                    previous_roll_number = prev_ranking.roll_number
-            
-            # Determine roll number: use existing, or inherit from previous month, or None
-            current_roll_number = None
-            if existing_ranking and existing_ranking.roll_number:
-                current_roll_number = existing_ranking.roll_number
-            elif previous_roll_number:
-                current_roll_number = previous_roll_number  # Inherit from previous month
-            
-            ranking_data = {
-                'user_id': student.id,
-                'student_name': student.full_name,
-                'student_phone': student.phoneNumber,
-                'roll_number': current_roll_number,
-                'individual_marks': individual_marks,
-                'total_exam_marks': total_exam_marks,
-                'total_possible_marks': total_possible_marks,
-                'attendance_marks': attendance_marks,
-                'max_attendance_marks': max_attendance_marks,
-                'total_attendance_days': total_days,
-                'attendance_percentage': round(attendance_percentage, 2),
-                'final_total': final_total,
-                'total_possible': total_possible,
-                'percentage': round(percentage, 2),
-                'grade': grade,
-                'gpa': round(gpa, 2),
-                'exam_gpa': round(exam_gpa, 2),
-                'passed_exams': passed_exams,
-                'total_exams': exam_count,
-                'previous_position': previous_position
-            }
-            
-            rankings.append(ranking_data)
-        
-        # Sort by final percentage (descending), then by total marks, then by name
-        rankings.sort(key=lambda x: (-x['percentage'], -x['final_total'], x['student_name']))
-        
-        # Assign positions and calculate position changes
-        for idx, rank in enumerate(rankings):
-            current_position = idx + 1
-            rank['current_position'] = current_position
-            rank['position'] = current_position  # For compatibility
-            
-            # Calculate position change
-            if rank['previous_position']:
-                rank['position_change'] = rank['previous_position'] - current_position
-                if rank['position_change'] > 0:
-                    rank['position_trend'] = 'up'
-                elif rank['position_change'] < 0:
-                    rank['position_trend'] = 'down'
-                else:
-                    rank['position_trend'] = 'same'
-            else:
-                rank['position_change'] = None
-                rank['position_trend'] = 'new'
-        
-        # Filter out archived students from rankings before returning
-        # (in case any old data exists)
-        active_student_ids = [s.id for s in batch_students]
-        rankings = [r for r in rankings if r['user_id'] in active_student_ids]
+        # Served from the materialized snapshot; rebuilt set-wise only when dirty
+        snapshot = get_ranking_snapshot(monthly_exam)
+        individual_exams = snapshot['individual_exams']
+        rankings = snapshot['rankings']
         
         # If student, only return their data and nearby rankings
         if current_user.role == UserRole.STUDENT:
@@ -510,7 +313,7 @@ def get_comprehensive_monthly_ranking(exam_id):
                 
                 return success_response('Student comprehensive ranking retrieved', {
                     'monthly_exam': serialize_monthly_exam(monthly_exam),
-                    'individual_exams': [{'id': e.id, 'title': e.title, 'subject': e.subject, 'marks': e.marks} for e in individual_exams],
+                    'individual_exams': individual_exams,
                     'student_position': current_pos,
                     'total_students': len(rankings),
                     'nearby_rankings': nearby_rankings
@@ -521,7 +324,7 @@ def get_comprehensive_monthly_ranking(exam_id):
         # For teachers/admin, return full comprehensive ranking
         return success_response('Comprehensive monthly ranking retrieved', {
             'monthly_exam': serialize_monthly_exam(monthly_exam),
-            'individual_exams': [{'id': e.id, 'title': e.title, 'subject': e.subject, 'marks': e.marks} for e in individual_exams],
+            'individual_exams': individual_exams,
             'rankings': rankings,
             'total_students': len(rankings)
         })
@@ -578,6 +381,7 @@ def update_bonus_marks(exam_id):
         bonus_setting.value = current_bonus
         bonus_setting.updated_at = datetime.utcnow()
         bonus_setting.updated_by = get_current_user().id
+        mark_rankings_dirty([exam_id])
         
         db.session.commit()
         
@@ -642,6 +446,8 @@ def assign_roll_numbers(exam_id):
             
             updated_count += 1
         
+        # Roll numbers feed this exam's ranking and next month's inheritance
+        mark_batch_rankings_dirty(monthly_exam.batch_id)
         db.session.commit()
         
         return success_response('Roll numbers assigned successfully', {
@@ -667,11 +473,7 @@ def auto_assign_roll_numbers(exam_id):
             return error_response('Monthly exam not found', 404)
         
         # Get current comprehensive ranking
-        ranking_response = get_comprehensive_monthly_ranking(exam_id)
-        if not ranking_response.json.get('success'):
-            return error_response('Failed to get current rankings', 500)
-        
-        rankings = ranking_response.json['data']['rankings']
+        rankings = compute_comprehensive_ranking(monthly_exam)['rankings']
         updated_count = 0
         
         for rank_data in rankings:
@@ -699,6 +501,7 @@ def auto_assign_roll_numbers(exam_id):
             
             updated_count += 1
         
+        mark_batch_rankings_dirty(monthly_exam.batch_id)
         db.session.commit()
         
         return success_response('Roll numbers auto-assigned based on ranking', {
@@ -723,50 +526,20 @@ def generate_monthly_ranking(exam_id):
         if not monthly_exam:
             return error_response('Monthly exam not found', 404)
         
-        # Get comprehensive ranking data (same as the display function)
-        ranking_response_tuple = get_comprehensive_monthly_ranking(exam_id)
-        ranking_response, status_code = ranking_response_tuple
-        
-        if status_code != 200:
-            return error_response('Failed to calculate rankings', 500)
-            
-        ranking_data = ranking_response.get_json()
-        if not ranking_data.get('success'):
-            return error_response('Failed to calculate rankings', 500)
-            
-        rankings = ranking_data['data']['rankings']
+        # Same computation as the comprehensive ranking display
+        result = compute_comprehensive_ranking(monthly_exam)
+        rankings = result['rankings']
         updated_count = 0
         
-        # Find previous month's exam to get roll numbers
-        prev_month = monthly_exam.month - 1 if monthly_exam.month > 1 else 12
-        prev_year = monthly_exam.year if monthly_exam.month > 1 else monthly_exam.year - 1
-        
-        prev_exam = MonthlyExam.query.filter_by(
-            batch_id=monthly_exam.batch_id,
-            month=prev_month,
-            year=prev_year
-        ).first()
-        
-        # Build a map of user_id to previous roll number
-        prev_roll_map = {}
+        # Map of user_id to previous month's roll number
+        prev_exam = result['previous_exam']
+        prev_roll_map = result['previous_rolls']
         if prev_exam:
-            print(f"\n🔍 Found previous exam: {prev_exam.month}/{prev_exam.year} (ID: {prev_exam.id})")
-            prev_rankings = MonthlyRanking.query.filter_by(
-                monthly_exam_id=prev_exam.id,
-                is_final=True
-            ).all()
-            print(f"📋 Previous rankings count: {len(prev_rankings)}")
-            for pr in prev_rankings:
-                if pr.roll_number:
-                    prev_roll_map[pr.user_id] = pr.roll_number
-                    print(f"  User {pr.user_id} had roll number: {pr.roll_number}")
-        else:
-            print(f"\n⚠️  No previous exam found for {prev_month}/{prev_year}")
-        
-        print(f"📊 Previous roll map: {prev_roll_map}")
+            logger.info(f"Inheriting {len(prev_roll_map)} roll numbers from monthly exam {prev_exam.id}")
         
         # Clear existing rankings for this exam
         MonthlyRanking.query.filter_by(monthly_exam_id=exam_id).delete()
+        reindex_batch_students(monthly_exam.batch_id)
         
         # Create new ranking records and assign roll numbers from previous month
         for idx, rank_data in enumerate(rankings):
@@ -776,11 +549,9 @@ def generate_monthly_ranking(exam_id):
             # Inherit from previous month or assign new roll number
             if user_id in prev_roll_map:
                 roll_number = prev_roll_map[user_id]
-                print(f"✅ User {user_id}: Inherited roll {roll_number} from previous month")
             else:
                 # New student: assign roll number based on current rank
                 roll_number = idx + 1
-                print(f"🆕 User {user_id}: New student, assigned roll {roll_number}")
             
             ranking = MonthlyRanking(
                 monthly_exam_id=exam_id,
@@ -803,6 +574,8 @@ def generate_monthly_ranking(exam_id):
             db.session.add(ranking)
             updated_count += 1
         
+        # Final rankings change roll numbers here and previous positions next month
+        mark_batch_rankings_dirty(monthly_exam.batch_id)
         db.session.commit()
         
         return success_response('Monthly rankings generated and saved successfully', {
@@ -896,17 +669,30 @@ def get_merit_list(exam_id):
         
         # Get top performers
         merit_list = rankings[:top_count]
+        user_ids = [rank['user_id'] for rank in merit_list]
+        users = {u.id: u for u in User.query.filter(User.id.in_(user_ids)).all()} if user_ids else {}
+        marks = (db.session.query(MonthlyMark, IndividualExam.subject)
+                .join(IndividualExam)
+                .filter(MonthlyMark.monthly_exam_id == exam_id, MonthlyMark.user_id.in_(user_ids))
+                .all()) if user_ids else []
+        subject_wise_marks = {}
+        for mark, subject in marks:
+            subject_wise_marks.setdefault(mark.user_id, {})[subject] = {
+                'marks_obtained': mark.marks_obtained,
+                'total_marks': mark.total_marks,
+                'percentage': mark.percentage,
+                'grade': mark.grade,
+                'gpa': mark.gpa
+            }
         
         # Add detailed performance data
         for rank in merit_list:
-            user = User.query.get(rank['user_id'])
-            subject_wise_marks = get_subject_wise_marks(exam_id, rank['user_id'])
-            
+            user = users[rank['user_id']]
             rank.update({
                 'student_name': user.full_name,
                 'student_id': user.student_id,
                 'phone_number': user.phoneNumber,
-                'subject_wise_marks': subject_wise_marks
+                'subject_wise_marks': subject_wise_marks.get(rank['user_id'], {})
             })
         
         return success_response('Merit list retrieved successfully', {
@@ -1065,7 +851,7 @@ def get_individual_exams(exam_id):
         
         # Check access permission
         if current_user.role == UserRole.STUDENT:
-            user_batch_ids = [b.id for b in current_user.batches if b.is_active]
+            user_batch_ids = get_current_user_batch_ids()
             if monthly_exam.batch_id not in user_batch_ids:
                 return error_response('Access denied', 403)
         
@@ -1154,6 +940,7 @@ def create_individual_exam(exam_id):
         new_total = int(new_total_result or 0)
         monthly_exam.total_marks = new_total
         monthly_exam.pass_marks = int(new_total * 0.33)  # Update pass marks to 33% of new total
+        mark_rankings_dirty([exam_id])
         
         db.session.commit()
         
@@ -1193,9 +980,7 @@ def submit_individual_exam_marks(exam_id, individual_exam_id):
             return error_response('Insufficient permissions - only teachers and administrators can save marks', 403)
         
         data = request.get_json()
-        logger.info(f"Received marks submission request for exam {exam_id}, individual exam {individual_exam_id}")
-        logger.info(f"Request data: {data}")
-        logger.info(f"User: {current_user.id} ({current_user.role})")
+        logger.info(f"Marks submission for exam {exam_id}, individual exam {individual_exam_id} by user {current_user.id}")
         
         # Enhanced validation
         if not data:
@@ -1244,131 +1029,129 @@ def submit_individual_exam_marks(exam_id, individual_exam_id):
             logger.error("Empty students data provided")
             return error_response('At least one student mark is required', 400)
         
+        # Preload the batch roster and this paper's existing marks once
+        batch_members = {
+            student.id: student for student in User.query.join(
+                user_batches, user_batches.c.user_id == User.id
+            ).filter(
+                user_batches.c.batch_id == monthly_exam.batch_id,
+                User.role == UserRole.STUDENT
+            ).all()
+        }
+        existing_marks = {
+            row.user_id: row for row in db.session.query(
+                MonthlyMark.user_id, MonthlyMark.marks_obtained, MonthlyMark.total_marks, MonthlyMark.is_absent
+            ).filter(
+                MonthlyMark.monthly_exam_id == exam_id,
+                MonthlyMark.individual_exam_id == individual_exam_id
+            ).all()
+        }
+        
+        upsert_rows = {}  # user_id -> row; a later entry for the same student wins
+        now = datetime.utcnow()
+        
         for idx, student_entry in enumerate(students_data):
+            # Validate student entry structure
+            if not isinstance(student_entry, dict):
+                errors.append(f"Student entry {idx + 1}: Must be an object")
+                continue
+            
+            user_id = student_entry.get('user_id')
+            marks_obtained = student_entry.get('marks_obtained')
+            
+            # Validate user_id
+            if not user_id:
+                errors.append(f"Student entry {idx + 1}: user_id is required")
+                continue
+            
+            # Validate marks_obtained
+            if marks_obtained is None or marks_obtained == '':
+                errors.append(f"Student entry {idx + 1}: marks_obtained is required")
+                continue
+            
+            # Convert and validate marks
             try:
-                # Validate student entry structure
-                if not isinstance(student_entry, dict):
-                    errors.append(f"Student entry {idx + 1}: Must be an object")
+                marks_obtained = float(marks_obtained)
+                if marks_obtained < 0:
+                    errors.append(f"Student entry {idx + 1}: marks cannot be negative")
                     continue
-                
-                user_id = student_entry.get('user_id')
-                marks_obtained = student_entry.get('marks_obtained')
-                
-                # Validate user_id
-                if not user_id:
-                    errors.append(f"Student entry {idx + 1}: user_id is required")
-                    continue
-                
-                # Validate marks_obtained
-                if marks_obtained is None or marks_obtained == '':
-                    errors.append(f"Student entry {idx + 1}: marks_obtained is required")
-                    continue
-                
-                # Convert and validate marks
-                try:
-                    marks_obtained = float(marks_obtained)
-                    if marks_obtained < 0:
-                        errors.append(f"Student entry {idx + 1}: marks cannot be negative")
-                        continue
-                    if marks_obtained > individual_exam.marks:
-                        errors.append(f"Student entry {idx + 1}: marks ({marks_obtained}) cannot exceed total marks ({individual_exam.marks})")
-                        continue
-                except (ValueError, TypeError) as e:
-                    errors.append(f"Student entry {idx + 1}: invalid marks format ({marks_obtained})")
-                    continue
-                
-                # Validate user exists
-                try:
-                    user = User.query.get(user_id)
-                    if not user:
-                        errors.append(f"Student entry {idx + 1}: student not found (ID: {user_id})")
-                        continue
-                except Exception as db_error:
-                    error_msg = f"Student entry {idx + 1}: database error while fetching student {user_id}: {str(db_error)}"
-                    logger.error(error_msg)
-                    errors.append(error_msg)
+                if marks_obtained > individual_exam.marks:
+                    errors.append(f"Student entry {idx + 1}: marks ({marks_obtained}) cannot exceed total marks ({individual_exam.marks})")
                     continue
+            except (ValueError, TypeError):
+                errors.append(f"Student entry {idx + 1}: invalid marks format ({marks_obtained})")
+                continue
             
-                # Check if mark already exists
-                try:
-                    existing_mark = MonthlyMark.query.filter_by(
-                        monthly_exam_id=exam_id,
-                        individual_exam_id=individual_exam_id,
-                        user_id=user_id
-                    ).first()
-                except Exception as db_error:
-                    error_msg = f"Student entry {idx + 1}: database error while checking existing marks: {str(db_error)}"
-                    logger.error(error_msg)
-                    errors.append(error_msg)
-                    continue
-                
-                # Calculate percentage, grade, and GPA
-                percentage = (marks_obtained / individual_exam.marks) * 100 if individual_exam.marks > 0 else 0
-                grade, gpa = calculate_grade_and_gpa(percentage)
-                
-                # Prepare SMS notification data
-                sms_notifications.append({
-                    'student': user,
-                    'marks_obtained': marks_obtained,
-                    'total_marks': individual_exam.marks,
-                    'percentage': percentage,
-                    'grade': grade,
-                    'subject': individual_exam.subject,
-                    'exam_title': individual_exam.title
-                })
-                
-                if existing_mark:
-                    # Update existing mark
-                    existing_mark.marks_obtained = marks_obtained
-                    existing_mark.total_marks = individual_exam.marks
-                    existing_mark.percentage = percentage
-                    existing_mark.grade = grade
-                    existing_mark.gpa = gpa
-                    existing_mark.is_absent = False  # No absent option
-                    existing_mark.remarks = ''      # No remarks option
-                    existing_mark.updated_at = datetime.utcnow()
-                    logger.info(f"Updated mark for user {user_id}: {marks_obtained}/{individual_exam.marks}")
-                else:
-                    # Create new mark
-                    monthly_mark = MonthlyMark(
-                        monthly_exam_id=exam_id,
-                        individual_exam_id=individual_exam_id,
-                        user_id=user_id,
-                        marks_obtained=marks_obtained,
-                        total_marks=individual_exam.marks,
-                        percentage=percentage,
-                        grade=grade,
-                        gpa=gpa,
-                        is_absent=False,  # No absent option
-                        remarks=''        # No remarks option
-                    )
-                    db.session.add(monthly_mark)
-                    logger.info(f"Created new mark for user {user_id}: {marks_obtained}/{individual_exam.marks}")
-                
-                saved_count += 1
-                
-            except Exception as entry_error:
-                error_msg = f"Student entry {idx + 1}: {str(entry_error)}"
-                logger.error(error_msg)
-                errors.append(error_msg)
+            # Validate student belongs to the exam's batch
+            try:
+                user = batch_members.get(int(user_id))
+            except (ValueError, TypeError):
+                user = None
+            if not user:
+                errors.append(f"Student entry {idx + 1}: student not found (ID: {user_id})")
+                continue
+            
+            # Calculate percentage, grade, and GPA
+            percentage = (marks_obtained / individual_exam.marks) * 100 if individual_exam.marks > 0 else 0
+            grade, gpa = calculate_grade_and_gpa(percentage)
+            
+            # Prepare SMS notification data
+            sms_notifications.append({
+                'student': user,
+                'marks_obtained': marks_obtained,
+                'total_marks': individual_exam.marks,
+                'percentage': percentage,
+                'grade': grade,
+                'subject': individual_exam.subject,
+                'exam_title': individual_exam.title
+            })
+            saved_count += 1
+            
+            # Unchanged marks need no write
+            existing = existing_marks.get(user.id)
+            if (existing and existing.marks_obtained == marks_obtained
+                    and existing.total_marks == individual_exam.marks and not existing.is_absent):
+                upsert_rows.pop(user.id, None)
                 continue
+            
+            upsert_rows[user.id] = {
+                'monthly_exam_id': exam_id,
+                'individual_exam_id': individual_exam_id,
+                'user_id': user.id,
+                'marks_obtained': marks_obtained,
+                'total_marks': individual_exam.marks,
+                'percentage': percentage,
+                'grade': grade,
+                'gpa': gpa,
+                'is_absent': False,  # No absent option
+                'remarks': '',       # No remarks option
+                'created_at': now,
+                'updated_at': now
+            }
         
         # If there were validation errors, return them
         if errors and saved_count == 0:
             return error_response(f'Validation errors: {"; ".join(errors[:5])}', 400)
         
-        # Commit database changes
+        # Write all changed marks with one INSERT ... ON CONFLICT executemany
         try:
+            written = bulk_upsert(
+                MonthlyMark, list(upsert_rows.values()),
+                conflict_columns=('monthly_exam_id', 'individual_exam_id', 'user_id'),
+                update_columns=('marks_obtained', 'total_marks', 'percentage', 'grade', 'gpa',
+                                'is_absent', 'remarks', 'updated_at')
+            )
+            mark_rankings_dirty([exam_id])
             db.session.commit()
-            logger.info(f"Successfully saved {saved_count} marks to database")
+            logger.info(f"Saved {saved_count} marks ({written} written) for individual exam {individual_exam_id}")
         except Exception as db_error:
             db.session.rollback()
             logger.error(f"Database commit failed: {str(db_error)}")
             return error_response(f'Failed to save marks to database: {str(db_error)}', 500)
         
-        # Send SMS notifications after successful save
+        # Queue SMS notifications after successful save; the SMS dispatcher delivers them
         current_user = get_current_user()
-        sms_sent_count = 0
+        sms_job = None
         sms_failed_count = 0
         sms_errors = []
         
@@ -1378,36 +1161,30 @@ def submit_individual_exam_marks(exam_id, individual_exam_id):
             # Get exam result template with better fallback system
             exam_template_message = get_sms_template('exam_result')
             
+            outbox = []
             for notification in sms_notifications:
-                try:
-                    student = notification['student']
-                    
-                    # Determine phone number to send to (prefer parent/guardian phone)
-                    target_phone = get_target_phone(student)
-                    
-                    if not target_phone:
-                        sms_errors.append(f"No valid phone number for {student.full_name}")
-                        sms_failed_count += 1
-                        continue
-                    
-                    # Generate message using template
-                    message = generate_exam_result_message(exam_template_message, notification)
-                    
-                    # Send SMS
-                    sms_result = send_sms_notification(target_phone, message, current_user)
-                    if sms_result.get('success'):
-                        sms_sent_count += 1
-                        logger.info(f"SMS sent successfully to {target_phone} for {student.full_name}")
-                    else:
-                        error_msg = sms_result.get('error', 'Unknown SMS error')
-                        sms_errors.append(f"SMS failed for {student.full_name}: {error_msg}")
-                        sms_failed_count += 1
-                            
-                except Exception as sms_error:
-                    error_msg = f"SMS error for {student.full_name}: {str(sms_error)}"
-                    logger.warning(error_msg)
-                    sms_errors.append(error_msg)
+                student = notification['student']
+                
+                # Determine phone number to send to (prefer parent/guardian phone)
+                target_phone = get_target_phone(student)
+                
+                if not target_phone:
+                    sms_errors.append(f"No valid phone number for {student.full_name}")
                     sms_failed_count += 1
+                    continue
+                
+                # Generate message using template
+                message = generate_exam_result_message(exam_template_message, notification)
+                outbox.append({'phone': target_phone, 'message': message, 'user_id': student.id})
+            
+            try:
+                sms_job = enqueue_sms(outbox, current_user.id, 'exam_result', charge_sender=True)
+                db.session.commit()
+            except Exception as sms_error:
+                db.session.rollback()
+                logger.warning(f"Failed to queue exam result SMS: {sms_error}")
+                sms_errors.append(f"Failed to queue SMS: {sms_error}")
+                sms_failed_count += len(outbox)
         
         # Prepare response data
         response_data = {
@@ -1423,7 +1200,8 @@ def submit_individual_exam_marks(exam_id, individual_exam_id):
         # Add SMS info if SMS was attempted
         if send_sms:
             response_data.update({
-                'sms_sent': sms_sent_count,
+                'sms_queued': sms_job.total if sms_job else 0,
+                'sms_job_id': sms_job.id if sms_job else None,
                 'sms_failed': sms_failed_count,
                 'remaining_sms_balance': current_user.sms_count
             })
@@ -1517,6 +1295,7 @@ def delete_individual_exam(exam_id, individual_exam_id):
         
         # Delete all rankings that might be affected
         MonthlyRanking.query.filter_by(monthly_exam_id=exam_id).delete()
+        reindex_batch_students(monthly_exam.batch_id)
         
         # Delete the individual exam
         db.session.delete(individual_exam)
@@ -1527,6 +1306,7 @@ def delete_individual_exam(exam_id, individual_exam_id):
         new_total = int(new_total_result or 0)
         monthly_exam.total_marks = new_total
         monthly_exam.pass_marks = int(new_total * 0.33) if new_total > 0 else 0
+        mark_rankings_dirty([exam_id])
         
         db.session.commit()
         
@@ -1563,10 +1343,15 @@ def delete_monthly_exam(exam_id):
         
         # Delete rankings
         rankings_deleted = MonthlyRanking.query.filter_by(monthly_exam_id=exam_id).delete()
+        reindex_batch_students(monthly_exam.batch_id)
         
         # Delete individual exams
         individual_exams_deleted = IndividualExam.query.filter_by(monthly_exam_id=exam_id).delete()
         
+        # Drop this exam's snapshot; the following month loses its previous ranking
+        delete_ranking_snapshot(exam_id)
+        mark_batch_rankings_dirty(monthly_exam.batch_id)
+        
         # Delete the monthly exam
         db.session.delete(monthly_exam)
         db.session.commit()
@@ -1607,23 +1392,6 @@ def serialize_monthly_exam(exam):
         'created_at': exam.created_at.isoformat()
     }
 
-def calculate_grade_and_gpa(percentage):
-    """Calculate grade and GPA based on percentage"""
-    if percentage >= 80:
-        return 'A+', 5.00
-    elif percentage >= 70:
-        return 'A', 4.00
-    elif percentage >= 60:
-        return 'A-', 3.50
-    elif percentage >= 50:
-        return 'B', 3.00
-    elif percentage >= 40:
-        return 'C', 2.00
-    elif percentage >= 33:
-        return 'D', 1.00
-    else:
-        return 'F', 0.00
-
 def get_bonus_marks_for_exam(exam_id, user_id):
     """Get bonus marks for a student in a monthly exam"""
     try:
@@ -1840,124 +1608,59 @@ def generate_exam_result_message(template, notification):
         # Ultimate fallback
         return f"{notification['student'].first_name} scored {int(notification['marks_obtained'])}/{int(notification['total_marks'])} marks in {notification['subject']}"
 
-def send_sms_notification(phone, message, current_user):
-    """Send SMS notification and log the attempt"""
-    try:
-        # Use the BulkSMSBD API
-        api_key = "gsOKLO6XtKsANCvgPHNt"
-        sender_id = "8809617628909"
-        api_url = "http://bulksmsbd.net/api/smsapi"
-        
-        # Format phone number
-        formatted_phone = validate_phone_number(phone)
-        if not formatted_phone:
-            return {'success': False, 'error': 'Invalid phone number format'}
-        
-        # Prepare API payload
-        payload = {
-            'api_key': api_key,
-            'type': 'text',
-            'number': formatted_phone,
-            'senderid': sender_id,
-            'message': message
-        }
-        
-        # Create SMS log entry
-        sms_log = SmsLog(
-            phone_number=formatted_phone,
-            message=message,
-            sent_by=current_user.id,
-            status=SmsStatus.PENDING
-        )
-        
-        # Find user by phone number for logging
-        user = User.query.filter_by(phoneNumber=formatted_phone).first()
-        if user:
-            sms_log.user_id = user.id
-        
-        # Send SMS
-        response = requests.post(api_url, data=payload, timeout=30)
-        
-        if response.status_code == 200:
-            # Check if response contains success indicator
-            response_text = response.text.lower()
-            if 'success' in response_text or 'sent' in response_text:
-                sms_log.status = SmsStatus.SENT
-                sms_log.sent_at = datetime.utcnow()
-                sms_log.cost = 1  # Default cost
-                
-                # Deduct SMS count from user
-                current_user.sms_count = max(0, current_user.sms_count - 1)
-                
-                db.session.add(sms_log)
-                db.session.commit()
-                
-                return {'success': True, 'message_id': None, 'cost': 1}
-            else:
-                sms_log.status = SmsStatus.FAILED
-                sms_log.api_response = {'error': response.text}
-                db.session.add(sms_log)
-                db.session.commit()
-                
-                return {'success': False, 'error': response.text}
-        else:
-            sms_log.status = SmsStatus.FAILED
-            sms_log.api_response = {'error': f'HTTP {response.status_code}: {response.text}'}
-            db.session.add(sms_log)
-            db.session.commit()
-            
-            return {'success': False, 'error': f'HTTP {response.status_code}: {response.text}'}
-    
-    except requests.exceptions.Timeout:
-        return {'success': False, 'error': 'SMS API timeout'}
-    except requests.exceptions.ConnectionError:
-        return {'success': False, 'error': 'SMS API connection error'}
-    except Exception as e:
-        return {'success': False, 'error': f'SMS API error: {str(e)}'}
-
 
 @monthly_exams_bp.route('/homepage-top-performers', methods=['GET'])
 def get_homepage_top_performers():
     """Get top 3 students from all monthly exams featured on homepage"""
     try:
-        # Find all monthly exams that are marked to show on homepage
-        featured_exams = MonthlyExam.query.filter_by(show_on_homepage=True).all()
+        # Top 3 final rankings of every featured exam in one joined read
+        rows = db.session.query(
+            MonthlyExam.id, MonthlyExam.title, MonthlyExam.month, MonthlyExam.year,
+            Batch.name.label('batch_name'),
+            MonthlyRanking.position, MonthlyRanking.roll_number, MonthlyRanking.final_total,
+            MonthlyRanking.max_possible_total, MonthlyRanking.percentage, MonthlyRanking.grade,
+            User.first_name, User.last_name, User.phoneNumber
+        ).join(
+            MonthlyRanking, MonthlyRanking.monthly_exam_id == MonthlyExam.id
+        ).join(
+            User, User.id == MonthlyRanking.user_id
+        ).outerjoin(
+            Batch, Batch.id == MonthlyExam.batch_id
+        ).filter(
+            MonthlyExam.show_on_homepage == True,
+            MonthlyRanking.is_final == True,
+            MonthlyRanking.position.between(1, 3)
+        ).order_by(MonthlyExam.id, MonthlyRanking.position.asc()).all()
         
-        if not featured_exams:
+        if not rows:
             return success_response('No featured exams', {'featured_results': []})
         
         featured_results = []
-        
-        for exam in featured_exams:
-            # Get top 3 rankings for this exam
-            top_rankings = MonthlyRanking.query.filter_by(
-                monthly_exam_id=exam.id,
-                is_final=True
-            ).order_by(MonthlyRanking.position.asc()).limit(3).all()
+        results_by_exam = {}
+        for row in rows:
+            exam_result = results_by_exam.get(row.id)
+            if exam_result is None:
+                exam_result = {
+                    'exam_id': row.id,
+                    'exam_title': row.title,
+                    'month': row.month,
+                    'year': row.year,
+                    'batch_name': row.batch_name or 'N/A',
+                    'top_students': []
+                }
+                results_by_exam[row.id] = exam_result
+                featured_results.append(exam_result)
             
-            if top_rankings:
-                top_students = []
-                for ranking in top_rankings:
-                    student = User.query.get(ranking.user_id)
-                    if student:
-                        top_students.append({
-                            'position': ranking.position,
-                            'student_name': student.full_name,
-                            'student_phone': student.phoneNumber,
-                            'roll_number': ranking.roll_number,
-                            'total_marks': ranking.final_total,
-                            'total_possible': ranking.max_possible_total,
-                            'percentage': round(ranking.percentage, 2) if ranking.percentage else 0,
-                            'grade': ranking.grade
-                        })
-                
-                featured_results.append({
-                    'exam_id': exam.id,
-                    'exam_title': exam.title,
-                    'month': exam.month,
-                    'year': exam.year,
-                    'batch_name': exam.batch.name if exam.batch else 'N/A',
-                    'top_students': top_students
+            if len(exam_result['top_students']) < 3:
+                exam_result['top_students'].append({
+                    'position': row.position,
+                    'student_name': f"{row.first_name} {row.last_name}",
+                    'student_phone': row.phoneNumber,
+                    'roll_number': row.roll_number,
+                    'total_marks': row.final_total,
+                    'total_possible': row.max_possible_total,
+                    'percentage': round(row.percentage, 2) if row.percentage else 0,
+                    'grade': row.grade
                 })
         
         return success_response('Featured top performers retrieved', {
@@ -4,12 +4,16 @@ Teacher can create class-wise exams with questions
 Students can take exams with auto-submit and instant results
 """
 
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, Response, request, jsonify, current_app
 from models import db, OnlineExam, OnlineQuestion, OnlineExamAttempt, OnlineStudentAnswer, User, UserRole
 from utils.auth import login_required, get_current_user, require_role
 from utils.response import success_response, error_response
+from services.answer_buffer import buffer_answers, flush_attempt
+from services.exam_scoring import score_attempts
+from services.exam_papers import get_exam_paper, invalidate_exam_paper
+from services.attempt_sweeper import attempt_deadline, reschedule_open_attempts
 from datetime import datetime, timedelta
-from sqlalchemy import func, and_, or_
+from sqlalchemy import func, and_, or_, case
 from sqlalchemy.orm import joinedload
 
 online_exams_bp = Blueprint('online_exams', __name__, url_prefix='/api/online-exams')
@@ -34,6 +38,22 @@ def get_exams():
             exams = OnlineExam.query.filter_by(is_published=True, is_active=True).order_by(OnlineExam.created_at.desc()).all()
         current_app.logger.info(f"[online_exams.get_exams] total_fetched={len(exams)} for role={current_user.role}")
         
+        # Students: their attempt stats for every listed exam from one grouped query
+        attempt_stats = {}
+        if current_user.role == UserRole.STUDENT and exams:
+            submitted = OnlineExamAttempt.is_submitted == True
+            ongoing = OnlineExamAttempt.is_submitted == False
+            attempt_stats = {row.exam_id: row for row in db.session.query(
+                OnlineExamAttempt.exam_id,
+                func.sum(case((submitted, 1), else_=0)).label('attempts_count'),
+                func.max(case((submitted, OnlineExamAttempt.percentage))).label('best_score'),
+                func.max(case((ongoing, OnlineExamAttempt.id))).label('ongoing_attempt_id'),
+                func.max(case((ongoing, OnlineExamAttempt.started_at))).label('ongoing_started_at')
+            ).filter(
+                OnlineExamAttempt.exam_id.in_([exam.id for exam in exams]),
+                OnlineExamAttempt.student_id == current_user.id
+            ).group_by(OnlineExamAttempt.exam_id).all()}
+        
         exams_data = []
         for exam in exams:
             exam_dict = {
@@ -50,31 +70,24 @@ def get_exams():
                 'is_active': exam.is_active,
                 'is_published': exam.is_published,
                 'created_at': exam.created_at.isoformat() if exam.created_at else None,
-                'questions_count': exam.questions.count(),
+                'questions_count': exam.questions_count or 0,
             }
             
             # Add attempt info for students
             if current_user.role == UserRole.STUDENT:
-                attempts = OnlineExamAttempt.query.filter_by(
-                    exam_id=exam.id,
-                    student_id=current_user.id,
-                    is_submitted=True
-                ).order_by(OnlineExamAttempt.submitted_at.desc()).all()
+                stats = attempt_stats.get(exam.id)
+                attempts_count = int(stats.attempts_count or 0) if stats else 0
                 
-                exam_dict['attempts_count'] = len(attempts)
-                exam_dict['best_score'] = max([a.percentage for a in attempts]) if attempts else 0
-                exam_dict['can_retake'] = exam.allow_retake or len(attempts) == 0
+                exam_dict['attempts_count'] = attempts_count
+                exam_dict['best_score'] = (stats.best_score or 0) if stats else 0
+                exam_dict['can_retake'] = exam.allow_retake or attempts_count == 0
                 
                 # Check if there's an ongoing attempt
-                ongoing = OnlineExamAttempt.query.filter_by(
-                    exam_id=exam.id,
-                    student_id=current_user.id,
-                    is_submitted=False
-                ).first()
-                exam_dict['has_ongoing_attempt'] = ongoing is not None
-                if ongoing:
-                    exam_dict['ongoing_attempt_id'] = ongoing.id
-                    exam_dict['ongoing_started_at'] = ongoing.started_at.isoformat()
+                ongoing_attempt_id = stats.ongoing_attempt_id if stats else None
+                exam_dict['has_ongoing_attempt'] = ongoing_attempt_id is not None
+                if ongoing_attempt_id:
+                    exam_dict['ongoing_attempt_id'] = ongoing_attempt_id
+                    exam_dict['ongoing_started_at'] = stats.ongoing_started_at.isoformat() if stats.ongoing_started_at else None
             
             exams_data.append(exam_dict)
         
@@ -214,6 +227,7 @@ def update_exam(exam_id):
             exam.chapter_name = data['chapter_name']
         if 'duration' in data:
             exam.duration = int(data['duration'])
+            reschedule_open_attempts(exam.id, exam.duration)
         if 'pass_percentage' in data:
             exam.pass_percentage = float(data['pass_percentage'])
         if 'allow_retake' in data:
@@ -224,6 +238,7 @@ def update_exam(exam_id):
             exam.is_published = data['is_published']
         
         db.session.commit()
+        invalidate_exam_paper(exam_id)
         
         return success_response('Exam updated successfully')
     
@@ -245,6 +260,7 @@ def delete_exam(exam_id):
         exam_title = exam.title
         db.session.delete(exam)
         db.session.commit()
+        invalidate_exam_paper(exam_id)
         
         return success_response(f'Exam "{exam_title}" deleted successfully with all questions and attempts')
     
@@ -268,7 +284,7 @@ def add_question(exam_id):
             return error_response('Exam not found', 404)
         
         # Check if exam already has max questions
-        current_count = OnlineQuestion.query.filter_by(exam_id=exam_id).count()
+        current_count = exam.questions_count or 0
         if current_count >= exam.total_questions:
             return error_response(f'Exam already has maximum {exam.total_questions} questions', 400)
         
@@ -301,6 +317,7 @@ def add_question(exam_id):
         
         db.session.add(question)
         db.session.commit()
+        invalidate_exam_paper(exam_id)
         
         new_count = current_count + 1
         return success_response(f'Question added successfully ({new_count}/{exam.total_questions})', {
@@ -349,6 +366,7 @@ def update_question(exam_id, question_id):
             question.marks = int(data['marks'])
         
         db.session.commit()
+        invalidate_exam_paper(exam_id)
         
         return success_response('Question updated successfully')
     
@@ -375,6 +393,7 @@ def delete_question(exam_id, question_id):
             q.question_order = idx + 1
         
         db.session.commit()
+        invalidate_exam_paper(exam_id)
         
         return success_response('Question deleted successfully')
     
@@ -387,6 +406,41 @@ def delete_question(exam_id, question_id):
 # STUDENT ROUTES - Taking Exams
 #############################################################################
 
+def _paper_response(message, paper, data):
+    """start_exam's response; questions are left out when the client's If-None-Match already names the paper"""
+    data['exam'] = paper.exam
+    data['questions_etag'] = paper.etag
+    if request.if_none_match.contains(paper.etag):
+        data['questions_unchanged'] = True
+    else:
+        data['questions'] = paper.questions
+    response, status_code = success_response(message, data)
+    response.set_etag(paper.etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response, status_code
+
+@online_exams_bp.route('/<int:exam_id>/paper', methods=['GET'])
+@login_required
+@require_role(UserRole.STUDENT)
+def get_exam_paper_route(exam_id):
+    """Questions of an exam without answers; answers 304 Not Modified while the client's copy is current"""
+    try:
+        exam = OnlineExam.query.get(exam_id)
+        if not exam:
+            return error_response('Exam not found', 404)
+        if not exam.is_published or not exam.is_active:
+            return error_response('This exam is not available', 403)
+        
+        paper = get_exam_paper(exam)
+        response = Response(paper.body, mimetype='application/json')
+        response.set_etag(paper.etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response.make_conditional(request)
+    
+    except Exception as e:
+        current_app.logger.error(f'Error getting exam paper: {str(e)}')
+        return error_response(f'Failed to get exam paper: {str(e)}', 500)
+
 @online_exams_bp.route('/<int:exam_id>/start', methods=['POST'])
 @login_required
 @require_role(UserRole.STUDENT)
@@ -416,6 +470,9 @@ def start_exam(exam_id):
         ).first()
         
         if ongoing:
+            # Buffered answers are scored or returned below
+            flush_attempt(ongoing.id)
+            
             # Check if time has expired
             time_elapsed = int((datetime.utcnow() - ongoing.started_at).total_seconds())
             time_limit = exam.duration * 60
@@ -423,52 +480,23 @@ def start_exam(exam_id):
             if time_elapsed >= time_limit:
                 # Auto-submit expired attempt
                 current_app.logger.info(f"[start_exam] Auto-submitting expired attempt {ongoing.id}")
-                ongoing.is_submitted = True
-                ongoing.submitted_at = datetime.utcnow()
-                
-                # Calculate score
-                answers = OnlineStudentAnswer.query.filter_by(attempt_id=ongoing.id).all()
-                correct_count = sum(1 for a in answers if a.is_correct)
-                total_questions = OnlineQuestion.query.filter_by(exam_id=exam_id).count()
-                
-                ongoing.scored_marks = correct_count
-                ongoing.total_marks = total_questions
-                ongoing.percentage = (correct_count / total_questions * 100) if total_questions > 0 else 0
-                
+                results = score_attempts([ongoing], auto_submitted=True)[ongoing.id]
                 db.session.commit()
-                current_app.logger.info(f"[start_exam] Expired attempt auto-submitted, score: {ongoing.percentage}%")
+                current_app.logger.info(f"[start_exam] Expired attempt auto-submitted, score: {results['percentage']}%")
                 
                 # Now fall through to create new attempt (will be blocked if retakes not allowed)
             
-            # Return the ongoing attempt
-            questions = OnlineQuestion.query.filter_by(exam_id=exam_id).order_by(OnlineQuestion.question_order).all()
-            questions_data = [{
-                'id': q.id,
-                'question_text': q.question_text,
-                'option_a': q.option_a,
-                'option_b': q.option_b,
-                'option_c': q.option_c,
-                'option_d': q.option_d,
-                'question_order': q.question_order,
-                'marks': q.marks
-            } for q in questions]
-            
             # Get existing answers
-            existing_answers = OnlineStudentAnswer.query.filter_by(attempt_id=ongoing.id).all()
-            answers_map = {a.question_id: a.selected_answer for a in existing_answers}
+            answers_map = dict(db.session.query(
+                OnlineStudentAnswer.question_id, OnlineStudentAnswer.selected_answer
+            ).filter(OnlineStudentAnswer.attempt_id == ongoing.id).all())
             
-            return success_response('Continuing existing attempt', {
+            # Return the ongoing attempt
+            return _paper_response('Continuing existing attempt', get_exam_paper(exam), {
                 'attempt_id': ongoing.id,
                 'started_at': ongoing.started_at.isoformat(),
                 'time_remaining': time_limit - time_elapsed,
-                'questions': questions_data,
-                'saved_answers': answers_map,
-                'exam': {
-                    'id': exam.id,
-                    'title': exam.title,
-                    'duration': exam.duration,
-                    'total_questions': exam.total_questions
-                }
+                'saved_answers': answers_map
             })
         
         # Check if retakes are allowed
@@ -482,15 +510,18 @@ def start_exam(exam_id):
             return error_response('Retakes are not allowed for this exam', 403)
         
         # Get questions count (just warn, don't block)
-        questions_count = OnlineQuestion.query.filter_by(exam_id=exam_id).count()
+        questions_count = exam.questions_count or 0
         if questions_count == 0:
             current_app.logger.warning(f"[start_exam] Exam {exam_id} has no questions!")
             return error_response('This exam has no questions yet. Please contact your teacher.', 400)
         
         # Create new attempt
+        started_at = datetime.utcnow()
         attempt = OnlineExamAttempt(
             exam_id=exam_id,
             student_id=current_user.id,
+            started_at=started_at,
+            deadline_at=attempt_deadline(started_at, exam.duration),
             attempt_number=previous_attempts + 1,
             total_marks=questions_count  # Assuming 1 mark per question
         )
@@ -500,33 +531,13 @@ def start_exam(exam_id):
         
         current_app.logger.info(f"[start_exam] Attempt created: attempt_id={attempt.id}")
         
-        # Get questions (without correct answers)
-        questions = OnlineQuestion.query.filter_by(exam_id=exam_id).order_by(OnlineQuestion.question_order).all()
-        current_app.logger.info(f"[start_exam] Questions loaded: count={len(questions)}")
+        # Questions (without correct answers) come from the cached paper
+        paper = get_exam_paper(exam)
+        current_app.logger.info(f"[start_exam] Success! Returning attempt_id={attempt.id} with {len(paper.questions)} questions")
         
-        questions_data = [{
-            'id': q.id,
-            'question_text': q.question_text,
-            'option_a': q.option_a,
-            'option_b': q.option_b,
-            'option_c': q.option_c,
-            'option_d': q.option_d,
-            'question_order': q.question_order,
-            'marks': q.marks
-        } for q in questions]
-        
-        current_app.logger.info(f"[start_exam] Success! Returning attempt_id={attempt.id} with {len(questions_data)} questions")
-        
-        return success_response('Exam started successfully', {
+        return _paper_response('Exam started successfully', paper, {
             'attempt_id': attempt.id,
-            'exam': {
-                'id': exam.id,
-                'title': exam.title,
-                'duration': exam.duration,
-                'total_questions': exam.total_questions
-            },
-            'questions': questions_data,
-            'started_at': attempt.started_at.isoformat(),
+            'started_at': started_at.isoformat(),
             'duration_minutes': exam.duration,
             'saved_answers': {}
         })
@@ -540,10 +551,17 @@ def start_exam(exam_id):
 @login_required
 @require_role(UserRole.STUDENT)
 def save_answer(attempt_id):
-    """Save/update a student's answer for a question"""
+    """
+    Save/update a student's answers for an attempt.
+    Accepts one answer ({question_id, selected_answer}) or a batch
+    ({answers: [{question_id, selected_answer}, ...]}). Answers are journaled by
+    the answer buffer and written to the database in batches.
+    """
     try:
         current_user = get_current_user()
-        attempt = OnlineExamAttempt.query.get(attempt_id)
+        attempt = db.session.query(OnlineExamAttempt.student_id, OnlineExamAttempt.is_submitted).filter(
+            OnlineExamAttempt.id == attempt_id
+        ).first()
         
         if not attempt:
             return error_response('Attempt not found', 404)
@@ -554,38 +572,40 @@ def save_answer(attempt_id):
         if attempt.is_submitted:
             return error_response('Exam already submitted', 400)
         
-        data = request.get_json()
-        question_id = data.get('question_id')
-        selected_answer = data.get('selected_answer', '').upper() if data.get('selected_answer') else None
-        
-        if not question_id:
-            return error_response('Question ID required', 400)
-        
-        if selected_answer and selected_answer not in ['A', 'B', 'C', 'D']:
-            return error_response('Invalid answer option', 400)
+        data = request.get_json() or {}
+        items = data['answers'] if isinstance(data.get('answers'), list) else [data]
         
-        # Check if answer already exists
-        student_answer = OnlineStudentAnswer.query.filter_by(
-            attempt_id=attempt_id,
-            question_id=question_id
-        ).first()
+        answers = []
+        for item in items:
+            if not isinstance(item, dict):
+                return error_response('Invalid answer format', 400)
+            
+            question_id = item.get('question_id')
+            selected_answer = item.get('selected_answer', '').upper() if item.get('selected_answer') else None
+            
+            if not question_id:
+                return error_response('Question ID required', 400)
+            
+            try:
+                question_id = int(question_id)
+            except (TypeError, ValueError):
+                return error_response('Invalid question ID', 400)
+            
+            if selected_answer and selected_answer not in ['A', 'B', 'C', 'D']:
+                return error_response('Invalid answer option', 400)
+            
+            answers.append((question_id, selected_answer))
         
-        if student_answer:
-            # Update existing answer
-            student_answer.selected_answer = selected_answer
-            student_answer.answered_at = datetime.utcnow()
-        else:
-            # Create new answer
-            student_answer = OnlineStudentAnswer(
-                attempt_id=attempt_id,
-                question_id=question_id,
-                selected_answer=selected_answer
-            )
-            db.session.add(student_answer)
+        pending = buffer_answers(attempt_id, answers)
         
-        db.session.commit()
+        if pending >= current_app.config['ANSWER_BUFFER_MAX_PENDING']:
+            try:
+                flush_attempt(attempt_id, blocking=False)
+            except Exception as e:
+                # The answers are safe in the journal; the interval flusher retries
+                current_app.logger.warning(f'Deferred answer flush for attempt {attempt_id}: {str(e)}')
         
-        return success_response('Answer saved successfully')
+        return success_response('Answer saved successfully', {'saved': len(answers)})
     
     except Exception as e:
         db.session.rollback()
@@ -599,6 +619,7 @@ def submit_exam(attempt_id):
     """Submit exam and calculate results"""
     try:
         current_user = get_current_user()
+        
         # Eager load exam to avoid lazy loading issues
         attempt = OnlineExamAttempt.query.options(joinedload(OnlineExamAttempt.exam)).get(attempt_id)
         
@@ -610,6 +631,9 @@ def submit_exam(attempt_id):
             current_app.logger.error(f'Unauthorized access to attempt {attempt_id} by user {current_user.id}')
             return error_response('Unauthorized', 403)
         
+        # Score against every answer, including ones still in the answer buffer
+        flush_attempt(attempt_id)
+        
         if attempt.is_submitted:
             current_app.logger.warning(f'Attempt {attempt_id} already submitted')
             return error_response('Exam already submitted', 400)
@@ -628,72 +652,26 @@ def submit_exam(attempt_id):
         data = request.get_json() or {}
         auto_submit = data.get('auto_submit', False)
         
-        # Calculate time taken
-        time_taken = int((datetime.utcnow() - attempt.started_at).total_seconds())
-        
-        # Get all questions for this exam
-        questions = OnlineQuestion.query.filter_by(exam_id=attempt.exam_id).all()
-        
-        # Calculate score
-        total_score = 0
-        total_marks = sum(q.marks for q in questions)
-        
-        for question in questions:
-            # Get student's answer
-            student_answer = OnlineStudentAnswer.query.filter_by(
-                attempt_id=attempt_id,
-                question_id=question.id
-            ).first()
-            
-            if student_answer and student_answer.selected_answer == question.correct_answer:
-                # Correct answer
-                student_answer.is_correct = True
-                student_answer.marks_obtained = question.marks
-                total_score += question.marks
-            elif student_answer:
-                # Wrong answer
-                student_answer.is_correct = False
-                student_answer.marks_obtained = 0
-            else:
-                # No answer submitted - create record
-                student_answer = OnlineStudentAnswer(
-                    attempt_id=attempt_id,
-                    question_id=question.id,
-                    selected_answer=None,
-                    is_correct=False,
-                    marks_obtained=0
-                )
-                db.session.add(student_answer)
-        
-        # Get pass percentage from exam
-        pass_percentage = exam.pass_percentage
-        current_app.logger.info(f'Exam pass percentage: {pass_percentage}%, Total questions: {len(questions)}, Total score: {total_score}/{total_marks}')
-        
-        # Update attempt
-        attempt.is_submitted = True
-        attempt.submitted_at = datetime.utcnow()
-        attempt.time_taken = time_taken
-        attempt.score = total_score
-        attempt.total_marks = total_marks
-        attempt.percentage = (total_score / total_marks * 100) if total_marks > 0 else 0
-        attempt.is_passed = attempt.percentage >= pass_percentage
-        attempt.auto_submitted = auto_submit
-        
+        results = score_attempts([attempt], auto_submitted=bool(auto_submit))[attempt_id]
         db.session.commit()
         
+        total_score = results['score']
+        total_marks = results['total_marks']
+        time_taken = results['time_taken']
+        
         # Format time_taken for display
         minutes = time_taken // 60
         seconds = time_taken % 60
         time_taken_display = f"{minutes}m {seconds}s"
         
-        current_app.logger.info(f'Exam submitted successfully - Score: {total_score}/{total_marks} ({attempt.percentage:.2f}%), Passed: {attempt.is_passed}')
+        current_app.logger.info(f'Exam submitted successfully - Score: {total_score}/{total_marks} ({results["percentage"]:.2f}%), Passed: {results["is_passed"]}')
         
         return success_response('Exam submitted successfully', {
-            'attempt_id': attempt.id,
+            'attempt_id': attempt_id,
             'score': total_score,
             'total_marks': total_marks,
-            'percentage': round(attempt.percentage, 2),
-            'is_passed': attempt.is_passed,
+            'percentage': round(results['percentage'], 2),
+            'is_passed': results['is_passed'],
             'time_taken': time_taken_display,
             'auto_submitted': auto_submit
         })
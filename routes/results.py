@@ -3,30 +3,16 @@ Results Management Routes
 Monthly result calculation and reporting
 """
 from flask import Blueprint, request
-from models import db, MonthlyResult, User, Batch, ExamSubmission, Attendance, Fee, UserRole, AttendanceStatus, FeeStatus
+from models import db, MonthlyResult, User, Batch, UserRole
 from utils.auth import login_required, require_role, get_current_user, check_batch_access
 from utils.response import success_response, error_response, paginated_response
-from sqlalchemy import or_, and_, func, extract, case
-from datetime import datetime, date
+from services.monthly_results import calculate_batch_results
+from sqlalchemy import or_, and_, func, case
+from datetime import datetime
 import calendar
 
 results_bp = Blueprint('results', __name__)
 
-def calculate_grade(percentage):
-    """Calculate grade based on percentage"""
-    if percentage >= 90:
-        return 'A+'
-    elif percentage >= 80:
-        return 'A'
-    elif percentage >= 70:
-        return 'B'
-    elif percentage >= 60:
-        return 'C'
-    elif percentage >= 50:
-        return 'D'
-    else:
-        return 'F'
-
 @results_bp.route('', methods=['GET'])
 @login_required
 def get_monthly_results():
@@ -156,146 +142,10 @@ def calculate_monthly_results():
         if not batch:
             return error_response('Batch not found', 404)
         
-        # Get all students in batch
-        students = User.query.filter(
-            User.role == UserRole.STUDENT,
-            User.is_active == True
-        ).join(User.batches).filter(Batch.id == batch_id).all()
-        
-        if not students:
+        # Three grouped queries for the whole batch, one upsert
+        calculated_results = calculate_batch_results(batch_id, year, month)
+        if not calculated_results:
             return error_response('No active students found in this batch', 404)
-        
-        # Calculate date range for the month
-        start_date = date(year, month, 1)
-        last_day = calendar.monthrange(year, month)[1]
-        end_date = date(year, month, last_day)
-        
-        calculated_results = []
-        
-        for student in students:
-            # Check if result already exists
-            existing_result = MonthlyResult.query.filter_by(
-                user_id=student.id,
-                batch_id=batch_id,
-                month=month,
-                year=year
-            ).first()
-            
-            # Get exam submissions for the month
-            exam_submissions = db.session.query(ExamSubmission).join(
-                ExamSubmission.exam
-            ).filter(
-                ExamSubmission.user_id == student.id,
-                ExamSubmission.status == 'submitted',
-                func.date(ExamSubmission.submitted_at) >= start_date,
-                func.date(ExamSubmission.submitted_at) <= end_date
-            ).join(
-                ExamSubmission.exam.batches.any(Batch.id == batch_id)
-            ).all()
-            
-            # Calculate exam statistics
-            total_exams = len(exam_submissions)
-            total_marks = sum(submission.total_marks for submission in exam_submissions)
-            obtained_marks = sum(submission.obtained_marks for submission in exam_submissions)
-            exam_percentage = (obtained_marks / total_marks * 100) if total_marks > 0 else 0
-            
-            # Calculate attendance for the month
-            attendance_records = Attendance.query.filter(
-                Attendance.user_id == student.id,
-                Attendance.batch_id == batch_id,
-                Attendance.date >= start_date,
-                Attendance.date <= end_date
-            ).all()
-            
-            if attendance_records:
-                present_count = len([a for a in attendance_records if a.status in [AttendanceStatus.PRESENT, AttendanceStatus.LATE]])
-                attendance_percentage = (present_count / len(attendance_records) * 100)
-            else:
-                attendance_percentage = 0
-            
-            # Check fee status for the month
-            fee_records = Fee.query.filter(
-                Fee.user_id == student.id,
-                Fee.batch_id == batch_id,
-                extract('month', Fee.due_date) == month,
-                extract('year', Fee.due_date) == year
-            ).all()
-            
-            if fee_records:
-                paid_fees = [f for f in fee_records if f.status == FeeStatus.PAID]
-                fee_status = 'paid' if len(paid_fees) == len(fee_records) else 'pending'
-            else:
-                fee_status = 'no_fees'
-            
-            # Calculate grade
-            grade = calculate_grade(exam_percentage)
-            
-            # Generate remarks
-            remarks = []
-            if exam_percentage >= 90:
-                remarks.append('Excellent performance')
-            elif exam_percentage >= 80:
-                remarks.append('Very good performance')
-            elif exam_percentage >= 70:
-                remarks.append('Good performance')
-            elif exam_percentage >= 60:
-                remarks.append('Satisfactory performance')
-            elif exam_percentage < 50:
-                remarks.append('Needs improvement')
-            
-            if attendance_percentage < 75:
-                remarks.append('Poor attendance')
-            elif attendance_percentage >= 95:
-                remarks.append('Excellent attendance')
-            
-            if fee_status == 'pending':
-                remarks.append('Fees pending')
-            
-            remarks_text = '; '.join(remarks) if remarks else None
-            
-            # Create or update monthly result
-            if existing_result:
-                existing_result.total_exams = total_exams
-                existing_result.total_marks = total_marks
-                existing_result.obtained_marks = obtained_marks
-                existing_result.percentage = round(exam_percentage, 2)
-                existing_result.grade = grade
-                existing_result.attendance_percentage = round(attendance_percentage, 2)
-                existing_result.fee_status = fee_status
-                existing_result.remarks = remarks_text
-                existing_result.calculated_at = datetime.utcnow()
-                result = existing_result
-            else:
-                result = MonthlyResult(
-                    user_id=student.id,
-                    batch_id=batch_id,
-                    month=month,
-                    year=year,
-                    total_exams=total_exams,
-                    total_marks=total_marks,
-                    obtained_marks=obtained_marks,
-                    percentage=round(exam_percentage, 2),
-                    grade=grade,
-                    attendance_percentage=round(attendance_percentage, 2),
-                    fee_status=fee_status,
-                    remarks=remarks_text
-                )
-                db.session.add(result)
-            
-            calculated_results.append(result)
-        
-        # Calculate ranks based on percentage
-        calculated_results.sort(key=lambda x: x.percentage, reverse=True)
-        
-        current_rank = 1
-        prev_percentage = None
-        
-        for i, result in enumerate(calculated_results):
-            if prev_percentage is not None and result.percentage < prev_percentage:
-                current_rank = i + 1
-            result.rank = current_rank
-            prev_percentage = result.percentage
-        
         db.session.commit()
         
         result_summary = {
@@ -3,12 +3,14 @@ SMS Management Routes
 SMS sending, template management, and notification system
 """
 from flask import Blueprint, request, jsonify, session
-from models import db, SmsLog, User, Batch, UserRole, SmsStatus, user_batches
-from utils.auth import login_required, require_role, get_current_user
+from models import db, SmsLog, SmsJob, User, Batch, UserRole, SmsStatus, user_batches
+from utils.auth import login_required, require_role, get_current_user, get_current_user_batch_ids
 from utils.response import success_response, error_response, paginated_response
-from sqlalchemy import or_, func, extract
+from services.sms_dispatcher import enqueue_sms, get_job_progress
+from services.sms_gateway import get_gateway_client
+from services.sms_balance import get_balance_summary, charge, InsufficientSmsBalance
+from sqlalchemy import or_, func, extract, case
 from datetime import datetime, date, timedelta
-import requests
 import os
 import re
 
@@ -146,33 +148,6 @@ def calculate_sms_cost(message):
     
     return sms_count
 
-def deduct_sms_balance(sms_count):
-    """Deduct SMS count from local balance in settings"""
-    try:
-        from models import Settings
-        
-        balance_setting = Settings.query.filter_by(key='sms_balance').first()
-        if not balance_setting:
-            # Initialize with default balance
-            balance_setting = Settings(
-                key='sms_balance',
-                value={'balance': 989},
-                category='sms',
-                description='Current SMS balance'
-            )
-            db.session.add(balance_setting)
-        
-        current_balance = balance_setting.value.get('balance', 0) if balance_setting.value else 0
-        new_balance = max(0, current_balance - sms_count)
-        
-        balance_setting.value = {'balance': new_balance}
-        db.session.commit()
-        
-        return new_balance
-    except Exception as e:
-        print(f"Error deducting balance: {e}")
-        return 0
-
 def validate_phone_number(phone):
     """Validate and format phone number"""
     # Remove any non-digit characters
@@ -191,87 +166,55 @@ def validate_phone_number(phone):
     return None
 
 def send_sms_via_api(phone, message):
-    """Send SMS using BulkSMSBD API - Hardcoded Configuration"""
-    try:
-        # Hardcoded SMS API Configuration - DO NOT CHANGE
-        api_key = 'gsOKLO6XtKsANCvgPHNt'
-        sender_id = '8809617628909'
-        api_url = 'http://bulksmsbd.net/api/smsapi'
-        
-        # Format phone number - remove any spaces or special characters
-        formatted_phone = phone.strip().replace(' ', '').replace('-', '').replace('+', '')
-        
-        # Ensure phone starts with 88 for Bangladesh
-        if formatted_phone.startswith('0'):
-            formatted_phone = '88' + formatted_phone
-        elif not formatted_phone.startswith('88'):
-            formatted_phone = '88' + formatted_phone
-        
-        # Build URL with GET parameters
-        params = {
-            'api_key': api_key,
-            'type': 'text',
-            'number': formatted_phone,
-            'senderid': sender_id,
-            'message': message
+    """Send SMS using BulkSMSBD API through the shared pooled gateway client"""
+    result = get_gateway_client().send(phone, message)
+    if result['success']:
+        return {
+            'success': True,
+            'message_id': result.get('message_id'),
+            'cost': 1
         }
-        
-        print(f"📤 Sending SMS to {formatted_phone}...")
-        print(f"🔗 URL: {api_url}")
-        print(f"📋 Params: {params}")
-        
-        # Send SMS using GET request
-        response = requests.get(api_url, params=params, timeout=30)
-        
-        print(f"📡 Response Status: {response.status_code}")
-        print(f"📄 Response Text: {response.text}")
-        
-        if response.status_code == 200:
-            try:
-                # Parse JSON response
-                response_data = response.json()
-                response_code = response_data.get('response_code')
-                success_message = response_data.get('success_message', '')
-                error_message = response_data.get('error_message', '')
-                
-                print(f"📊 Response Code: {response_code}")
-                
-                # BulkSMSBD success codes (typically 200 or 202)
-                if response_code in [200, 202]:
-                    print(f"✅ SMS sent successfully to {formatted_phone}")
-                    return {
-                        'success': True,
-                        'message_id': success_message,
-                        'cost': 1
-                    }
-                else:
-                    print(f"❌ SMS API error (code {response_code}): {error_message}")
-                    return {
-                        'success': False,
-                        'error': error_message or f"API Error Code: {response_code}"
-                    }
-            except ValueError:
-                # Not JSON response - treat as error
-                print(f"❌ Invalid JSON response: {response.text}")
-                return {
-                    'success': False,
-                    'error': 'Invalid API response format'
-                }
+    return {'success': False, 'error': result.get('error')}
+
+def send_sms_to_numbers(phone_numbers, message, sent_by):
+    """
+    Send one message to many numbers through the pooled gateway client
+    (multi-number requests, concurrent) and build an SmsLog per number.
+    Delivered cost is charged to the balance ledger once.
+    Returns (sms_logs, sent_count, failed_count); the caller adds and commits.
+    """
+    recipients = dict(
+        db.session.query(User.phoneNumber, User.id)
+        .filter(User.phoneNumber.in_(phone_numbers))
+        .all()
+    )
+    results = get_gateway_client().send_messages([(phone, message) for phone in phone_numbers])
+
+    sms_logs = []
+    sent_count = 0
+    failed_count = 0
+    sms_cost = calculate_sms_cost(message)
+    now = datetime.utcnow()
+    for phone, result in zip(phone_numbers, results):
+        sms_log = SmsLog(
+            phone_number=phone,
+            message=message,
+            sent_by=sent_by,
+            user_id=recipients.get(phone),
+            api_response=result
+        )
+        if result['success']:
+            sms_log.status = SmsStatus.SENT
+            sms_log.sent_at = now
+            sms_log.cost = sms_cost
+            sent_count += 1
         else:
-            error_msg = f'HTTP {response.status_code}: {response.text}'
-            print(f"❌ SMS API HTTP error: {error_msg}")
-            return {'success': False, 'error': error_msg}
-    
-    except requests.exceptions.Timeout:
-        print(f"❌ SMS API timeout for {phone}")
-        return {'success': False, 'error': 'SMS API timeout'}
-    except Exception as e:
-        print(f"❌ SMS API exception: {str(e)}")
-        return {'success': False, 'error': str(e)}
-    except requests.exceptions.ConnectionError:
-        return {'success': False, 'error': 'SMS API connection error'}
-    except Exception as e:
-        return {'success': False, 'error': f'SMS API error: {str(e)}'}
+            sms_log.status = SmsStatus.FAILED
+            failed_count += 1
+        sms_logs.append(sms_log)
+
+    charge(sent_count * sms_cost, sent_by, f'Sent to {sent_count} recipients')
+    return sms_logs, sent_count, failed_count
 
 @sms_bp.route('/send', methods=['POST'])
 @login_required
@@ -320,41 +263,9 @@ def send_sms():
         if not phone_numbers:
             return error_response('No valid phone numbers found', 400)
         
-        # Send SMS to each recipient (no balance check - API handles it)
-        sent_count = 0
-        failed_count = 0
-        sms_logs = []
-        
-        for phone in phone_numbers:
-            # Create SMS log entry
-            sms_log = SmsLog(
-                phone_number=phone,
-                message=message,
-                sent_by=current_user.id,
-                status=SmsStatus.PENDING
-            )
-            
-            # Find user by phone number
-            user = User.query.filter_by(phone=phone).first()
-            if user:
-                sms_log.user_id = user.id
-            
-            # Send SMS
-            result = send_sms_via_api(phone, message)
-            
-            if result['success']:
-                sms_log.status = SmsStatus.SENT
-                sms_log.sent_at = datetime.utcnow()
-                sms_log.api_response = result
-                sms_log.cost = result.get('cost', 1)
-                sent_count += 1
-            else:
-                sms_log.status = SmsStatus.FAILED
-                sms_log.api_response = result
-                failed_count += 1
-            
-            db.session.add(sms_log)
-            sms_logs.append(sms_log)
+        # Send SMS to all recipients (no balance check - API handles it)
+        sms_logs, sent_count, failed_count = send_sms_to_numbers(phone_numbers, message, current_user.id)
+        db.session.add_all(sms_logs)
         
         # Update user's SMS count
         current_user.sms_count -= sent_count
@@ -434,39 +345,9 @@ def send_batch_sms():
         if not phone_numbers:
             return error_response('No valid phone numbers found in selected batches', 400)
         
-        # Send SMS to each recipient (no balance check - API handles it)
-        sent_count = 0
-        failed_count = 0
-        
-        for phone in phone_numbers:
-            # Create SMS log entry
-            sms_log = SmsLog(
-                phone_number=phone,
-                message=message,
-                sent_by=current_user.id,
-                status=SmsStatus.PENDING
-            )
-            
-            # Find user by phone number
-            user = User.query.filter_by(phone=phone).first()
-            if user:
-                sms_log.user_id = user.id
-            
-            # Send SMS
-            result = send_sms_via_api(phone, message)
-            
-            if result['success']:
-                sms_log.status = SmsStatus.SENT
-                sms_log.sent_at = datetime.utcnow()
-                sms_log.api_response = result
-                sms_log.cost = result.get('cost', 1)
-                sent_count += 1
-            else:
-                sms_log.status = SmsStatus.FAILED
-                sms_log.api_response = result
-                failed_count += 1
-            
-            db.session.add(sms_log)
+        # Send SMS to all recipients (no balance check - API handles it)
+        sms_logs, sent_count, failed_count = send_sms_to_numbers(phone_numbers, message, current_user.id)
+        db.session.add_all(sms_logs)
         
         # Update user's SMS count
         current_user.sms_count -= sent_count
@@ -692,91 +573,67 @@ def validate_sms_message():
     except Exception as e:
         return error_response(f'Failed to validate message: {str(e)}', 500)
 
+def _sent_counts(user_id):
+    """Total and this-month delivered SMS of a sender, in one aggregate query"""
+    now = datetime.now()
+    month_start = datetime(now.year, now.month, 1)
+    total_sent, sent_this_month = db.session.query(
+        func.count(SmsLog.id),
+        func.sum(case((SmsLog.sent_at >= month_start, 1), else_=0))
+    ).filter(
+        SmsLog.sent_by == user_id,
+        SmsLog.status == SmsStatus.SENT
+    ).one()
+    return total_sent or 0, int(sent_this_month or 0)
+
 @sms_bp.route('/balance', methods=['GET'])
 @login_required
 @require_role(UserRole.TEACHER, UserRole.SUPER_USER)
 def get_sms_balance():
-    """Get SMS balance from local settings"""
+    """Get SMS balance from the balance ledger"""
     try:
-        from models import Settings
-        
-        # Get balance from settings
-        balance_setting = Settings.query.filter_by(key='sms_balance').first()
-        if not balance_setting:
-            # Initialize with default balance
-            balance_setting = Settings(
-                key='sms_balance',
-                value={'balance': 989},
-                category='sms',
-                description='Current SMS balance'
-            )
-            db.session.add(balance_setting)
-            db.session.commit()
-        
-        balance = balance_setting.value.get('balance', 0) if balance_setting.value else 0
-        
-        current_user = get_current_user()
-        total_sent = SmsLog.query.filter(
-            SmsLog.sent_by == current_user.id,
-            SmsLog.status == SmsStatus.SENT
-        ).count()
+        summary = get_balance_summary()
+        db.session.commit()  # Persists the balance row if this was its first use
 
-        current_month = datetime.now().month
-        sent_this_month = SmsLog.query.filter(
-            SmsLog.sent_by == current_user.id,
-            SmsLog.status == SmsStatus.SENT,
-            func.extract('month', SmsLog.sent_at) == current_month
-        ).count()
+        current_user = get_current_user()
+        total_sent, sent_this_month = _sent_counts(current_user.id)
 
         return success_response('SMS balance retrieved', {
-            'balance': balance,
+            'balance': summary['available'],
+            'reserved': summary['reserved'],
             'total_sent': total_sent,
             'sent_this_month': sent_this_month
         })
 
     except Exception as e:
+        db.session.rollback()
         return error_response(f'Failed to get SMS balance: {str(e)}', 500)
 
 
 @sms_bp.route('/balance-check', methods=['GET'])
 def get_sms_balance_noauth():
-    """Get SMS balance from local settings (no auth required)"""
+    """Get SMS balance from the balance ledger (no auth required)"""
     try:
-        from models import Settings
-        
-        # Get balance from settings
-        balance_setting = Settings.query.filter_by(key='sms_balance').first()
-        if not balance_setting:
-            # Initialize with default balance
-            balance_setting = Settings(
-                key='sms_balance',
-                value={'balance': 989},
-                category='sms',
-                description='Current SMS balance'
-            )
-            db.session.add(balance_setting)
-            db.session.commit()
-        
-        balance = balance_setting.value.get('balance', 0) if balance_setting.value else 0
+        summary = get_balance_summary()
+        db.session.commit()  # Persists the balance row if this was its first use
 
         # Get Sample Teacher for stats
         teacher = User.query.filter_by(first_name='Sample', last_name='Teacher', role=UserRole.TEACHER).first()
         
         total_sent = 0
         if teacher:
-            total_sent = SmsLog.query.filter(
-                SmsLog.sent_by == teacher.id,
-                SmsLog.status == SmsStatus.SENT
-            ).count()
+            total_sent, _ = _sent_counts(teacher.id)
 
         return success_response('SMS balance retrieved', {
-            'balance': balance,
+            'balance': summary['available'],
+            'reserved': summary['reserved'],
             'total_sent': total_sent,
             'teacher_name': teacher.full_name if teacher else 'N/A',
             'teacher_phone': teacher.phone if teacher else 'N/A'
         })
 
     except Exception as e:
+        db.session.rollback()
         return error_response(f'Failed to get SMS balance: {str(e)}', 500)
 
 
@@ -963,27 +820,51 @@ def add_sms_credits():
 def get_sms_system_stats():
     """Get SMS system statistics (Super Admin only)"""
     try:
-        # Get all teachers with their SMS counts
-        teachers = User.query.filter_by(role=UserRole.TEACHER, is_active=True).all()
-        
-        total_credits_distributed = sum(teacher.sms_count or 0 for teacher in teachers)
-        active_teachers = len([t for t in teachers if (t.sms_count or 0) > 0])
-        
-        # Get total SMS sent (approximation of credits used)
-        total_sent = SmsLog.query.filter_by(status=SmsStatus.SENT).count()
+        # Teacher credit totals in one aggregate instead of loading every teacher
+        total_teachers, total_credits_distributed, active_teachers = db.session.query(
+            func.count(User.id),
+            func.sum(User.sms_count),
+            func.sum(case((User.sms_count > 0, 1), else_=0))
+        ).filter(User.role == UserRole.TEACHER, User.is_active == True).one()
+
+        # Credits used come from the ledger's running total
+        summary = get_balance_summary()
+        db.session.commit()
         
         stats = {
-            'totalCreditsDistributed': total_credits_distributed,
-            'totalCreditsUsed': total_sent,  # Approximation
-            'activeTeachers': active_teachers,
-            'totalTeachers': len(teachers)
+            'totalCreditsDistributed': int(total_credits_distributed or 0),
+            'totalCreditsUsed': summary['total_used'],
+            'activeTeachers': int(active_teachers or 0),
+            'totalTeachers': total_teachers,
+            'balance': summary['available'],
+            'reserved': summary['reserved']
         }
         
         return success_response('SMS system statistics retrieved', stats)
         
     except Exception as e:
+        db.session.rollback()
         return error_response(f'Failed to get SMS system statistics: {str(e)}', 500)
 
+@sms_bp.route('/jobs/<int:job_id>', methods=['GET'])
+@login_required
+@require_role(UserRole.TEACHER, UserRole.SUPER_USER)
+def get_sms_job(job_id):
+    """Get delivery progress of a queued SMS job"""
+    try:
+        current_user = get_current_user()
+        job = SmsJob.query.get(job_id)
+        if not job:
+            return error_response('SMS job not found', 404)
+
+        if current_user.role == UserRole.TEACHER and job.created_by != current_user.id:
+            return error_response('You do not have access to this SMS job', 403)
+
+        return success_response('SMS job progress retrieved', get_job_progress(job))
+
+    except Exception as e:
+        return error_response(f'Failed to get SMS job: {str(e)}', 500)
+
 @sms_bp.route('/send-bulk', methods=['POST'])
 @login_required
 @require_role(UserRole.TEACHER, UserRole.SUPER_USER)
@@ -1033,7 +914,7 @@ def send_bulk_sms():
         if not batch:
             return error_response('Batch not found', 404)
 
-        if current_user.role == UserRole.TEACHER and batch not in current_user.batches:
+        if current_user.role == UserRole.TEACHER and batch.id not in get_current_user_batch_ids():
             return error_response('You do not have access to this batch', 403)
 
         # Determine recipients based on selection type
@@ -1061,80 +942,31 @@ def send_bulk_sms():
         if not valid_recipients:
             return error_response('No recipients have valid phone numbers', 400)
 
-        # Send SMS to each recipient (no balance check - API handles it)
-        sent_count = 0
-        failed_count = 0
-        failed_recipients = []
-
+        # Queue one message per recipient; the SMS dispatcher delivers them in the background
+        today = datetime.now().strftime('%d/%m/%Y')
+        outbox = []
         for student, phone in valid_recipients:
-            try:
-                message_to_send = base_message
-                message_to_send = message_to_send.replace('{student_name}', (student.first_name or ''))
-                message_to_send = message_to_send.replace('{batch_name}', batch.name or '')
-                message_to_send = message_to_send.replace('{date}', datetime.now().strftime('%d/%m/%Y'))
-                message_to_send = message_to_send.replace('{total}', str(getattr(student, 'total_marks', '')))
-                message_to_send = message_to_send.replace('{marks}', str(getattr(student, 'obtained_marks', '')))
-                message_to_send = message_to_send.replace('{subject}', getattr(student, 'subject', ''))
-
-                sms_response = send_sms_via_api(phone, message_to_send)
-
-                if sms_response.get('success'):
-                    # Calculate SMS cost based on message content
-                    sms_cost = calculate_sms_cost(message_to_send)
-                    
-                    sms_log = SmsLog(
-                        user_id=student.id,
-                        phone_number=phone,
-                        message=message_to_send,
-                        status=SmsStatus.SENT,
-                        api_response=sms_response,
-                        sent_by=current_user.id,
-                        cost=sms_cost,
-                        sent_at=datetime.utcnow()
-                    )
-                    db.session.add(sms_log)
-                    
-                    # Deduct from local balance
-                    deduct_sms_balance(sms_cost)
-                    sent_count += 1
-                else:
-                    sms_log = SmsLog(
-                        user_id=student.id,
-                        phone_number=phone,
-                        message=message_to_send,
-                        status=SmsStatus.FAILED,
-                        api_response=sms_response,
-                        sent_by=current_user.id,
-                        cost=0,
-                        sent_at=datetime.utcnow()
-                    )
-                    db.session.add(sms_log)
-                    failed_count += 1
-                    failed_recipients.append(student.full_name)
-
-            except Exception as e:
-                sms_log = SmsLog(
-                    user_id=student.id,
-                    phone_number=phone,
-                    message=base_message,
-                    status=SmsStatus.FAILED,
-                    api_response={'error': str(e)},
-                    sent_by=current_user.id,
-                    cost=0,
-                    sent_at=datetime.utcnow()
-                )
-                db.session.add(sms_log)
-                failed_count += 1
-                failed_recipients.append(student.full_name)
-
-        if invalid_recipients:
-            failed_recipients.extend([f'{name} (invalid phone)' for name in invalid_recipients])
+            message_to_send = base_message
+            message_to_send = message_to_send.replace('{student_name}', (student.first_name or ''))
+            message_to_send = message_to_send.replace('{batch_name}', batch.name or '')
+            message_to_send = message_to_send.replace('{date}', today)
+            message_to_send = message_to_send.replace('{total}', str(getattr(student, 'total_marks', '')))
+            message_to_send = message_to_send.replace('{marks}', str(getattr(student, 'obtained_marks', '')))
+            message_to_send = message_to_send.replace('{subject}', getattr(student, 'subject', ''))
+            outbox.append({'phone': phone, 'message': message_to_send, 'user_id': student.id})
 
+        try:
+            job = enqueue_sms(outbox, current_user.id, 'bulk')
+        except InsufficientSmsBalance as e:
+            db.session.rollback()
+            return error_response(str(e), 400)
         db.session.commit()
 
+        failed_recipients = [f'{name} (invalid phone)' for name in invalid_recipients]
+
         response_data = {
-            'sent': sent_count,
-            'failed': failed_count,
+            'job_id': job.id,
+            'queued': len(outbox),
             'total_recipients': len(valid_recipients),
             'remaining_balance': current_user.sms_count or 0,
             'failed_recipients': failed_recipients or None,
@@ -1142,14 +974,7 @@ def send_bulk_sms():
             'used_custom_message': use_custom_message
         }
 
-        if sent_count > 0 and failed_count == 0:
-            message_text = f'Successfully sent SMS to all {sent_count} recipients'
-        elif sent_count > 0 and failed_count > 0:
-            message_text = f'Sent SMS to {sent_count} recipients, {failed_count} failed'
-        else:
-            message_text = f'Failed to send SMS to all {failed_count} recipients'
-
-        return success_response(message_text, response_data)
+        return success_response(f'Queued SMS for {len(outbox)} recipients', response_data, 202)
         
     except Exception as e:
         db.session.rollback()
@@ -1227,64 +1052,31 @@ def send_bulk_sms_noauth():
         if not valid_recipients:
             return error_response('No recipients have valid phone numbers', 400)
 
-        # Send SMS to each recipient (no balance check - API handles it)
-        sent_count = 0
-        failed_count = 0
-
+        # Queue one message per recipient; the SMS dispatcher delivers them in the background
+        today = datetime.now().strftime('%d/%m/%Y')
+        outbox = []
         for student, phone in valid_recipients:
-            try:
-                message_to_send = base_message
-                message_to_send = message_to_send.replace('{student_name}', (student.first_name or ''))
-                message_to_send = message_to_send.replace('{batch_name}', batch.name or '')
-                message_to_send = message_to_send.replace('{date}', datetime.now().strftime('%d/%m/%Y'))
-
-                sms_response = send_sms_via_api(phone, message_to_send)
-
-                if sms_response.get('success'):
-                    # Calculate SMS cost based on message content
-                    sms_cost = calculate_sms_cost(message_to_send)
-                    
-                    sms_log = SmsLog(
-                        user_id=student.id,
-                        phone_number=phone,
-                        message=message_to_send,
-                        status=SmsStatus.SENT,
-                        api_response=sms_response,
-                        sent_by=current_user.id,
-                        cost=sms_cost,
-                        sent_at=datetime.utcnow()
-                    )
-                    db.session.add(sms_log)
-                    
-                    # Deduct from local balance
-                    deduct_sms_balance(sms_cost)
-                    sent_count += 1
-                else:
-                    sms_log = SmsLog(
-                        user_id=student.id,
-                        phone_number=phone,
-                        message=message_to_send,
-                        status=SmsStatus.FAILED,
-                        api_response=sms_response,
-                        sent_by=current_user.id,
-                        cost=0,
-                        sent_at=datetime.utcnow()
-                    )
-                    db.session.add(sms_log)
-                    failed_count += 1
-            except Exception as e:
-                failed_count += 1
+            message_to_send = base_message
+            message_to_send = message_to_send.replace('{student_name}', (student.first_name or ''))
+            message_to_send = message_to_send.replace('{batch_name}', batch.name or '')
+            message_to_send = message_to_send.replace('{date}', today)
+            outbox.append({'phone': phone, 'message': message_to_send, 'user_id': student.id})
 
+        try:
+            job = enqueue_sms(outbox, current_user.id, 'bulk')
+        except InsufficientSmsBalance as e:
+            db.session.rollback()
+            return error_response(str(e), 400)
         db.session.commit()
 
         response_data = {
-            'sent': sent_count,
-            'failed': failed_count,
+            'job_id': job.id,
+            'queued': len(outbox),
             'total_recipients': len(valid_recipients),
             'remaining_balance': current_user.sms_count or 0,
         }
 
-        return success_response(f'SMS sent to {sent_count} recipients', response_data)
+        return success_response(f'Queued SMS for {len(outbox)} recipients', response_data, 202)
         
     except Exception as e:
         db.session.rollback()
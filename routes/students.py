@@ -3,47 +3,51 @@ Student Management Routes
 CRUD operations specifically for student management from teacher dashboard
 """
 from flask import Blueprint, request, session
-from flask_bcrypt import generate_password_hash
-from models import db, User, UserRole, Batch, user_batches
-from utils.auth import login_required, require_role, get_current_user
-from utils.response import success_response, error_response, serialize_user
-from sqlalchemy import or_
-import re
+from models import db, User, UserRole, Batch, StudentImportJob, user_batches
+from utils.auth import (login_required, require_role, get_current_user, get_current_user_batch_ids,
+                        generate_password_hash)
+from utils.phone import validate_phone
+from utils.response import (success_response, error_response, cursor_response, serialize_user,
+                            encode_cursor, decode_cursor)
+from services.student_search import search_filter
+from services.student_import import (ImportFileError, parse_student_file, create_import_job, start_import_job,
+                                     serialize_import_job)
+from sqlalchemy import tuple_
+from sqlalchemy.orm import selectinload
 import secrets
 import string
 from datetime import datetime
 
 students_bp = Blueprint('students', __name__)
 
+STUDENT_PAGE_SIZE = 50
+STUDENT_MAX_PAGE_SIZE = 200
+
 def generate_password(length=8):
     """Generate a random password"""
     alphabet = string.ascii_letters + string.digits
     return ''.join(secrets.choice(alphabet) for _ in range(length))
 
-def validate_phone(phone):
-    """Validate and format phone number"""
-    phone = re.sub(r'[^\d]', '', phone)
-    
-    if phone.startswith('880'):
-        phone = phone[3:]
-    elif phone.startswith('+880'):
-        phone = phone[4:]
-    
-    if len(phone) == 11 and phone.startswith('01'):
-        return phone
-    
-    return None
-
 @students_bp.route('', methods=['GET'])
 @login_required
 @require_role(UserRole.TEACHER, UserRole.SUPER_USER)
 def get_students():
-    """Get all students with their batch information (excludes archived)"""
+    """
+    Get students with their batch information (excludes archived).
+
+    Pages are keyset-paginated on (first_name, last_name, id): pass
+    pagination.next_cursor back as ?cursor= for the next page. ?search= matches
+    every word against name, guardian name, phone, guardian phone and roll number.
+    """
     try:
         batch_id = request.args.get('batch_id', type=int)
         search = request.args.get('search', '').strip()
+        cursor = request.args.get('cursor')
+        limit = min(max(request.args.get('limit', STUDENT_PAGE_SIZE, type=int), 1), STUDENT_MAX_PAGE_SIZE)
         
-        query = User.query.filter(User.role == UserRole.STUDENT, User.is_active == True, User.is_archived == False)
+        query = User.query.options(selectinload(User.batches)).filter(
+            User.role == UserRole.STUDENT, User.is_active == True, User.is_archived == False
+        )
         
         # Filter by batch
         if batch_id:
@@ -51,62 +55,69 @@ def get_students():
         
         # Search filter
         if search:
-            search_filter = or_(
-                User.first_name.ilike(f'%{search}%'),
-                User.last_name.ilike(f'%{search}%'),
-                User.phoneNumber.ilike(f'%{search}%'),
-                User.guardian_name.ilike(f'%{search}%'),
-                User.guardian_phone.ilike(f'%{search}%')
-            )
-            query = query.filter(search_filter)
+            query = query.filter(search_filter(search))
         
-        students = query.order_by(User.first_name, User.last_name).all()
-        
-        students_data = []
-        for student in students:
-            student_data = serialize_user(student)
-            # Add batch information - include ALL batches
-            if student.batches:
-                # Primary batch (first one for backward compatibility)
-                student_data['batch'] = {
-                    'id': student.batches[0].id,
-                    'name': student.batches[0].name,
-                    'description': student.batches[0].description
-                }
-                student_data['batchId'] = student.batches[0].id
-                
-                # All batches this student is enrolled in
-                student_data['batches'] = [{
-                    'id': batch.id,
-                    'name': batch.name,
-                    'description': batch.description
-                } for batch in student.batches]
-                student_data['batchIds'] = [batch.id for batch in student.batches]
-            else:
-                student_data['batch'] = None
-                student_data['batchId'] = None
-                student_data['batches'] = []
-                student_data['batchIds'] = []
-            
-            # Format for frontend
-            student_data['firstName'] = student_data.get('first_name', '')
-            student_data['lastName'] = student_data.get('last_name', '')
-            student_data['phoneNumber'] = student_data.get('phoneNumber', '')  # Fixed: use phoneNumber not phone
-            student_data['studentId'] = student_data.get('student_id', '')
-            student_data['isActive'] = student_data.get('is_active', True)
-            student_data['guardianPhone'] = student_data.get('guardian_phone', '')
-            student_data['guardianName'] = student_data.get('guardian_name', '')
-            student_data['motherName'] = student_data.get('mother_name', '')
-            student_data['address'] = student_data.get('address', '')
-            student_data['school'] = student_data.get('address', '')
-            
-            students_data.append(student_data)
-        
-        return success_response('Students retrieved successfully', students_data)
+        # Resume after the last row of the previous page
+        if cursor:
+            try:
+                first_name, last_name, cursor_id = decode_cursor(cursor)
+                cursor_id = int(cursor_id)
+            except (ValueError, TypeError):
+                return error_response('Invalid cursor', 400)
+            query = query.filter(tuple_(User.first_name, User.last_name, User.id) > (first_name, last_name, cursor_id))
+        
+        students = query.order_by(User.first_name, User.last_name, User.id).limit(limit + 1).all()
+        next_cursor = None
+        if len(students) > limit:
+            students = students[:limit]
+            last = students[-1]
+            next_cursor = encode_cursor(last.first_name, last.last_name, last.id)
+        
+        return cursor_response([_student_row(student) for student in students], next_cursor, limit,
+                               'Students retrieved successfully')
         
     except Exception as e:
         return error_response(f'Failed to retrieve students: {str(e)}', 500)
 
+def _student_row(student):
+    """JSON shape of one student in the student list"""
+    student_data = serialize_user(student)
+    # Add batch information - include ALL batches
+    if student.batches:
+        # Primary batch (first one for backward compatibility)
+        student_data['batch'] = {
+            'id': student.batches[0].id,
+            'name': student.batches[0].name,
+            'description': student.batches[0].description
+        }
+        student_data['batchId'] = student.batches[0].id
+        
+        # All batches this student is enrolled in
+        student_data['batches'] = [{
+            'id': batch.id,
+            'name': batch.name,
+            'description': batch.description
+        } for batch in student.batches]
+        student_data['batchIds'] = [batch.id for batch in student.batches]
+    else:
+        student_data['batch'] = None
+        student_data['batchId'] = None
+        student_data['batches'] = []
+        student_data['batchIds'] = []
+    
+    # Format for frontend
+    student_data['firstName'] = student_data.get('first_name', '')
+    student_data['lastName'] = student_data.get('last_name', '')
+    student_data['phoneNumber'] = student_data.get('phoneNumber', '')  # Fixed: use phoneNumber not phone
+    student_data['studentId'] = student_data.get('student_id', '')
+    student_data['isActive'] = student_data.get('is_active', True)
+    student_data['guardianPhone'] = student_data.get('guardian_phone', '')
+    student_data['guardianName'] = student_data.get('guardian_name', '')
+    student_data['motherName'] = student_data.get('mother_name', '')
+    student_data['address'] = student_data.get('address', '')
+    student_data['school'] = student_data.get('address', '')
+    return student_data
+
 @students_bp.route('', methods=['POST'])
 # @login_required  # Temporarily disabled for testing
 # @require_role(UserRole.TEACHER, UserRole.SUPER_USER)  # Temporarily disabled for testing
@@ -524,110 +535,49 @@ def reset_student_password(student_id):
 @login_required
 @require_role(UserRole.TEACHER, UserRole.SUPER_USER)
 def bulk_import_students():
-    """Bulk import students from CSV data"""
+    """
+    Bulk import students from an uploaded CSV/XLSX file (multipart field 'file')
+    or a JSON {'students': [...]} list. The import runs as a background job;
+    poll GET /bulk-import/<job_id> for its progress and results.
+    """
     try:
-        data = request.get_json()
-        
-        if not data or 'students' not in data:
-            return error_response('Students data is required', 400)
-        
-        students_data = data['students']
-        successful_imports = []
-        failed_imports = []
-        
-        for idx, student_data in enumerate(students_data):
+        upload = request.files.get('file')
+        if upload:
             try:
-                # Validate required fields
-                if not all(field in student_data for field in ['firstName', 'lastName', 'phoneNumber']):
-                    failed_imports.append({
-                        'row': idx + 1,
-                        'error': 'Missing required fields (firstName, lastName, phoneNumber)',
-                        'data': student_data
-                    })
-                    continue
-                
-                # Validate phone number
-                phone = validate_phone(student_data['phoneNumber'])
-                if not phone:
-                    failed_imports.append({
-                        'row': idx + 1,
-                        'error': 'Invalid phone number format',
-                        'data': student_data
-                    })
-                    continue
-                
-                # Check if student already exists
-                existing_user = User.query.filter_by(phoneNumber=phone).first()
-                if existing_user:
-                    failed_imports.append({
-                        'row': idx + 1,
-                        'error': 'Student with this phone number already exists',
-                        'data': student_data
-                    })
-                    continue
-                
-                # Generate student ID if not provided
-                student_id = student_data.get('studentId')
-                if not student_id:
-                    current_year = datetime.now().year
-                    count = User.query.filter(User.role == UserRole.STUDENT).count()
-                    student_id = f"{current_year}{count + len(successful_imports) + 1:04d}"
-                
-                # Create new student
-                student = User(
-                    phoneNumber=phone,  # This will be guardian phone for login
-                    first_name=student_data['firstName'].strip(),
-                    last_name=student_data['lastName'].strip(),
-                    email=student_data.get('email', '').strip() if student_data.get('email') else None,
-                    role=UserRole.STUDENT,
-                    is_active=True
-                )
-                
-                # Generate unique password for student
-                from utils.password_generator import generate_simple_unique_password
-                unique_password = generate_simple_unique_password(student_data['firstName'].strip(), phone)
-                student.password_hash = generate_password_hash(unique_password)
-                
-                db.session.add(student)
-                db.session.flush()
-                
-                # Assign to batch if provided
-                batch_id = student_data.get('batchId')
-                if batch_id:
-                    batch = Batch.query.get(batch_id)
-                    if batch:
-                        student.batches.append(batch)
-                
-                successful_imports.append({
-                    'row': idx + 1,
-                    'studentId': student_id,
-                    'name': f"{student.first_name} {student.last_name}",
-                    'phone': phone
-                })
-                
-            except Exception as e:
-                failed_imports.append({
-                    'row': idx + 1,
-                    'error': str(e),
-                    'data': student_data
-                })
-        
-        if successful_imports:
-            db.session.commit()
+                rows = parse_student_file(upload.filename, upload.stream)
+            except ImportFileError as e:
+                return error_response(str(e), 400)
+            filename = upload.filename
         else:
-            db.session.rollback()
+            data = request.get_json(silent=True)
+            if not data or 'students' not in data:
+                return error_response('Students data is required', 400)
+            rows, filename = data['students'], None
         
-        return success_response('Bulk import completed', {
-            'successful': len(successful_imports),
-            'failed': len(failed_imports),
-            'successfulImports': successful_imports,
-            'failedImports': failed_imports
-        })
+        if not rows:
+            return error_response('No students found in the import', 400)
+        
+        current_user = get_current_user()
+        job = create_import_job(rows, current_user.id if current_user else None, filename)
+        db.session.commit()
+        start_import_job(job.id, rows)
+        
+        return success_response('Bulk import started', serialize_import_job(db.session.get(StudentImportJob, job.id)), 202)
         
     except Exception as e:
         db.session.rollback()
         return error_response(f'Failed to import students: {str(e)}', 500)
 
+@students_bp.route('/bulk-import/<int:job_id>', methods=['GET'])
+@login_required
+@require_role(UserRole.TEACHER, UserRole.SUPER_USER)
+def get_bulk_import_status(job_id):
+    """Progress of a bulk import job, with created and rejected rows once it has finished"""
+    job = db.session.get(StudentImportJob, job_id)
+    if not job:
+        return error_response('Import job not found', 404)
+    return success_response('Import job retrieved', serialize_import_job(job))
+
 # ============================================================================
 # ARCHIVE MANAGEMENT ROUTES
 # ============================================================================
@@ -760,25 +710,24 @@ def get_archived_students():
 def get_my_batches():
     """Get current student's batches"""
     try:
-        user_id = session.get('user_id')
-        if not user_id:
+        if not session.get('user_id'):
             return error_response('Not authenticated', 401)
         
-        student = User.query.get(user_id)
+        student = get_current_user()
         if not student or student.role != UserRole.STUDENT:
             return error_response('Student not found', 404)
         
         batches_data = []
-        if student.batches:
-            for batch in student.batches:
-                if batch.is_active:
-                    batches_data.append({
-                        'id': batch.id,
-                        'name': batch.name,
-                        'description': batch.description,
-                        'fee_amount': float(batch.fee_amount),
-                        'is_active': batch.is_active
-                    })
+        batch_ids = get_current_user_batch_ids()
+        if batch_ids:
+            for batch in Batch.query.filter(Batch.id.in_(batch_ids)).order_by(Batch.id).all():
+                batches_data.append({
+                    'id': batch.id,
+                    'name': batch.name,
+                    'description': batch.description,
+                    'fee_amount': float(batch.fee_amount),
+                    'is_active': batch.is_active
+                })
         
         return success_response('Batches retrieved', {'batches': batches_data})
         
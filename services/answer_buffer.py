@@ -0,0 +1,255 @@
+"""
+Online Exam Answer Buffer
+save_answer used to commit one online_student_answers row per click. During a
+class-wide MCQ exam that is thousands of tiny write transactions in a few
+minutes, all queueing on SQLite's single writer lock.
+
+Answers are now appended to a journal file per attempt
+(ANSWER_BUFFER_DIR/<attempt_id>.jsonl, fsync'd before the request returns) and
+written to the database with one upsert per attempt when:
+  - the interval flusher runs (every ANSWER_BUFFER_FLUSH_INTERVAL seconds),
+  - the attempt is submitted or resumed,
+  - a worker has buffered ANSWER_BUFFER_MAX_PENDING answers for the attempt.
+
+The journal directory is shared by every worker, so it does not matter which
+worker took an answer or which one flushes it. A flush moves the journal aside
+to <attempt_id>.flushing and deletes that file only after its upsert has been
+committed. Whatever a crashed or restarted worker leaves behind is replayed by
+the next flush (the upsert is idempotent), so an acknowledged answer is never lost.
+"""
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from flask import current_app
+
+from models import db, OnlineExam, OnlineExamAttempt, OnlineStudentAnswer
+from services.exam_scoring import get_answer_key
+from utils.upsert import bulk_upsert
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines: locks only cover this process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_SUFFIX = '.jsonl'
+FLUSHING_SUFFIX = '.flushing'
+LOCK_STRIPES = 64
+
+_pending: Dict[int, int] = defaultdict(int)
+_pending_lock = threading.Lock()
+_local_locks: Dict[str, threading.Lock] = defaultdict(threading.Lock)
+_thread_lock = threading.Lock()
+_thread: Optional[threading.Thread] = None
+_thread_pid: Optional[int] = None
+
+
+def _buffer_dir() -> str:
+    directory = current_app.config.get('ANSWER_BUFFER_DIR') or os.path.join(current_app.instance_path, 'answer_buffer')
+    os.makedirs(os.path.join(directory, 'locks'), exist_ok=True)
+    return directory
+
+
+@contextmanager
+def _striped_lock(directory: str, kind: str, attempt_id: int, blocking: bool = True):
+    """Cross-process lock shared by the attempts of one stripe; yields False if busy and not blocking"""
+    path = os.path.join(directory, 'locks', f'{kind}-{attempt_id % LOCK_STRIPES:02d}.lock')
+    if fcntl is None:
+        lock = _local_locks[path]
+        acquired = lock.acquire(blocking)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                lock.release()
+        return
+
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            acquired = True
+        except BlockingIOError:
+            acquired = False
+        yield acquired
+    finally:
+        os.close(fd)  # Closing the descriptor releases the lock
+
+
+def buffer_answers(attempt_id: int, answers: Iterable[Tuple[int, Optional[str]]]) -> int:
+    """
+    Durably record (question_id, selected_answer) pairs for an attempt.
+    Returns how many answers this worker has buffered for the attempt since it last flushed it.
+    """
+    answered_at = datetime.utcnow().isoformat()
+    lines = [json.dumps({'q': question_id, 'a': selected_answer, 't': answered_at}) + '\n'
+             for question_id, selected_answer in answers]
+    if not lines:
+        return 0
+
+    directory = _buffer_dir()
+    with _striped_lock(directory, 'append', attempt_id):
+        with open(os.path.join(directory, f'{attempt_id}{JOURNAL_SUFFIX}'), 'a', encoding='utf-8') as journal:
+            journal.write(''.join(lines))
+            journal.flush()
+            if current_app.config.get('ANSWER_BUFFER_FSYNC', True):
+                os.fsync(journal.fileno())
+
+    with _pending_lock:
+        _pending[attempt_id] += len(lines)
+        return _pending[attempt_id]
+
+
+def _read_journal(path: str) -> List[dict]:
+    entries = []
+    with open(path, encoding='utf-8') as journal:
+        for line in journal:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                # A write torn by a crash; its request never got a success response
+                logger.warning(f"Skipping unreadable answer journal line in {path}")
+    return entries
+
+
+def _write_answers(attempt_id: int, entries: List[dict]) -> int:
+    """Upsert the latest buffered answer per question; the caller commits"""
+    attempt = db.session.query(
+        OnlineExamAttempt.exam_id, OnlineExamAttempt.is_submitted, OnlineExam.updated_at
+    ).join(OnlineExam, OnlineExam.id == OnlineExamAttempt.exam_id).filter(
+        OnlineExamAttempt.id == attempt_id
+    ).first()
+    if attempt is None or attempt.is_submitted:
+        # save_answer would have refused these too
+        logger.info(f"Dropping {len(entries)} buffered answer(s) of closed attempt {attempt_id}")
+        return 0
+
+    latest = {}
+    for entry in entries:
+        latest[entry['q']] = entry  # Journal order is arrival order: the last answer wins
+
+    valid_ids = get_answer_key(attempt.exam_id, attempt.updated_at).positions
+
+    rows = [{
+        'attempt_id': attempt_id,
+        'question_id': question_id,
+        'selected_answer': entry['a'],
+        'is_correct': False,
+        'marks_obtained': 0,
+        'answered_at': datetime.fromisoformat(entry['t'])
+    } for question_id, entry in latest.items() if question_id in valid_ids]
+
+    return bulk_upsert(OnlineStudentAnswer, rows, ('attempt_id', 'question_id'), ('selected_answer', 'answered_at'))
+
+
+def flush_attempt(attempt_id: int, blocking: bool = True) -> Optional[int]:
+    """
+    Write an attempt's buffered answers to online_student_answers and commit.
+    Returns the number of answers written, or None when another worker is
+    flushing the same lock stripe and blocking is False.
+    """
+    directory = _buffer_dir()
+    journal = os.path.join(directory, f'{attempt_id}{JOURNAL_SUFFIX}')
+    flushing = os.path.join(directory, f'{attempt_id}{FLUSHING_SUFFIX}')
+
+    with _striped_lock(directory, 'flush', attempt_id, blocking) as acquired:
+        if not acquired:
+            return None
+
+        # Move the journal aside so new answers start a fresh one while this flush runs
+        with _striped_lock(directory, 'append', attempt_id):
+            with _pending_lock:
+                _pending.pop(attempt_id, None)
+            if os.path.exists(journal):
+                if os.path.exists(flushing):
+                    # Left behind by a failed flush: append to it to keep arrival order
+                    with open(journal, 'rb') as src, open(flushing, 'ab') as dst:
+                        shutil.copyfileobj(src, dst)
+                        dst.flush()
+                        os.fsync(dst.fileno())
+                    os.remove(journal)
+                else:
+                    os.replace(journal, flushing)
+
+        if not os.path.exists(flushing):
+            return 0
+
+        try:
+            written = _write_answers(attempt_id, _read_journal(flushing))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        os.remove(flushing)
+        return written
+
+
+def flush_buffered_answers() -> int:
+    """
+    Flush every journal in the buffer directory, including those left by other or
+    restarted workers. Attempts another worker is flushing are skipped.
+    Returns the number of answers written.
+    """
+    directory = _buffer_dir()
+    attempt_ids = set()
+    for name in os.listdir(directory):
+        stem, suffix = os.path.splitext(name)
+        if suffix in (JOURNAL_SUFFIX, FLUSHING_SUFFIX) and stem.isdigit():
+            attempt_ids.add(int(stem))
+
+    written = 0
+    for attempt_id in sorted(attempt_ids):
+        try:
+            written += flush_attempt(attempt_id, blocking=False) or 0
+        except Exception as e:
+            logger.error(f"Answer buffer flush of attempt {attempt_id} failed: {e}")
+    return written
+
+
+def _ensure_thread(app) -> None:
+    global _thread, _thread_pid
+    # Threads do not survive fork, so a preloaded app starts one per worker
+    if _thread is not None and _thread.is_alive() and _thread_pid == os.getpid():
+        return
+    with _thread_lock:
+        if _thread is not None and _thread.is_alive() and _thread_pid == os.getpid():
+            return
+        _thread = threading.Thread(target=_run_flusher, args=(app,), name='answer-buffer', daemon=True)
+        _thread_pid = os.getpid()
+        _thread.start()
+
+
+def _run_flusher(app) -> None:
+    interval = app.config['ANSWER_BUFFER_FLUSH_INTERVAL']
+    while True:
+        # The first pass also recovers journals a previous worker did not get to flush
+        with app.app_context():
+            try:
+                written = flush_buffered_answers()
+                if written:
+                    logger.info(f"Answer buffer flushed {written} answer(s)")
+            except Exception as e:
+                logger.error(f"Answer buffer flusher error: {e}")
+            finally:
+                db.session.remove()
+        time.sleep(interval)
+
+
+def init_answer_buffer(app) -> None:
+    """Start the interval flusher lazily on the first request of each worker"""
+    if app.config.get('ANSWER_BUFFER_FLUSHER') != 'thread':
+        return
+
+    @app.before_request
+    def _start_answer_flusher():
+        _ensure_thread(app)
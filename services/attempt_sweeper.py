@@ -0,0 +1,227 @@
+"""
+Expired Attempt Sweeper
+An online exam attempt whose time ran out used to stay open until the same
+student called start_exam again, or until someone ran clean_expired_attempts.py
+by hand, so stale attempts kept showing up as "ongoing".
+
+Every attempt now carries deadline_at (started_at + the exam's duration),
+indexed together with is_submitted. The sweeper finds open attempts past their
+deadline plus ATTEMPT_SWEEP_GRACE seconds, so the browser's own auto-submit
+normally wins. It flushes their buffered answers and grades them in bulk with
+services.exam_scoring, marking them auto_submitted.
+
+It runs as a background thread in exactly one web worker
+(ATTEMPT_SWEEPER='thread'; the workers elect it through a file lock) or as its
+own process via clean_expired_attempts.py --watch (ATTEMPT_SWEEPER='external').
+Every run records its metrics in a small JSON status file, which
+/health/attempt-sweeper serves together with the live backlog.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from flask import current_app
+from sqlalchemy import bindparam, func, update
+
+from models import db, OnlineExamAttempt
+from services.answer_buffer import flush_attempt
+from services.exam_scoring import score_attempts
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines: every worker may sweep
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_thread_lock = threading.Lock()
+_thread: Optional[threading.Thread] = None
+_thread_pid: Optional[int] = None
+
+
+def attempt_deadline(started_at: datetime, duration_minutes: int) -> datetime:
+    """When an attempt started at started_at runs out of time"""
+    return started_at + timedelta(minutes=duration_minutes or 0)
+
+
+def reschedule_open_attempts(exam_id: int, duration_minutes: int) -> int:
+    """Move the deadlines of an exam's open attempts after its duration changed; the caller commits"""
+    rows = [{'attempt_id': attempt_id, 'deadline_at': attempt_deadline(started_at, duration_minutes)}
+            for attempt_id, started_at in db.session.query(OnlineExamAttempt.id, OnlineExamAttempt.started_at).filter(
+                OnlineExamAttempt.exam_id == exam_id,
+                OnlineExamAttempt.is_submitted == False
+            ).all() if started_at]
+    if rows:
+        table = OnlineExamAttempt.__table__
+        db.session.execute(update(table).where(table.c.id == bindparam('attempt_id')), rows)
+    return len(rows)
+
+
+def _overdue(cutoff: datetime):
+    return (OnlineExamAttempt.is_submitted == False,
+            OnlineExamAttempt.deadline_at <= cutoff)
+
+
+def sweep_expired_attempts(limit: Optional[int] = None) -> int:
+    """
+    Auto-submit one batch of attempts past their deadline and commit.
+    Returns the number of attempts submitted (0 when nothing is overdue).
+    """
+    config = current_app.config
+    limit = limit or config['ATTEMPT_SWEEP_BATCH_SIZE']
+    now = datetime.utcnow()
+    cutoff = now - timedelta(seconds=config['ATTEMPT_SWEEP_GRACE'])
+
+    attempt_ids = [attempt_id for (attempt_id,) in db.session.query(OnlineExamAttempt.id).filter(
+        *_overdue(cutoff)
+    ).order_by(OnlineExamAttempt.deadline_at).limit(limit).all()]
+    if not attempt_ids:
+        return 0
+
+    # Grade the answers still sitting in the answer buffer too
+    for attempt_id in attempt_ids:
+        flush_attempt(attempt_id)
+
+    attempts = OnlineExamAttempt.query.filter(
+        OnlineExamAttempt.id.in_(attempt_ids),
+        OnlineExamAttempt.is_submitted == False
+    ).all()
+    score_attempts(attempts, auto_submitted=True, submitted_at=now)
+    db.session.commit()
+    return len(attempts)
+
+
+def drain_expired_attempts(limit: Optional[int] = None) -> int:
+    """Sweep batches until nothing is overdue and record the run. Returns the number of attempts submitted."""
+    started = time.perf_counter()
+    swept = 0
+    error = None
+    try:
+        while True:
+            count = sweep_expired_attempts(limit)
+            if not count:
+                break
+            swept += count
+    except Exception as e:
+        db.session.rollback()
+        error = str(e)
+        raise
+    finally:
+        _record_run(swept, round((time.perf_counter() - started) * 1000, 2), error)
+    if swept:
+        logger.info(f"Attempt sweeper auto-submitted {swept} expired attempt(s)")
+    return swept
+
+
+def _status_path() -> str:
+    path = current_app.config.get('ATTEMPT_SWEEPER_STATUS_FILE') or \
+        os.path.join(current_app.instance_path, 'attempt_sweeper.json')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def _read_status(path: str) -> Dict[str, Any]:
+    try:
+        with open(path, encoding='utf-8') as status_file:
+            return json.load(status_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _record_run(swept: int, duration_ms: float, error: Optional[str]) -> None:
+    path = _status_path()
+    status = _read_status(path)
+    status.update({
+        'pid': os.getpid(),
+        'runs': status.get('runs', 0) + 1,
+        'errors': status.get('errors', 0) + (1 if error else 0),
+        'total_swept': status.get('total_swept', 0) + swept,
+        'last_run_at': datetime.utcnow().isoformat() + 'Z',
+        'last_swept': swept,
+        'last_duration_ms': duration_ms,
+        'last_error': error
+    })
+    try:
+        # Write-then-rename so readers never see a half-written file
+        with open(f'{path}.{os.getpid()}.tmp', 'w', encoding='utf-8') as status_file:
+            json.dump(status, status_file)
+        os.replace(f'{path}.{os.getpid()}.tmp', path)
+    except OSError as e:
+        logger.warning(f"Could not record attempt sweeper metrics: {e}")
+
+
+def get_sweeper_status() -> Dict[str, Any]:
+    """Metrics of the last sweeps plus the live backlog of overdue open attempts"""
+    config = current_app.config
+    now = datetime.utcnow()
+    count, oldest = db.session.query(
+        func.count(OnlineExamAttempt.id), func.min(OnlineExamAttempt.deadline_at)
+    ).filter(*_overdue(now)).one()
+    return {
+        'mode': config.get('ATTEMPT_SWEEPER'),
+        'interval_seconds': config['ATTEMPT_SWEEP_INTERVAL'],
+        'grace_seconds': config['ATTEMPT_SWEEP_GRACE'],
+        'overdue_attempts': count,
+        'oldest_overdue_seconds': int((now - oldest).total_seconds()) if oldest else 0,
+        **_read_status(_status_path())
+    }
+
+
+def _ensure_thread(app) -> None:
+    global _thread, _thread_pid
+    # Threads do not survive fork, so a preloaded app starts one per worker
+    if _thread is not None and _thread.is_alive() and _thread_pid == os.getpid():
+        return
+    with _thread_lock:
+        if _thread is not None and _thread.is_alive() and _thread_pid == os.getpid():
+            return
+        _thread = threading.Thread(target=_run_sweeper, args=(app,), name='attempt-sweeper', daemon=True)
+        _thread_pid = os.getpid()
+        _thread.start()
+
+
+def _acquire_leadership(path: str) -> Optional[int]:
+    """A descriptor holding the sweeper lock, or None while another worker holds it"""
+    if fcntl is None:
+        return -1
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return fd
+    except BlockingIOError:
+        os.close(fd)
+        return None
+
+
+def _run_sweeper(app) -> None:
+    interval = app.config['ATTEMPT_SWEEP_INTERVAL']
+    os.makedirs(app.instance_path, exist_ok=True)
+    lock_path = os.path.join(app.instance_path, 'attempt_sweeper.lock')
+
+    # Only one worker sweeps; the others retry in case it exits (the OS drops its lock)
+    while _acquire_leadership(lock_path) is None:
+        time.sleep(interval)
+
+    while True:
+        with app.app_context():
+            try:
+                drain_expired_attempts()
+            except Exception as e:
+                logger.error(f"Attempt sweeper error: {e}")
+            finally:
+                db.session.remove()
+        time.sleep(interval)
+
+
+def init_attempt_sweeper(app) -> None:
+    """Start the sweeper thread lazily on the first request of each worker"""
+    if app.config.get('ATTEMPT_SWEEPER') != 'thread':
+        return
+
+    @app.before_request
+    def _start_attempt_sweeper():
+        _ensure_thread(app)
@@ -0,0 +1,121 @@
+"""
+Monthly Attendance Matrix
+The monthly attendance sheet and the ranking's present-day counts both need
+every status of a batch for one month. Instead of re-reading and re-keying
+the attendance rows on every view, each (batch, year, month) is cached in
+attendance_months as one compact string per student: one character per
+day ('P' present, 'A' absent, 'L' late, '.' unmarked).
+
+The matrix is built from the attendance table on first read. After that,
+the bulk marking endpoints patch the affected day in place. Every patch
+is a conditional UPDATE on the row's version. If a concurrent write got
+there first, the cached row is dropped and rebuilt on the next read, so
+the attendance table always stays the source of truth.
+
+None of these functions commit; the caller owns the transaction.
+"""
+import calendar
+import logging
+from datetime import date
+from typing import Dict, Mapping, Optional
+
+from sqlalchemy import delete, update
+
+from models import db, Attendance, AttendanceMonth, AttendanceStatus
+
+logger = logging.getLogger(__name__)
+
+STATUS_CODES = {
+    AttendanceStatus.PRESENT: 'P',
+    AttendanceStatus.ABSENT: 'A',
+    AttendanceStatus.LATE: 'L',
+}
+UNMARKED = '.'
+CODE_STATUSES = {code: status for status, code in STATUS_CODES.items()}
+
+
+def _build_statuses(batch_id: int, year: int, month: int, days: int) -> Dict[str, str]:
+    """Status strings of every student with attendance in the month, from one query"""
+    rows = db.session.query(Attendance.user_id, Attendance.date, Attendance.status).filter(
+        Attendance.batch_id == batch_id,
+        Attendance.date >= date(year, month, 1),
+        Attendance.date <= date(year, month, days)
+    ).all()
+
+    grid: Dict[str, list] = {}
+    for user_id, day, status in rows:
+        cells = grid.setdefault(str(user_id), [UNMARKED] * days)
+        cells[day.day - 1] = STATUS_CODES.get(status, UNMARKED)
+    return {user_id: ''.join(cells) for user_id, cells in grid.items()}
+
+
+def get_month_matrix(batch_id: int, year: int, month: int) -> AttendanceMonth:
+    """The cached matrix of a batch and month, built from the attendance table if missing"""
+    matrix = AttendanceMonth.query.filter_by(batch_id=batch_id, year=year, month=month).first()
+    if matrix is not None:
+        return matrix
+
+    days = calendar.monthrange(year, month)[1]
+    try:
+        with db.session.begin_nested():
+            matrix = AttendanceMonth(batch_id=batch_id, year=year, month=month, days=days,
+                                     statuses=_build_statuses(batch_id, year, month, days), version=0)
+            db.session.add(matrix)
+    except Exception:
+        # Another request built it first
+        logger.info(f"Attendance matrix for batch {batch_id} {year}-{month:02d} built concurrently")
+        matrix = AttendanceMonth.query.filter_by(batch_id=batch_id, year=year, month=month).first()
+    return matrix
+
+
+def record_marks(batch_id: int, day: date, statuses: Mapping[int, AttendanceStatus]) -> None:
+    """
+    Patch one day of a cached matrix after attendance was written for it.
+    A month that is not cached yet is left alone; it is built on first read.
+    """
+    if not statuses:
+        return
+    matrix = AttendanceMonth.query.filter_by(batch_id=batch_id, year=day.year, month=day.month).first()
+    if matrix is None:
+        return
+
+    index = day.day - 1
+    patched = dict(matrix.statuses or {})
+    for user_id, status in statuses.items():
+        cells = list(patched.get(str(user_id)) or UNMARKED * matrix.days)
+        cells[index] = STATUS_CODES.get(status, UNMARKED)
+        patched[str(user_id)] = ''.join(cells)
+
+    result = db.session.execute(
+        update(AttendanceMonth)
+        .where(AttendanceMonth.id == matrix.id, AttendanceMonth.version == matrix.version)
+        .values(statuses=patched, version=AttendanceMonth.version + 1),
+        execution_options={'synchronize_session': False}
+    )
+    if result.rowcount != 1:
+        # Lost a race with another patch: let the next read rebuild from the attendance table
+        invalidate_month_matrix(batch_id, day.year, day.month)
+    db.session.expire(matrix)
+
+
+def invalidate_month_matrix(batch_id: int, year: Optional[int] = None, month: Optional[int] = None) -> None:
+    """Drop cached matrices of a batch (one month, or all of them) after out-of-band attendance changes"""
+    stmt = delete(AttendanceMonth).where(AttendanceMonth.batch_id == batch_id)
+    if year and month:
+        stmt = stmt.where(AttendanceMonth.year == year, AttendanceMonth.month == month)
+    db.session.execute(stmt, execution_options={'synchronize_session': False})
+
+
+def present_counts(batch_id: int, year: int, month: int) -> Dict[int, int]:
+    """Present days per student in a month, counted from the cached matrix"""
+    matrix = get_month_matrix(batch_id, year, month)
+    code = STATUS_CODES[AttendanceStatus.PRESENT]
+    return {int(user_id): cells.count(code) for user_id, cells in (matrix.statuses or {}).items()
+            if code in cells}
+
+
+def decode_statuses(cells: Optional[str], days: int) -> Dict[int, Optional[str]]:
+    """{day: 'present' | 'absent' | 'late' | None} for one student's status string"""
+    cells = cells or UNMARKED * days
+    return {day: (CODE_STATUSES[cells[day - 1]].value if cells[day - 1] in CODE_STATUSES else None)
+            for day in range(1, days + 1)}
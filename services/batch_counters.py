@@ -0,0 +1,138 @@
+"""
+Batch Student Counters
+Every batch list used to load batch.students for each batch just to take
+len() of a filtered list, loading the whole enrollment of every batch shown.
+
+Batch now carries three counters over its student members:
+  - active_students_count: active and not archived
+  - archived_students_count: archived
+  - total_students_count: every student member
+A session listener notes the batches whose membership, or whose members'
+role, active or archive state, changes in a flush, and recounts just those
+batches from user_batches once the flush has written them. Recounting
+instead of applying deltas keeps the counters exact however the change was
+made (User.batches or Batch.students, archive routes, deletes).
+reconcile_batch_counts.py repairs drift from writes that bypass the ORM.
+"""
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import event, func, inspect, select, update
+from sqlalchemy.orm import Session
+
+from models import db, Batch, User, UserRole, user_batches
+
+COUNTER_COLUMNS = ('active_students_count', 'archived_students_count', 'total_students_count')
+
+# User columns that decide which counter a member falls under
+_COUNTED_FIELDS = ('role', 'is_active', 'is_archived')
+
+
+def _member_count(*conditions):
+    batches = Batch.__table__
+    return select(func.count()).select_from(
+        user_batches.join(User.__table__, User.__table__.c.id == user_batches.c.user_id)
+    ).where(
+        user_batches.c.batch_id == batches.c.id,
+        User.__table__.c.role == UserRole.STUDENT,
+        *conditions
+    ).scalar_subquery()
+
+
+def _recount_values():
+    users = User.__table__
+    return {
+        'active_students_count': _member_count(users.c.is_active == True, users.c.is_archived == False),
+        'archived_students_count': _member_count(users.c.is_archived == True),
+        'total_students_count': _member_count()
+    }
+
+
+def recount_batches(connection, batch_ids: Optional[Iterable[int]] = None) -> None:
+    """Recount the counters of the given batches (all batches when None) on a connection"""
+    batches = Batch.__table__
+    stmt = update(batches).values(**_recount_values())
+    if batch_ids is not None:
+        batch_ids = [batch_id for batch_id in set(batch_ids) if batch_id]
+        if not batch_ids:
+            return
+        stmt = stmt.where(batches.c.id.in_(batch_ids))
+    connection.execute(stmt)
+
+
+def find_count_drift() -> List[Dict[str, int]]:
+    """Batches whose stored counters differ from their enrollment"""
+    batches = Batch.__table__
+    actual = _recount_values()
+    rows = db.session.execute(select(
+        batches.c.id,
+        *(batches.c[name] for name in COUNTER_COLUMNS),
+        *(actual[name].label(f'actual_{name}') for name in COUNTER_COLUMNS)
+    )).all()
+    drift = []
+    for row in rows:
+        mapping = row._mapping
+        if any(mapping[name] != mapping[f'actual_{name}'] for name in COUNTER_COLUMNS):
+            drift.append({'batch_id': row.id, **{name: mapping[name] for name in COUNTER_COLUMNS},
+                          **{f'actual_{name}': mapping[f'actual_{name}'] for name in COUNTER_COLUMNS}})
+    return drift
+
+
+def reconcile_batch_counts() -> List[Dict[str, int]]:
+    """Repair drifted counters; the caller commits. Returns the drift that was found."""
+    drift = find_count_drift()
+    if drift:
+        recount_batches(db.session.connection(), [row['batch_id'] for row in drift])
+        db.session.expire_all()
+    return drift
+
+
+@event.listens_for(Session, 'before_flush')
+def _note_counted_changes(session, flush_context, instances):
+    """Remember the batches whose counters this flush changes"""
+    batch_ids = set()
+    new_batches = []
+
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User):
+            state = inspect(obj)
+            history = state.attrs.batches.history
+            for batch in list(history.added) + list(history.deleted):
+                if batch.id:
+                    batch_ids.add(batch.id)
+                else:
+                    new_batches.append(batch)
+            if obj not in session.new and (obj in session.deleted or
+                                           any(state.attrs[f].history.has_changes() for f in _COUNTED_FIELDS)):
+                batch_ids.update(b.id for b in obj.batches)
+        elif isinstance(obj, Batch) and obj not in session.deleted:
+            history = inspect(obj).attrs.students.history
+            if history.added or history.deleted:
+                if obj in session.new:
+                    new_batches.append(obj)
+                else:
+                    batch_ids.add(obj.id)
+
+    if batch_ids or new_batches:
+        pending = session.info.setdefault('recount_batches', {'ids': set(), 'objects': []})
+        pending['ids'].update(batch_ids)
+        pending['objects'].extend(new_batches)
+
+
+@event.listens_for(Session, 'after_flush_postexec')
+def _recount_after_flush(session, flush_context):
+    pending = session.info.pop('recount_batches', None)
+    if not pending:
+        return
+    batch_ids = pending['ids'] | {batch.id for batch in pending['objects'] if batch.id}
+    recount_batches(session.connection(), batch_ids)
+
+    # Loaded batches would otherwise keep showing their pre-flush counts
+    for batch_id in batch_ids:
+        batch = session.identity_map.get(inspect(Batch).identity_key_from_primary_key((batch_id,)))
+        if batch is not None:
+            session.expire(batch, list(COUNTER_COLUMNS))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back_counts(session):
+    session.info.pop('recount_batches', None)
@@ -0,0 +1,155 @@
+"""
+Dashboard Statistics
+The dashboard used to load every batch and walk batch.students for each one,
+lazy-loading the whole student table through user_batches on every page
+view, and the overview repeated its counts on each request.
+
+The numbers now come from grouped COUNT queries (users per role, batches)
+and the batches' maintained student counters, and are cached per process for
+DASHBOARD_CACHE_TTL seconds. Committing a change the dashboard shows (a
+student or batch added, removed, archived, renamed or re-enrolled) drops this
+process's cache; other workers catch up within the TTL. Hit and miss counters are
+served by /health/dashboard-cache.
+"""
+import threading
+import time
+from typing import Any, Callable, Dict
+
+from flask import current_app
+from sqlalchemy import event, func, inspect, or_
+from sqlalchemy.orm import Session
+
+from models import db, User, Batch, UserRole
+
+_cache: Dict[str, tuple] = {}
+_cache_lock = threading.Lock()
+_counters = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+DASHBOARD_USER_FIELDS = ('role', 'is_active', 'is_archived', 'first_name', 'last_name',
+                         'phoneNumber', 'email', 'batches')
+
+
+def _cached(key: str, build: Callable[[], Any]) -> Any:
+    ttl = current_app.config.get('DASHBOARD_CACHE_TTL', 30)
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None and entry[0] > now:
+            _counters['hits'] += 1
+            return entry[1]
+        _counters['misses'] += 1
+
+    value = build()
+    if ttl > 0:
+        with _cache_lock:
+            _cache[key] = (now + ttl, value)
+    return value
+
+
+def invalidate_dashboard_cache() -> None:
+    """Drop this process's cached dashboard numbers"""
+    with _cache_lock:
+        if _cache:
+            _cache.clear()
+            _counters['invalidations'] += 1
+
+
+def get_dashboard_cache_stats() -> Dict[str, Any]:
+    """Hit/miss counters of this process's dashboard cache"""
+    with _cache_lock:
+        lookups = _counters['hits'] + _counters['misses']
+        return {
+            **_counters,
+            'hit_ratio': round(_counters['hits'] / lookups, 4) if lookups else 0.0,
+            'entries': len(_cache),
+            'ttl_seconds': current_app.config.get('DASHBOARD_CACHE_TTL', 30)
+        }
+
+
+def _active_counts() -> Dict[UserRole, int]:
+    """Active users per role; archived students are left out"""
+    return dict(db.session.query(User.role, func.count(User.id)).filter(
+        User.is_active == True,
+        or_(User.role != UserRole.STUDENT, User.is_archived == False)
+    ).group_by(User.role).all())
+
+
+def _build_stats() -> Dict[str, Any]:
+    counts = _active_counts()
+    total_batches = db.session.query(func.count(Batch.id)).scalar()
+
+    recent_students = db.session.query(
+        User.id, User.first_name, User.last_name, User.phoneNumber, User.email, User.created_at
+    ).filter(
+        User.role == UserRole.STUDENT, User.is_active == True, User.is_archived == False
+    ).order_by(User.created_at.desc()).limit(5).all()
+
+    batches = db.session.query(
+        Batch.id, Batch.name, Batch.description, Batch.fee_amount, Batch.is_active, Batch.active_students_count
+    ).order_by(Batch.id).all()
+
+    return {
+        'totalStudents': counts.get(UserRole.STUDENT, 0),
+        'totalBatches': total_batches,
+        'pendingFees': 0.0,  # This would need proper fee management integration
+        'smsCount': 0,  # This would need proper SMS service integration
+        'totalTeachers': counts.get(UserRole.TEACHER, 0),
+        'recentStudents': [{
+            'id': student.id,
+            'name': f"{student.first_name} {student.last_name}",
+            'phoneNumber': student.phoneNumber,
+            'email': student.email,
+            'created_at': student.created_at.isoformat() if student.created_at else None
+        } for student in recent_students],
+        'allBatchesData': [{
+            'id': batch.id,
+            'name': batch.name,
+            'description': batch.description,
+            'student_count': batch.active_students_count,
+            'fee_amount': float(batch.fee_amount or 0),
+            'is_active': batch.is_active
+        } for batch in batches]
+    }
+
+
+def get_admin_stats() -> Dict[str, Any]:
+    """Counts, recent students and per-batch student counts for the admin dashboard"""
+    return _cached('stats', _build_stats)
+
+
+def _build_overview() -> Dict[str, Any]:
+    return {
+        'total_students': _active_counts().get(UserRole.STUDENT, 0),
+        'total_batches': db.session.query(func.count(Batch.id)).filter(Batch.is_active == True).scalar()
+    }
+
+
+def get_teacher_overview() -> Dict[str, Any]:
+    """Active student and batch counts of the teacher/admin overview"""
+    return _cached('overview', _build_overview)
+
+
+def _changes_dashboard(obj) -> bool:
+    if isinstance(obj, Batch):
+        return True
+    # Logins touch users all day; only these fields show on the dashboard
+    state = inspect(obj)
+    return any(state.attrs[name].history.has_changes() for name in DASHBOARD_USER_FIELDS)
+
+
+@event.listens_for(Session, 'before_flush')
+def _note_dashboard_changes(session, flush_context, instances):
+    if any(isinstance(obj, (User, Batch)) for obj in (*session.new, *session.deleted)) or \
+            any(isinstance(obj, (User, Batch)) and _changes_dashboard(obj) for obj in session.dirty):
+        session.info['dashboard_changed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    if session.info.pop('dashboard_changed', False):
+        invalidate_dashboard_cache()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back_changes(session):
+    session.info.pop('dashboard_changed', None)
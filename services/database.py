@@ -0,0 +1,136 @@
+"""
+Database Engine Tuning
+Production runs gunicorn sync workers against a single SQLite file. With the
+default rollback journal, a writer blocks every reader, and a second writer
+fails at once with "database is locked".
+
+Every new SQLite connection is tuned at connect time:
+- WAL journal: readers and the single writer no longer block each other
+- synchronous=NORMAL: safe with WAL; fsync happens at checkpoints instead of every commit
+- busy_timeout: a writer waits for the lock instead of failing
+- mmap_size / cache_size: hot pages are served from memory
+
+gunicorn preloads the app (preload_app=True), so the master opens connections
+(db.create_all()) before it forks. Those pooled connections must never be used
+by a child, so the pool is emptied after create_all and again in every forked
+worker.
+"""
+import logging
+import os
+import threading
+import time
+import weakref
+from typing import Any, Dict, Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+
+from models import db
+
+logger = logging.getLogger(__name__)
+
+_configured_engines = weakref.WeakSet()
+_fork_hook_registered = False
+_fork_hook_lock = threading.Lock()
+
+
+def sqlite_settings(config) -> Dict[str, Any]:
+    """The SQLITE_* settings of an app config (or any mapping)"""
+    return {
+        'journal_mode': config.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': config.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'busy_timeout': int(config.get('SQLITE_BUSY_TIMEOUT', 15000)),
+        'mmap_size': int(config.get('SQLITE_MMAP_SIZE', 0)),
+        'cache_size': int(config.get('SQLITE_CACHE_SIZE', -2000)),
+    }
+
+
+def _is_file_database(engine: Engine) -> bool:
+    return engine.dialect.name == 'sqlite' and engine.url.database not in (None, '', ':memory:')
+
+
+def apply_sqlite_pragmas(dbapi_connection, settings: Dict[str, Any]) -> None:
+    """Run the tuning PRAGMAs on a freshly opened sqlite3 connection"""
+    cursor = dbapi_connection.cursor()
+    try:
+        # busy_timeout first, so switching the journal mode can wait for a lock too
+        cursor.execute(f"PRAGMA busy_timeout = {int(settings['busy_timeout'])}")
+        if settings.get('journal_mode'):
+            cursor.execute(f"PRAGMA journal_mode = {settings['journal_mode']}")
+        if settings.get('synchronous'):
+            cursor.execute(f"PRAGMA synchronous = {settings['synchronous']}")
+        cursor.execute(f"PRAGMA cache_size = {int(settings['cache_size'])}")
+        if settings.get('mmap_size'):
+            cursor.execute(f"PRAGMA mmap_size = {int(settings['mmap_size'])}")
+    finally:
+        cursor.close()
+
+
+def configure_sqlite_engine(engine: Engine, settings: Dict[str, Any]) -> bool:
+    """Tune every connection the engine opens; returns False for non-file databases"""
+    if not _is_file_database(engine):
+        return False
+
+    @event.listens_for(engine, 'connect')
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        apply_sqlite_pragmas(dbapi_connection, settings)
+
+    # Connections opened before the listener existed would miss the pragmas
+    engine.dispose()
+    return True
+
+
+def dispose_engines_after_fork() -> None:
+    """
+    Forget the pooled connections inherited from the parent process.
+    close=False leaves the parent's sqlite handles alone; the child simply
+    opens its own connections on first use.
+    """
+    for engine in list(_configured_engines):
+        engine.dispose(close=False)
+
+
+def init_database_engine(app) -> None:
+    """Apply the SQLITE_* settings to the app's engines and make them fork-safe"""
+    global _fork_hook_registered
+    settings = sqlite_settings(app.config)
+
+    with app.app_context():
+        for engine in db.engines.values():
+            if configure_sqlite_engine(engine, settings):
+                _configured_engines.add(engine)
+                logger.info(f"SQLite engine tuned: {engine.url.database} ({settings['journal_mode']}, "
+                            f"busy_timeout={settings['busy_timeout']}ms)")
+
+    with _fork_hook_lock:
+        if not _fork_hook_registered and hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=dispose_engines_after_fork)
+            _fork_hook_registered = True
+
+
+def release_connections(app) -> None:
+    """Close pooled file connections in this process (the master, before gunicorn forks workers)"""
+    with app.app_context():
+        db.session.remove()
+        for engine in db.engines.values():
+            # An in-memory database lives only as long as its connection
+            if _is_file_database(engine):
+                engine.dispose()
+
+
+def health_check() -> Dict[str, Any]:
+    """Connectivity plus the PRAGMAs a connection actually runs with"""
+    started = time.perf_counter()
+    try:
+        db.session.execute(text('SELECT 1'))
+        status: Dict[str, Any] = {'status': 'healthy', 'message': 'Database connection OK'}
+        if db.engine.dialect.name == 'sqlite':
+            pragmas: Dict[str, Optional[Any]] = {}
+            for pragma in ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'mmap_size'):
+                pragmas[pragma] = db.session.execute(text(f'PRAGMA {pragma}')).scalar()
+            status['sqlite'] = pragmas
+        status['latency_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        return status
+    except Exception as e:
+        db.session.rollback()
+        return {'status': 'unhealthy', 'error': str(e)}
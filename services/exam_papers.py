@@ -0,0 +1,92 @@
+"""
+Online Exam Papers
+start_exam used to load and serialize an exam's whole question set for every
+student who started or resumed it, so a class starting together serialized
+the same questions hundreds of times.
+
+Each exam's student-facing paper (exam header plus questions, never the
+correct answers or explanations) is now built once per process and cached,
+keyed by exam id and the exam's updated_at. Editing the exam or any of its
+questions bumps that timestamp, and the editing routes also drop this
+process's copy right away. Every paper carries an ETag derived from its
+content, so a reconnecting client that already holds the paper gets a
+304 (or, from start_exam, a response without the questions).
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, Optional
+
+from models import db, OnlineExam, OnlineQuestion
+
+EXAM_PAPER_CACHE_SIZE = 128
+
+_papers: 'OrderedDict[int, ExamPaper]' = OrderedDict()
+_papers_lock = threading.Lock()
+
+
+class ExamPaper:
+    """The questions of an exam as students see them, with their pre-encoded JSON body and ETag"""
+    __slots__ = ('exam_id', 'updated_at', 'exam', 'questions', 'etag', 'body')
+
+    def __init__(self, exam: OnlineExam, questions: List[dict]):
+        self.exam_id = exam.id
+        self.updated_at = exam.updated_at
+        self.exam = {
+            'id': exam.id,
+            'title': exam.title,
+            'duration': exam.duration,
+            'total_questions': exam.total_questions
+        }
+        self.questions = questions
+        content = json.dumps({'exam': self.exam, 'questions': questions}, sort_keys=True, ensure_ascii=False)
+        self.etag = f'exam-{exam.id}-{hashlib.sha1(content.encode("utf-8")).hexdigest()[:20]}'
+        self.body = json.dumps({
+            'success': True,
+            'message': 'Exam paper retrieved successfully',
+            'data': {'exam': self.exam, 'questions': questions, 'questions_etag': self.etag}
+        }, ensure_ascii=False).encode('utf-8')
+
+
+def _load_questions(exam_id: int) -> List[dict]:
+    rows = db.session.query(
+        OnlineQuestion.id, OnlineQuestion.question_text, OnlineQuestion.option_a, OnlineQuestion.option_b,
+        OnlineQuestion.option_c, OnlineQuestion.option_d, OnlineQuestion.question_order, OnlineQuestion.marks
+    ).filter(OnlineQuestion.exam_id == exam_id).order_by(OnlineQuestion.question_order, OnlineQuestion.id).all()
+    return [{
+        'id': q.id,
+        'question_text': q.question_text,
+        'option_a': q.option_a,
+        'option_b': q.option_b,
+        'option_c': q.option_c,
+        'option_d': q.option_d,
+        'question_order': q.question_order,
+        'marks': q.marks
+    } for q in rows]
+
+
+def get_exam_paper(exam: OnlineExam) -> ExamPaper:
+    """The cached paper of an exam, rebuilt when the exam's updated_at moved"""
+    updated_at: Optional[datetime] = exam.updated_at
+    with _papers_lock:
+        paper = _papers.get(exam.id)
+        if paper is not None and paper.updated_at == updated_at:
+            _papers.move_to_end(exam.id)
+            return paper
+
+    paper = ExamPaper(exam, _load_questions(exam.id))
+
+    with _papers_lock:
+        _papers[exam.id] = paper
+        _papers.move_to_end(exam.id)
+        while len(_papers) > EXAM_PAPER_CACHE_SIZE:
+            _papers.popitem(last=False)
+    return paper
+
+
+def invalidate_exam_paper(exam_id: int) -> None:
+    """Drop this process's cached paper of an exam after it was edited"""
+    with _papers_lock:
+        _papers.pop(exam_id, None)
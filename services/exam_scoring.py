@@ -0,0 +1,186 @@
+"""
+Online Exam Scoring
+Grading used to load every question of the exam and then look up the
+student's answer to each one with its own query.
+
+Each exam's answer key (question ids, correct options and marks in question
+order) is now cached per process as compact arrays, keyed by exam id and the
+exam's updated_at. Any change to one of its questions bumps that timestamp
+(and keeps the exam's denormalized questions_count current).
+Grading an attempt is one query for its answers plus a position-by-position
+comparison against the key. Graded answers are written back with one upsert
+and the attempts with one executemany UPDATE, however many attempts are
+scored together.
+
+None of these functions commit; the caller owns the transaction.
+"""
+import threading
+from array import array
+from collections import OrderedDict, defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy import bindparam, event, update
+from sqlalchemy.orm import Session
+
+from models import db, OnlineExam, OnlineQuestion, OnlineExamAttempt, OnlineStudentAnswer
+from utils.upsert import bulk_upsert
+
+ANSWER_KEY_CACHE_SIZE = 256
+
+_answer_keys: 'OrderedDict[int, AnswerKey]' = OrderedDict()
+_answer_keys_lock = threading.Lock()
+
+
+class AnswerKey:
+    """Correct options and marks of an exam's questions, in question order"""
+    __slots__ = ('exam_id', 'updated_at', 'question_ids', 'positions', 'correct', 'marks', 'total_marks')
+
+    def __init__(self, exam_id: int, updated_at: Optional[datetime], questions: Sequence):
+        self.exam_id = exam_id
+        self.updated_at = updated_at
+        self.question_ids = array('q', (q.id for q in questions))
+        self.positions = {question_id: index for index, question_id in enumerate(self.question_ids)}
+        self.correct = ''.join((q.correct_answer or ' ')[0].upper() for q in questions)
+        self.marks = array('l', (q.marks if q.marks is not None else 1 for q in questions))
+        self.total_marks = sum(self.marks)
+
+    def grade(self, selected: Dict[int, Optional[str]]) -> List[int]:
+        """Marks obtained per question (in key order) for {question_id: selected_answer}"""
+        chosen = [' '] * len(self.question_ids)
+        for question_id, answer in selected.items():
+            index = self.positions.get(question_id)
+            if index is not None and answer:
+                chosen[index] = answer
+        return [mark if pick == key else 0 for pick, key, mark in zip(chosen, self.correct, self.marks)]
+
+
+def get_answer_key(exam_id: int, updated_at: Optional[datetime]) -> AnswerKey:
+    """The cached answer key of an exam, reloaded when the exam's updated_at moved"""
+    with _answer_keys_lock:
+        key = _answer_keys.get(exam_id)
+        if key is not None and key.updated_at == updated_at:
+            _answer_keys.move_to_end(exam_id)
+            return key
+
+    questions = db.session.query(OnlineQuestion.id, OnlineQuestion.correct_answer, OnlineQuestion.marks).filter(
+        OnlineQuestion.exam_id == exam_id
+    ).order_by(OnlineQuestion.question_order, OnlineQuestion.id).all()
+    key = AnswerKey(exam_id, updated_at, questions)
+
+    with _answer_keys_lock:
+        _answer_keys[exam_id] = key
+        _answer_keys.move_to_end(exam_id)
+        while len(_answer_keys) > ANSWER_KEY_CACHE_SIZE:
+            _answer_keys.popitem(last=False)
+    return key
+
+
+def score_attempts(attempts: Iterable[OnlineExamAttempt], auto_submitted: bool = False,
+                   submitted_at: Optional[datetime] = None) -> Dict[int, dict]:
+    """
+    Grade and submit attempts. Every question gets an answer row (unanswered ones
+    with no selection) carrying is_correct and marks_obtained, and each attempt
+    gets its score, percentage, pass flag and time taken.
+    Returns {attempt_id: {'score', 'total_marks', 'percentage', 'is_passed', 'time_taken'}}.
+    """
+    attempts = list(attempts)
+    if not attempts:
+        return {}
+    submitted_at = submitted_at or datetime.utcnow()
+    attempt_ids = [attempt.id for attempt in attempts]
+
+    exams = {exam.id: exam for exam in db.session.query(
+        OnlineExam.id, OnlineExam.updated_at, OnlineExam.pass_percentage, OnlineExam.duration
+    ).filter(OnlineExam.id.in_({attempt.exam_id for attempt in attempts})).all()}
+
+    selected = defaultdict(dict)
+    for attempt_id, question_id, answer in db.session.query(
+        OnlineStudentAnswer.attempt_id, OnlineStudentAnswer.question_id, OnlineStudentAnswer.selected_answer
+    ).filter(OnlineStudentAnswer.attempt_id.in_(attempt_ids)).all():
+        selected[attempt_id][question_id] = answer
+
+    results = {}
+    answer_rows = []
+    attempt_rows = []
+    for attempt in attempts:
+        exam = exams[attempt.exam_id]
+        key = get_answer_key(exam.id, exam.updated_at)
+        answers = selected[attempt.id]
+        obtained = key.grade(answers)
+
+        score = sum(obtained)
+        percentage = (score / key.total_marks * 100) if key.total_marks > 0 else 0
+        time_taken = int((submitted_at - attempt.started_at).total_seconds()) if attempt.started_at else 0
+        if auto_submitted and exam.duration:
+            time_taken = min(time_taken, exam.duration * 60)
+
+        for question_id, marks in zip(key.question_ids, obtained):
+            answer_rows.append({
+                'attempt_id': attempt.id,
+                'question_id': question_id,
+                'selected_answer': answers.get(question_id),
+                'is_correct': marks > 0,
+                'marks_obtained': marks
+            })
+        attempt_rows.append({
+            'attempt_id': attempt.id,
+            'score': score,
+            'total_marks': key.total_marks,
+            'percentage': percentage,
+            'is_passed': percentage >= (exam.pass_percentage or 0),
+            'time_taken': time_taken
+        })
+        results[attempt.id] = {k: v for k, v in attempt_rows[-1].items() if k != 'attempt_id'}
+
+    bulk_upsert(OnlineStudentAnswer, answer_rows, ('attempt_id', 'question_id'), ('is_correct', 'marks_obtained'))
+
+    # The remaining keys of each row (score, total_marks, ...) become its SET clause;
+    # an attempt submitted concurrently (e.g. by the sweeper) keeps its first result
+    table = OnlineExamAttempt.__table__
+    db.session.execute(
+        update(table)
+        .where(table.c.id == bindparam('attempt_id'), table.c.is_submitted == False)
+        .values(is_submitted=True, submitted_at=submitted_at, auto_submitted=auto_submitted),
+        attempt_rows
+    )
+    for attempt in attempts:
+        db.session.expire(attempt)
+    return results
+
+
+@event.listens_for(Session, 'before_flush')
+def _touch_exam_on_question_change(session, flush_context, instances):
+    """
+    Keep an exam's questions_count in step with its questions and bump its
+    updated_at whenever one of them changes, retiring cached answer keys
+    """
+    deltas = defaultdict(int)
+    for obj in session.new:
+        if not isinstance(obj, OnlineQuestion):
+            continue
+        if obj.exam_id:
+            deltas[obj.exam_id] += 1
+        elif obj.exam is not None and obj.exam in session.new:
+            # The exam is inserted in this same flush, after this hook
+            obj.exam.questions_count = (obj.exam.questions_count or 0) + 1
+    for obj in session.deleted:
+        if isinstance(obj, OnlineQuestion) and obj.exam_id:
+            deltas[obj.exam_id] -= 1
+    for obj in session.dirty:
+        if isinstance(obj, OnlineQuestion) and session.is_modified(obj):
+            deltas.setdefault(obj.exam_id, 0)
+
+    if not deltas:
+        return
+    table = OnlineExam.__table__
+    now = datetime.utcnow()
+    by_delta = defaultdict(list)
+    for exam_id, delta in deltas.items():
+        by_delta[delta].append(exam_id)
+    for delta, exam_ids in by_delta.items():
+        session.connection().execute(
+            update(table)
+            .where(table.c.id.in_(exam_ids))
+            .values(updated_at=now, questions_count=table.c.questions_count + delta)
+        )
@@ -0,0 +1,193 @@
+"""
+Monthly Results
+Calculating a batch's monthly results used to run four queries per student
+(the existing result, exam submissions, every attendance row counted in
+Python, fees), so a 200-student batch cost 800 round trips.
+
+A batch is now calculated from three grouped queries (GROUP BY user_id) over
+the roster: exam totals, attendance counts and fee counts for the month.
+Results are graded and ranked in memory and written with one upsert on
+(user_id, batch_id, month, year), so recalculating a month replaces its rows.
+
+calculate_batch_results does not commit; the caller owns the transaction.
+calculate_monthly_results.py runs it for every active batch at month-end.
+"""
+import calendar
+from datetime import date, datetime, timedelta
+from typing import Dict, List
+
+from sqlalchemy import and_, case, func
+
+from models import (db, MonthlyResult, User, UserRole, Batch, ExamSubmission, Attendance, Fee,
+                    AttendanceStatus, FeeStatus, SubmissionStatus, exam_batches, user_batches)
+from utils.upsert import bulk_upsert
+
+RESULT_COLUMNS = ('total_exams', 'total_marks', 'obtained_marks', 'percentage', 'grade', 'rank',
+                  'attendance_percentage', 'fee_status', 'remarks', 'calculated_at')
+
+
+def calculate_grade(percentage):
+    """Calculate grade based on percentage"""
+    if percentage >= 90:
+        return 'A+'
+    elif percentage >= 80:
+        return 'A'
+    elif percentage >= 70:
+        return 'B'
+    elif percentage >= 60:
+        return 'C'
+    elif percentage >= 50:
+        return 'D'
+    else:
+        return 'F'
+
+
+def result_remarks(exam_percentage, attendance_percentage, fee_status):
+    """Remarks text of a monthly result, or None"""
+    remarks = []
+    if exam_percentage >= 90:
+        remarks.append('Excellent performance')
+    elif exam_percentage >= 80:
+        remarks.append('Very good performance')
+    elif exam_percentage >= 70:
+        remarks.append('Good performance')
+    elif exam_percentage >= 60:
+        remarks.append('Satisfactory performance')
+    elif exam_percentage < 50:
+        remarks.append('Needs improvement')
+
+    if attendance_percentage < 75:
+        remarks.append('Poor attendance')
+    elif attendance_percentage >= 95:
+        remarks.append('Excellent attendance')
+
+    if fee_status == 'pending':
+        remarks.append('Fees pending')
+
+    return '; '.join(remarks) if remarks else None
+
+
+def _exam_totals(batch_id: int, student_ids, start: datetime, end: datetime) -> Dict[int, tuple]:
+    """{user_id: (exams, total_marks, obtained_marks)} of submissions to the batch's exams in [start, end)"""
+    return {row.user_id: (row.exams, row.total_marks or 0, row.obtained_marks or 0) for row in db.session.query(
+        ExamSubmission.user_id,
+        func.count(ExamSubmission.id).label('exams'),
+        func.sum(ExamSubmission.total_marks).label('total_marks'),
+        func.sum(ExamSubmission.obtained_marks).label('obtained_marks')
+    ).join(exam_batches, and_(
+        exam_batches.c.exam_id == ExamSubmission.exam_id,
+        exam_batches.c.batch_id == batch_id
+    )).filter(
+        ExamSubmission.user_id.in_(student_ids),
+        ExamSubmission.status == SubmissionStatus.SUBMITTED,
+        ExamSubmission.submitted_at >= start,
+        ExamSubmission.submitted_at < end
+    ).group_by(ExamSubmission.user_id).all()}
+
+
+def _attendance_counts(batch_id: int, student_ids, first_day: date, last_day: date) -> Dict[int, tuple]:
+    """{user_id: (marked_days, attended_days)}; late counts as attended"""
+    attended = case((Attendance.status.in_([AttendanceStatus.PRESENT, AttendanceStatus.LATE]), 1), else_=0)
+    return {row.user_id: (row.marked, row.attended or 0) for row in db.session.query(
+        Attendance.user_id,
+        func.count(Attendance.id).label('marked'),
+        func.sum(attended).label('attended')
+    ).filter(
+        Attendance.batch_id == batch_id,
+        Attendance.user_id.in_(student_ids),
+        Attendance.date >= first_day,
+        Attendance.date <= last_day
+    ).group_by(Attendance.user_id).all()}
+
+
+def _fee_counts(batch_id: int, student_ids, year: int, month: int) -> Dict[int, tuple]:
+    """{user_id: (fees, paid_fees)} of the month"""
+    paid = case((Fee.status == FeeStatus.PAID, 1), else_=0)
+    return {row.user_id: (row.fees, row.paid or 0) for row in db.session.query(
+        Fee.user_id,
+        func.count(Fee.id).label('fees'),
+        func.sum(paid).label('paid')
+    ).filter(
+        Fee.batch_id == batch_id,
+        Fee.user_id.in_(student_ids),
+        Fee.year == year,
+        Fee.month == month
+    ).group_by(Fee.user_id).all()}
+
+
+def calculate_batch_results(batch_id: int, year: int, month: int) -> List[dict]:
+    """
+    Calculate, rank and upsert the monthly results of a batch's active students.
+    Returns the result rows, best first (empty when the batch has no active students).
+    """
+    student_ids = [user_id for (user_id,) in db.session.query(User.id).join(
+        user_batches, user_batches.c.user_id == User.id
+    ).filter(
+        user_batches.c.batch_id == batch_id,
+        User.role == UserRole.STUDENT,
+        User.is_active == True
+    ).all()]
+    if not student_ids:
+        return []
+
+    first_day = date(year, month, 1)
+    last_day = date(year, month, calendar.monthrange(year, month)[1])
+    month_start = datetime.combine(first_day, datetime.min.time())
+    month_end = datetime.combine(last_day + timedelta(days=1), datetime.min.time())
+
+    exams = _exam_totals(batch_id, student_ids, month_start, month_end)
+    attendance = _attendance_counts(batch_id, student_ids, first_day, last_day)
+    fees = _fee_counts(batch_id, student_ids, year, month)
+
+    calculated_at = datetime.utcnow()
+    rows = []
+    for user_id in student_ids:
+        total_exams, total_marks, obtained_marks = exams.get(user_id, (0, 0, 0))
+        exam_percentage = (obtained_marks / total_marks * 100) if total_marks > 0 else 0
+
+        marked, attended = attendance.get(user_id, (0, 0))
+        attendance_percentage = (attended / marked * 100) if marked else 0
+
+        fee_total, fee_paid = fees.get(user_id, (0, 0))
+        if fee_total:
+            fee_status = 'paid' if fee_paid == fee_total else 'pending'
+        else:
+            fee_status = 'no_fees'
+
+        rows.append({
+            'user_id': user_id,
+            'batch_id': batch_id,
+            'month': month,
+            'year': year,
+            'total_exams': total_exams,
+            'total_marks': total_marks,
+            'obtained_marks': obtained_marks,
+            'percentage': round(exam_percentage, 2),
+            'grade': calculate_grade(exam_percentage),
+            'attendance_percentage': round(attendance_percentage, 2),
+            'fee_status': fee_status,
+            'remarks': result_remarks(exam_percentage, attendance_percentage, fee_status),
+            'calculated_at': calculated_at
+        })
+
+    # Competition ranking: equal percentages share a rank, the next one skips ahead
+    rows.sort(key=lambda row: row['percentage'], reverse=True)
+    previous = None
+    for index, row in enumerate(rows):
+        if previous is None or row['percentage'] < previous['percentage']:
+            row['rank'] = index + 1
+        else:
+            row['rank'] = previous['rank']
+        previous = row
+
+    bulk_upsert(MonthlyResult, rows, ('user_id', 'batch_id', 'month', 'year'), RESULT_COLUMNS)
+    return rows
+
+
+def calculate_all_batches(year: int, month: int) -> Dict[int, int]:
+    """Calculate every active batch, committing each batch on its own. Returns {batch_id: students}."""
+    calculated = {}
+    for (batch_id,) in db.session.query(Batch.id).filter(Batch.is_active == True).order_by(Batch.id).all():
+        calculated[batch_id] = len(calculate_batch_results(batch_id, year, month))
+        db.session.commit()
+    return calculated
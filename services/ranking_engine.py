@@ -0,0 +1,272 @@
+"""
+Monthly Ranking Engine
+Set-based computation of comprehensive monthly exam rankings.
+
+All inputs (roster, marks, attendance counts, existing and previous-month
+rankings) are loaded with a fixed number of grouped queries, and totals,
+GPA and positions are computed in memory.
+"""
+import logging
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple, Any
+
+from models import (db, MonthlyExam, IndividualExam, MonthlyMark, MonthlyRanking,
+                    User, UserRole, user_batches)
+from services.attendance_matrix import present_counts as month_present_counts
+
+logger = logging.getLogger(__name__)
+
+
+def calculate_grade_and_gpa(percentage):
+    """Calculate grade and GPA based on percentage"""
+    if percentage >= 80:
+        return 'A+', 5.00
+    elif percentage >= 70:
+        return 'A', 4.00
+    elif percentage >= 60:
+        return 'A-', 3.50
+    elif percentage >= 50:
+        return 'B', 3.00
+    elif percentage >= 40:
+        return 'C', 2.00
+    elif percentage >= 33:
+        return 'D', 1.00
+    else:
+        return 'F', 0.00
+
+
+def get_month_bounds(year: int, month: int) -> Tuple[date, date]:
+    """Return the first and last day of a calendar month"""
+    month_start = date(year, month, 1)
+    if month == 12:
+        month_end = date(year + 1, 1, 1) - timedelta(days=1)
+    else:
+        month_end = date(year, month + 1, 1) - timedelta(days=1)
+    return month_start, month_end
+
+
+def count_working_days(month_start: date, month_end: date) -> int:
+    """Count weekdays (Monday to Friday) between two dates, inclusive"""
+    total_days = 0
+    current_date = month_start
+    while current_date <= month_end:
+        if current_date.weekday() < 5:
+            total_days += 1
+        current_date += timedelta(days=1)
+    return total_days
+
+
+def get_previous_month_exam(monthly_exam: MonthlyExam) -> Optional[MonthlyExam]:
+    """Find the same batch's monthly exam for the preceding month"""
+    prev_month = monthly_exam.month - 1 if monthly_exam.month > 1 else 12
+    prev_year = monthly_exam.year if monthly_exam.month > 1 else monthly_exam.year - 1
+    return MonthlyExam.query.filter_by(
+        batch_id=monthly_exam.batch_id,
+        month=prev_month,
+        year=prev_year
+    ).first()
+
+
+def serialize_individual_exams(individual_exams: List[IndividualExam]) -> List[Dict[str, Any]]:
+    """Compact individual exam list used by ranking responses"""
+    return [{'id': e.id, 'title': e.title, 'subject': e.subject, 'marks': e.marks} for e in individual_exams]
+
+
+def _load_batch_students(batch_id: int):
+    """Active, non-archived students of a batch as (id, first, last, phone) rows"""
+    return db.session.query(
+        User.id, User.first_name, User.last_name, User.phoneNumber
+    ).join(
+        user_batches, user_batches.c.user_id == User.id
+    ).filter(
+        user_batches.c.batch_id == batch_id,
+        User.role == UserRole.STUDENT,
+        User.is_active == True,
+        User.is_archived == False
+    ).order_by(User.id).all()
+
+
+def _load_marks(exam_id: int) -> Dict[Tuple[int, int], Any]:
+    """All marks of a monthly exam keyed by (user_id, individual_exam_id)"""
+    rows = db.session.query(
+        MonthlyMark.user_id,
+        MonthlyMark.individual_exam_id,
+        MonthlyMark.marks_obtained,
+        MonthlyMark.total_marks,
+        MonthlyMark.is_absent
+    ).filter(MonthlyMark.monthly_exam_id == exam_id).all()
+    return {(row.user_id, row.individual_exam_id): row for row in rows}
+
+
+def _load_rankings(exam_id: int, final_only: bool = False) -> Dict[int, Any]:
+    """Saved ranking rows of a monthly exam keyed by user_id"""
+    query = db.session.query(
+        MonthlyRanking.user_id,
+        MonthlyRanking.position,
+        MonthlyRanking.roll_number,
+        MonthlyRanking.previous_position
+    ).filter(MonthlyRanking.monthly_exam_id == exam_id)
+    if final_only:
+        query = query.filter(MonthlyRanking.is_final == True)
+    return {row.user_id: row for row in query.all()}
+
+
+def compute_comprehensive_ranking(monthly_exam: MonthlyExam) -> Dict[str, Any]:
+    """
+    Compute comprehensive rankings for a monthly exam.
+
+    Returns a dict with:
+        individual_exams: ordered IndividualExam rows
+        rankings: ranking dicts sorted by position (comprehensive-ranking JSON shape)
+        previous_exam: previous month's MonthlyExam or None
+        previous_rolls: {user_id: roll_number} from the previous month's final rankings
+    """
+    exam_id = monthly_exam.id
+
+    individual_exams = IndividualExam.query.filter_by(
+        monthly_exam_id=exam_id
+    ).order_by(IndividualExam.order_index).all()
+
+    students = _load_batch_students(monthly_exam.batch_id)
+    marks = _load_marks(exam_id)
+    existing_rankings = _load_rankings(exam_id)
+
+    # Attendance: 1 mark per present day, only within the exam's own month
+    total_days = 0
+    present_counts: Dict[int, int] = {}
+    has_attendance_window = bool(monthly_exam.start_date and monthly_exam.end_date)
+    if has_attendance_window:
+        month_start, month_end = get_month_bounds(monthly_exam.year, monthly_exam.month)
+        total_days = count_working_days(month_start, month_end)
+        # Counted from the cached attendance month matrix shared with the attendance sheet
+        present_counts = month_present_counts(monthly_exam.batch_id, monthly_exam.year, monthly_exam.month)
+    max_attendance_marks = total_days
+
+    # Previous month's final rankings drive position trends and roll inheritance
+    previous_exam = get_previous_month_exam(monthly_exam)
+    previous_rankings = _load_rankings(previous_exam.id, final_only=True) if previous_exam else {}
+    previous_rolls = {uid: r.roll_number for uid, r in previous_rankings.items() if r.roll_number}
+
+    exam_count = len(individual_exams)
+    rankings = []
+
+    for student in students:
+        student_name = f"{student.first_name} {student.last_name}"
+        individual_marks = {}
+        total_exam_marks = 0
+        total_possible_marks = 0
+        passed_exams = 0
+
+        for exam in individual_exams:
+            mark = marks.get((student.id, exam.id))
+            if mark:
+                mark_percentage = (mark.marks_obtained / mark.total_marks * 100) if mark.total_marks > 0 else 0
+                individual_marks[exam.id] = {
+                    'exam_title': exam.title,
+                    'subject': exam.subject,
+                    'marks_obtained': mark.marks_obtained,
+                    'total_marks': mark.total_marks,
+                    'percentage': round(mark_percentage, 2) if mark.total_marks > 0 else 0,
+                    'is_absent': mark.is_absent,
+                    'grade': calculate_grade_and_gpa(mark_percentage)[0]
+                }
+                if not mark.is_absent:
+                    total_exam_marks += mark.marks_obtained
+                    if mark.marks_obtained >= (mark.total_marks * 0.4):  # 40% pass mark
+                        passed_exams += 1
+                total_possible_marks += mark.total_marks
+            else:
+                individual_marks[exam.id] = {
+                    'exam_title': exam.title,
+                    'subject': exam.subject,
+                    'marks_obtained': 0,
+                    'total_marks': exam.marks,
+                    'percentage': 0,
+                    'is_absent': True,
+                    'grade': 'F'
+                }
+                total_possible_marks += exam.marks
+
+        attendance_marks = present_counts.get(student.id, 0) if has_attendance_window else 0
+        attendance_percentage = (attendance_marks / total_days * 100) if total_days > 0 else 0
+
+        # Final totals: exam marks + attendance marks (no bonus)
+        final_total = total_exam_marks + attendance_marks
+        total_possible = total_possible_marks + max_attendance_marks
+        percentage = (final_total / total_possible * 100) if total_possible > 0 else 0
+
+        grade, gpa = calculate_grade_and_gpa(percentage)
+        exam_gpa = calculate_grade_and_gpa((total_exam_marks / total_possible_marks * 100) if total_possible_marks > 0 else 0)[1]
+
+        existing = existing_rankings.get(student.id)
+        previous = previous_rankings.get(student.id)
+
+        previous_position = existing.previous_position if existing and existing.previous_position else None
+        previous_roll_number = None
+        if previous:
+            previous_position = previous.position
+            previous_roll_number = previous.roll_number
+
+        # Roll number: use existing, or inherit from previous month, or None
+        current_roll_number = None
+        if existing and existing.roll_number:
+            current_roll_number = existing.roll_number
+        elif previous_roll_number:
+            current_roll_number = previous_roll_number
+
+        rankings.append({
+            'user_id': student.id,
+            'student_name': student_name,
+            'student_phone': student.phoneNumber,
+            'roll_number': current_roll_number,
+            'individual_marks': individual_marks,
+            'total_exam_marks': total_exam_marks,
+            'total_possible_marks': total_possible_marks,
+            'attendance_marks': attendance_marks,
+            'max_attendance_marks': max_attendance_marks,
+            'total_attendance_days': total_days,
+            'attendance_percentage': round(attendance_percentage, 2),
+            'final_total': final_total,
+            'total_possible': total_possible,
+            'percentage': round(percentage, 2),
+            'grade': grade,
+            'gpa': round(gpa, 2),
+            'exam_gpa': round(exam_gpa, 2),
+            'passed_exams': passed_exams,
+            'total_exams': exam_count,
+            'previous_position': previous_position
+        })
+
+    assign_positions(rankings)
+
+    return {
+        'individual_exams': individual_exams,
+        'rankings': rankings,
+        'previous_exam': previous_exam,
+        'previous_rolls': previous_rolls
+    }
+
+
+def assign_positions(rankings: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Sort rankings in place and attach position and trend fields"""
+    # Final percentage (descending), then total marks, then name
+    rankings.sort(key=lambda x: (-x['percentage'], -x['final_total'], x['student_name']))
+
+    for idx, rank in enumerate(rankings):
+        current_position = idx + 1
+        rank['current_position'] = current_position
+        rank['position'] = current_position  # For compatibility
+
+        if rank['previous_position']:
+            rank['position_change'] = rank['previous_position'] - current_position
+            if rank['position_change'] > 0:
+                rank['position_trend'] = 'up'
+            elif rank['position_change'] < 0:
+                rank['position_trend'] = 'down'
+            else:
+                rank['position_trend'] = 'same'
+        else:
+            rank['position_change'] = None
+            rank['position_trend'] = 'new'
+
+    return rankings
@@ -0,0 +1,165 @@
+"""
+Monthly Ranking Snapshots
+Persisted comprehensive rankings per monthly exam with dirty-flag invalidation.
+
+Writes that affect a ranking (marks, bonus, individual exam deletes,
+attendance, roll numbers, roster changes) only flag the snapshot dirty.
+The ranking is recomputed by the ranking engine when it is next read,
+or by the background tick in rebuild_ranking_snapshots.py.
+"""
+import json
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterable, Optional
+
+from sqlalchemy import event, inspect, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import db, MonthlyExam, MonthlyRankingSnapshot, User, Batch
+from services.ranking_engine import compute_comprehensive_ranking, serialize_individual_exams
+
+logger = logging.getLogger(__name__)
+
+# User columns that appear in (or decide membership of) a ranking
+_ROSTER_FIELDS = ('is_active', 'is_archived', 'role', 'first_name', 'last_name', 'phoneNumber')
+
+
+def _dirty_values():
+    return {
+        'is_dirty': True,
+        'version': MonthlyRankingSnapshot.version + 1,
+        'dirtied_at': datetime.utcnow()
+    }
+
+
+def mark_rankings_dirty(monthly_exam_ids: Iterable[int]) -> None:
+    """Flag snapshots of the given monthly exams for rebuild (committed by the caller)"""
+    exam_ids = [exam_id for exam_id in set(monthly_exam_ids) if exam_id]
+    if not exam_ids:
+        return
+    db.session.execute(
+        update(MonthlyRankingSnapshot)
+        .where(MonthlyRankingSnapshot.monthly_exam_id.in_(exam_ids))
+        .values(**_dirty_values()),
+        execution_options={'synchronize_session': False}
+    )
+
+
+def mark_batch_rankings_dirty(batch_id: int, year: Optional[int] = None, month: Optional[int] = None) -> None:
+    """Flag snapshots of a batch, optionally only the exam(s) of one month"""
+    if not batch_id:
+        return
+    stmt = update(MonthlyRankingSnapshot).where(MonthlyRankingSnapshot.batch_id == batch_id)
+    if year and month:
+        month_exams = select(MonthlyExam.id).where(
+            MonthlyExam.batch_id == batch_id,
+            MonthlyExam.year == year,
+            MonthlyExam.month == month
+        )
+        stmt = stmt.where(MonthlyRankingSnapshot.monthly_exam_id.in_(month_exams))
+    db.session.execute(stmt.values(**_dirty_values()), execution_options={'synchronize_session': False})
+
+
+def delete_ranking_snapshot(monthly_exam_id: int) -> None:
+    """Remove the snapshot of a monthly exam that is being deleted"""
+    MonthlyRankingSnapshot.query.filter_by(monthly_exam_id=monthly_exam_id).delete(synchronize_session=False)
+
+
+def get_ranking_snapshot(monthly_exam: MonthlyExam) -> Dict[str, Any]:
+    """
+    Return {'individual_exams': [...], 'rankings': [...]} for a monthly exam.
+    A clean snapshot is a single indexed read; a missing or dirty one is rebuilt.
+    """
+    snapshot = MonthlyRankingSnapshot.query.filter_by(monthly_exam_id=monthly_exam.id).first()
+    if snapshot and not snapshot.is_dirty and snapshot.payload is not None:
+        return snapshot.payload
+    return rebuild_ranking_snapshot(monthly_exam, snapshot)
+
+
+def rebuild_ranking_snapshot(monthly_exam: MonthlyExam,
+                             snapshot: Optional[MonthlyRankingSnapshot] = None) -> Dict[str, Any]:
+    """Recompute a monthly exam's ranking and persist it as a clean snapshot"""
+    version = snapshot.version if snapshot else None
+
+    result = compute_comprehensive_ranking(monthly_exam)
+    # Round-trip through JSON so callers always see the stored shape (string dict keys)
+    payload = json.loads(json.dumps({
+        'individual_exams': serialize_individual_exams(result['individual_exams']),
+        'rankings': result['rankings']
+    }))
+    now = datetime.utcnow()
+
+    try:
+        if snapshot is None:
+            db.session.add(MonthlyRankingSnapshot(
+                monthly_exam_id=monthly_exam.id,
+                batch_id=monthly_exam.batch_id,
+                payload=payload,
+                is_dirty=False,
+                version=0,
+                built_at=now
+            ))
+        else:
+            # Only clear the dirty flag if nobody invalidated it while we were computing
+            db.session.execute(
+                update(MonthlyRankingSnapshot)
+                .where(MonthlyRankingSnapshot.id == snapshot.id,
+                       MonthlyRankingSnapshot.version == version)
+                .values(payload=payload, is_dirty=False, built_at=now),
+                execution_options={'synchronize_session': False}
+            )
+            db.session.expire(snapshot)
+        db.session.commit()
+    except IntegrityError:
+        # Another worker created the snapshot concurrently; its copy is equally fresh
+        db.session.rollback()
+    except Exception as e:
+        db.session.rollback()
+        logger.warning(f"Failed to persist ranking snapshot for exam {monthly_exam.id}: {e}")
+
+    return payload
+
+
+def rebuild_dirty_snapshots(limit: Optional[int] = None) -> int:
+    """Rebuild dirty snapshots (background tick). Returns the number rebuilt."""
+    query = MonthlyRankingSnapshot.query.filter_by(is_dirty=True).order_by(MonthlyRankingSnapshot.dirtied_at)
+    if limit:
+        query = query.limit(limit)
+
+    rebuilt = 0
+    for snapshot in query.all():
+        monthly_exam = db.session.get(MonthlyExam, snapshot.monthly_exam_id)
+        if not monthly_exam:
+            continue
+        rebuild_ranking_snapshot(monthly_exam, snapshot)
+        rebuilt += 1
+    return rebuilt
+
+
+@event.listens_for(Session, 'before_flush')
+def _invalidate_on_roster_change(session, flush_context, instances):
+    """Dirty a batch's snapshots when its membership or a member's displayed data changes"""
+    batch_ids = set()
+
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User):
+            state = inspect(obj)
+            history = state.attrs.batches.history
+            batch_ids.update(b.id for b in list(history.added) + list(history.deleted) if b.id)
+            if obj in session.deleted or any(state.attrs[f].history.has_changes() for f in _ROSTER_FIELDS):
+                if obj not in session.new:
+                    batch_ids.update(b.id for b in obj.batches)
+        elif isinstance(obj, Batch) and obj not in session.new:
+            history = inspect(obj).attrs.students.history
+            if history.added or history.deleted:
+                batch_ids.add(obj.id)
+
+    if batch_ids:
+        session.connection().execute(
+            update(MonthlyRankingSnapshot.__table__)
+            .where(MonthlyRankingSnapshot.__table__.c.batch_id.in_(batch_ids))
+            .values(is_dirty=True,
+                    version=MonthlyRankingSnapshot.__table__.c.version + 1,
+                    dirtied_at=datetime.utcnow())
+        )
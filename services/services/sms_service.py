@@ -7,10 +7,11 @@ import json
 import requests
 import logging
 from typing import Dict, List, Optional, Any
+from collections import defaultdict
 from datetime import datetime
 from dataclasses import dataclass
 from flask import current_app
-from models import SmsLog, SmsTemplate, User, Settings, db
+from models import SmsLog, SmsStatus, SmsTemplate, User, Settings, db
 
 logger = logging.getLogger(__name__)
 
@@ -38,6 +39,13 @@ class SMSResult:
     cost: float = 0.0
     balance_remaining: float = 0.0
 
+def _local_phone(phone: str) -> str:
+    """Recipient number in the 01XXXXXXXXX form stored on users (gateway numbers carry 88)"""
+    digits = ''.join(filter(str.isdigit, phone))
+    if len(digits) == 13 and digits.startswith('880'):
+        return digits[2:]
+    return digits
+
 class SMSService:
     """SMS Service for sending messages via BulkSMSBD"""
     
@@ -124,64 +132,74 @@ class SMSService:
     
     def send_sms(self, message: SMSMessage, user_id: Optional[int] = None) -> SMSResult:
         """Send single SMS using BulkSMSBD API"""
+        return self.send_bulk_sms([message], user_id)[0]
+    
+    def send_bulk_sms(self, messages: List[SMSMessage], user_id: Optional[int] = None) -> List[SMSResult]:
+        """Send multiple SMS messages concurrently through the pooled gateway client"""
         if not self.config.api_key:
-            return SMSResult(
-                success=False,
-                error='SMS API key not configured'
-            )
+            return [SMSResult(success=False, error='SMS API key not configured') for _ in messages]
+        
+        from services.sms_gateway import get_gateway_client
+        
+        # One shared client per sender id; identical messages go out as multi-number requests
+        results: List[Optional[SMSResult]] = [None] * len(messages)
+        by_sender = defaultdict(list)
+        for index, message in enumerate(messages):
+            by_sender[message.sender_id or self.config.sender_id].append(index)
+        
+        for sender_id, indexes in by_sender.items():
+            client = get_gateway_client(SMSConfig(
+                api_key=self.config.api_key,
+                sender_id=sender_id,
+                api_url=self.config.api_url,
+                balance_url=self.config.balance_url
+            ))
+            responses = client.send_messages([(messages[i].recipient, messages[i].message) for i in indexes])
+            for index, response in zip(indexes, responses):
+                results[index] = SMSResult(
+                    success=response['success'],
+                    message_id=response.get('message_id'),
+                    error=response.get('error'),
+                    cost=1.0 if response['success'] else 0.0
+                )
         
+        self._log_results(messages, results, user_id)
+        return results
+    
+    def _log_results(self, messages: List[SMSMessage], results: List[SMSResult], user_id: Optional[int]):
+        """Log sent messages to the database with a single commit"""
         try:
-            # Format phone number for Bangladesh
-            formatted_phone = self.clean_phone_number(message.recipient)
-            if not formatted_phone.startswith('88'):
-                formatted_phone = '88' + formatted_phone
+            now = datetime.utcnow()
             
-            # BulkSMSBD API format: GET with parameters
-            params = {
-                'api_key': self.config.api_key,
-                'type': 'text',
-                'number': formatted_phone,
-                'senderid': message.sender_id or self.config.sender_id,
-                'message': message.message
-            }
-            
-            # Send request using GET method
-            response = requests.get(
-                self.config.api_url,
-                params=params,
-                timeout=30
-            )
-            
-            # Parse response
-            result = self._parse_response(response, message, user_id)
-            
-            # Log the SMS
-            self._log_sms(message, result, user_id)
-            
-            return result
+            # Without a user id, each log goes to the account registered on its recipient's phone
+            recipient_ids = {}
+            if not user_id:
+                phones = {message.recipient: _local_phone(message.recipient or '') for message in messages}
+                for recipient_id, phone in (db.session.query(User.id, User.phoneNumber)
+                                            .filter(User.phoneNumber.in_({p for p in phones.values() if p}))
+                                            .order_by(User.id).all()):
+                    recipient_ids.setdefault(phone, recipient_id)
+                recipient_ids = {recipient: recipient_ids.get(phone) for recipient, phone in phones.items()}
             
+            for message, result in zip(messages, results):
+                db.session.add(SmsLog(
+                    user_id=user_id or recipient_ids.get(message.recipient),
+                    phone_number=message.recipient,
+                    message=message.message,
+                    status=SmsStatus.SENT if result.success else SmsStatus.FAILED,
+                    api_response={
+                        'message_id': result.message_id,
+                        'error': result.error,
+                        'cost': result.cost
+                    },
+                    cost=result.cost,
+                    sent_at=now if result.success else None
+                ))
+            db.session.commit()
         except Exception as e:
-            logger.error(f"Error sending SMS: {e}")
-            result = SMSResult(
-                success=False,
-                error=str(e)
-            )
-            self._log_sms(message, result, user_id)
-            return result
-    
-    def send_bulk_sms(self, messages: List[SMSMessage], user_id: Optional[int] = None) -> List[SMSResult]:
-        """Send multiple SMS messages"""
-        results = []
-        
-        for message in messages:
-            result = self.send_sms(message, user_id)
-            results.append(result)
-            
-            # Small delay between messages to avoid rate limiting
-            import time
-            time.sleep(0.1)
-        
-        return results
+            db.session.rollback()
+            logger.error(f"Error logging SMS: {e}")
+            # Don't raise exception here as SMS might have been sent successfully
 
 def send_attendance_notification(phone_number, student_name, status, date, batch_name, teacher_name):
     """
@@ -314,81 +332,6 @@ def send_bulk_attendance_sms(attendance_data, batch_name, date, teacher_name):
             logger.error(f"Error sending template SMS: {e}")
             return [SMSResult(success=False, error=str(e))]
     
-    def _parse_response(self, response: requests.Response, message: SMSMessage, user_id: Optional[int]) -> SMSResult:
-        """Parse BulkSMSBD API response"""
-        try:
-            if response.status_code == 200:
-                try:
-                    data = response.json()
-                    response_code = data.get('response_code')
-                    success_message = data.get('success_message', '')
-                    error_message = data.get('error_message', '')
-                    
-                    # BulkSMSBD success codes: 200 or 202
-                    if response_code in [200, 202]:
-                        return SMSResult(
-                            success=True,
-                            message_id=success_message,
-                            cost=1.0,  # Each SMS costs 1 credit
-                            balance_remaining=0  # Will be updated from balance API
-                        )
-                    else:
-                        return SMSResult(
-                            success=False,
-                            error=error_message or f"API Error Code: {response_code}"
-                        )
-                except ValueError:
-                    return SMSResult(
-                        success=False,
-                        error='Invalid API response format'
-                    )
-            else:
-                return SMSResult(
-                    success=False,
-                    error=f'HTTP {response.status_code}: {response.text}'
-                )
-                
-        except Exception as e:
-            logger.error(f"Error parsing SMS response: {e}")
-            return SMSResult(
-                success=False,
-                error=f'Response parsing error: {str(e)}'
-            )
-    
-    def _log_sms(self, message: SMSMessage, result: SMSResult, user_id: Optional[int]):
-        """Log SMS to database"""
-        try:
-            # Determine user if phone number provided
-            logged_user = None
-            if not user_id and message.recipient:
-                clean_phone = self.clean_phone_number(message.recipient)
-                logged_user = User.query.filter_by(phoneNumber=clean_phone).first()
-                if logged_user:
-                    user_id = logged_user.id
-            
-            # Create log entry
-            sms_log = SmsLog(
-                user_id=user_id,
-                phone_number=message.recipient,
-                message=message.message,
-                status='sent' if result.success else 'failed',
-                api_response={
-                    'message_id': result.message_id,
-                    'error': result.error,
-                    'cost': result.cost,
-                    'balance': result.balance_remaining
-                },
-                cost=result.cost,
-                sent_at=datetime.utcnow() if result.success else None
-            )
-            
-            db.session.add(sms_log)
-            db.session.commit()
-            
-        except Exception as e:
-            logger.error(f"Error logging SMS: {e}")
-            # Don't raise exception here as SMS might have been sent successfully
-    
     def _process_template(self, template_content: str, variables: Dict[str, Any]) -> str:
         """Process template with variables"""
         content = template_content
@@ -0,0 +1,139 @@
+"""
+SMS Balance Ledger
+The local SMS credit balance is a single sms_balance row changed only with
+atomic UPDATE ... SET balance = balance - :n statements, so concurrent
+senders never lose updates. Every movement is also written to
+sms_balance_entries.
+
+Queued jobs reserve their full cost when they are enqueued and settle
+once, when the dispatcher finishes them. Settling charges what was actually
+delivered and releases the reservation. Synchronous sends are charged once
+per request. Readers get the running total with a primary-key lookup.
+
+None of these functions commit; the caller owns the transaction.
+"""
+import logging
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from sqlalchemy import case, update
+
+from models import db, Settings, SmsBalance, SmsBalanceEntry, SmsJob
+
+logger = logging.getLogger(__name__)
+
+BALANCE_ROW_ID = 1
+DEFAULT_BALANCE = 989
+
+
+class InsufficientSmsBalance(Exception):
+    """Raised when a reservation exceeds the available (unreserved) balance"""
+
+    def __init__(self, required: int, available: int):
+        self.required = required
+        self.available = available
+        super().__init__(f'Insufficient SMS balance. Need {required} SMS, but only {available} available')
+
+
+def get_balance() -> SmsBalance:
+    """The balance row, created on first use from the legacy sms_balance setting"""
+    row = db.session.get(SmsBalance, BALANCE_ROW_ID)
+    if row is not None:
+        return row
+
+    legacy = Settings.query.filter_by(key='sms_balance').first()
+    opening = DEFAULT_BALANCE
+    if legacy and legacy.value:
+        opening = int(legacy.value.get('balance', DEFAULT_BALANCE))
+
+    try:
+        with db.session.begin_nested():
+            db.session.add(SmsBalance(id=BALANCE_ROW_ID, balance=opening, reserved=0, total_used=0))
+            db.session.add(SmsBalanceEntry(entry_type='adjust', balance_change=opening,
+                                           memo='Opening balance'))
+    except Exception:
+        # Another request created it first
+        logger.info("SMS balance row created concurrently")
+    return db.session.get(SmsBalance, BALANCE_ROW_ID)
+
+
+def get_balance_summary() -> Dict[str, Any]:
+    """Cached running totals for the balance endpoints"""
+    row = get_balance()
+    return {
+        'balance': row.balance,
+        'reserved': row.reserved,
+        'available': row.available,
+        'total_used': row.total_used,
+        'updated_at': row.updated_at.isoformat() if row.updated_at else None
+    }
+
+
+def _apply(balance_change: int = 0, reserved_change: int = 0, used_change: int = 0, guard=None) -> bool:
+    """One atomic UPDATE of the balance row; returns False when the guard rejected it"""
+    row = get_balance()
+    values = {'updated_at': datetime.utcnow()}
+    if balance_change:
+        new_balance = SmsBalance.balance + balance_change
+        values['balance'] = case((new_balance < 0, 0), else_=new_balance)
+    if reserved_change:
+        new_reserved = SmsBalance.reserved + reserved_change
+        values['reserved'] = case((new_reserved < 0, 0), else_=new_reserved)
+    if used_change:
+        values['total_used'] = SmsBalance.total_used + used_change
+
+    stmt = update(SmsBalance).where(SmsBalance.id == BALANCE_ROW_ID)
+    if guard is not None:
+        stmt = stmt.where(guard)
+    result = db.session.execute(stmt.values(**values), execution_options={'synchronize_session': False})
+    db.session.expire(row)
+    return result.rowcount == 1
+
+
+def reserve_for_job(job: SmsJob, amount: int) -> None:
+    """Hold `amount` credits for a queued job, or raise InsufficientSmsBalance"""
+    amount = int(amount)
+    if amount <= 0:
+        job.reserved_cost = 0
+        return
+
+    if not _apply(reserved_change=amount, guard=(SmsBalance.balance - SmsBalance.reserved >= amount)):
+        raise InsufficientSmsBalance(amount, max(0, get_balance().available))
+
+    job.reserved_cost = amount
+    db.session.add(SmsBalanceEntry(entry_type='reserve', reserved_change=amount, job_id=job.id,
+                                   created_by=job.created_by, memo=f'{job.source} job reservation'))
+
+
+def settle_job(job: SmsJob, used: int) -> None:
+    """Charge a finished job's delivered cost and release its reservation"""
+    used = int(used)
+    reserved = int(job.reserved_cost or 0)
+    if not used and not reserved:
+        return
+
+    _apply(balance_change=-used, reserved_change=-reserved, used_change=used)
+    db.session.add(SmsBalanceEntry(entry_type='settle', balance_change=-used, reserved_change=-reserved,
+                                   job_id=job.id, created_by=job.created_by,
+                                   memo=f'{job.source} job settled'))
+
+
+def charge(amount: int, created_by: Optional[int] = None, memo: Optional[str] = None) -> None:
+    """Charge credits spent by a synchronous send"""
+    amount = int(amount)
+    if amount <= 0:
+        return
+    _apply(balance_change=-amount, used_change=amount)
+    db.session.add(SmsBalanceEntry(entry_type='charge', balance_change=-amount,
+                                   created_by=created_by, memo=memo))
+
+
+def set_balance(new_balance: int, created_by: Optional[int] = None, memo: Optional[str] = None) -> int:
+    """Set the balance (e.g. after a gateway top-up); returns the recorded change"""
+    row = get_balance()
+    change = int(new_balance) - row.balance
+    if change:
+        _apply(balance_change=change)
+        db.session.add(SmsBalanceEntry(entry_type='adjust', balance_change=change,
+                                       created_by=created_by, memo=memo or 'Balance set'))
+    return change
@@ -0,0 +1,271 @@
+"""
+SMS Outbox Dispatcher
+Bulk SMS endpoints no longer talk to the gateway inside the request.
+
+They enqueue PENDING sms_logs rows grouped under an SmsJob and return the
+job id. The dispatcher claims due rows, sends them to BulkSMSBD with bounded
+concurrency, retries transient failures with backoff and records the outcome
+on each SmsLog row. A job's cost is reserved on the SMS balance when it is
+enqueued and settled once when its last message is resolved.
+
+The dispatcher runs as a background thread inside each web worker
+(SMS_DISPATCHER='thread') or as its own process via dispatch_sms_outbox.py
+(SMS_DISPATCHER='external'). Claims are a conditional UPDATE, so several
+dispatchers can drain the same outbox without sending a message twice.
+"""
+import logging
+import os
+import threading
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+from flask import current_app
+from sqlalchemy import event, func, insert, or_, update
+from sqlalchemy.orm import Session
+
+from models import db, SmsJob, SmsLog, SmsStatus, User
+from services.sms_balance import reserve_for_job, settle_job
+from services.sms_gateway import get_gateway_client
+
+logger = logging.getLogger(__name__)
+
+_wakeup = threading.Event()
+_thread_lock = threading.Lock()
+_thread: Optional[threading.Thread] = None
+_thread_pid: Optional[int] = None
+
+
+def enqueue_sms(messages: Iterable[Dict[str, Any]], sent_by: Optional[int], source: str,
+                charge_sender: bool = False) -> SmsJob:
+    """
+    Queue messages ({'phone', 'message', 'user_id'}) as one SmsJob.
+    The job's cost is reserved on the SMS balance (InsufficientSmsBalance if it
+    does not fit) and rows are written with a single executemany; the caller
+    commits, and the dispatcher is woken once that commit lands.
+    """
+    from routes.sms import calculate_sms_cost
+
+    messages = list(messages)
+    costs = [calculate_sms_cost(item['message']) for item in messages]
+    job = SmsJob(source=source, created_by=sent_by, charge_sender=charge_sender, total=len(messages))
+    db.session.add(job)
+    db.session.flush()
+
+    # Hold the whole job's cost up front; raises InsufficientSmsBalance
+    reserve_for_job(job, sum(costs))
+
+    now = datetime.utcnow()
+    if messages:
+        db.session.execute(insert(SmsLog.__table__), [{
+            'job_id': job.id,
+            'user_id': item.get('user_id'),
+            'phone_number': item['phone'],
+            'message': item['message'],
+            'status': SmsStatus.PENDING,
+            'sent_by': sent_by,
+            'cost': cost,
+            'attempts': 0,
+            'created_at': now
+        } for item, cost in zip(messages, costs)])
+        db.session.info['sms_enqueued'] = True
+    else:
+        job.completed_at = now
+
+    return job
+
+
+def get_job_progress(job: SmsJob) -> Dict[str, Any]:
+    """Delivery counts of a job, computed with one grouped query"""
+    counts = dict(
+        db.session.query(SmsLog.status, func.count(SmsLog.id))
+        .filter(SmsLog.job_id == job.id)
+        .group_by(SmsLog.status)
+        .all()
+    )
+    return {
+        'job_id': job.id,
+        'source': job.source,
+        'total': job.total,
+        'pending': counts.get(SmsStatus.PENDING, 0),
+        'sent': counts.get(SmsStatus.SENT, 0),
+        'failed': counts.get(SmsStatus.FAILED, 0),
+        'completed': job.completed_at is not None,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'completed_at': job.completed_at.isoformat() if job.completed_at else None
+    }
+
+
+def _claim_due_messages(limit: int, lease: timedelta) -> List[SmsLog]:
+    """Atomically take up to `limit` due outbox rows for this dispatcher"""
+    now = datetime.utcnow()
+    due = or_(SmsLog.next_attempt_at.is_(None), SmsLog.next_attempt_at <= now)
+
+    candidate_ids = [row_id for (row_id,) in db.session.query(SmsLog.id).filter(
+        SmsLog.job_id.isnot(None),
+        SmsLog.status == SmsStatus.PENDING,
+        due
+    ).order_by(SmsLog.id).limit(limit).all()]
+    if not candidate_ids:
+        return []
+
+    # Re-checking the due condition makes the claim safe against other dispatchers:
+    # a row they claimed first already has next_attempt_at pushed past now
+    token = uuid.uuid4().hex
+    db.session.execute(
+        update(SmsLog)
+        .where(SmsLog.id.in_(candidate_ids), SmsLog.status == SmsStatus.PENDING, due)
+        .values(claim_token=token, attempts=SmsLog.attempts + 1, next_attempt_at=now + lease),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.commit()
+
+    return SmsLog.query.filter_by(claim_token=token).order_by(SmsLog.id).all()
+
+
+def dispatch_pending(limit: Optional[int] = None) -> int:
+    """
+    Claim one batch of due messages, send them concurrently and record the results.
+    Returns the number of messages processed (0 when the outbox is idle).
+    """
+    config = current_app.config
+    limit = limit or config['SMS_DISPATCH_BATCH_SIZE']
+    timeout = config['SMS_API_TIMEOUT']
+    max_attempts = config['SMS_DISPATCH_MAX_ATTEMPTS']
+    retry_delay = config['SMS_DISPATCH_RETRY_DELAY']
+
+    # The lease outlives the slowest possible round of gateway calls
+    messages = _claim_due_messages(limit, timedelta(seconds=timeout * 2 + 60))
+    if not messages:
+        return 0
+
+    # Identical messages (e.g. one absent notice per batch) go out as multi-number requests
+    results = get_gateway_client().send_messages([(sms.phone_number, sms.message) for sms in messages])
+
+    now = datetime.utcnow()
+    delivered_by_job = defaultdict(int)
+
+    for sms, result in zip(messages, results):
+        sms.claim_token = None
+        sms.api_response = result
+        if result.get('success'):
+            sms.status = SmsStatus.SENT
+            sms.sent_at = now
+            sms.next_attempt_at = None
+            delivered_by_job[sms.job_id] += 1
+        elif result.get('retryable') and sms.attempts < max_attempts:
+            sms.next_attempt_at = now + timedelta(seconds=retry_delay * 2 ** (sms.attempts - 1))
+        else:
+            sms.status = SmsStatus.FAILED
+            sms.cost = 0
+            sms.next_attempt_at = None
+
+    job_ids = {sms.job_id for sms in messages}
+    jobs = SmsJob.query.filter(SmsJob.id.in_(job_ids)).all()
+    for job in jobs:
+        if job.charge_sender and delivered_by_job[job.id] and job.created_by:
+            db.session.execute(
+                update(User)
+                .where(User.id == job.created_by)
+                .values(sms_count=User.sms_count - delivered_by_job[job.id]),
+                execution_options={'synchronize_session': False}
+            )
+
+    db.session.flush()
+    unfinished = {job_id for (job_id,) in db.session.query(SmsLog.job_id).filter(
+        SmsLog.job_id.in_(job_ids),
+        SmsLog.status == SmsStatus.PENDING
+    ).distinct().all()}
+    finished = [job for job in jobs if job.id not in unfinished and job.completed_at is None]
+    if finished:
+        used = dict(db.session.query(SmsLog.job_id, func.sum(SmsLog.cost)).filter(
+            SmsLog.job_id.in_([job.id for job in finished]),
+            SmsLog.status == SmsStatus.SENT
+        ).group_by(SmsLog.job_id).all())
+        for job in finished:
+            # Only the dispatcher that flips completed_at settles the job
+            result = db.session.execute(
+                update(SmsJob)
+                .where(SmsJob.id == job.id, SmsJob.completed_at.is_(None))
+                .values(completed_at=now),
+                execution_options={'synchronize_session': False}
+            )
+            if result.rowcount == 1:
+                settle_job(job, int(used.get(job.id) or 0))
+            db.session.expire(job, ['completed_at'])
+
+    db.session.commit()
+    logger.info(f"SMS dispatcher processed {len(messages)} message(s), {sum(delivered_by_job.values())} delivered")
+    return len(messages)
+
+
+def drain_outbox(limit: Optional[int] = None) -> int:
+    """Dispatch batches until nothing is due. Returns the number of messages processed."""
+    processed = 0
+    while True:
+        count = dispatch_pending(limit)
+        if not count:
+            return processed
+        processed += count
+
+
+def notify_dispatcher() -> None:
+    """Wake the in-process dispatcher (starting it in this worker if needed)"""
+    try:
+        app = current_app._get_current_object()
+    except RuntimeError:
+        return
+    if app.config.get('SMS_DISPATCHER') == 'thread':
+        _ensure_thread(app)
+        _wakeup.set()
+
+
+def _ensure_thread(app) -> None:
+    global _thread, _thread_pid
+    # Threads do not survive fork, so a preloaded app starts one per worker
+    if _thread is not None and _thread.is_alive() and _thread_pid == os.getpid():
+        return
+    with _thread_lock:
+        if _thread is not None and _thread.is_alive() and _thread_pid == os.getpid():
+            return
+        _thread = threading.Thread(target=_run_dispatcher, args=(app,), name='sms-dispatcher', daemon=True)
+        _thread_pid = os.getpid()
+        _thread.start()
+
+
+def _run_dispatcher(app) -> None:
+    interval = app.config['SMS_DISPATCH_POLL_INTERVAL']
+    while True:
+        with app.app_context():
+            try:
+                drain_outbox()
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"SMS dispatcher error: {e}")
+            finally:
+                db.session.remove()
+        _wakeup.wait(interval)
+        _wakeup.clear()
+
+
+def init_sms_dispatcher(app) -> None:
+    """Start the in-process dispatcher lazily on the first request of each worker"""
+    if app.config.get('SMS_DISPATCHER') != 'thread':
+        return
+
+    @app.before_request
+    def _start_sms_dispatcher():
+        _ensure_thread(app)
+
+
+@event.listens_for(Session, 'after_commit')
+def _wake_after_enqueue(session):
+    """Messages become visible to the dispatcher only once the enqueuing transaction commits"""
+    if session.info.pop('sms_enqueued', False):
+        notify_dispatcher()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_enqueue_flag(session):
+    session.info.pop('sms_enqueued', None)
@@ -0,0 +1,162 @@
+"""
+BulkSMSBD Gateway Client
+One process-wide client per gateway configuration, holding a keep-alive
+connection pool and a bounded worker pool for concurrent requests.
+
+Recipients that share an identical message are sent in one request using the
+gateway's comma-separated multi-number form. Results are always returned per
+recipient, in input order, so callers can map them back to SmsLog rows.
+"""
+import logging
+import os
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import requests
+from flask import current_app
+from requests.adapters import HTTPAdapter
+
+from services.services.sms_service import SMSConfig
+
+logger = logging.getLogger(__name__)
+
+_clients: Dict[tuple, 'SMSGatewayClient'] = {}
+_clients_lock = threading.Lock()
+
+
+def format_gateway_number(phone: str) -> str:
+    """Normalise a phone number to the 88XXXXXXXXXXX form the gateway expects"""
+    number = phone.strip().replace(' ', '').replace('-', '').replace('+', '')
+    if not number.startswith('88'):
+        number = '88' + number
+    return number
+
+
+class SMSGatewayClient:
+    """Thread-safe BulkSMSBD client sharing one keep-alive connection pool"""
+
+    def __init__(self, config: SMSConfig, timeout: int = 30, concurrency: int = 8,
+                 max_numbers_per_request: int = 100):
+        self.config = config
+        self.timeout = timeout
+        self.concurrency = max(1, concurrency)
+        self.max_numbers_per_request = max(1, max_numbers_per_request)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=self.concurrency, pool_block=True)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='sms-gateway')
+
+    def send(self, phone: str, message: str) -> Dict[str, Any]:
+        """Send one message. Never raises; see _request for the result shape."""
+        return self._request([phone], message)
+
+    def send_messages(self, items: Sequence[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        """
+        Send (phone, message) pairs concurrently and return one result per pair.
+        Pairs with the same message are grouped into multi-number requests.
+        """
+        groups = defaultdict(list)
+        for index, (_, message) in enumerate(items):
+            groups[message].append(index)
+
+        futures = []
+        for message, indexes in groups.items():
+            for start in range(0, len(indexes), self.max_numbers_per_request):
+                chunk = indexes[start:start + self.max_numbers_per_request]
+                phones = [items[i][0] for i in chunk]
+                futures.append((chunk, self._executor.submit(self._send_group, phones, message)))
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+        for chunk, future in futures:
+            for index, result in zip(chunk, future.result()):
+                results[index] = result
+        return results
+
+    def _send_group(self, phones: List[str], message: str) -> List[Dict[str, Any]]:
+        result = self._request(phones, message)
+        if len(phones) == 1 or result['success'] or result.get('retryable'):
+            return [dict(result) for _ in phones]
+
+        # The gateway rejects the whole request when one number is bad; isolate it
+        logger.info(f"Multi-number SMS request rejected ({result.get('error')}), retrying {len(phones)} numbers individually")
+        return [self._request([phone], message) for phone in phones]
+
+    def _request(self, phones: List[str], message: str) -> Dict[str, Any]:
+        """
+        One gateway call. The result carries 'retryable' on failure so the
+        dispatcher can tell outages from rejected messages.
+        """
+        params = {
+            'api_key': self.config.api_key,
+            'type': 'text',
+            'number': ','.join(format_gateway_number(phone) for phone in phones),
+            'senderid': self.config.sender_id,
+            'message': message
+        }
+
+        try:
+            response = self.session.get(self.config.api_url, params=params, timeout=self.timeout)
+        except requests.exceptions.Timeout:
+            return {'success': False, 'error': 'SMS API timeout', 'retryable': True}
+        except requests.exceptions.RequestException as e:
+            return {'success': False, 'error': f'SMS API connection error: {e}', 'retryable': True}
+
+        if response.status_code != 200:
+            return {
+                'success': False,
+                'error': f'HTTP {response.status_code}: {response.text[:200]}',
+                'retryable': response.status_code == 429 or response.status_code >= 500
+            }
+
+        try:
+            data = response.json()
+        except ValueError:
+            return {'success': False, 'error': 'Invalid API response format', 'retryable': True}
+
+        response_code = data.get('response_code')
+        if response_code in (200, 202):
+            return {
+                'success': True,
+                'message_id': data.get('message_id') or data.get('success_message', ''),
+                'response_code': response_code
+            }
+
+        # Gateway rejected the message (bad number, insufficient balance, ...)
+        return {
+            'success': False,
+            'error': data.get('error_message') or f'API Error Code: {response_code}',
+            'response_code': response_code,
+            'retryable': False
+        }
+
+
+def get_gateway_client(config: Optional[SMSConfig] = None) -> SMSGatewayClient:
+    """
+    Shared client for this process. Defaults to the app's SMS_API_* settings.
+    Clients are keyed by pid as well, so a forked worker never reuses its
+    parent's sockets.
+    """
+    app_config = current_app.config
+    if config is None:
+        config = SMSConfig(
+            api_key=app_config['SMS_API_KEY'],
+            sender_id=app_config['SMS_SENDER_ID'],
+            api_url=app_config['SMS_API_URL']
+        )
+    timeout = app_config['SMS_API_TIMEOUT']
+    concurrency = app_config['SMS_GATEWAY_CONCURRENCY']
+    max_numbers = app_config['SMS_GATEWAY_MAX_NUMBERS']
+
+    key = (os.getpid(), config.api_url, config.api_key, config.sender_id, timeout, concurrency, max_numbers)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = SMSGatewayClient(config, timeout, concurrency, max_numbers)
+                _clients[key] = client
+    return client
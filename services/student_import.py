@@ -0,0 +1,343 @@
+"""
+Student Bulk Import
+/api/students/bulk-import used to create students one row at a time inside
+the request. Each row cost a phone lookup, a COUNT over all students, a batch
+lookup, a flush and a bcrypt hash (about a quarter second at cost 12), so an
+admission import of two thousand students ran into the worker timeout.
+
+An upload (CSV, XLSX, or the old JSON list) now becomes a StudentImportJob
+and returns at once:
+  - the whole file is validated against phone numbers and batch ids loaded
+    with a few IN queries, rejecting bad rows and duplicates within the file
+  - passwords are hashed in a process pool, so the hashing uses every core
+    instead of holding the GIL in one thread
+  - accepted rows are written in chunks of STUDENT_IMPORT_CHUNK_SIZE with
+    one executemany for users and one for user_batches, then the job's
+    progress is committed
+Bulk inserts skip the session listeners, so each chunk also recounts its
+batches, reindexes its students for search, dirties the batches' ranking
+snapshots and clears the dashboard cache.
+
+STUDENT_IMPORT_RUNNER='thread' runs jobs on a background thread of the
+worker that took the upload; 'inline' runs them inside the request (tests,
+small installs). GET /api/students/bulk-import/<job_id> reports progress
+from any worker.
+"""
+import csv
+import io
+import json
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import bcrypt
+from flask import current_app
+from sqlalchemy import insert, select
+
+from models import db, User, UserRole, Batch, StudentImportJob, ImportJobStatus, user_batches
+from utils.phone import validate_phone
+
+logger = logging.getLogger(__name__)
+
+MAX_STORED_ERRORS = 500  # Rejected rows kept on the job; the failed count keeps going
+
+# Accepted spellings of each column in an uploaded sheet (compared lower-cased, without spaces or _)
+_HEADER_ALIASES = {
+    'firstName': ('firstname', 'first'),
+    'lastName': ('lastname', 'last', 'surname'),
+    'phoneNumber': ('phonenumber', 'phone', 'mobile', 'guardianphone'),
+    'email': ('email',),
+    'batchId': ('batchid', 'batch'),
+    'guardianName': ('guardianname', 'guardian', 'fathername'),
+    'motherName': ('mothername',),
+    'address': ('address', 'school'),
+}
+
+
+class ImportFileError(ValueError):
+    """The uploaded file cannot be read as a student sheet"""
+
+
+def _normalize_header(name: Any) -> Optional[str]:
+    key = str(name or '').strip().lower().replace(' ', '').replace('_', '')
+    for field, aliases in _HEADER_ALIASES.items():
+        if key in aliases:
+            return field
+    return None
+
+
+def _rows_from_table(rows: Iterable[Iterable[Any]]) -> Iterator[Dict[str, str]]:
+    rows = iter(rows)
+    header = next(rows, None)
+    if header is None:
+        raise ImportFileError('The file is empty')
+    fields = [_normalize_header(name) for name in header]
+    if not all(field in fields for field in ('firstName', 'lastName', 'phoneNumber')):
+        raise ImportFileError('The file needs first name, last name and phone number columns')
+    for values in rows:
+        record = {field: str(value).strip() for field, value in zip(fields, values)
+                  if field and value is not None and str(value).strip()}
+        if record:
+            yield record
+
+
+def parse_student_file(filename: str, stream) -> List[Dict[str, str]]:
+    """Rows of an uploaded CSV or XLSX sheet, keyed like the JSON import (firstName, phoneNumber, ...)"""
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension == '.xlsx':
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            raise ImportFileError('XLSX import needs openpyxl installed; upload the sheet as CSV instead')
+        workbook = load_workbook(stream, read_only=True, data_only=True)
+        try:
+            return list(_rows_from_table(workbook.active.iter_rows(values_only=True)))
+        finally:
+            workbook.close()
+    if extension in ('.csv', '.txt', ''):
+        # utf-8-sig drops the byte order mark Excel puts in front of CSV exports
+        text_stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+        try:
+            return list(_rows_from_table(csv.reader(text_stream)))
+        except UnicodeDecodeError:
+            raise ImportFileError('CSV files must be UTF-8 encoded')
+    raise ImportFileError('Upload a .csv or .xlsx file')
+
+
+def _hash_password(password: str, rounds: int) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def hash_passwords(passwords: List[str], rounds: int, workers: int) -> Iterator[str]:
+    """
+    bcrypt hashes of passwords, in order. With workers > 1 they are computed
+    in a process pool while the caller consumes earlier results.
+    """
+    if workers <= 1 or len(passwords) < 2:
+        for password in passwords:
+            yield _hash_password(password, rounds)
+        return
+    # spawn, not fork: the web worker forking this pool has live threads
+    with ProcessPoolExecutor(max_workers=min(workers, len(passwords)),
+                             mp_context=multiprocessing.get_context('spawn')) as pool:
+        chunksize = max(1, min(32, len(passwords) // (workers * 4)))
+        yield from pool.map(_hash_password, passwords, [rounds] * len(passwords), chunksize=chunksize)
+
+
+def _load_existing_phones(phones: List[str]) -> set:
+    existing = set()
+    for start in range(0, len(phones), 500):
+        chunk = phones[start:start + 500]
+        existing.update(db.session.execute(
+            select(User.phoneNumber).where(User.phoneNumber.in_(chunk))
+        ).scalars())
+    return existing
+
+
+def validate_rows(rows: List[Dict[str, Any]]):
+    """
+    Split rows into (accepted, rejected) against phone numbers and batch ids
+    loaded up front. Accepted rows carry the cleaned phone and batch id.
+    """
+    accepted, rejected = [], []
+    candidates = []
+    for idx, row in enumerate(rows):
+        row_number = idx + 1
+        if not all(str(row.get(field) or '').strip() for field in ('firstName', 'lastName', 'phoneNumber')):
+            rejected.append({'row': row_number, 'error': 'Missing required fields (firstName, lastName, phoneNumber)',
+                             'data': row})
+            continue
+        phone = validate_phone(str(row['phoneNumber']))
+        if not phone:
+            rejected.append({'row': row_number, 'error': 'Invalid phone number format', 'data': row})
+            continue
+        candidates.append((row_number, row, phone))
+
+    existing_phones = _load_existing_phones(sorted({phone for _, _, phone in candidates}))
+    batch_ids = set(db.session.execute(select(Batch.id)).scalars())
+
+    seen_phones = set()
+    for row_number, row, phone in candidates:
+        if phone in existing_phones or phone in seen_phones:
+            rejected.append({'row': row_number, 'error': 'Student with this phone number already exists',
+                             'data': row})
+            continue
+        seen_phones.add(phone)
+        batch_id = None
+        if row.get('batchId'):
+            try:
+                batch_id = int(row['batchId'])
+            except (TypeError, ValueError):
+                batch_id = None
+            if batch_id not in batch_ids:
+                rejected.append({'row': row_number, 'error': 'Batch not found', 'data': row})
+                continue
+        accepted.append({'row': row_number, 'data': row, 'phone': phone, 'batch_id': batch_id})
+    rejected.sort(key=lambda item: item['row'])
+    return accepted, rejected
+
+
+def create_import_job(rows: List[Dict[str, Any]], created_by: Optional[int], filename: Optional[str] = None):
+    """Record a pending import of rows; the caller commits and then calls start_import_job"""
+    job = StudentImportJob(filename=filename, total=len(rows), created_by=created_by)
+    db.session.add(job)
+    db.session.flush()
+    return job
+
+
+def start_import_job(job_id: int, rows: List[Dict[str, Any]]) -> None:
+    """Run a committed import job according to STUDENT_IMPORT_RUNNER"""
+    app = current_app._get_current_object()
+    if app.config.get('STUDENT_IMPORT_RUNNER') == 'inline':
+        run_import_job(job_id, rows)
+        return
+    thread = threading.Thread(target=_run_in_app, args=(app, job_id, rows),
+                              name=f'student-import-{job_id}', daemon=True)
+    thread.start()
+
+
+def _run_in_app(app, job_id: int, rows: List[Dict[str, Any]]) -> None:
+    with app.app_context():
+        try:
+            run_import_job(job_id, rows)
+        finally:
+            db.session.remove()
+
+
+def run_import_job(job_id: int, rows: List[Dict[str, Any]]) -> None:
+    """Validate, hash and insert the rows of an import job, committing progress after every chunk"""
+    job = db.session.get(StudentImportJob, job_id)
+    job.status = ImportJobStatus.RUNNING
+    job.started_at = datetime.utcnow()
+    db.session.commit()
+
+    try:
+        _import_rows(job, rows)
+        job.status = ImportJobStatus.COMPLETED
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Student import {job_id} failed: {e}")
+        job = db.session.get(StudentImportJob, job_id)
+        job.status = ImportJobStatus.FAILED
+        job.message = str(e)
+    job.completed_at = datetime.utcnow()
+    db.session.commit()
+
+
+def _import_rows(job: StudentImportJob, rows: List[Dict[str, Any]]) -> None:
+    from utils.password_generator import generate_simple_unique_password
+
+    config = current_app.config
+    chunk_size = config.get('STUDENT_IMPORT_CHUNK_SIZE', 500)
+    rounds = config.get('BCRYPT_LOG_ROUNDS', 12)
+    workers = config.get('STUDENT_IMPORT_HASH_WORKERS') or os.cpu_count() or 1
+
+    accepted, rejected = validate_rows(rows)
+    errors = rejected[:MAX_STORED_ERRORS]
+    job.failed = len(rejected)
+    job.processed = len(rejected)
+    job.errors = json.dumps(errors, default=str)
+    db.session.commit()
+
+    passwords = [generate_simple_unique_password(item['data']['firstName'].strip(), item['phone'])
+                 for item in accepted]
+    hashes = hash_passwords(passwords, rounds, workers)
+    try:
+        _insert_chunks(job, accepted, len(rejected), hashes, chunk_size)
+    finally:
+        hashes.close()  # Shuts the hashing pool down if a chunk failed
+
+
+def _insert_chunks(job: StudentImportJob, accepted: List[Dict[str, Any]], rejected_count: int,
+                   hashes: Iterator[str], chunk_size: int) -> None:
+    from services.batch_counters import recount_batches
+    from services.dashboard_stats import invalidate_dashboard_cache
+    from services.ranking_snapshots import mark_batch_rankings_dirty
+    from services.student_search import reindex_students, search_index_exists
+
+    created = []
+    for start in range(0, len(accepted), chunk_size):
+        chunk = accepted[start:start + chunk_size]
+        now = datetime.utcnow()
+        values = []
+        for item in chunk:
+            data = item['data']
+            values.append({
+                'phoneNumber': item['phone'],  # Guardian phone for login
+                'first_name': data['firstName'].strip(),
+                'last_name': data['lastName'].strip(),
+                'email': (data.get('email') or '').strip() or None,
+                'guardian_name': (data.get('guardianName') or '').strip() or None,
+                'mother_name': (data.get('motherName') or '').strip() or None,
+                'address': (data.get('address') or '').strip() or None,
+                'password_hash': next(hashes),
+                'role': UserRole.STUDENT,
+                'is_active': True,
+                'is_archived': False,
+                'created_at': now,
+                'updated_at': now
+            })
+
+        connection = db.session.connection()
+        connection.execute(insert(User.__table__), values)
+        # Phones are unique within the import and were free when validated; created_at
+        # pins the match to this chunk. (Ordered RETURNING would insert row by row here.)
+        users = User.__table__
+        ids_by_phone = dict(connection.execute(
+            select(users.c.phoneNumber, users.c.id).where(
+                users.c.phoneNumber.in_([row['phoneNumber'] for row in values]),
+                users.c.role == UserRole.STUDENT,
+                users.c.created_at == now
+            )
+        ).all())
+        user_ids = [ids_by_phone[row['phoneNumber']] for row in values]
+        enrollments = [{'user_id': user_id, 'batch_id': item['batch_id'], 'enrollment_date': now, 'is_active': True}
+                       for user_id, item in zip(user_ids, chunk) if item['batch_id']]
+        if enrollments:
+            connection.execute(insert(user_batches), enrollments)
+
+        batch_ids = {item['batch_id'] for item in enrollments}
+        recount_batches(connection, batch_ids)
+        for batch_id in batch_ids:
+            mark_batch_rankings_dirty(batch_id)
+        if search_index_exists(connection):
+            reindex_students(connection, user_ids)
+
+        created.extend({
+            'row': item['row'],
+            'id': user_id,
+            'studentId': User.format_student_id(user_id, now),
+            'name': f"{row['first_name']} {row['last_name']}",
+            'phone': row['phoneNumber']
+        } for user_id, item, row in zip(user_ids, chunk, values))
+        job.succeeded = len(created)
+        job.processed = rejected_count + len(created)
+        job.results = json.dumps(created)
+        db.session.commit()
+        invalidate_dashboard_cache()
+
+
+def serialize_import_job(job: StudentImportJob, include_rows: bool = True) -> Dict[str, Any]:
+    """Progress of an import job; created and rejected rows once it has finished"""
+    data = {
+        'id': job.id,
+        'filename': job.filename,
+        'status': job.status.value,
+        'total': job.total,
+        'processed': job.processed,
+        'successful': job.succeeded,
+        'failed': job.failed,
+        'progress': round(job.processed * 100 / job.total, 1) if job.total else 100.0,
+        'message': job.message,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'completed_at': job.completed_at.isoformat() if job.completed_at else None
+    }
+    if include_rows and job.status in (ImportJobStatus.COMPLETED, ImportJobStatus.FAILED):
+        data['successfulImports'] = json.loads(job.results or '[]')
+        data['failedImports'] = json.loads(job.errors or '[]')
+    return data
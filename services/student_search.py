@@ -0,0 +1,247 @@
+"""
+Student Search Index
+The student page used to download every active student and filter them in
+the browser. Listing is now keyset-paginated, and search runs on the server
+against an SQLite FTS5 table, student_search, with one row per active,
+non-archived student (rowid = user id). It indexes name, guardian name,
+phone, guardian phone and current roll numbers (final positions in the
+latest monthly exam of each of the student's batches).
+
+The table uses the trigram tokenizer, so every search word of three or more
+characters is an indexed substring match, just like the ILIKE '%word%' it
+replaces. Shorter words, and databases without the index (not SQLite, or
+not migrated yet), fall back to ILIKE.
+
+A session listener keeps the index current. When students are created,
+edited, archived, restored, re-enrolled or deleted, or their rankings
+change, their rows are rewritten once the flush has written them. Adding,
+moving or deleting a monthly exam changes which exam is a batch's latest,
+so it rewrites the rows of the whole batch. Bulk query deletes of rankings
+bypass the session and call reindex_batch_students themselves.
+migrate_add_student_search.py creates and fills the table on existing
+databases. create_all creates it together with the users table.
+"""
+import logging
+from typing import Iterable, List, Optional
+
+from sqlalchemy import and_, event, inspect, or_, select, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from models import db, User, UserRole, MonthlyExam, MonthlyRanking, user_batches
+
+logger = logging.getLogger(__name__)
+
+SEARCH_TABLE = 'student_search'
+MIN_INDEXED_WORD = 3  # The trigram tokenizer cannot match anything shorter
+
+# User columns that are indexed or decide whether a student is indexed at all
+_INDEXED_FIELDS = ('first_name', 'last_name', 'guardian_name', 'phoneNumber', 'guardian_phone',
+                   'role', 'is_active', 'is_archived', 'batches')
+# MonthlyExam columns that decide which exam is a batch's latest
+_LATEST_EXAM_FIELDS = ('batch_id', 'year', 'month')
+
+
+def create_search_table(connection) -> bool:
+    """Create the FTS5 table if missing; False where SQLite lacks FTS5 or the trigram tokenizer"""
+    if connection.dialect.name != 'sqlite':
+        return False
+    try:
+        connection.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+            "name, guardian_name, phone, guardian_phone, roll_number, tokenize='trigram')"
+        ))
+        return True
+    except OperationalError as e:
+        logger.warning(f"Student search index unavailable, falling back to ILIKE: {e}")
+        return False
+
+
+def search_index_exists(connection) -> bool:
+    if connection.dialect.name != 'sqlite':
+        return False
+    return connection.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"
+    ), {'name': SEARCH_TABLE}).first() is not None
+
+
+def _roll_numbers(connection, user_ids: List[int]) -> dict:
+    """{user_id: 'position position ...'} from the latest monthly exam of each batch"""
+    latest = MonthlyExam.__table__.alias('latest')
+    latest_exam_id = select(latest.c.id).where(
+        latest.c.batch_id == MonthlyExam.batch_id
+    ).order_by(latest.c.year.desc(), latest.c.month.desc(), latest.c.id.desc()).limit(1).scalar_subquery()
+
+    rolls = {}
+    for user_id, position in connection.execute(
+        select(MonthlyRanking.user_id, MonthlyRanking.position).join(
+            MonthlyExam, MonthlyExam.id == MonthlyRanking.monthly_exam_id
+        ).where(
+            MonthlyRanking.user_id.in_(user_ids),
+            MonthlyRanking.is_final == True,
+            MonthlyExam.id == latest_exam_id
+        )
+    ):
+        rolls.setdefault(user_id, []).append(str(position))
+    return {user_id: ' '.join(positions) for user_id, positions in rolls.items()}
+
+
+def reindex_students(connection, user_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    Rewrite the index rows of the given students (every student when None).
+    Students that are inactive, archived or gone are left out. Returns the rows written.
+    """
+    users = User.__table__
+    query = select(users.c.id, users.c.first_name, users.c.last_name, users.c.guardian_name,
+                   users.c.phoneNumber, users.c.guardian_phone).where(
+        users.c.role == UserRole.STUDENT,
+        users.c.is_active == True,
+        users.c.is_archived == False
+    )
+    if user_ids is None:
+        connection.execute(text(f"DELETE FROM {SEARCH_TABLE}"))
+    else:
+        user_ids = sorted({user_id for user_id in user_ids if user_id})
+        if not user_ids:
+            return 0
+        for start in range(0, len(user_ids), 500):
+            chunk = user_ids[start:start + 500]
+            connection.execute(text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({','.join(map(str, chunk))})"))
+        query = query.where(users.c.id.in_(user_ids))
+
+    students = connection.execute(query).all()
+    if not students:
+        return 0
+    rolls = _roll_numbers(connection, [student.id for student in students])
+    connection.execute(text(
+        f"INSERT INTO {SEARCH_TABLE} (rowid, name, guardian_name, phone, guardian_phone, roll_number) "
+        "VALUES (:id, :name, :guardian_name, :phone, :guardian_phone, :roll_number)"
+    ), [{
+        'id': student.id,
+        'name': f"{student.first_name} {student.last_name}",
+        'guardian_name': student.guardian_name or '',
+        'phone': student.phoneNumber or '',
+        'guardian_phone': student.guardian_phone or '',
+        'roll_number': rolls.get(student.id, '')
+    } for student in students])
+    return len(students)
+
+
+def _batch_student_ids(connection, batch_ids: Iterable[int]) -> List[int]:
+    batch_ids = [batch_id for batch_id in set(batch_ids) if batch_id]
+    if not batch_ids:
+        return []
+    return list(connection.execute(
+        select(user_batches.c.user_id).where(user_batches.c.batch_id.in_(batch_ids))
+    ).scalars())
+
+
+def reindex_batch_students(batch_id: int, connection=None) -> int:
+    """Rewrite the index rows of a batch's students, e.g. after a bulk delete of its rankings"""
+    connection = connection or db.session.connection()
+    if not search_index_exists(connection):
+        return 0
+    user_ids = _batch_student_ids(connection, [batch_id])
+    return reindex_students(connection, user_ids) if user_ids else 0
+
+
+def search_filter(term: str, connection=None):
+    """
+    A filter on User matching every word of term in a student's name, guardian
+    name, phone, guardian phone or roll number. Returns None for a blank term.
+    """
+    words = term.split()
+    if not words:
+        return None
+    connection = connection or db.session.connection()
+    indexed = [word for word in words if len(word) >= MIN_INDEXED_WORD]
+    if not search_index_exists(connection):
+        indexed = []
+
+    conditions = []
+    if indexed:
+        # Each word is a quoted phrase (quotes doubled), so FTS syntax in the input is inert
+        match = ' '.join('"' + word.replace('"', '""') + '"' for word in indexed)
+        conditions.append(User.id.in_(
+            select(text('rowid')).select_from(text(SEARCH_TABLE)).where(text(f"{SEARCH_TABLE} MATCH :match"))
+            .params(match=match)
+        ))
+    for word in words:
+        if word in indexed:
+            continue
+        pattern = f'%{word}%'
+        conditions.append(or_(
+            User.first_name.ilike(pattern),
+            User.last_name.ilike(pattern),
+            User.phoneNumber.ilike(pattern),
+            User.guardian_name.ilike(pattern),
+            User.guardian_phone.ilike(pattern)
+        ))
+    return and_(*conditions)
+
+
+@event.listens_for(User.__table__, 'after_create')
+def _create_with_users(target, connection, **kw):
+    if create_search_table(connection):
+        reindex_students(connection)
+
+
+@event.listens_for(User.__table__, 'before_drop')
+def _drop_with_users(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        connection.execute(text(f"DROP TABLE IF EXISTS {SEARCH_TABLE}"))
+
+
+@event.listens_for(Session, 'before_flush')
+def _note_search_changes(session, flush_context, instances):
+    """Remember the students, and batches of students, whose index rows this flush changes"""
+    pending = []
+    batch_ids = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User):
+            if obj in session.new or obj in session.deleted:
+                pending.append(obj)
+            else:
+                state = inspect(obj)
+                if any(state.attrs[f].history.has_changes() for f in _INDEXED_FIELDS):
+                    pending.append(obj)
+        elif isinstance(obj, MonthlyRanking):
+            if obj.user_id:
+                pending.append(obj.user_id)
+        elif isinstance(obj, MonthlyExam):
+            if obj in session.new or obj in session.deleted:
+                batch_ids.add(obj.batch_id)
+            else:
+                state = inspect(obj)
+                for field in _LATEST_EXAM_FIELDS:
+                    history = state.attrs[field].history
+                    if history.has_changes():
+                        batch_ids.add(obj.batch_id)
+                        if field == 'batch_id':
+                            batch_ids.update(history.deleted)
+    if pending:
+        session.info.setdefault('reindex_students', []).extend(pending)
+    if batch_ids:
+        session.info.setdefault('reindex_batches', set()).update(batch_ids)
+
+
+@event.listens_for(Session, 'after_flush_postexec')
+def _reindex_after_flush(session, flush_context):
+    pending = session.info.pop('reindex_students', None)
+    batch_ids = session.info.pop('reindex_batches', None)
+    if not pending and not batch_ids:
+        return
+    connection = session.connection()
+    if not search_index_exists(connection):
+        return
+    user_ids = {item if isinstance(item, int) else inspect(item).identity[0]
+                for item in pending or () if isinstance(item, int) or inspect(item).identity}
+    if batch_ids:
+        user_ids.update(_batch_student_ids(connection, batch_ids))
+    reindex_students(connection, user_ids)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back_search_changes(session):
+    session.info.pop('reindex_students', None)
+    session.info.pop('reindex_batches', None)
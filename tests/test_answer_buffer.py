@@ -0,0 +1,100 @@
+"""
+Test script for the online exam answer buffer
+"""
+import sys
+import os
+import shutil
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from models import db, User, UserRole, OnlineExam, OnlineQuestion, OnlineStudentAnswer
+from services.answer_buffer import flush_buffered_answers
+
+
+def _seed():
+    teacher = User(phoneNumber='01800000000', first_name='Test', last_name='Teacher', role=UserRole.TEACHER)
+    student = User(phoneNumber='01710000000', first_name='Test', last_name='Student', role=UserRole.STUDENT)
+    db.session.add_all([teacher, student])
+    db.session.flush()
+    exam = OnlineExam(title='Buffer Exam', class_name='HSC', book_name='Physics', chapter_name='Motion',
+                      duration=30, total_questions=3, is_published=True, created_by=teacher.id)
+    db.session.add(exam)
+    db.session.flush()
+    questions = [OnlineQuestion(exam_id=exam.id, question_text=f'Q{i}', option_a='a', option_b='b',
+                                option_c='c', option_d='d', correct_answer='A', question_order=i)
+                 for i in range(3)]
+    db.session.add_all(questions)
+    db.session.commit()
+    return student, exam, questions
+
+
+def test_answers_are_buffered_and_flushed():
+    """Answers reach the database on flush, submit or resume, and survive an interrupted flush"""
+    app = create_app('testing')
+    buffer_dir = app.config['ANSWER_BUFFER_DIR']
+    shutil.rmtree(buffer_dir, ignore_errors=True)
+    with app.app_context():
+        student, exam, questions = _seed()
+        q = [question.id for question in questions]
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = student.id
+            sess['user_role'] = student.role.value
+
+        attempt_id = client.post(f'/api/online-exams/{exam.id}/start').get_json()['data']['attempt_id']
+        answer_url = f'/api/online-exams/attempts/{attempt_id}/answer'
+
+        # A batch and a single answer are journaled, not written
+        response = client.post(answer_url, json={'answers': [
+            {'question_id': q[0], 'selected_answer': 'b'},
+            {'question_id': q[1], 'selected_answer': 'A'},
+        ]})
+        assert response.get_json()['data']['saved'] == 2
+        client.post(answer_url, json={'question_id': q[0], 'selected_answer': 'A'})
+        assert OnlineStudentAnswer.query.count() == 0
+        assert client.post(answer_url, json={'question_id': q[0], 'selected_answer': 'E'}).status_code == 400
+
+        # Resuming flushes; the latest answer per question wins
+        saved = client.post(f'/api/online-exams/{exam.id}/start').get_json()['data']['saved_answers']
+        assert saved == {str(q[0]): 'A', str(q[1]): 'A'}
+        assert os.listdir(buffer_dir) == ['locks']
+
+        # A flush interrupted before its commit leaves the journal aside; the next flush replays it
+        client.post(answer_url, json={'question_id': q[2], 'selected_answer': 'C'})
+        os.replace(os.path.join(buffer_dir, f'{attempt_id}.jsonl'), os.path.join(buffer_dir, f'{attempt_id}.flushing'))
+        client.post(answer_url, json={'question_id': q[2], 'selected_answer': 'A'})
+        assert flush_buffered_answers() == 1
+        assert OnlineStudentAnswer.query.filter_by(question_id=q[2]).one().selected_answer == 'A'
+        assert sorted(os.listdir(buffer_dir)) == ['locks']
+
+        # Submitting someone else's attempt is refused before their buffer is touched
+        intruder = User(phoneNumber='01710000001', first_name='Other', last_name='Student', role=UserRole.STUDENT)
+        db.session.add(intruder)
+        db.session.commit()
+        other = app.test_client()
+        with other.session_transaction() as sess:
+            sess['user_id'] = intruder.id
+            sess['user_role'] = intruder.role.value
+        client.post(answer_url, json={'question_id': q[1], 'selected_answer': 'B'})
+        assert other.post(f'/api/online-exams/attempts/{attempt_id}/submit', json={}).status_code == 403
+        assert os.path.exists(os.path.join(buffer_dir, f'{attempt_id}.jsonl'))
+        assert OnlineStudentAnswer.query.filter_by(question_id=q[1]).one().selected_answer == 'A'
+
+        # Reaching the size threshold flushes inline; submit scores every answer
+        app.config['ANSWER_BUFFER_MAX_PENDING'] = 1
+        client.post(answer_url, json={'question_id': q[1], 'selected_answer': 'D'})
+        assert OnlineStudentAnswer.query.filter_by(question_id=q[1]).one().selected_answer == 'D'
+
+        data = client.post(f'/api/online-exams/attempts/{attempt_id}/submit', json={}).get_json()['data']
+        assert data['score'] == 2 and data['total_marks'] == 3
+
+        db.session.remove()
+        db.drop_all()
+    shutil.rmtree(buffer_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    test_answers_are_buffered_and_flushed()
+    print("✅ Answer buffer tests passed")
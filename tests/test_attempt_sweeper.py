@@ -0,0 +1,91 @@
+"""
+Test script for the expired online exam attempt sweeper
+"""
+import sys
+import os
+import shutil
+from datetime import datetime, timedelta
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from models import db, User, UserRole, OnlineExam, OnlineQuestion, OnlineExamAttempt
+from services.attempt_sweeper import drain_expired_attempts
+
+
+def test_sweeper_submits_overdue_attempts():
+    """Overdue attempts are graded with their buffered answers; open ones and recent ones are left alone"""
+    app = create_app('testing')
+    shutil.rmtree(app.config['ANSWER_BUFFER_DIR'], ignore_errors=True)
+    if os.path.exists(app.config['ATTEMPT_SWEEPER_STATUS_FILE']):
+        os.remove(app.config['ATTEMPT_SWEEPER_STATUS_FILE'])
+    with app.app_context():
+        teacher = User(phoneNumber='01800000000', first_name='Test', last_name='Teacher', role=UserRole.TEACHER)
+        students = [User(phoneNumber=f'0171000000{i}', first_name=f'Student{i}', last_name='Test',
+                         role=UserRole.STUDENT) for i in range(3)]
+        db.session.add_all([teacher] + students)
+        db.session.flush()
+        exam = OnlineExam(title='Sweep Exam', class_name='HSC', book_name='Physics', chapter_name='Motion',
+                          duration=20, total_questions=2, is_published=True, created_by=teacher.id)
+        db.session.add(exam)
+        db.session.flush()
+        questions = [OnlineQuestion(exam_id=exam.id, question_text=f'Q{i}', option_a='a', option_b='b',
+                                    option_c='c', option_d='d', correct_answer='A', question_order=i)
+                     for i in range(2)]
+        db.session.add_all(questions)
+        db.session.commit()
+
+        attempt_ids = []
+        for student in students:
+            client = app.test_client()
+            with client.session_transaction() as sess:
+                sess['user_id'] = student.id
+                sess['user_role'] = student.role.value
+            attempt_id = client.post(f'/api/online-exams/{exam.id}/start').get_json()['data']['attempt_id']
+            client.post(f'/api/online-exams/attempts/{attempt_id}/answer',
+                        json={'question_id': questions[0].id, 'selected_answer': 'A'})
+            attempt_ids.append(attempt_id)
+
+        attempt = db.session.get(OnlineExamAttempt, attempt_ids[0])
+        assert attempt.deadline_at == attempt.started_at + timedelta(minutes=20)
+
+        # The first ran out long ago, the second only seconds ago (inside the grace period)
+        now = datetime.utcnow()
+        db.session.get(OnlineExamAttempt, attempt_ids[0]).started_at = now - timedelta(hours=2)
+        db.session.get(OnlineExamAttempt, attempt_ids[0]).deadline_at = now - timedelta(hours=2) + timedelta(minutes=20)
+        db.session.get(OnlineExamAttempt, attempt_ids[1]).deadline_at = now - timedelta(seconds=5)
+        db.session.commit()
+
+        assert app.test_client().get('/health/attempt-sweeper').get_json()['overdue_attempts'] == 2
+        assert drain_expired_attempts() == 1
+
+        swept = db.session.get(OnlineExamAttempt, attempt_ids[0])
+        assert swept.is_submitted and swept.auto_submitted
+        assert (swept.score, swept.total_marks, swept.time_taken) == (1, 2, 20 * 60)
+        assert not db.session.get(OnlineExamAttempt, attempt_ids[1]).is_submitted
+
+        status = app.test_client().get('/health/attempt-sweeper').get_json()
+        assert status['total_swept'] == 1 and status['runs'] == 1 and status['overdue_attempts'] == 1
+
+        # Changing the exam's duration moves the deadlines of open attempts
+        db.session.get(OnlineExamAttempt, attempt_ids[1]).deadline_at = None
+        db.session.commit()
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = teacher.id
+            sess['user_role'] = teacher.role.value
+        assert client.put(f'/api/online-exams/{exam.id}', json={'duration': 30}).status_code == 200
+        for attempt_id in attempt_ids[1:]:
+            attempt = db.session.get(OnlineExamAttempt, attempt_id)
+            assert attempt.deadline_at == attempt.started_at + timedelta(minutes=30)
+        assert drain_expired_attempts() == 0
+
+        db.session.remove()
+        db.drop_all()
+    shutil.rmtree(app.config['ANSWER_BUFFER_DIR'], ignore_errors=True)
+
+
+if __name__ == '__main__':
+    test_sweeper_submits_overdue_attempts()
+    print("✅ Attempt sweeper tests passed")
@@ -0,0 +1,72 @@
+"""
+Test script for keyset-paginated and NDJSON attendance listing
+"""
+import sys
+import os
+import json
+from datetime import date, timedelta
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from models import db, User, UserRole, Batch, Attendance, AttendanceStatus
+
+
+def _seed():
+    teacher = User(phoneNumber='01800000000', first_name='Test', last_name='Teacher', role=UserRole.TEACHER)
+    batch = Batch(name='Listing Batch', start_date=date(2025, 1, 1))
+    students = [User(phoneNumber=f'0171000000{i}', first_name=f'Student{i}', last_name='Test',
+                     role=UserRole.STUDENT) for i in range(5)]
+    for student in students:
+        student.batches.append(batch)
+    db.session.add_all([teacher, batch] + students)
+    db.session.flush()
+    for day in range(3):
+        for student in students:
+            db.session.add(Attendance(user_id=student.id, batch_id=batch.id, date=date(2025, 3, 1) + timedelta(days=day),
+                                      status=AttendanceStatus.PRESENT))
+    db.session.commit()
+    return teacher, batch, students
+
+
+def test_keyset_pages_and_ndjson_export():
+    """Pages follow (date, id) newest first without gaps or repeats; NDJSON streams them all"""
+    app = create_app('testing')
+    with app.app_context():
+        teacher, batch, students = _seed()
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = teacher.id
+            sess['user_role'] = teacher.role.value
+
+        seen = []
+        url = f'/api/attendance?batch_id={batch.id}&limit=4'
+        while url:
+            body = client.get(url).get_json()
+            assert body['success']
+            seen.extend(body['data'])
+            cursor = body['pagination']['next_cursor']
+            url = f'/api/attendance?batch_id={batch.id}&limit=4&cursor={cursor}' if cursor else None
+
+        assert len(seen) == 15
+        keys = [(row['date'], row['id']) for row in seen]
+        assert keys == sorted(keys, reverse=True)
+        assert len(set(keys)) == 15
+        assert seen[0]['user']['fullName'].startswith('Student')
+        assert seen[0]['batch']['name'] == 'Listing Batch'
+
+        response = client.get(f'/api/attendance?batch_id={batch.id}&format=ndjson&start_date=2025-03-02')
+        assert response.mimetype == 'application/x-ndjson'
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        assert len(lines) == 10 and all(line['date'] >= '2025-03-02' for line in lines)
+
+        assert client.get('/api/attendance?cursor=not-a-cursor').status_code == 400
+
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    test_keyset_pages_and_ndjson_export()
+    print("✅ Attendance listing tests passed")
@@ -0,0 +1,65 @@
+"""
+Test script for the per-request session user cache in utils.auth
+"""
+import sys
+import os
+from datetime import date
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+from app import create_app
+from models import db, User, UserRole, Batch
+
+
+def test_session_user_loaded_once_per_request():
+    """require_role, get_current_user and the batch access check share one user lookup"""
+    app = create_app('testing')
+    with app.app_context():
+        active = Batch(name='Active Batch', start_date=date(2025, 1, 1))
+        inactive = Batch(name='Old Batch', start_date=date(2024, 1, 1), is_active=False)
+        student = User(phoneNumber='01710000001', first_name='Cache', last_name='Student',
+                       role=UserRole.STUDENT)
+        student.batches.extend([active, inactive])
+        db.session.add_all([active, inactive, student])
+        db.session.commit()
+
+        statements = []
+
+        def _record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', _record)
+        try:
+            client = app.test_client()
+            with client.session_transaction() as sess:
+                sess['user_id'] = student.id
+                sess['user_role'] = student.role.value
+
+            response = client.get('/api/exams')
+            assert response.status_code == 200
+
+            user_selects = [s for s in statements if s.lstrip().upper().startswith('SELECT')
+                            and 'FROM users' in s]
+            assert len(user_selects) == 1
+            # Batch ids come from the association table, not a user.batches lazy load
+            assert sum('user_batches' in s for s in statements) == 1
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', _record)
+
+        with app.test_request_context():
+            from flask import session
+            from utils.auth import get_current_user, get_current_user_batch_ids
+            session['user_id'] = student.id
+            assert get_current_user() is get_current_user()
+            assert get_current_user_batch_ids() == {active.id}
+
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    test_session_user_loaded_once_per_request()
+    print("✅ Auth cache tests passed")
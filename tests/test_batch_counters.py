@@ -0,0 +1,93 @@
+"""
+Test script for the denormalized batch student counters
+"""
+import sys
+import os
+from datetime import date
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event, text
+
+from app import create_app
+from models import db, User, UserRole, Batch
+from services.batch_counters import find_count_drift, reconcile_batch_counts
+
+
+def test_counters_follow_enrollment_and_archiving():
+    """Counters track enrollment, archive and restore, batch lists stop loading students, and drift is repaired"""
+    app = create_app('testing')
+    with app.app_context():
+        teacher = User(phoneNumber='01800000000', first_name='Test', last_name='Teacher', role=UserRole.TEACHER)
+        batches = [Batch(name=f'Batch {i}', description='HSC - Physics', start_date=date(2025, 1, 1))
+                   for i in range(2)]
+        students = [User(phoneNumber=f'0171000000{i}', first_name=f'Student{i}', last_name='Test',
+                         role=UserRole.STUDENT) for i in range(4)]
+        batches[0].students.extend(students[:3])
+        db.session.add_all([teacher] + batches + students)
+        db.session.commit()
+        batch_id, other_id = batches[0].id, batches[1].id
+        student_ids = [s.id for s in students]
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = teacher.id
+            sess['user_role'] = teacher.role.value
+
+        def counts(bid):
+            batch = db.session.get(Batch, bid)
+            return batch.active_students_count, batch.archived_students_count, batch.total_students_count
+
+        assert counts(batch_id) == (3, 0, 3)
+        assert client.post(f'/api/batches/{batch_id}/students', json={'student_id': student_ids[3]}).status_code == 200
+        assert client.post(f'/api/batches/{other_id}/students', json={'student_id': student_ids[0]}).status_code == 200
+        assert counts(batch_id) == (4, 0, 4) and counts(other_id) == (1, 0, 1)
+
+        assert client.post(f'/api/students/{student_ids[0]}/archive', json={}).status_code == 200
+        assert counts(batch_id) == (3, 1, 4) and counts(other_id) == (0, 1, 1)
+
+        assert client.post(f'/api/batches/{batch_id}/archive', json={}).status_code == 200
+        assert counts(batch_id) == (0, 4, 4)
+        assert client.post(f'/api/batches/{batch_id}/restore', json={}).status_code == 200
+        assert counts(batch_id) == (3, 1, 4)  # Only students archived with the batch come back
+        archived = client.get('/api/batches/archived').get_json()['data']['batches']
+        assert archived == []
+
+        assert client.delete(f'/api/batches/{batch_id}/students/{student_ids[1]}').status_code == 200
+        assert counts(batch_id) == (2, 1, 3)
+        db.session.delete(db.session.get(User, student_ids[3]))
+        db.session.commit()
+        assert counts(batch_id) == (1, 1, 2)
+        assert find_count_drift() == []
+
+        # A batch whose only member is archived still cannot be deleted
+        assert counts(other_id) == (0, 1, 1)
+        assert client.delete(f'/api/batches/{other_id}').status_code == 400
+
+        # Batch lists read the counters instead of loading every enrollment
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        listed = client.get('/api/batches').get_json()['data']
+        active = client.get('/api/batches/active').get_json()['data']['batches']
+        event.remove(db.engine, 'before_cursor_execute', listener)
+        assert not any('user_batches' in s for s in statements)
+        assert {b['id']: b['currentStudents'] for b in listed} == {batch_id: 1, other_id: 0}
+        assert {b['id']: b['student_count'] for b in active} == {batch_id: 1, other_id: 0}
+
+        # Writes that bypass the ORM drift until reconciled
+        db.session.execute(text('DELETE FROM user_batches WHERE batch_id = :batch_id'), {'batch_id': other_id})
+        db.session.commit()
+        assert [row['batch_id'] for row in find_count_drift()] == [other_id]
+        reconcile_batch_counts()
+        db.session.commit()
+        assert counts(other_id) == (0, 0, 0) and find_count_drift() == []
+        assert client.delete(f'/api/batches/{other_id}').status_code == 200
+
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    test_counters_follow_enrollment_and_archiving()
+    print("✅ Batch counter tests passed")
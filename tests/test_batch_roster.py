@@ -0,0 +1,77 @@
+"""
+Test script for the single-query batch roster and its ETag
+"""
+import sys
+import os
+from datetime import date, datetime
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+from app import create_app
+from models import db, User, UserRole, Batch, MonthlyExam, MonthlyRanking
+
+
+def test_roster_is_one_query_ordered_by_rank():
+    """The roster comes from one query ordered by the latest final position and revalidates with an ETag"""
+    app = create_app('testing')
+    with app.app_context():
+        teacher = User(phoneNumber='01800000000', first_name='Test', last_name='Teacher', role=UserRole.TEACHER)
+        batch = Batch(name='Roster Batch', start_date=date(2025, 1, 1))
+        students = [User(phoneNumber=f'0171000000{i}', first_name=f'Student{i}', last_name='Test',
+                         role=UserRole.STUDENT, created_at=datetime(2025, 1, 5)) for i in range(5)]
+        students[4].is_archived = True
+        batch.students.extend(students)
+        db.session.add_all([teacher, batch] + students)
+        db.session.flush()
+
+        def monthly_exam(month, positions, is_final=True):
+            exam = MonthlyExam(title=f'Month {month}', month=month, year=2025, total_marks=100, pass_marks=40,
+                               start_date=datetime(2025, month, 1), end_date=datetime(2025, month, 28),
+                               batch_id=batch.id, created_by=teacher.id)
+            db.session.add(exam)
+            db.session.flush()
+            db.session.add_all([MonthlyRanking(monthly_exam_id=exam.id, user_id=students[i].id, position=position,
+                                               is_final=is_final) for i, position in positions.items()])
+
+        monthly_exam(1, {0: 1, 1: 2, 2: 3, 3: 4})
+        monthly_exam(2, {2: 1, 0: 2, 3: 3})  # The latest exam decides; student 1 has no position there
+        db.session.commit()
+        batch_id, ids = batch.id, [s.id for s in students]
+
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = teacher.id
+            sess['user_role'] = teacher.role.value
+        client.get('/api/auth/me')  # Load the session user outside the window
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        response = client.get(f'/api/batches/{batch_id}/students')
+        event.remove(db.engine, 'before_cursor_execute', listener)
+        roster = response.get_json()['data']['students']
+        assert [s['id'] for s in roster] == [ids[2], ids[0], ids[3], ids[1]]
+        assert [s['current_rank'] for s in roster] == [1, 2, 3, None]
+        assert roster[0]['student_id'] == f'STU2025{ids[2]:04d}' and roster[0]['full_name'] == 'Student2 Test'
+        assert sum('user_batches' in s for s in statements) == 1
+
+        # Unchanged roster: 304; a change in ranks changes the ETag
+        etag = response.headers['ETag']
+        assert client.get(f'/api/batches/{batch_id}/students', headers={'If-None-Match': etag}).status_code == 304
+        MonthlyRanking.query.filter_by(user_id=ids[3]).update({'is_final': False})
+        db.session.commit()
+        response = client.get(f'/api/batches/{batch_id}/students', headers={'If-None-Match': etag})
+        assert response.status_code == 200 and response.headers['ETag'] != etag
+
+        assert client.get('/api/batches/9999/students').status_code == 404
+
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    test_roster_is_one_query_ordered_by_rank()
+    print("✅ Batch roster tests passed")
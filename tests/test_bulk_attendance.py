@@ -0,0 +1,81 @@
+"""
+Test script for set-based bulk attendance marking
+"""
+import sys
+import os
+from datetime import date
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+from app import create_app
+from models import db, User, UserRole, Batch, Attendance, AttendanceStatus
+from services.sms_balance import set_balance
+
+
+def test_bulk_marking_uses_constant_queries():
+    """Marking costs the same number of statements for 5 or 50 students, and re-marking updates in place"""
+    app = create_app('testing')
+    with app.app_context():
+        teacher = User(phoneNumber='01800000000', first_name='Test', last_name='Teacher', role=UserRole.TEACHER)
+        batch = Batch(name='Bulk Batch', start_date=date(2025, 1, 1))
+        other = Batch(name='Other Batch', start_date=date(2025, 1, 1))
+        students = [User(phoneNumber=f'017100{i:05d}', first_name=f'Student{i}', last_name='Test',
+                         role=UserRole.STUDENT) for i in range(55)]
+        for student in students[:50]:
+            student.batches.append(batch)
+        for student in students[50:]:
+            student.batches.append(other)
+        db.session.add_all([teacher, batch, other] + students)
+        set_balance(1000)
+        db.session.commit()
+
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = teacher.id
+            sess['user_role'] = teacher.role.value
+
+        batch_id = batch.id
+
+        def mark(day, group, status, url='/api/attendance/bulk'):
+            payload = [{'userId': s.id, 'status': status} for s in group]
+            statements = []
+            listener = lambda *args: statements.append(args[2])
+            event.listen(db.engine, 'before_cursor_execute', listener)
+            response = client.post(url, json={
+                'batchId': batch_id, 'date': day,
+                'attendanceData': payload
+            })
+            event.remove(db.engine, 'before_cursor_execute', listener)
+            assert response.status_code == 200
+            return response.get_json()['data'], len(statements)
+
+        small, small_queries = mark('2025-03-03', students[:5], 'present')
+        large, large_queries = mark('2025-03-04', students[:50], 'present')
+        assert small['attendance_marked'] == 5 and large['attendance_marked'] == 50
+        assert small_queries == large_queries
+
+        # Absence SMS are composed from the loaded roster, not one reload per student
+        sms_url = '/api/attendance/bulk-absent-sms'
+        small, small_queries = mark('2025-03-05', students[:5], 'absent', sms_url)
+        large, large_queries = mark('2025-03-06', students[:50], 'absent', sms_url)
+        assert small['absent_count'] == 5 and large['absent_count'] == 50
+        assert small_queries == large_queries
+
+        # Students of another batch are ignored; existing rows are updated, not duplicated
+        data, _ = mark('2025-03-04', students[:10] + students[50:], 'absent')
+        assert data['attendance_marked'] == 10
+        assert Attendance.query.filter_by(batch_id=batch_id, date=date(2025, 3, 4)).count() == 50
+        assert Attendance.query.filter_by(batch_id=batch_id, date=date(2025, 3, 4),
+                                          status=AttendanceStatus.ABSENT).count() == 10
+        assert Attendance.query.filter_by(user_id=students[50].id).count() == 0
+
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    test_bulk_marking_uses_constant_queries()
+    print("✅ Bulk attendance tests passed")
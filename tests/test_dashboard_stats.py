@@ -0,0 +1,77 @@
+"""
+Test script for the grouped, cached dashboard statistics
+"""
+import sys
+import os
+from datetime import date
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+from app import create_app
+from models import db, User, UserRole, Batch
+from services.dashboard_stats import invalidate_dashboard_cache
+
+
+def test_dashboard_counts_are_grouped_and_cached():
+    """Stats cost the same for any number of batches, are cached, and student changes clear the cache"""
+    app = create_app('testing')
+    with app.app_context():
+        invalidate_dashboard_cache()
+        teacher = User(phoneNumber='01800000000', first_name='Test', last_name='Teacher', role=UserRole.TEACHER)
+        db.session.add(teacher)
+        batches = [Batch(name=f'Batch {i}', start_date=date(2025, 1, 1), fee_amount=500) for i in range(6)]
+        for i, batch in enumerate(batches):
+            batch.students.extend(User(phoneNumber=f'017{i:04d}{j:04d}', first_name=f'S{j}', last_name=f'B{i}',
+                                       role=UserRole.STUDENT, is_archived=(j == 0)) for j in range(i + 1))
+        db.session.add_all(batches)
+        db.session.commit()
+        teacher_id = teacher.id
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = teacher_id
+            sess['user_role'] = teacher.role.value
+
+        def stats():
+            statements = []
+            listener = lambda *args: statements.append(args[2])
+            event.listen(db.engine, 'before_cursor_execute', listener)
+            data = client.get('/api/dashboard/stats').get_json()
+            event.remove(db.engine, 'before_cursor_execute', listener)
+            return data, statements
+
+        data, statements = stats()
+        assert data['totalStudents'] == 15 and data['totalTeachers'] == 1 and data['totalBatches'] == 6
+        assert [b['student_count'] for b in data['allBatchesData']] == [0, 1, 2, 3, 4, 5]
+        assert not any('FROM users, user_batches' in s for s in statements)
+
+        # Served from the cache; only the session user is loaded
+        _, cached_statements = stats()
+        assert len(cached_statements) < len(statements)
+        assert not any('GROUP BY' in s for s in cached_statements)
+
+        # Logins do not clear it, enrolling a student does
+        db.session.get(User, teacher_id).last_login = date.today()
+        db.session.commit()
+        assert not any('GROUP BY' in s for s in stats()[1])
+        batch = Batch.query.filter_by(name='Batch 0').one()
+        batch.students.append(User(phoneNumber='01799999999', first_name='New', last_name='Student',
+                                   role=UserRole.STUDENT))
+        db.session.commit()
+        data, _ = stats()
+        assert data['totalStudents'] == 16 and data['allBatchesData'][0]['student_count'] == 1
+
+        overview = client.get('/api/dashboard/overview').get_json()['data']
+        assert (overview['total_students'], overview['total_batches']) == (16, 6)
+        counters = client.get('/health/dashboard-cache').get_json()
+        assert counters['hits'] >= 2 and counters['misses'] >= 3 and counters['invalidations'] >= 1
+
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    test_dashboard_counts_are_grouped_and_cached()
+    print("✅ Dashboard statistics tests passed")
@@ -0,0 +1,40 @@
+"""
+Test script for the SQLite engine tuning in services/database.py
+"""
+import sys
+import os
+import tempfile
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+
+from config import Config
+from services.database import configure_sqlite_engine, sqlite_settings
+
+
+def test_file_engine_connections_are_tuned():
+    """Every new connection of a file database runs with the configured PRAGMAs"""
+    path = os.path.join(tempfile.mkdtemp(), 'tuned.db')
+    engine = create_engine(f'sqlite:///{path}')
+    assert configure_sqlite_engine(engine, sqlite_settings(vars(Config)))
+
+    with engine.connect() as conn:
+        assert conn.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+        assert conn.execute(text('PRAGMA synchronous')).scalar() == 1  # NORMAL
+        assert conn.execute(text('PRAGMA busy_timeout')).scalar() == Config.SQLITE_BUSY_TIMEOUT
+        assert conn.execute(text('PRAGMA cache_size')).scalar() == Config.SQLITE_CACHE_SIZE
+    engine.dispose()
+
+
+def test_memory_engine_is_left_alone():
+    """In-memory databases (the test config) keep their single connection"""
+    engine = create_engine('sqlite://')
+    assert not configure_sqlite_engine(engine, sqlite_settings(vars(Config)))
+
+
+if __name__ == '__main__':
+    test_file_engine_connections_are_tuned()
+    test_memory_engine_is_left_alone()
+    print("✅ Database engine tests passed")
@@ -0,0 +1,88 @@
+"""
+Test script for the cached online exam papers and their ETags
+"""
+import sys
+import os
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+from app import create_app
+from models import db, User, UserRole, OnlineExam, OnlineQuestion
+
+
+def test_paper_is_cached_and_revalidated():
+    """Starts share one cached paper, clients holding it get a 304, and edits change its ETag"""
+    app = create_app('testing')
+    with app.app_context():
+        teacher = User(phoneNumber='01800000000', first_name='Test', last_name='Teacher', role=UserRole.TEACHER)
+        students = [User(phoneNumber=f'0171000000{i}', first_name=f'Student{i}', last_name='Test',
+                         role=UserRole.STUDENT) for i in range(2)]
+        db.session.add_all([teacher] + students)
+        db.session.flush()
+        exam = OnlineExam(title='Paper Exam', class_name='HSC', book_name='Physics', chapter_name='Motion',
+                          duration=30, total_questions=3, is_published=True, created_by=teacher.id)
+        db.session.add(exam)
+        db.session.flush()
+        db.session.add_all([OnlineQuestion(exam_id=exam.id, question_text=f'Q{i}', option_a='a', option_b='b',
+                                           option_c='c', option_d='d', correct_answer='A', question_order=i + 1)
+                            for i in range(3)])
+        db.session.commit()
+        exam_id = exam.id
+
+        clients = []
+        for user in [teacher] + students:
+            client = app.test_client()
+            with client.session_transaction() as sess:
+                sess['user_id'] = user.id
+                sess['user_role'] = user.role.value
+            clients.append(client)
+        teacher_client, first, second = clients
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        response = first.post(f'/api/online-exams/{exam_id}/start')
+        data = response.get_json()['data']
+        etag = data['questions_etag']
+        assert response.headers['ETag'] == f'"{etag}"'
+        assert [q['question_text'] for q in data['questions']] == ['Q0', 'Q1', 'Q2']
+        assert all('correct_answer' not in q for q in data['questions'])
+
+        # A second student starting the same exam is served from the cache
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        data = second.post(f'/api/online-exams/{exam_id}/start').get_json()['data']
+        event.remove(db.engine, 'before_cursor_execute', listener)
+        assert data['questions_etag'] == etag and len(data['questions']) == 3
+        assert not any('FROM online_questions' in s for s in statements)
+
+        # Reconnecting clients that hold the paper
+        data = first.post(f'/api/online-exams/{exam_id}/start', headers={'If-None-Match': f'"{etag}"'}).get_json()['data']
+        assert data['questions_unchanged'] and 'questions' not in data
+        response = first.get(f'/api/online-exams/{exam_id}/paper', headers={'If-None-Match': f'"{etag}"'})
+        assert response.status_code == 304
+        response = first.get(f'/api/online-exams/{exam_id}/paper')
+        assert response.status_code == 200 and response.get_json()['data']['questions_etag'] == etag
+
+        # Editing a question or the exam changes the paper
+        question_id = OnlineQuestion.query.filter_by(exam_id=exam_id, question_order=2).one().id
+        assert teacher_client.put(f'/api/online-exams/{exam_id}/questions/{question_id}',
+                                  json={'question_text': 'Q1 edited'}).status_code == 200
+        response = first.get(f'/api/online-exams/{exam_id}/paper', headers={'If-None-Match': f'"{etag}"'})
+        assert response.status_code == 200
+        paper = response.get_json()['data']
+        assert paper['questions'][1]['question_text'] == 'Q1 edited' and paper['questions_etag'] != etag
+
+        teacher_client.put(f'/api/online-exams/{exam_id}', json={'title': 'Renamed'})
+        data = second.post(f'/api/online-exams/{exam_id}/start',
+                           headers={'If-None-Match': f'"{paper["questions_etag"]}"'}).get_json()['data']
+        assert data['exam']['title'] == 'Renamed' and len(data['questions']) == 3
+
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    test_paper_is_cached_and_revalidated()
+    print("✅ Exam paper tests passed")
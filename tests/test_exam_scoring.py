@@ -0,0 +1,95 @@
+"""
+Test script for cached answer keys and set-based online exam scoring
+"""
+import sys
+import os
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+from app import create_app
+from models import db, User, UserRole, OnlineExam, OnlineQuestion, OnlineExamAttempt, OnlineStudentAnswer
+from services.exam_scoring import score_attempts
+
+
+def _exam(teacher, count):
+    exam = OnlineExam(title=f'Scoring Exam {count}', class_name='HSC', book_name='Physics', chapter_name='Motion',
+                      duration=30, total_questions=count, is_published=True, created_by=teacher.id)
+    db.session.add(exam)
+    db.session.flush()
+    db.session.add_all([OnlineQuestion(exam_id=exam.id, question_text=f'Q{i}', option_a='a', option_b='b',
+                                       option_c='c', option_d='d', correct_answer='A', question_order=i,
+                                       marks=2 if i == 0 else 1)
+                        for i in range(count)])
+    db.session.flush()
+    return exam
+
+
+def test_scoring_cost_does_not_grow_with_questions():
+    """Submitting costs the same statements for 3 or 30 questions, and edits retire the cached key"""
+    app = create_app('testing')
+    with app.app_context():
+        teacher = User(phoneNumber='01800000000', first_name='Test', last_name='Teacher', role=UserRole.TEACHER)
+        students = [User(phoneNumber=f'0171000000{i}', first_name=f'Student{i}', last_name='Test',
+                         role=UserRole.STUDENT) for i in range(3)]
+        db.session.add_all([teacher] + students)
+        db.session.flush()
+        small, large = _exam(teacher, 3), _exam(teacher, 30)
+        db.session.commit()
+
+        def submit(student, exam, answers):
+            client = app.test_client()
+            with client.session_transaction() as sess:
+                sess['user_id'] = student.id
+                sess['user_role'] = student.role.value
+            attempt_id = client.post(f'/api/online-exams/{exam.id}/start').get_json()['data']['attempt_id']
+            question_ids = [q.id for q in OnlineQuestion.query.filter_by(exam_id=exam.id)
+                            .order_by(OnlineQuestion.question_order)]
+            client.post(f'/api/online-exams/attempts/{attempt_id}/answer', json={'answers': [
+                {'question_id': question_ids[i], 'selected_answer': answer} for i, answer in answers.items()
+            ]})
+            statements = []
+            listener = lambda *args: statements.append(args[2])
+            event.listen(db.engine, 'before_cursor_execute', listener)
+            data = client.post(f'/api/online-exams/attempts/{attempt_id}/submit', json={}).get_json()['data']
+            event.remove(db.engine, 'before_cursor_execute', listener)
+            return data, statements
+
+        data, small_statements = submit(students[0], small, {0: 'A', 1: 'B'})
+        assert (data['score'], data['total_marks']) == (2, 4)
+        assert OnlineStudentAnswer.query.filter_by(attempt_id=data['attempt_id']).count() == 3
+
+        data, large_statements = submit(students[0], large, {0: 'A', 1: 'A', 2: 'C'})
+        assert (data['score'], data['total_marks']) == (3, 31)
+        assert len(small_statements) == len(large_statements)
+        assert any('online_questions' in s for s in large_statements)
+
+        # A cached key is reused until one of the exam's questions changes
+        data, statements = submit(students[1], large, {0: 'A'})
+        assert data['score'] == 2
+        assert not any('FROM online_questions' in s for s in statements)
+
+        question = OnlineQuestion.query.filter_by(exam_id=large.id, question_order=0).one()
+        question.correct_answer = 'B'
+        db.session.commit()
+        data, _ = submit(students[2], large, {0: 'A'})
+        assert data['score'] == 0
+
+        # Several attempts are graded and submitted together
+        attempts = [OnlineExamAttempt(exam_id=small.id, student_id=s.id) for s in students[1:]]
+        db.session.add_all(attempts)
+        db.session.commit()
+        results = score_attempts(attempts, auto_submitted=True)
+        db.session.commit()
+        assert all(r['score'] == 0 and r['total_marks'] == 4 for r in results.values())
+        assert OnlineExamAttempt.query.filter_by(is_submitted=True, auto_submitted=True).count() == 2
+
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    test_scoring_cost_does_not_grow_with_questions()
+    print("✅ Exam scoring tests passed")
@@ -0,0 +1,118 @@
+"""
+Test script for fee period columns and the monthly fee grid endpoints
+"""
+import sys
+import os
+from datetime import date
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from models import db, User, UserRole, Batch, Fee
+
+
+def _seed():
+    batch = Batch(name='Fee Batch', start_date=date(2025, 1, 1))
+    students = [User(phoneNumber=f'0171000000{i}', first_name=f'Student{i}', last_name='Test',
+                     role=UserRole.STUDENT) for i in range(3)]
+    for student in students:
+        student.batches.append(batch)
+    db.session.add_all([batch] + students)
+    db.session.commit()
+    return batch, students
+
+
+def test_fee_period_follows_due_date():
+    """year/month are set from due_date on insert and on every later change"""
+    app = create_app('testing')
+    with app.app_context():
+        batch, students = _seed()
+        fee = Fee(user_id=students[0].id, batch_id=batch.id, amount=500, due_date=date(2025, 3, 31))
+        db.session.add(fee)
+        db.session.commit()
+        assert (fee.year, fee.month) == (2025, 3)
+
+        fee.due_date = date(2026, 1, 31)
+        db.session.commit()
+        assert Fee.query.filter_by(year=2026, month=1).one().id == fee.id
+
+        db.session.remove()
+        db.drop_all()
+
+
+def test_save_monthly_fee_uses_period():
+    """Saving a grid cell creates, updates and deletes the fee of that period"""
+    app = create_app('testing')
+    with app.app_context():
+        batch, students = _seed()
+        client = app.test_client()
+        cell = {'student_id': students[0].id, 'batch_id': batch.id, 'month': 2, 'year': 2025}
+
+        response = client.post('/api/fees/save-monthly', json={**cell, 'amount': 500})
+        assert response.status_code == 201
+        fee_id = response.get_json()['data']['fee_id']
+        assert (db.session.get(Fee, fee_id).year, db.session.get(Fee, fee_id).month) == (2025, 2)
+
+        response = client.post('/api/fees/save-monthly', json={**cell, 'amount': 650})
+        assert response.get_json()['data']['fee_id'] == fee_id
+
+        data = client.get(f'/api/fees/load-monthly?batch_id={batch.id}&year=2025').get_json()['data']
+        months = {row['student_id']: row['months'] for row in data['fees']}
+        assert months[students[0].id]['2']['amount'] == 650
+        assert months[students[0].id]['3']['fee_id'] is None
+
+        response = client.post('/api/fees/save-monthly', json={**cell, 'amount': 0})
+        assert response.get_json()['data']['deleted']
+        assert Fee.query.count() == 0
+
+        db.session.remove()
+        db.drop_all()
+
+
+def test_save_monthly_bulk():
+    """One request creates, updates, deletes and rejects cells with per-cell results"""
+    app = create_app('testing')
+    with app.app_context():
+        batch, students = _seed()
+        outsider = User(phoneNumber='01719999999', first_name='Other', last_name='Batch',
+                        role=UserRole.STUDENT)
+        db.session.add(outsider)
+        db.session.add(Fee(user_id=students[1].id, batch_id=batch.id, amount=500, due_date=date(2025, 1, 31)))
+        db.session.add(Fee(user_id=students[2].id, batch_id=batch.id, amount=500, due_date=date(2025, 1, 31)))
+        db.session.commit()
+
+        client = app.test_client()
+        response = client.post('/api/fees/save-monthly-bulk', json={
+            'batch_id': batch.id,
+            'year': 2025,
+            'changes': [
+                {'student_id': students[0].id, 'month': 1, 'amount': 400},
+                {'student_id': students[0].id, 'month': 2, 'amount': 450, 'year': 2026},
+                {'student_id': students[1].id, 'month': 1, 'amount': 700},
+                {'student_id': students[2].id, 'month': 1, 'amount': 0},
+                {'student_id': students[2].id, 'month': 13, 'amount': 100},
+                {'student_id': outsider.id, 'month': 1, 'amount': 100},
+            ]
+        })
+        assert response.status_code == 200
+        data = response.get_json()['data']
+        assert [r['status'] for r in data['results']] == ['created', 'created', 'updated', 'deleted',
+                                                          'error', 'error']
+        assert data['summary']['error'] == 2
+
+        created = db.session.get(Fee, data['results'][1]['fee_id'])
+        assert (created.user_id, created.year, created.month, created.due_date) == \
+            (students[0].id, 2026, 2, date(2026, 2, 28))
+        assert float(db.session.get(Fee, data['results'][2]['fee_id']).amount) == 700
+        assert Fee.query.filter_by(user_id=students[2].id).count() == 0
+
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    test_fee_period_follows_due_date()
+    test_save_monthly_fee_uses_period()
+    test_save_monthly_bulk()
+    print("✅ Fee period tests passed")
@@ -0,0 +1,95 @@
+"""
+Test script for scheme-aware password checks and the login fast path
+"""
+import sys
+import os
+from datetime import date
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bcrypt
+from sqlalchemy import event
+from werkzeug.security import generate_password_hash as werkzeug_hash
+
+from app import create_app
+from models import db, User, UserRole, Batch
+from utils.auth import verify_password, password_hash_scheme
+
+
+def test_verify_password_uses_the_stored_scheme():
+    """One check per hash, with a rehash flag for anything but bcrypt at the configured cost"""
+    app = create_app('testing')
+    with app.app_context():
+        current = bcrypt.hashpw(b'secret99', bcrypt.gensalt(4)).decode()
+        stronger = bcrypt.hashpw(b'secret99', bcrypt.gensalt(5)).decode()
+        legacy = werkzeug_hash('secret99', method='pbkdf2:sha256:1000')
+
+        assert password_hash_scheme(current) == ('bcrypt', 4)
+        assert password_hash_scheme(legacy) == ('pbkdf2', None)
+        assert password_hash_scheme('plaintext') == (None, None)
+        assert verify_password(current, 'secret99') == (True, False)
+        assert verify_password(stronger, 'secret99') == (True, True)
+        assert verify_password(legacy, 'secret99') == (True, True)
+        assert verify_password(current.encode(), 'secret99') == (True, False)
+        assert verify_password(current, 'wrong') == (False, False)
+        assert verify_password(legacy, 'wrong') == (False, False)
+        assert verify_password('plaintext', 'plaintext') == (False, False)
+        assert verify_password(current, 'x' * 129) == (False, False)
+
+        db.session.remove()
+        db.drop_all()
+
+
+def test_login_upgrades_hashes_and_loads_batches_once():
+    """Legacy hashes move to bcrypt on login, and a shared phone's batches come from one query"""
+    app = create_app('testing')
+    with app.app_context():
+        teacher = User(phoneNumber='01800000001', first_name='Legacy', last_name='Teacher', role=UserRole.TEACHER,
+                       password_hash=werkzeug_hash('Teach3r!pass', method='pbkdf2:sha256:1000'))
+        batches = [Batch(name=f'Batch {i}', start_date=date(2025, 1, 1), is_active=i != 2) for i in range(3)]
+        siblings = [User(phoneNumber='01710000001', first_name=f'Sibling{i}', last_name='Student',
+                         role=UserRole.STUDENT) for i in range(3)]
+        siblings[0].batches.extend([batches[0], batches[2]])
+        siblings[1].batches.extend([batches[1], batches[0]])
+        db.session.add_all([teacher] + batches + siblings)
+        db.session.commit()
+        teacher_id = teacher.id
+        batch_ids = [b.id for b in batches]
+
+        client = app.test_client()
+        assert client.post('/api/auth/login', json={'phoneNumber': '01800000001',
+                                                    'password': 'wrong'}).status_code == 401
+        assert db.session.get(User, teacher_id).password_hash.startswith('pbkdf2:')
+        assert client.post('/api/auth/login', json={'phoneNumber': '01800000001',
+                                                    'password': 'Teach3r!pass'}).status_code == 200
+        db.session.expire_all()
+        upgraded = db.session.get(User, teacher_id).password_hash
+        assert password_hash_scheme(upgraded) == ('bcrypt', 4)
+        assert client.post('/api/auth/login', json={'phoneNumber': '01800000001',
+                                                    'password': 'Teach3r!pass'}).status_code == 200
+        db.session.expire_all()
+        assert db.session.get(User, teacher_id).password_hash == upgraded  # No rehash once current
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        response = client.post('/api/auth/login', json={'phoneNumber': '01710000001', 'password': 'student123'})
+        event.remove(db.engine, 'before_cursor_execute', listener)
+        assert response.status_code == 200
+        user = response.get_json()['data']['user']
+        assert sum('user_batches' in s for s in statements) == 1
+        assert user['isMultiStudent'] and user['allBatchIds'] == [batch_ids[0], batch_ids[2], batch_ids[1]]
+        assert [b['id'] for b in user['batches']] == [batch_ids[0], batch_ids[1]]
+        assert [[b['id'] for b in s['batches']] for s in user['allStudents']] == [
+            [batch_ids[0]], [batch_ids[0], batch_ids[1]], []
+        ]
+
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    test_verify_password_uses_the_stored_scheme()
+    test_login_upgrades_hashes_and_loads_batches_once()
+    print("✅ Login fast path tests passed")
@@ -0,0 +1,99 @@
+"""
+Test script for the bulk upsert path of individual exam marks submission
+"""
+import sys
+import os
+from datetime import datetime, date
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+from app import create_app
+from models import db, User, UserRole, Batch, MonthlyExam, IndividualExam, MonthlyMark
+from services.ranking_engine import calculate_grade_and_gpa
+
+
+def test_marks_are_written_in_one_executemany():
+    """New and changed marks go out in one statement, unchanged marks are skipped, outsiders are rejected"""
+    app = create_app('testing')
+    with app.app_context():
+        teacher = User(phoneNumber='01800000000', first_name='Test', last_name='Teacher', role=UserRole.TEACHER)
+        batch = Batch(name='Marks Batch', start_date=date(2025, 1, 1))
+        other_batch = Batch(name='Other Batch', start_date=date(2025, 1, 1))
+        students = [User(phoneNumber=f'0171000000{i}', first_name=f'Student{i}', last_name='Test',
+                         role=UserRole.STUDENT) for i in range(4)]
+        batch.students.extend(students[:3])
+        other_batch.students.append(students[3])
+        db.session.add_all([teacher, batch, other_batch] + students)
+        db.session.flush()
+        exam = MonthlyExam(title='March', month=3, year=2025, total_marks=50, pass_marks=17,
+                           start_date=datetime(2025, 3, 1), end_date=datetime(2025, 3, 31),
+                           batch_id=batch.id, created_by=teacher.id)
+        db.session.add(exam)
+        db.session.flush()
+        paper = IndividualExam(monthly_exam_id=exam.id, title='Paper', subject='Maths', marks=50,
+                               exam_date=datetime(2025, 3, 10), duration=60)
+        db.session.add(paper)
+        db.session.flush()
+        for student, marks in ((students[1], 30), (students[2], 40)):
+            db.session.add(MonthlyMark(monthly_exam_id=exam.id, individual_exam_id=paper.id, user_id=student.id,
+                                       marks_obtained=marks, total_marks=50, percentage=marks * 2.0))
+        db.session.commit()
+        exam_id, paper_id = exam.id, paper.id
+        new, updated, unchanged, outsider = [s.id for s in students]
+        unchanged_stamp = MonthlyMark.query.filter_by(user_id=unchanged).one().updated_at
+
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = teacher.id
+            sess['user_role'] = teacher.role.value
+        client.get('/api/auth/me')  # Load the session user outside the window
+
+        writes = []
+        def listener(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('INSERT INTO monthly_marks'):
+                writes.append((executemany, parameters))
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        response = client.post(f'/api/monthly-exams/{exam_id}/individual-exams/{paper_id}/marks', json={'students': [
+            {'user_id': new, 'marks_obtained': 25},
+            {'user_id': updated, 'marks_obtained': 35},
+            {'user_id': unchanged, 'marks_obtained': 40},
+            {'user_id': outsider, 'marks_obtained': 20}
+        ]})
+        event.remove(db.engine, 'before_cursor_execute', listener)
+
+        assert response.status_code == 200
+        data = response.get_json()['data']
+        assert data['saved_count'] == 3
+        assert data['validation_errors'] == [f'Student entry 4: student not found (ID: {outsider})']
+
+        # One executemany carrying only the new and the changed mark
+        assert len(writes) == 1
+        executemany, parameters = writes[0]
+        assert executemany and len(parameters) == 2
+
+        db.session.expire_all()
+        marks = {m.user_id: m for m in MonthlyMark.query.filter_by(individual_exam_id=paper_id).all()}
+        assert sorted(marks) == [new, updated, unchanged]
+        assert (marks[new].marks_obtained, marks[new].percentage) == (25, 50.0)
+        assert (marks[updated].marks_obtained, marks[updated].percentage) == (35, 70.0)
+        assert (marks[updated].grade, marks[updated].gpa) == calculate_grade_and_gpa(70.0)
+        assert marks[unchanged].marks_obtained == 40 and marks[unchanged].updated_at == unchanged_stamp
+        assert MonthlyMark.query.filter_by(user_id=updated).count() == 1
+
+        # Nobody in the batch: nothing is saved
+        response = client.post(f'/api/monthly-exams/{exam_id}/individual-exams/{paper_id}/marks', json={'students': [
+            {'user_id': outsider, 'marks_obtained': 20}
+        ]})
+        assert response.status_code == 400
+        assert 'student not found' in response.get_json()['message']
+
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    test_marks_are_written_in_one_executemany()
+    print("✅ Marks upsert tests passed")
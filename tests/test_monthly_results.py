@@ -0,0 +1,89 @@
+"""
+Test script for the grouped monthly results calculation
+"""
+import sys
+import os
+from datetime import date, datetime
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+from app import create_app
+from models import (db, User, UserRole, Batch, Exam, ExamSubmission, Attendance, Fee, MonthlyResult,
+                    AttendanceStatus, FeeStatus, SubmissionStatus)
+
+
+def _seed_batch(name, teacher, size, offset):
+    batch = Batch(name=name, start_date=date(2025, 1, 1))
+    students = [User(phoneNumber=f'017{offset + i:08d}', first_name=f'Student{i}', last_name=name,
+                     role=UserRole.STUDENT) for i in range(size)]
+    batch.students.extend(students)
+    db.session.add_all([batch] + students)
+    db.session.flush()
+    exam = Exam(title=f'{name} Test', duration=60, total_marks=100, start_time=datetime(2025, 3, 1),
+                end_time=datetime(2025, 3, 2), created_by=teacher.id)
+    exam.batches.append(batch)
+    db.session.add(exam)
+    db.session.flush()
+    for i, student in enumerate(students):
+        db.session.add(ExamSubmission(exam_id=exam.id, user_id=student.id, total_marks=100,
+                                      obtained_marks=90 - 10 * (i // 2), status=SubmissionStatus.SUBMITTED,
+                                      submitted_at=datetime(2025, 3, 1, 11)))
+        for day in range(1, 5):
+            db.session.add(Attendance(user_id=student.id, batch_id=batch.id, date=date(2025, 3, day),
+                                      status=AttendanceStatus.ABSENT if day <= i else AttendanceStatus.PRESENT))
+        db.session.add(Fee(user_id=student.id, batch_id=batch.id, amount=500, due_date=date(2025, 3, 10),
+                           year=2025, month=3, status=FeeStatus.PAID if i % 2 == 0 else FeeStatus.PENDING))
+    return batch
+
+
+def test_results_use_grouped_queries():
+    """A batch costs the same statements for 4 or 40 students, ranks ties together and recalculates in place"""
+    app = create_app('testing')
+    with app.app_context():
+        teacher = User(phoneNumber='01800000000', first_name='Test', last_name='Teacher', role=UserRole.TEACHER)
+        db.session.add(teacher)
+        db.session.flush()
+        small = _seed_batch('Small', teacher, 4, 0)
+        large = _seed_batch('Large', teacher, 40, 100)
+        db.session.commit()
+        small_id, large_id = small.id, large.id
+
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = teacher.id
+            sess['user_role'] = teacher.role.value
+
+        def calculate(batch_id):
+            statements = []
+            listener = lambda *args: statements.append(args[2])
+            event.listen(db.engine, 'before_cursor_execute', listener)
+            response = client.post('/api/results/calculate', json={'batch_id': batch_id, 'month': 3, 'year': 2025})
+            event.remove(db.engine, 'before_cursor_execute', listener)
+            assert response.status_code == 201
+            return statements
+
+        # The first request loads the session user; compare the ones after it
+        calculate(small_id)
+        small_statements, large_statements = calculate(small_id), calculate(large_id)
+        assert len(small_statements) == len(large_statements)
+        assert sum('GROUP BY' in s for s in large_statements) == 3
+
+        results = MonthlyResult.query.filter_by(batch_id=small_id, month=3, year=2025).order_by(MonthlyResult.rank).all()
+        assert [(r.percentage, r.rank) for r in results] == [(90.0, 1), (90.0, 1), (80.0, 3), (80.0, 3)]
+        assert [r.attendance_percentage for r in sorted(results, key=lambda r: r.user_id)] == [100.0, 75.0, 50.0, 25.0]
+        assert sorted(r.fee_status for r in results) == ['paid', 'paid', 'pending', 'pending']
+        assert results[0].grade == 'A+' and 'Poor attendance' in results[-1].remarks
+
+        # Recalculating replaced the rows instead of adding new ones
+        assert MonthlyResult.query.filter_by(batch_id=small_id).count() == 4
+
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    test_results_use_grouped_queries()
+    print("✅ Monthly results tests passed")
@@ -0,0 +1,86 @@
+"""
+Test script for the N+1-free online exam listing and denormalized question counts
+"""
+import sys
+import os
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+from app import create_app
+from models import db, User, UserRole, OnlineExam, OnlineExamAttempt
+
+
+def test_listing_queries_do_not_grow_with_exams():
+    """Question counts follow add/delete, and the student listing costs the same for 2 or 8 exams"""
+    app = create_app('testing')
+    with app.app_context():
+        teacher = User(phoneNumber='01800000000', first_name='Test', last_name='Teacher', role=UserRole.TEACHER)
+        student = User(phoneNumber='01710000000', first_name='Test', last_name='Student', role=UserRole.STUDENT)
+        db.session.add_all([teacher, student])
+        db.session.commit()
+        teacher_client, student_client = app.test_client(), app.test_client()
+        for client, user in ((teacher_client, teacher), (student_client, student)):
+            with client.session_transaction() as sess:
+                sess['user_id'] = user.id
+                sess['user_role'] = user.role.value
+
+        def create_exam(title):
+            exam_id = teacher_client.post('/api/online-exams', json={
+                'title': title, 'class_name': 'HSC', 'book_name': 'Physics', 'chapter_name': 'Motion',
+                'duration': 30, 'total_questions': 3
+            }).get_json()['data']['id']
+            for i in range(2):
+                response = teacher_client.post(f'/api/online-exams/{exam_id}/questions', json={
+                    'question_text': f'Q{i}', 'option_a': 'a', 'option_b': 'b', 'option_c': 'c',
+                    'option_d': 'd', 'correct_answer': 'A'
+                })
+                assert response.status_code == 200
+            teacher_client.put(f'/api/online-exams/{exam_id}', json={'is_published': True})
+            return exam_id
+
+        def listing():
+            statements = []
+            listener = lambda *args: statements.append(args[2])
+            event.listen(db.engine, 'before_cursor_execute', listener)
+            data = student_client.get('/api/online-exams').get_json()['data']
+            event.remove(db.engine, 'before_cursor_execute', listener)
+            return {exam['id']: exam for exam in data}, len(statements)
+
+        first, second = create_exam('First'), create_exam('Second')
+        question_id = teacher_client.post(f'/api/online-exams/{first}/questions', json={
+            'question_text': 'Extra', 'option_a': 'a', 'option_b': 'b', 'option_c': 'c',
+            'option_d': 'd', 'correct_answer': 'B'
+        }).get_json()['data']['id']
+        assert db.session.get(OnlineExam, first).questions_count == 3
+        teacher_client.delete(f'/api/online-exams/{first}/questions/{question_id}')
+        db.session.expire_all()
+        assert db.session.get(OnlineExam, first).questions_count == 2
+
+        # Two submitted attempts and one ongoing attempt on the first exam
+        db.session.add(OnlineExamAttempt(exam_id=first, student_id=student.id, is_submitted=True, percentage=50.0))
+        db.session.add(OnlineExamAttempt(exam_id=first, student_id=student.id, is_submitted=True, percentage=80.0))
+        db.session.commit()
+        ongoing_id = student_client.post(f'/api/online-exams/{first}/start').get_json()['data']['attempt_id']
+
+        exams, small_queries = listing()
+        assert exams[first]['questions_count'] == 2
+        assert (exams[first]['attempts_count'], exams[first]['best_score']) == (2, 80.0)
+        assert exams[first]['ongoing_attempt_id'] == ongoing_id and exams[first]['ongoing_started_at']
+        assert exams[second]['attempts_count'] == 0 and not exams[second]['has_ongoing_attempt']
+
+        for i in range(6):
+            create_exam(f'More {i}')
+        exams, large_queries = listing()
+        assert len(exams) == 8
+        assert small_queries == large_queries
+
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    test_listing_queries_do_not_grow_with_exams()
+    print("✅ Online exam listing tests passed")
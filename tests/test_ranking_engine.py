@@ -0,0 +1,147 @@
+"""
+Test script for the set-based monthly ranking engine
+"""
+import sys
+import os
+from datetime import datetime, date
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+from app import create_app
+from models import (db, User, UserRole, Batch, MonthlyExam, IndividualExam, MonthlyMark,
+                    MonthlyRanking, MonthlyRankingSnapshot, Attendance, AttendanceStatus)
+from services.attendance_matrix import get_month_matrix
+from services.ranking_engine import (compute_comprehensive_ranking, count_working_days,
+                                     get_month_bounds, calculate_grade_and_gpa)
+from services.ranking_snapshots import (get_ranking_snapshot, mark_rankings_dirty,
+                                        mark_batch_rankings_dirty)
+
+
+def _seed(students=5):
+    teacher = User(phoneNumber='01800000000', first_name='Test', last_name='Teacher', role=UserRole.TEACHER)
+    batch = Batch(name='Ranking Batch', start_date=date(2025, 1, 1))
+    db.session.add_all([teacher, batch])
+    db.session.flush()
+
+    users = []
+    for i in range(students):
+        student = User(phoneNumber=f'0171000000{i}', first_name=f'Student{i}', last_name='Test', role=UserRole.STUDENT)
+        student.batches.append(batch)
+        users.append(student)
+    db.session.add_all(users)
+
+    prev_exam = MonthlyExam(title='February', month=2, year=2025, total_marks=50, pass_marks=17,
+                            start_date=datetime(2025, 2, 1), end_date=datetime(2025, 2, 28),
+                            batch_id=batch.id, created_by=1)
+    exam = MonthlyExam(title='March', month=3, year=2025, total_marks=100, pass_marks=33,
+                       start_date=datetime(2025, 3, 1), end_date=datetime(2025, 3, 31),
+                       batch_id=batch.id, created_by=1)
+    db.session.add_all([prev_exam, exam])
+    db.session.flush()
+
+    papers = [IndividualExam(monthly_exam_id=exam.id, title=f'Paper {p}', subject=f'Subject {p}', marks=50,
+                             exam_date=datetime(2025, 3, 10), duration=60, order_index=p) for p in range(2)]
+    db.session.add_all(papers)
+    db.session.flush()
+
+    for i, student in enumerate(users):
+        for paper in papers:
+            db.session.add(MonthlyMark(monthly_exam_id=exam.id, individual_exam_id=paper.id, user_id=student.id,
+                                       marks_obtained=10 * i, total_marks=50, percentage=20.0 * i))
+        db.session.add(Attendance(user_id=student.id, batch_id=batch.id, date=date(2025, 3, 3),
+                                  status=AttendanceStatus.PRESENT))
+    db.session.add(MonthlyRanking(monthly_exam_id=prev_exam.id, user_id=users[0].id, position=1,
+                                  roll_number=7, is_final=True))
+    db.session.commit()
+    return exam, users
+
+
+def test_month_helpers():
+    """Month bounds and working-day counting"""
+    assert get_month_bounds(2024, 12) == (date(2024, 12, 1), date(2024, 12, 31))
+    assert get_month_bounds(2024, 2) == (date(2024, 2, 1), date(2024, 2, 29))
+    assert count_working_days(date(2025, 3, 1), date(2025, 3, 31)) == 21
+    assert calculate_grade_and_gpa(80) == ('A+', 5.00)
+    assert calculate_grade_and_gpa(32.9) == ('F', 0.00)
+
+
+def test_comprehensive_ranking_uses_constant_queries():
+    """Ranking is computed with a fixed number of queries regardless of batch size"""
+    app = create_app('testing')
+    with app.app_context():
+        exam, users = _seed(students=5)
+        # Present-day counts come from the attendance month matrix, built once per month
+        get_month_matrix(exam.batch_id, exam.year, exam.month)
+        db.session.commit()
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        result = compute_comprehensive_ranking(exam)
+        event.remove(db.engine, 'before_cursor_execute', listener)
+
+        rankings = result['rankings']
+        assert len(statements) <= 8
+        assert [r['user_id'] for r in rankings] == [u.id for u in reversed(users)]
+        assert [r['position'] for r in rankings] == [1, 2, 3, 4, 5]
+
+        top = rankings[0]
+        assert top['total_exam_marks'] == 80
+        assert top['attendance_marks'] == 1
+        assert top['total_possible'] == 100 + 21
+        assert top['position_trend'] == 'new'
+
+        # Roll number and position inherited from the previous month's final ranking
+        last = rankings[-1]
+        assert last['roll_number'] == 7
+        assert last['previous_position'] == 1
+        assert last['position_trend'] == 'down'
+        assert result['previous_rolls'] == {users[0].id: 7}
+
+        db.session.remove()
+        db.drop_all()
+
+
+def test_ranking_snapshot_invalidation():
+    """Snapshots are reused until a mark, attendance or roster write dirties them"""
+    app = create_app('testing')
+    with app.app_context():
+        exam, users = _seed(students=3)
+
+        first = get_ranking_snapshot(exam)
+        snapshot = MonthlyRankingSnapshot.query.filter_by(monthly_exam_id=exam.id).one()
+        assert not snapshot.is_dirty
+        assert get_ranking_snapshot(exam) == first
+
+        mark_rankings_dirty([exam.id])
+        db.session.commit()
+        db.session.refresh(snapshot)
+        assert snapshot.is_dirty and snapshot.version == 1
+        get_ranking_snapshot(exam)
+        db.session.refresh(snapshot)
+        assert not snapshot.is_dirty
+
+        # Attendance in another month leaves this exam's snapshot alone
+        mark_batch_rankings_dirty(exam.batch_id, 2025, 4)
+        db.session.commit()
+        db.session.refresh(snapshot)
+        assert not snapshot.is_dirty
+
+        # Archiving a student changes the roster
+        users[0].is_archived = True
+        db.session.commit()
+        db.session.refresh(snapshot)
+        assert snapshot.is_dirty
+        assert len(get_ranking_snapshot(exam)['rankings']) == 2
+
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    test_month_helpers()
+    test_comprehensive_ranking_uses_constant_queries()
+    test_ranking_snapshot_invalidation()
+    print("✅ Ranking engine tests passed")
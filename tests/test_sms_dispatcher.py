@@ -0,0 +1,255 @@
+"""
+Test script for the SMS outbox dispatcher and pooled gateway client
+against a local fake BulkSMSBD server
+"""
+import sys
+import os
+import json
+import threading
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+from app import create_app
+from models import db, User, UserRole, Batch, SmsLog, SmsJob, SmsStatus, Settings, SmsBalanceEntry
+from services.sms_dispatcher import enqueue_sms, drain_outbox, get_job_progress
+from services.sms_gateway import get_gateway_client
+from services.sms_balance import get_balance_summary, InsufficientSmsBalance
+from services.services.sms_service import SMSService, SMSConfig, SMSMessage
+
+
+class FakeBulkSMSBD(BaseHTTPRequestHandler):
+    """
+    Accepts comma-separated numbers like the real gateway. A request containing
+    8801700000009 is rejected as a whole; 8801700000008 fails once with HTTP 500.
+    """
+    requests_seen = []
+    flaky_failures = {'8801700000008': 1}
+
+    def do_GET(self):
+        params = parse_qs(urlparse(self.path).query)
+        numbers = params['number'][0].split(',')
+        FakeBulkSMSBD.requests_seen.append(numbers)
+
+        if any(FakeBulkSMSBD.flaky_failures.get(number) for number in numbers):
+            for number in numbers:
+                if FakeBulkSMSBD.flaky_failures.get(number):
+                    FakeBulkSMSBD.flaky_failures[number] -= 1
+            self.send_response(500)
+            self.end_headers()
+            return
+
+        if '8801700000009' in numbers:
+            body = {'response_code': 1001, 'error_message': 'Invalid Number'}
+        else:
+            body = {'response_code': 202, 'message_id': f'msg-{len(FakeBulkSMSBD.requests_seen)}',
+                    'success_message': 'SMS Submitted Successfully'}
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def _start_gateway():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeBulkSMSBD)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _app(server):
+    app = create_app('testing')
+    app.config['SMS_API_URL'] = f'http://127.0.0.1:{server.server_address[1]}/api/smsapi'
+    app.config['SMS_GATEWAY_CONCURRENCY'] = 4
+    return app
+
+
+def test_dispatcher_retries_and_settles_job():
+    """Delivered, retried and rejected messages end up with the right status and charges"""
+    server = _start_gateway()
+    FakeBulkSMSBD.requests_seen = []
+    FakeBulkSMSBD.flaky_failures = {'8801700000008': 1}
+    app = _app(server)
+    with app.app_context():
+        teacher = User(phoneNumber='01800000000', first_name='Test', last_name='Teacher',
+                       role=UserRole.TEACHER, sms_count=10)
+        db.session.add(teacher)
+        db.session.add(Settings(key='sms_balance', value={'balance': 100}, category='sms'))
+        db.session.commit()
+
+        phones = ['01700000001', '01700000002', '01700000008', '01700000009']
+        job = enqueue_sms([{'phone': p, 'message': 'Hello'} for p in phones],
+                          teacher.id, 'bulk', charge_sender=True)
+        db.session.commit()
+
+        progress = get_job_progress(job)
+        assert progress['pending'] == 4 and not progress['completed']
+
+        # The whole job is reserved up front on the ledger (opened from the legacy setting)
+        assert get_balance_summary()['available'] == 96
+        assert job.reserved_cost == 4
+
+        # One multi-number request hits the flaky number and is retried as a whole;
+        # the retry is rejected for the invalid number, which is then isolated
+        assert drain_outbox() == 8
+        assert FakeBulkSMSBD.requests_seen[0] == ['8801700000001', '8801700000002',
+                                                 '8801700000008', '8801700000009']
+        assert len(FakeBulkSMSBD.requests_seen) == 6
+
+        logs = {log.phone_number: log for log in SmsLog.query.filter_by(job_id=job.id)}
+        assert logs['01700000001'].status == SmsStatus.SENT
+        assert logs['01700000008'].status == SmsStatus.SENT
+        assert logs['01700000008'].attempts == 2
+        assert logs['01700000009'].status == SmsStatus.FAILED
+        assert logs['01700000009'].api_response['error'] == 'Invalid Number'
+        assert all(log.claim_token is None for log in logs.values())
+
+        progress = get_job_progress(db.session.get(SmsJob, job.id))
+        assert (progress['sent'], progress['failed'], progress['pending']) == (3, 1, 0)
+        assert progress['completed']
+
+        db.session.refresh(teacher)
+        assert teacher.sms_count == 7
+
+        # Settled once: delivered cost charged, reservation released
+        summary = get_balance_summary()
+        assert (summary['balance'], summary['reserved'], summary['total_used']) == (97, 0, 3)
+        assert [e.entry_type for e in SmsBalanceEntry.query.filter_by(job_id=job.id)] == ['reserve', 'settle']
+
+        # A job that does not fit the available balance is refused before anything is queued
+        try:
+            enqueue_sms([{'phone': '01700000001', 'message': 'Hello'}] * 98, teacher.id, 'bulk')
+            assert False, 'expected InsufficientSmsBalance'
+        except InsufficientSmsBalance as e:
+            db.session.rollback()
+            assert (e.required, e.available) == (98, 97)
+
+        # Nothing is due any more, so nothing is sent twice
+        assert drain_outbox() == 0
+        assert len(FakeBulkSMSBD.requests_seen) == 6
+
+        db.session.remove()
+        db.drop_all()
+    server.shutdown()
+
+
+def test_gateway_client_groups_identical_messages():
+    """Identical messages share requests; results come back per recipient in input order"""
+    server = _start_gateway()
+    FakeBulkSMSBD.requests_seen = []
+    FakeBulkSMSBD.flaky_failures = {}
+    app = _app(server)
+    app.config['SMS_GATEWAY_MAX_NUMBERS'] = 2
+    with app.app_context():
+        client = get_gateway_client()
+        assert get_gateway_client() is client
+
+        items = [('01700000001', 'A'), ('01700000002', 'B'), ('01700000003', 'A'),
+                 ('01700000004', 'A'), ('01700000009', 'B')]
+        results = client.send_messages(items)
+
+        assert [r['success'] for r in results] == [True, True, True, True, False]
+        assert results[4]['retryable'] is False
+        # A: two requests (max 2 numbers each); B: one rejected request plus two single retries
+        assert sorted(len(numbers) for numbers in FakeBulkSMSBD.requests_seen) == [1, 1, 1, 2, 2]
+        db.session.remove()
+        db.drop_all()
+    server.shutdown()
+
+
+def test_service_logs_to_recipient_accounts():
+    """Messages sent without a user id are logged to the accounts on their numbers, found in one query"""
+    server = _start_gateway()
+    FakeBulkSMSBD.requests_seen = []
+    FakeBulkSMSBD.flaky_failures = {}
+    app = _app(server)
+    with app.app_context():
+        students = [User(phoneNumber=f'0171000000{i}', first_name=f'Student{i}', last_name='Test',
+                         role=UserRole.STUDENT) for i in range(2)]
+        db.session.add_all(students)
+        db.session.commit()
+
+        service = SMSService()
+        service._config = SMSConfig(api_key='test-key', sender_id='Test', api_url=app.config['SMS_API_URL'])
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        results = service.send_bulk_sms([SMSMessage(recipient='01710000000', message='Hi'),
+                                         SMSMessage(recipient='8801710000001', message='Hi'),
+                                         SMSMessage(recipient='01790000000', message='Hi')])
+        event.remove(db.engine, 'before_cursor_execute', listener)
+
+        assert [r.success for r in results] == [True, True, True]
+        assert sum('FROM users' in s for s in statements) == 1
+        logs = {log.phone_number: log for log in SmsLog.query.all()}
+        assert logs['01710000000'].user_id == students[0].id
+        assert logs['8801710000001'].user_id == students[1].id
+        assert logs['01790000000'].user_id is None
+        assert {log.status for log in logs.values()} == {SmsStatus.SENT}
+
+        db.session.remove()
+        db.drop_all()
+    server.shutdown()
+
+
+def test_absent_sms_endpoint_enqueues_job():
+    """The attendance endpoint only enqueues; progress is served by /api/sms/jobs/<id>"""
+    server = _start_gateway()
+    FakeBulkSMSBD.requests_seen = []
+    app = _app(server)
+    with app.app_context():
+        teacher = User(phoneNumber='01800000000', first_name='Test', last_name='Teacher',
+                       role=UserRole.TEACHER, sms_count=10)
+        batch = Batch(name='SMS Batch', start_date=date(2025, 1, 1))
+        students = [User(phoneNumber=f'0171000000{i}', first_name=f'Student{i}', last_name='Test',
+                         role=UserRole.STUDENT, guardian_phone=f'0172000000{i}') for i in range(3)]
+        for student in students:
+            student.batches.append(batch)
+        db.session.add_all([teacher, batch] + students)
+        db.session.commit()
+
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = teacher.id
+            sess['user_role'] = teacher.role.value
+
+        response = client.post('/api/attendance/bulk-absent-sms', json={
+            'batchId': batch.id,
+            'date': '2025-03-03',
+            'attendanceData': [{'userId': s.id, 'status': 'absent' if i < 2 else 'present'}
+                               for i, s in enumerate(students)]
+        })
+        assert response.status_code == 200
+        data = response.get_json()['data']
+        assert data['sms_queued'] == 4  # guardian and student phone of two absentees
+        assert FakeBulkSMSBD.requests_seen == []
+
+        progress = client.get(f"/api/sms/jobs/{data['sms_job_id']}").get_json()['data']
+        assert progress['pending'] == 4 and not progress['completed']
+
+        drain_outbox()
+        progress = client.get(f"/api/sms/jobs/{data['sms_job_id']}").get_json()['data']
+        assert progress['sent'] == 4 and progress['completed']
+        # Each absentee's guardian and student share a message, so two requests cover four numbers
+        assert sorted(len(numbers) for numbers in FakeBulkSMSBD.requests_seen) == [2, 2]
+
+        db.session.remove()
+        db.drop_all()
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    test_dispatcher_retries_and_settles_job()
+    test_gateway_client_groups_identical_messages()
+    test_service_logs_to_recipient_accounts()
+    test_absent_sms_endpoint_enqueues_job()
+    print("✅ SMS dispatcher tests passed")
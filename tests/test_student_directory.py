@@ -0,0 +1,113 @@
+"""
+Test script for the paginated student list and its search index
+"""
+import sys
+import os
+from datetime import date, datetime
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+from app import create_app
+from models import db, User, UserRole, Batch, MonthlyExam, IndividualExam, MonthlyRanking
+
+
+def test_student_list_pages_and_searches():
+    """Students page on a keyset cursor, batches load in one query, and search follows writes"""
+    app = create_app('testing')
+    with app.app_context():
+        teacher = User(phoneNumber='01800000000', first_name='Test', last_name='Teacher', role=UserRole.TEACHER)
+        batch = Batch(name='Search Batch', start_date=date(2025, 1, 1))
+        names = ['Rahim', 'Karim', 'Nadia', 'Farhan', 'Tania']
+        students = [User(phoneNumber=f'0171234500{i}', first_name=name, last_name='Hossain', role=UserRole.STUDENT,
+                         guardian_name=f'Guardian {name}', guardian_phone=f'0199988800{i}')
+                    for i, name in enumerate(names)]
+        batch.students.extend(students)
+        db.session.add_all([teacher, batch] + students)
+        db.session.flush()
+        exam = MonthlyExam(title='January', month=1, year=2025, total_marks=100, pass_marks=40,
+                           start_date=datetime(2025, 1, 1), end_date=datetime(2025, 1, 28),
+                           batch_id=batch.id, created_by=teacher.id)
+        db.session.add(exam)
+        db.session.flush()
+        db.session.add(MonthlyRanking(monthly_exam_id=exam.id, user_id=students[2].id, position=417, is_final=True))
+        db.session.commit()
+        ids = {s.first_name: s.id for s in students}
+
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = teacher.id
+            sess['user_role'] = teacher.role.value
+        client.get('/api/auth/me')  # Load the session user outside the window
+
+        def search(term, **params):
+            body = client.get('/api/students', query_string={'search': term, **params}).get_json()
+            return sorted(s['first_name'] for s in body['data'])
+
+        # Pages follow (first_name, last_name, id) without gaps or overlap
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        first = client.get('/api/students?limit=2').get_json()
+        event.remove(db.engine, 'before_cursor_execute', listener)
+        assert [s['first_name'] for s in first['data']] == ['Farhan', 'Karim']
+        assert first['data'][0]['batchIds'] == [batch.id]
+        assert sum('user_batches' in s for s in statements) == 1
+        seen = [s['first_name'] for s in first['data']]
+        cursor = first['pagination']['next_cursor']
+        while cursor:
+            page = client.get('/api/students', query_string={'limit': 2, 'cursor': cursor}).get_json()
+            seen += [s['first_name'] for s in page['data']]
+            cursor = page['pagination']['next_cursor']
+        assert seen == sorted(names)
+        assert client.get('/api/students?cursor=bogus').status_code == 400
+
+        # Name, phone, guardian phone and roll number, through the index and the short-word fallback
+        assert search('arh') == ['Farhan']
+        assert search('karim hoss') == ['Karim']
+        assert search('12345003') == ['Farhan']
+        assert search('999888004') == ['Tania']
+        assert search('417') == ['Nadia']
+        assert search('ad', batch_id=batch.id) == ['Nadia']
+        assert search('"OR*') == []
+
+        # Create, update, archive and restore keep the index current
+        created = client.post('/api/students', json={'firstName': 'Sabbir', 'lastName': 'Ahmed',
+                                                     'guardianPhone': '01555666777', 'batchId': batch.id})
+        assert created.status_code in (200, 201)
+        assert search('5566') == ['Sabbir']
+        assert client.put(f"/api/students/{ids['Rahim']}", json={'firstName': 'Rakibul'}).status_code == 200
+        assert search('rakib') == ['Rakibul']
+        assert client.post(f"/api/students/{ids['Tania']}/archive", json={}).status_code == 200
+        assert search('tania') == []
+        assert client.post(f"/api/students/{ids['Tania']}/restore", json={}).status_code == 200
+        assert search('tania') == ['Tania']
+
+        # A newer exam takes over the roll numbers; deleting it hands them back
+        february = MonthlyExam(title='February', month=2, year=2025, total_marks=100, pass_marks=40,
+                               start_date=datetime(2025, 2, 1), end_date=datetime(2025, 2, 28),
+                               batch_id=batch.id, created_by=teacher.id)
+        db.session.add(february)
+        db.session.commit()
+        assert search('417') == []
+        db.session.delete(february)
+        db.session.commit()
+        assert search('417') == ['Nadia']
+
+        # Bulk ranking deletes go around the session listener and reindex the batch themselves
+        paper = IndividualExam(monthly_exam_id=exam.id, title='Paper', subject='Maths', marks=100,
+                               exam_date=datetime(2025, 1, 10), duration=60)
+        db.session.add(paper)
+        db.session.commit()
+        assert client.delete(f'/api/monthly-exams/{exam.id}/individual-exams/{paper.id}').status_code == 200
+        assert search('417') == []
+
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    test_student_list_pages_and_searches()
+    print("✅ Student directory tests passed")
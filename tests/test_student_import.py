@@ -0,0 +1,105 @@
+"""
+Test script for the background student bulk import
+"""
+import sys
+import os
+import io
+from datetime import date
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bcrypt
+from sqlalchemy import event
+
+from app import create_app
+from models import db, User, UserRole, Batch
+from services.student_import import hash_passwords
+
+
+def test_csv_import_runs_as_chunked_job():
+    """A CSV upload is validated up front, written in executemany chunks and reported on the job"""
+    app = create_app('testing')
+    app.config.update(STUDENT_IMPORT_CHUNK_SIZE=2, BCRYPT_LOG_ROUNDS=4)
+    with app.app_context():
+        teacher = User(phoneNumber='01800000000', first_name='Test', last_name='Teacher', role=UserRole.TEACHER)
+        batch = Batch(name='Admission Batch', start_date=date(2025, 1, 1))
+        existing = User(phoneNumber='01710000009', first_name='Old', last_name='Student', role=UserRole.STUDENT)
+        db.session.add_all([teacher, batch, existing])
+        db.session.commit()
+        batch_id = batch.id
+
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = teacher.id
+            sess['user_role'] = teacher.role.value
+        client.get('/api/auth/me')  # Load the session user outside the window
+
+        sheet = '﻿First Name,Last Name,Phone,Batch ID,Guardian Name\n' + '\n'.join([
+            f'Amina,Akter,01710000001,{batch_id},Rafiq',
+            f'Bilal,Khan,01710000002,{batch_id},',
+            'Chandni,Roy,01710000003,,',
+            f'Dipu,Das,01710000004,{batch_id},',
+            'Old,Again,01710000009,,',    # Phone already registered
+            'Twin,Copy,01710000001,,',    # Repeated within the file
+            'Bad,Phone,12345,,',
+            'Lost,Batch,01710000005,9999,',
+            'Only,,01710000006,,'         # No last name
+        ])
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        response = client.post('/api/students/bulk-import', content_type='multipart/form-data',
+                               data={'file': (io.BytesIO(sheet.encode('utf-8')), 'admission.csv')})
+        event.remove(db.engine, 'before_cursor_execute', listener)
+        assert response.status_code == 202
+        job_id = response.get_json()['data']['id']
+
+        # Two chunks of inserts, not a query per row
+        assert sum(s.startswith('INSERT INTO users') for s in statements) == 2
+        assert sum(s.startswith('INSERT INTO user_batches') for s in statements) == 2
+        assert not any('count(' in s.lower() and 'FROM users' in s and 'role' in s for s in statements)
+
+        job = client.get(f'/api/students/bulk-import/{job_id}').get_json()['data']
+        assert job['status'] == 'completed' and job['total'] == 9 and job['processed'] == 9
+        assert (job['successful'], job['failed']) == (4, 5)
+        assert [row['row'] for row in job['successfulImports']] == [1, 2, 3, 4]
+        assert {row['row']: row['error'] for row in job['failedImports']} == {
+            5: 'Student with this phone number already exists',
+            6: 'Student with this phone number already exists',
+            7: 'Invalid phone number format',
+            8: 'Batch not found',
+            9: 'Missing required fields (firstName, lastName, phoneNumber)'
+        }
+
+        amina = User.query.filter_by(phoneNumber='01710000001').one()
+        assert amina.guardian_name == 'Rafiq' and [b.id for b in amina.batches] == [batch_id]
+        assert bcrypt.checkpw(b'Amina0001', amina.password_hash.encode())
+        assert db.session.get(Batch, batch_id).active_students_count == 3
+        found = client.get('/api/students?search=chandni').get_json()['data']
+        assert [s['first_name'] for s in found] == ['Chandni']
+
+        assert client.get('/api/students/bulk-import/9999').status_code == 404
+        bad = client.post('/api/students/bulk-import', content_type='multipart/form-data',
+                          data={'file': (io.BytesIO(b'Name,Email\nA,a@example.com\n'), 'wrong.csv')})
+        assert bad.status_code == 400
+        no_last_name = client.post('/api/students/bulk-import', content_type='multipart/form-data',
+                                   data={'file': (io.BytesIO(b'First Name,Phone\nA,01710000007\n'), 'short.csv')})
+        assert no_last_name.status_code == 400
+
+        db.session.remove()
+        db.drop_all()
+
+
+def test_passwords_hash_in_a_process_pool():
+    """Pool hashing keeps the order of its input"""
+    passwords = ['Alpha1234', 'Bravo5678', 'Charlie9012']
+    hashes = list(hash_passwords(passwords, rounds=4, workers=2))
+    assert [bcrypt.checkpw(p.encode(), h.encode()) for p, h in zip(passwords, hashes)] == [True, True, True]
+
+
+if __name__ == '__main__':
+    test_csv_import_runs_as_chunked_job()
+    test_passwords_hash_in_a_process_pool()
+    print("✅ Student import tests passed")
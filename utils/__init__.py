@@ -1,11 +1,13 @@
 """
 Utilities package for SmartGardenHub
-Exposes authentication helpers, response formatting, and password generation utilities.
+Exposes authentication helpers, response formatting, phone validation and password generation utilities.
 """
 from .auth import (
     login_required,
     require_role,
     get_current_user,
+    get_current_user_batch_ids,
+    clear_current_user_cache,
     get_current_user_id,
     get_current_user_role,
     is_teacher_or_admin,
@@ -15,13 +17,21 @@ from .auth import (
     check_user_access,
     generate_password_hash,
     check_password_hash,
+    verify_password,
+    password_hash_scheme,
 )
 from .response import (
     success_response,
     error_response,
     paginated_response,
+    cursor_response,
+    ndjson_response,
+    encode_cursor,
+    decode_cursor,
     serialize_data,
 )
+from .upsert import bulk_upsert
+from .phone import validate_phone
 from .password_generator import (
     generate_unique_student_password,
     generate_secure_student_password,
@@ -30,10 +40,13 @@ from .password_generator import (
 )
 
 __all__ = [
-    'login_required', 'require_role', 'get_current_user', 'get_current_user_id', 'get_current_user_role',
+    'login_required', 'require_role', 'get_current_user', 'get_current_user_batch_ids',
+    'clear_current_user_cache', 'get_current_user_id', 'get_current_user_role',
     'is_teacher_or_admin', 'is_admin', 'is_student', 'check_batch_access', 'check_user_access',
-    'generate_password_hash', 'check_password_hash',
-    'success_response', 'error_response', 'paginated_response', 'serialize_data',
+    'generate_password_hash', 'check_password_hash', 'verify_password', 'password_hash_scheme',
+    'success_response', 'error_response', 'paginated_response', 'cursor_response', 'ndjson_response',
+    'encode_cursor', 'decode_cursor', 'serialize_data',
+    'bulk_upsert', 'validate_phone',
     'generate_unique_student_password', 'generate_secure_student_password', 'generate_simple_unique_password',
     'validate_student_password_strength'
 ]
@@ -2,16 +2,33 @@
 Authentication Utilities
 Decorators and helper functions for authentication and authorization
 """
-from functools import wraps
-from flask import session, jsonify, request
-from models import User, UserRole
+from functools import lru_cache, wraps
+from flask import session, jsonify, request, g, current_app, has_app_context, has_request_context
+from models import db, User, UserRole, Batch, user_batches
 import bcrypt
 
+# Per-request cache of the session user and their active batch ids, kept on flask.g.
+# Entries are tagged with the session user_id so a login/logout in the same request
+# is never served a stale user.
+_USER_CACHE = '_auth_current_user'
+_BATCH_IDS_CACHE = '_auth_active_batch_ids'
+
+# Stored hashes name their scheme in a prefix: bcrypt '$2b$12$...', werkzeug 'pbkdf2:sha256:600000$...'
+# or 'scrypt:32768:8:1$...'. Logins verify with exactly that scheme and upgrade anything that is not
+# bcrypt at BCRYPT_LOG_ROUNDS, so a failed attempt costs one KDF run instead of one per backend.
+_BCRYPT_PREFIXES = ('$2a$', '$2b$', '$2y$')
+_WERKZEUG_SCHEMES = ('pbkdf2', 'scrypt')
+MAX_PASSWORD_LENGTH = 128  # Longer input is rejected before any KDF runs
+_BCRYPT_MAX_BYTES = 72  # bcrypt ignores (bcrypt>=5: refuses) anything past this
+
+def _password_rounds():
+    return current_app.config.get('BCRYPT_LOG_ROUNDS', 12) if has_app_context() else 12
+
 def generate_password_hash(password):
-    """Generate password hash using bcrypt"""
+    """Generate password hash using bcrypt at the configured BCRYPT_LOG_ROUNDS"""
     if isinstance(password, str):
         password = password.encode('utf-8')
-    return bcrypt.hashpw(password, bcrypt.gensalt()).decode('utf-8')
+    return bcrypt.hashpw(password, bcrypt.gensalt(_password_rounds())).decode('utf-8')
 
 def check_password_hash(hashed_password, password):
     """Check if password matches hash"""
@@ -21,6 +38,46 @@ def check_password_hash(hashed_password, password):
         hashed_password = hashed_password.encode('utf-8')
     return bcrypt.checkpw(password, hashed_password)
 
+@lru_cache(maxsize=1024)
+def password_hash_scheme(stored_hash):
+    """(scheme, bcrypt cost) of a stored hash; scheme is 'bcrypt', 'pbkdf2', 'scrypt' or None"""
+    if not stored_hash:
+        return None, None
+    if stored_hash.startswith(_BCRYPT_PREFIXES):
+        try:
+            return 'bcrypt', int(stored_hash[4:6])
+        except ValueError:
+            return None, None
+    scheme = stored_hash.split(':', 1)[0]
+    if scheme in _WERKZEUG_SCHEMES and '$' in stored_hash:
+        return scheme, None
+    return None, None
+
+def verify_password(stored_hash, password):
+    """
+    Check password against a stored hash with the one scheme its prefix names.
+    Returns (valid, needs_rehash); needs_rehash is set for valid passwords whose
+    hash is not bcrypt at the configured cost.
+    """
+    if isinstance(stored_hash, (bytes, bytearray)):
+        stored_hash = stored_hash.decode('utf-8', 'replace')
+    if not password or len(password) > MAX_PASSWORD_LENGTH:
+        return False, False
+    scheme, cost = password_hash_scheme(stored_hash)
+    encoded = password.encode('utf-8')
+
+    if scheme == 'bcrypt':
+        try:
+            valid = bcrypt.checkpw(encoded, stored_hash.encode('utf-8'))
+        except ValueError:  # Malformed hash, or a password bcrypt cannot take
+            return False, False
+        return valid, valid and cost != _password_rounds()
+    if scheme in _WERKZEUG_SCHEMES:
+        from werkzeug.security import check_password_hash as werkzeug_check
+        valid = werkzeug_check(stored_hash, password)
+        return valid, valid and len(encoded) <= _BCRYPT_MAX_BYTES
+    return False, False
+
 def login_required(f):
     """Decorator to require user login"""
     @wraps(f)
@@ -30,12 +87,15 @@ def login_required(f):
         if not user_id:
             return jsonify({'error': 'Authentication required', 'success': False}), 401
         
-        # Check if user still exists and is active
-        user = User.query.get(user_id)
+        # Check if user still exists and is active (cached for the rest of the request)
+        user = _load_user(user_id)
         if not user or not user.is_active:
             session.clear()
             return jsonify({'error': 'Invalid session', 'success': False}), 401
         
+        if user.role == UserRole.STUDENT and current_app.config.get('AUTH_PRELOAD_BATCH_IDS'):
+            get_current_user_batch_ids()
+        
         return f(*args, **kwargs)
     
     return decorated_function
@@ -66,13 +126,51 @@ def require_role(*allowed_roles):
         return decorated_function
     return decorator
 
+def _load_user(user_id):
+    """Load a user once per request; later calls reuse the instance cached on flask.g"""
+    if not has_request_context():
+        return db.session.get(User, user_id)
+    
+    cached = g.get(_USER_CACHE)
+    if cached is not None and cached[0] == user_id:
+        return cached[1]
+    
+    user = db.session.get(User, user_id)
+    setattr(g, _USER_CACHE, (user_id, user))
+    return user
+
 def get_current_user():
     """Get current user from session"""
     user_id = session.get('user_id')
     if user_id:
-        return User.query.get(user_id)
+        return _load_user(user_id)
     return None
 
+def get_current_user_batch_ids():
+    """
+    IDs of the current user's active batches, loaded with one query and cached
+    for the request, so access checks do not lazy-load user.batches
+    """
+    user_id = session.get('user_id')
+    if not user_id:
+        return set()
+    
+    cached = g.get(_BATCH_IDS_CACHE)
+    if cached is not None and cached[0] == user_id:
+        return cached[1]
+    
+    batch_ids = {batch_id for (batch_id,) in db.session.query(user_batches.c.batch_id)
+                 .join(Batch, Batch.id == user_batches.c.batch_id)
+                 .filter(user_batches.c.user_id == user_id, Batch.is_active == True)
+                 .all()}
+    setattr(g, _BATCH_IDS_CACHE, (user_id, batch_ids))
+    return batch_ids
+
+def clear_current_user_cache():
+    """Drop the cached user and batch ids (after changing the current user's enrollment)"""
+    g.pop(_USER_CACHE, None)
+    g.pop(_BATCH_IDS_CACHE, None)
+
 def get_current_user_id():
     """Get current user ID from session"""
     return session.get('user_id')
@@ -112,6 +210,8 @@ def check_batch_access(user, batch_id):
     
     if is_student():
         # Students can only access their enrolled batches
+        if user.id == get_current_user_id():
+            return int(batch_id) in get_current_user_batch_ids()
         user_batch_ids = [batch.id for batch in user.batches if batch.is_active]
         return int(batch_id) in user_batch_ids
     
@@ -0,0 +1,20 @@
+"""
+Phone Number Utilities
+Normalisation of Bangladesh mobile numbers shared by the routes and services
+"""
+import re
+
+
+def validate_phone(phone):
+    """Validate and format phone number"""
+    phone = re.sub(r'[^\d]', '', phone)
+    
+    if phone.startswith('880'):
+        phone = phone[3:]
+    elif phone.startswith('+880'):
+        phone = phone[4:]
+    
+    if len(phone) == 11 and phone.startswith('01'):
+        return phone
+    
+    return None
@@ -2,10 +2,12 @@
 Response Utilities
 Standardized response formats for API endpoints
 """
-from flask import jsonify
+from flask import jsonify, Response, stream_with_context
 from datetime import datetime, date
 from decimal import Decimal
 from functools import wraps
+import base64
+import json
 
 def success_response(message="Success", data=None, status_code=200):
     """Create a standardized success response"""
@@ -53,6 +55,49 @@ def paginated_response(data, page, per_page, total, message="Data retrieved succ
     
     return jsonify(response), 200
 
+def cursor_response(data, next_cursor, limit, message="Data retrieved successfully"):
+    """Create a keyset-paginated response; pass next_cursor back to get the following page"""
+    response = {
+        'success': True,
+        'message': message,
+        'data': serialize_data(data),
+        'pagination': {
+            'limit': limit,
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None
+        },
+        'timestamp': datetime.utcnow().isoformat()
+    }
+    
+    return jsonify(response), 200
+
+def ndjson_response(rows, filename=None):
+    """Stream an iterable of dicts as newline-delimited JSON, one object per line"""
+    def generate():
+        for row in rows:
+            yield json.dumps(serialize_data(row), separators=(',', ':')) + '\n'
+    
+    headers = {'X-Accel-Buffering': 'no'}  # Let nginx pass lines through as they are produced
+    if filename:
+        headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson', headers=headers)
+
+def encode_cursor(*values):
+    """Opaque keyset cursor from the sort key of the last row of a page"""
+    raw = json.dumps([serialize_data(value) for value in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Values packed by encode_cursor; raises ValueError for a malformed cursor"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list):
+        raise ValueError('Invalid cursor')
+    return values
+
 def serialize_data(data):
     """Serialize data for JSON response"""
     if isinstance(data, (datetime, date)):
@@ -113,8 +158,7 @@ def serialize_batch(batch):
     if description and ' - ' in description:
         class_name = description.split(' - ')[0]
     batch_data['class'] = class_name
-    students = getattr(batch, 'students', [])
-    batch_data['student_count'] = len([s for s in students if getattr(s, 'is_active', False)])
+    batch_data['student_count'] = getattr(batch, 'active_students_count', 0) or 0
     batch_data['currentStudents'] = batch_data['student_count']
     batch_data['maxStudents'] = getattr(batch, 'max_students', 50) or 50
     batch_data['isActive'] = getattr(batch, 'is_active', True)
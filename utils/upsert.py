@@ -0,0 +1,36 @@
+"""
+Bulk Upsert Utilities
+Dialect-aware INSERT ... ON CONFLICT helpers executed as a single executemany
+"""
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from models import db
+
+
+def bulk_upsert(table, rows, conflict_columns, update_columns):
+    """
+    Insert rows into table, updating update_columns when a row collides on
+    conflict_columns (which must be covered by a unique constraint).
+    All rows are sent in one executemany; the caller owns the transaction.
+    Returns the number of rows submitted.
+    """
+    if not rows:
+        return 0
+
+    if hasattr(table, '__table__'):
+        table = table.__table__
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'mysql':
+        stmt = mysql_insert(table)
+        stmt = stmt.on_duplicate_key_update({col: stmt.inserted[col] for col in update_columns})
+    else:
+        # SQLite (default deployment)
+        stmt = sqlite_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(conflict_columns),
+            set_={col: stmt.excluded[col] for col in update_columns}
+        )
+
+    db.session.execute(stmt, rows)
+    return len(rows)